@@ -0,0 +1,136 @@
+"""
+番組表XML解析のベンチマーク。
+
+エリア全体・複数日分を想定した大きな合成番組表XMLを生成し、
+従来の実装（ET.fromstring + findall + strptime + 辞書）と
+iter_guide_programs（iterparse + Program）の処理時間とピークメモリを比較する。
+
+    python3 benchmarks/bench_guide_parse.py --stations 40 --days 7 --programs 40
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from radiko_rec import iter_guide_programs  # noqa: E402
+
+
+def build_guide_xml(stations, days, programs_per_day, info_length):
+    """Radiko v3 番組表と同じ構造の合成XMLを生成する。"""
+    info = "番組詳細" * (info_length // 4)
+    base = datetime(2024, 5, 21, 5, 0, 0)
+    minutes = 24 * 60 // programs_per_day
+
+    parts = ['<?xml version="1.0" encoding="UTF-8"?><radiko><stations>']
+    for s in range(stations):
+        parts.append(f'<station id="ST{s:03d}"><name>テスト局{s}</name>')
+        for d in range(days):
+            day = base + timedelta(days=d)
+            parts.append(f"<progs><date>{day:%Y%m%d}</date>")
+            for p in range(programs_per_day):
+                ft = day + timedelta(minutes=p * minutes)
+                to = ft + timedelta(minutes=minutes)
+                parts.append(
+                    f'<prog id="{s}{d}{p}" ft="{ft:%Y%m%d%H%M%S}" to="{to:%Y%m%d%H%M%S}" dur="{minutes * 60}">'
+                    f"<title>番組タイトル {s}-{d}-{p}</title><pfm>出演者{p}</pfm>"
+                    f"<url>https://example.com/{s}/{p}</url><desc></desc><info>{info}</info>"
+                    f"</prog>"
+                )
+            parts.append("</progs>")
+        parts.append("</station>")
+    parts.append("</stations></radiko>")
+    return "".join(parts).encode("utf-8")
+
+
+def parse_legacy(content):
+    """変更前の RadikoMetadata.get_programs の解析処理。"""
+    root = ET.fromstring(content)
+    program_data = []
+    for p in root.findall(".//prog"):
+        ft = p.attrib.get("ft")
+        to = p.attrib.get("to")
+        title = p.findtext("title", default="(タイトル不明)")
+        if not ft or not to:
+            continue
+        try:
+            start_dt = datetime.strptime(ft, "%Y%m%d%H%M%S")
+            end_dt = datetime.strptime(to, "%Y%m%d%H%M%S")
+        except ValueError:
+            continue
+        program_data.append(
+            {
+                "title": title,
+                "start_time_dt": start_dt,
+                "end_time_dt": end_dt,
+                "start_time_str": ft,
+                "end_time_str": to,
+            }
+        )
+    return program_data
+
+
+def parse_streaming(content):
+    return list(iter_guide_programs(content))
+
+
+def parse_streaming_with_times(content):
+    """従来実装と条件を揃えるため、全番組の開始・終了datetimeも生成する。"""
+    programs = list(iter_guide_programs(content))
+    for program in programs:
+        program.start_time_dt
+        program.end_time_dt
+    return programs
+
+
+def measure(func, content, repeat):
+    """最良の処理時間(秒)と、結果を保持した状態でのピークメモリ(バイト)を返す。"""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func(content)
+        best = min(best, time.perf_counter() - start)
+        count = len(result)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = func(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return best, peak, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=40)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--programs", type=int, default=40, help="1局1日あたりの番組数")
+    parser.add_argument("--info-length", type=int, default=400, help="番組詳細(info)の文字数")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    content = build_guide_xml(args.stations, args.days, args.programs, args.info_length)
+    print(f"合成番組表: {len(content) / 1024 / 1024:.1f} MB, "
+          f"{args.stations * args.days * args.programs} 番組")
+
+    cases = [
+        ("従来実装 (fromstring + strptime)", parse_legacy),
+        ("iterparse + Program", parse_streaming),
+        ("iterparse + Program (datetime生成込み)", parse_streaming_with_times),
+    ]
+    print(f"{'実装':<40}{'時間(s)':>10}{'ピークメモリ(MB)':>18}{'件数':>10}")
+    for name, func in cases:
+        elapsed, peak, count = measure(func, content, args.repeat)
+        print(f"{name:<40}{elapsed:>10.3f}{peak / 1024 / 1024:>18.1f}{count:>10}")
+
+
+if __name__ == "__main__":
+    main()
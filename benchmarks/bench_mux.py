@@ -0,0 +1,114 @@
+"""
+取得したADTSのM4A化のベンチマーク。プロセス内のmuxer (mux_adts_to_m4a) と、
+従来のFFmpegによるremux (-acodec copy -bsf:a aac_adtstoasc) を比較する。
+
+合成したADTSファイルを入力に、それぞれを子プロセスとして実行し、以下を計測する。
+  * 実時間 (wall) と CPU時間 (user + sys)。音声1時間あたりに換算して表示する
+  * 最大RSS
+muxer 側の子プロセスは Python の起動と radiko_rec の import を含むため、
+import だけを行うプロセスの値も基準として表示する。
+
+    python3 benchmarks/bench_mux.py --hours 1 --repeat 3
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_radiko import SAMPLE_RATE, SAMPLES_PER_FRAME, adts_frame  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import radiko_rec"
+MUX_SNIPPET = "import sys, radiko_rec; radiko_rec.mux_adts_to_m4a(sys.argv[1:-1], sys.argv[-1])"
+
+
+def write_adts(path, seconds, bitrate):
+    """seconds 秒分の合成ADTSファイルを書き出す。"""
+    frames_per_second = SAMPLE_RATE / SAMPLES_PER_FRAME
+    frame = adts_frame(max(1, int(bitrate / 8 / frames_per_second) - 7))
+    count = int(seconds * frames_per_second)
+    block = frame * int(frames_per_second * 60)
+    with open(path, "wb") as f:
+        for _ in range(count // int(frames_per_second * 60)):
+            f.write(block)
+        f.write(frame * (count % int(frames_per_second * 60)))
+
+
+def run_child(args):
+    """子プロセスを実行し、(実時間秒, CPU秒, 最大RSS(MB)) を返す。"""
+    start = time.perf_counter()
+    process = subprocess.Popen(args, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    stderr = process.stderr.read().decode(errors="replace")
+    process.stderr.close()
+    if process.returncode != 0:
+        raise RuntimeError(f"{args[0]} が失敗しました ({process.returncode}): {stderr.strip()[-500:]}")
+    # ru_maxrss は Linux ではKB、macOS ではバイト
+    rss = usage.ru_maxrss / 1024 if sys.platform != "darwin" else usage.ru_maxrss / 1024 / 1024
+    return elapsed, usage.ru_utime + usage.ru_stime, rss
+
+
+def measure(args, repeat):
+    results = [run_child(args) for _ in range(repeat)]
+    return [statistics.median(values) for values in zip(*results)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=1.0, help="入力の音声の長さ(時間)")
+    parser.add_argument("--parts", type=int, default=1, help="入力を分割するファイル数 (分割ダウンロードの連結)")
+    parser.add_argument("--bitrate", type=int, default=48000, help="合成AACのビットレート(bps)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    hours = args.hours
+    with tempfile.TemporaryDirectory() as workdir:
+        inputs = []
+        for i in range(args.parts):
+            path = os.path.join(workdir, f"part{i}.aac")
+            write_adts(path, hours * 3600 / args.parts, args.bitrate)
+            inputs.append(path)
+        input_mb = sum(os.path.getsize(path) for path in inputs) / 1024 / 1024
+        print(f"入力: {hours:g} 時間, {args.parts} ファイル, {input_mb:.1f} MB (ADTS, {args.bitrate // 1000} kbps)")
+        print(f"{'方式':<28}{'実時間(s/h)':>12}{'CPU(s/h)':>12}{'最大RSS(MB)':>14}")
+
+        rows = []
+        baseline = measure([sys.executable, "-c", IMPORT_SNIPPET], args.repeat)
+        rows.append(("python + import (基準)", baseline, False))
+
+        output = os.path.join(workdir, "native.m4a")
+        rows.append(("muxer (プロセス内)", measure([sys.executable, "-c", MUX_SNIPPET, *inputs, output], args.repeat), True))
+
+        if shutil.which("ffmpeg"):
+            output = os.path.join(workdir, "ffmpeg.m4a")
+            if len(inputs) == 1:
+                input_args = ["-i", inputs[0]]
+            else:
+                list_path = os.path.join(workdir, "concat.txt")
+                with open(list_path, "w", encoding="utf-8") as f:
+                    f.writelines(f"file '{path}'\n" for path in inputs)
+                input_args = ["-f", "concat", "-safe", "0", "-i", list_path]
+            command = [
+                "ffmpeg", "-loglevel", "error", *input_args,
+                "-acodec", "copy", "-vn", "-bsf:a", "aac_adtstoasc", "-y", output,
+            ]
+            rows.append(("FFmpeg (aac_adtstoasc)", measure(command, args.repeat), True))
+        else:
+            print("FFmpegが見つからないため、FFmpegによるremuxは計測しません。")
+
+        for name, (elapsed, cpu, rss), per_hour in rows:
+            scale = hours if per_hour else 1
+            print(f"{name:<28}{elapsed / scale:>12.3f}{cpu / scale:>12.3f}{rss:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+ローカルのモックRadikoサーバー (mock_radiko.py) を相手にした総合ベンチマーク。
+
+radiko.jp にアクセスせずに以下を計測する。
+  * 認証 (auth1 → auth2) のレイテンシ
+  * エリア番組表の取得・解析時間
+  * 1番組のダウンロードのスループット（実時間に対する倍速）
+  * 同時ダウンロード数を増やしたときのスケーリング
+
+モックサーバーには遅延・帯域制限・エラーを注入できるため、実回線に近い条件での比較や、
+再試行処理の回帰確認にも使える。
+
+    python3 benchmarks/bench_radiko.py --latency 0.02 --bandwidth 1000000 --concurrency 1,2,4,8
+
+FFmpegが無い環境でも計測できるよう、ダウンロードはM4Aへのremux前の取得処理（ADTSの一時ファイル
+への書き出し）を計測する。FFmpegがあれば --full で download() 全体（remux込み）も計測する。
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_radiko import MockRadikoServer  # noqa: E402
+
+
+def quiet(message):
+    pass
+
+
+def bench_auth(rr, repeat):
+    """認証1回あたりの時間(ms)のリストを返す。"""
+    timings = []
+    for _ in range(repeat):
+        auth = rr.RadikoAuth(quiet, cache_path=None)
+        start = time.perf_counter()
+        if not auth.auth(use_cache=False):
+            raise RuntimeError("モックサーバーでの認証に失敗しました")
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, auth
+
+
+def bench_guide(rr, auth, date_str, repeat):
+    """エリア番組表の取得時間(ms)、解析時間(ms)、番組数を返す。"""
+    fetch_timings = []
+    parse_timings = []
+    count = 0
+    for _ in range(repeat):
+        metadata = rr.RadikoMetadata(auth, quiet, guide_cache_dir=None)
+        url = rr.URL_AREA_GUIDE.format(date=date_str, area_id=auth.area_id)
+
+        start = time.perf_counter()
+        content = metadata._fetch_guide_xml(url, ("area", auth.area_id, date_str), date_str)
+        fetch_timings.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        count = sum(1 for _ in rr.iter_guide_programs(content))
+        parse_timings.append((time.perf_counter() - start) * 1000)
+    return fetch_timings, parse_timings, count
+
+
+def fetch_program(rr, auth, station_id, ft, to, workdir, engine, full):
+    """1番組を取得し、(経過秒, バイト数) を返す。"""
+    downloader = rr.StreamDownloader(auth, quiet)
+    start = time.perf_counter()
+    if full:
+        output_path = os.path.join(workdir, f"{station_id}_{ft}.m4a")
+        ok = downloader.download(station_id, ft, to, output_path, lambda progress: None, engine=engine)
+    else:
+        output_path = os.path.join(workdir, f"{station_id}_{ft}.aac")
+        ok = downloader._fetch_range_adts(station_id, ft, to, output_path, engine, lambda progress: None)
+    elapsed = time.perf_counter() - start
+    if not ok:
+        raise RuntimeError(f"{station_id} のダウンロードに失敗しました")
+    size = os.path.getsize(output_path)
+    os.remove(output_path)
+    return elapsed, size
+
+
+def bench_concurrent(rr, auth, stations, ft, to, workdir, engine, full, concurrency):
+    """concurrency 件を同時にダウンロードし、(全体の経過秒, 合計バイト数) を返す。"""
+    results = [None] * concurrency
+    errors = []
+
+    def worker(i):
+        try:
+            results[i] = fetch_program(rr, auth, stations[i % len(stations)], ft, to, workdir, engine, full)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    return elapsed, sum(size for _, size in results)
+
+
+def report(name, timings, unit="ms"):
+    print(f"{name:<36}{statistics.median(timings):>12.1f}{min(timings):>12.1f}  {unit}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--stations", type=int, default=40, help="エリア内の局数")
+    parser.add_argument("--programs", type=int, default=40, help="1局1日あたりの番組数")
+    parser.add_argument("--duration", type=int, default=1800, help="ダウンロードする番組の長さ(秒)")
+    parser.add_argument("--engine", choices=["native", "ffmpeg"], default="native")
+    parser.add_argument("--full", action="store_true", help="download() 全体 (remux込み) を計測する (FFmpegが必要)")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="同時ダウンロード数 (カンマ区切り)")
+    parser.add_argument("--latency", type=float, default=0.0, help="応答前の遅延(秒)")
+    parser.add_argument("--bandwidth", type=int, default=0, help="1接続あたりの帯域(バイト/秒, 0=無制限)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="エラー応答を返す確率")
+    parser.add_argument("--fault-path", default=None, help="障害を注入するパスの正規表現 (例: /segments/)")
+    args = parser.parse_args()
+
+    if (args.full or args.engine == "ffmpeg") and not shutil.which("ffmpeg"):
+        parser.error("FFmpegが見つかりません (--engine ffmpeg / --full にはFFmpegが必要です)")
+
+    server = MockRadikoServer(stations=args.stations, programs_per_day=args.programs).start()
+    server.faults.update(
+        latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate, path=args.fault_path
+    )
+    # 接続先URLは import 時に決まるため、モックサーバーの起動後に読み込む
+    os.environ["RADIKO_BASE_URL"] = server.base_url
+    import radiko_rec as rr
+
+    print(f"モックサーバー: {server.base_url} (遅延 {args.latency}s, 帯域 {args.bandwidth or '無制限'}, "
+          f"エラー率 {args.error_rate})")
+    print(f"{'計測対象':<36}{'中央値':>12}{'最小':>12}")
+
+    try:
+        timings, auth = bench_auth(rr, args.repeat)
+        report("認証 (auth1 → auth2)", timings)
+
+        date_str = (datetime.now() - timedelta(days=1)).strftime("%Y%m%d")
+        fetch_timings, parse_timings, count = bench_guide(rr, auth, date_str, args.repeat)
+        report(f"エリア番組表の取得 ({args.stations}局)", fetch_timings)
+        report(f"エリア番組表の解析 ({count}番組)", parse_timings)
+
+        ft_dt = datetime.strptime(date_str, "%Y%m%d") + timedelta(hours=6)
+        ft = ft_dt.strftime("%Y%m%d%H%M%S")
+        to = (ft_dt + timedelta(seconds=args.duration)).strftime("%Y%m%d%H%M%S")
+        stations = [f"ST{i:03d}" for i in range(args.stations)]
+
+        with tempfile.TemporaryDirectory() as workdir:
+            elapsed, size = fetch_program(rr, auth, stations[0], ft, to, workdir, args.engine, args.full)
+            print(f"\n単体ダウンロード ({args.engine}, {args.duration}秒の番組): "
+                  f"{elapsed:.2f}s, {size / 1024 / 1024 / elapsed:.2f} MB/s, {args.duration / elapsed:.0f}倍速")
+
+            print(f"\n{'同時数':>6}{'経過(s)':>10}{'合計MB/s':>12}{'合計倍速':>10}{'効率':>8}")
+            base = None
+            for concurrency in [int(c) for c in args.concurrency.split(",") if c]:
+                elapsed, size = bench_concurrent(
+                    rr, auth, stations, ft, to, workdir, args.engine, args.full, concurrency
+                )
+                throughput = size / elapsed
+                base = base or throughput / concurrency
+                print(f"{concurrency:>6}{elapsed:>10.2f}{throughput / 1024 / 1024:>12.2f}"
+                      f"{args.duration * concurrency / elapsed:>10.0f}{throughput / (base * concurrency):>8.0%}")
+    finally:
+        server.stop()
+
+    stats = server.state.counters
+    print(f"\nモックサーバーへのリクエスト: {sum(stats.values())} 件 (注入したエラー {stats.get('injected_errors', 0)} 件)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+CLIのコールドスタート時間のベンチマーク。
+
+新しいPythonプロセスを繰り返し起動し、以下を計測する。
+  * radiko_rec の import
+  * `radiko_rec.py --help`
+  * import から最初の認証リクエストを送れる状態 (RadikoAuth 生成) まで
+あわせて、CLI経路で tkinter が読み込まれていないことを確認する。
+
+    python3 benchmarks/bench_startup.py --repeat 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import radiko_rec"
+
+READY_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import radiko_rec
+radiko_rec.RadikoAuth(lambda message: None, cache_path=None)
+print((time.perf_counter() - start) * 1000)
+print(",".join(m for m in ("tkinter", "yaml") if m in sys.modules))
+"""
+
+
+def run_wall(args, repeat):
+    """プロセス全体の実行時間(ms)のリストを返す。"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, cwd=REPO_DIR, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def run_ready(repeat):
+    """プロセス内で計測した「import から認証準備完了まで」の時間(ms)と、読み込まれた重いモジュールを返す。"""
+    timings = []
+    loaded = ""
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", READY_SNIPPET], cwd=REPO_DIR, check=True, capture_output=True, text=True
+        )
+        elapsed, loaded = (result.stdout.splitlines() + [""])[:2]
+        timings.append(float(elapsed))
+    return timings, loaded
+
+
+def report(name, timings):
+    print(f"{name:<40}{statistics.median(timings):>10.1f}{min(timings):>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'計測対象':<40}{'中央値(ms)':>10}{'最小(ms)':>10}")
+    report("python -c 'pass' (基準)", run_wall([sys.executable, "-c", "pass"], args.repeat))
+    report("import radiko_rec", run_wall([sys.executable, "-c", IMPORT_SNIPPET], args.repeat))
+    report("radiko_rec.py --help", run_wall([sys.executable, "radiko_rec.py", "--help"], args.repeat))
+
+    timings, loaded = run_ready(args.repeat)
+    report("import → 認証準備完了 (プロセス内)", timings)
+    print(f"CLI経路で読み込まれたGUI/設定モジュール: {loaded or 'なし'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,500 @@
+"""
+ベンチマーク用のRadikoモックサーバー。
+
+radiko_rec が使うAPIをローカルで再現する。
+  * auth1 / auth2 (X-Radiko-KeyOffset / KeyLength から生成されるPartialKeyを AUTHKEY_VALUE と照合)
+  * プレミアムログイン / ログアウト
+  * 局リスト、局単位・エリア単位の番組表XML (ETagによる条件付きリクエストに対応)
+  * ts/playlist.m3u8 (master → chunklist) と合成AAC (ADTS) セグメント
+  * ライブ配信 so/playlist.m3u8 (実時刻に合わせて進むスライディングウィンドウ、ID3タグ付きセグメント)
+遅延・帯域制限・エラー応答を任意のタイミングで注入できる。
+
+単体で起動して radiko_rec.py から接続することもできる。
+
+    python3 benchmarks/mock_radiko.py --port 8080 --latency 0.05 --bandwidth 2000000
+    RADIKO_BASE_URL=http://127.0.0.1:8080 python3 radiko_rec.py auth --no-cache
+
+実行中の障害注入の変更:
+
+    curl 'http://127.0.0.1:8080/_mock/faults?error_rate=0.2&path=/segments/'
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# radiko_rec の import は RADIKO_BASE_URL の設定より後に行いたいため、鍵だけを複製しておく
+AUTHKEY_VALUE = b"bcd151073c03b352e1ef2fd66c32209da9ca0afa"
+
+AREA_ID = "JP13"
+SEGMENT_SECONDS = 5
+# 合成AAC: AAC-LC 48kHz ステレオ, 1フレーム1024サンプル
+SAMPLE_RATE = 48000
+SAMPLES_PER_FRAME = 1024
+SAMPLING_INDEX = {96000: 0, 88200: 1, 64000: 2, 48000: 3, 44100: 4, 32000: 5, 24000: 6, 22050: 7}
+# ライブのプレイリストに載せるセグメント数。セグメント n はUNIX時刻 n*5〜(n+1)*5 秒の放送で、終わると公開される
+LIVE_WINDOW_SEGMENTS = 3
+
+
+def id3_tag(timestamp_90k):
+    """HLSのパックドオーディオと同じ、MPEG-TSのタイムスタンプを入れたPRIVフレームのID3タグ。"""
+    owner = b"com.apple.streaming.transportStreamTimestamp\x00"
+    body = owner + (timestamp_90k & ((1 << 33) - 1)).to_bytes(8, "big")
+    frame = b"PRIV" + len(body).to_bytes(4, "big") + b"\x00\x00" + body
+
+    def syncsafe(n):
+        return bytes([(n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F])
+    return b"ID3\x04\x00\x00" + syncsafe(len(frame)) + frame
+
+
+def adts_frame(payload_size, sample_rate=SAMPLE_RATE, channels=2):
+    """無音相当（ゼロ埋め）のペイロードを持つADTSフレームを1つ返す。"""
+    frame_length = 7 + payload_size
+    profile = 1  # AAC LC (ADTSでは object type - 1)
+    sf_index = SAMPLING_INDEX[sample_rate]
+    header = bytes([
+        0xFF,
+        0xF1,  # MPEG-4, layer 0, CRCなし
+        (profile << 6) | (sf_index << 2) | (channels >> 2),
+        ((channels & 3) << 6) | (frame_length >> 11),
+        (frame_length >> 3) & 0xFF,
+        ((frame_length & 7) << 5) | 0x1F,
+        0xFC,
+    ])
+    return header + bytes(payload_size)
+
+
+class Faults:
+    """注入する障害の設定。path に正規表現を指定すると一致するリクエストにだけ適用する。"""
+    def __init__(self, latency=0.0, bandwidth=0, error_rate=0.0, error_status=503, retry_after=None, path=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.path = path
+
+    def update(self, **values):
+        for key, value in values.items():
+            if not hasattr(self, key):
+                raise KeyError(key)
+            setattr(self, key, value)
+
+    def applies_to(self, path):
+        return not self.path or re.search(self.path, path) is not None
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class MockRadikoState:
+    """発行したトークン・セッションと、番組表・セグメントの生成パラメータを保持する。"""
+    def __init__(self, stations=20, programs_per_day=24, bitrate=48000, accounts=None, live_program_date_time=False):
+        self.station_ids = [f"ST{i:03d}" for i in range(stations)]
+        # ライブのプレイリストに EXT-X-PROGRAM-DATE-TIME を付けるか (Radikoのライブ配信には無い)
+        self.live_program_date_time = live_program_date_time
+        self.programs_per_day = programs_per_day
+        self.accounts = accounts or {"user@example.com": "password"}
+        self.faults = Faults()
+        self.lock = threading.Lock()
+        # authtoken -> {"partial_key": ..., "area_id": None|str}
+        self.tokens = {}
+        self.sessions = set()
+        self.counters = {}
+
+        frames_per_second = SAMPLE_RATE / SAMPLES_PER_FRAME
+        self.frame = adts_frame(max(1, int(bitrate / 8 / frames_per_second) - 7))
+        self.frames_per_second = frames_per_second
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def issue_token(self):
+        token = secrets.token_urlsafe(16)
+        offset = random.randrange(0, len(AUTHKEY_VALUE) - 16)
+        length = 16
+        partial_key = base64.b64encode(AUTHKEY_VALUE[offset:offset + length]).decode()
+        with self.lock:
+            self.tokens[token] = {"partial_key": partial_key, "area_id": None}
+        return token, offset, length
+
+    def activate_token(self, token, partial_key):
+        with self.lock:
+            entry = self.tokens.get(token)
+            if not entry or entry["partial_key"] != partial_key:
+                return False
+            entry["area_id"] = AREA_ID
+            return True
+
+    def token_valid(self, token):
+        with self.lock:
+            entry = self.tokens.get(token)
+            return bool(entry and entry["area_id"])
+
+    def segment(self, index):
+        """index 番目のセグメント (5秒) のADTSデータ。累積フレーム数で端数を揃え、長さの誤差を蓄積させない。"""
+        first = int(index * SEGMENT_SECONDS * self.frames_per_second)
+        last = int((index + 1) * SEGMENT_SECONDS * self.frames_per_second)
+        return self.frame * (last - first)
+
+    def station_list_xml(self):
+        parts = ['<?xml version="1.0" encoding="UTF-8"?>', f'<stations area_id="{AREA_ID}">']
+        for station_id in self.station_ids:
+            parts.append(f"<station><id>{station_id}</id><name>テスト局{station_id}</name></station>")
+        parts.append("</stations>")
+        return "".join(parts).encode("utf-8")
+
+    def guide_xml(self, date_str, station_ids):
+        """Radiko v3 番組表と同じ構造の合成XML。放送日は5:00〜翌5:00。"""
+        base = datetime.strptime(date_str, "%Y%m%d") + timedelta(hours=5)
+        minutes = 24 * 60 // self.programs_per_day
+        parts = ['<?xml version="1.0" encoding="UTF-8"?><radiko><stations>']
+        for station_id in station_ids:
+            parts.append(f'<station id="{station_id}"><name>テスト局{station_id}</name>')
+            parts.append(f"<progs><date>{date_str}</date>")
+            for p in range(self.programs_per_day):
+                ft = base + timedelta(minutes=p * minutes)
+                to = ft + timedelta(minutes=minutes)
+                parts.append(
+                    f'<prog id="{station_id}{date_str}{p}" ft="{ft:%Y%m%d%H%M%S}" to="{to:%Y%m%d%H%M%S}" '
+                    f'dur="{minutes * 60}"><title>番組{p} ({station_id})</title><pfm>出演者{p}</pfm>'
+                    f"<url>https://example.com/{station_id}/{p}</url><desc></desc><info>番組詳細{p}</info></prog>"
+                )
+            parts.append("</progs></station>")
+        parts.append("</stations></radiko>")
+        return "".join(parts).encode("utf-8")
+
+
+class MockRadikoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockRadiko/1.0"
+
+    routes = [
+        ("GET", re.compile(r"^/v2/api/auth1$"), "auth1"),
+        ("GET", re.compile(r"^/v2/api/auth2$"), "auth2"),
+        ("POST", re.compile(r"^/v4/api/member/login$"), "login"),
+        ("POST", re.compile(r"^/v4/api/member/logout$"), "logout"),
+        ("GET", re.compile(r"^/v3/station/list/(?P<area>[^/]+)\.xml$"), "station_list"),
+        ("GET", re.compile(r"^/v3/program/station/date/(?P<date>\d{8})/(?P<station>[^/]+)\.xml$"), "station_guide"),
+        ("GET", re.compile(r"^/v3/program/date/(?P<date>\d{8})/(?P<area>[^/]+)\.xml$"), "area_guide"),
+        ("GET", re.compile(r"^/v2/api/ts/playlist\.m3u8$"), "playlist"),
+        ("GET", re.compile(r"^/v2/api/ts/chunklist\.m3u8$"), "chunklist"),
+        ("GET", re.compile(r"^/segments/(?P<station>[^/]+)/(?P<ft>\d{14})/(?P<index>\d+)\.aac$"), "segment"),
+        ("GET", re.compile(r"^/so/playlist\.m3u8$"), "live_playlist"),
+        ("GET", re.compile(r"^/so/chunklist\.m3u8$"), "live_chunklist"),
+        ("GET", re.compile(r"^/live/(?P<station>[^/]+)/(?P<index>\d+)\.aac$"), "live_segment"),
+        ("GET", re.compile(r"^/_mock/faults$"), "faults"),
+        ("GET", re.compile(r"^/_mock/stats$"), "stats"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        self.query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        for route_method, pattern, name in self.routes:
+            match = pattern.match(url.path)
+            if match and route_method == method:
+                break
+        else:
+            self._send(404, b"not found")
+            return
+
+        self.state.count(name)
+        faults = self.state.faults
+        if not url.path.startswith("/_mock/") and faults.applies_to(url.path):
+            if faults.latency:
+                time.sleep(faults.latency)
+            if faults.error_rate and random.random() < faults.error_rate:
+                headers = {"Retry-After": str(faults.retry_after)} if faults.retry_after is not None else {}
+                self.state.count("injected_errors")
+                self._send(faults.error_status, b"injected error", headers=headers)
+                return
+
+        getattr(self, "handle_" + name)(**match.groupdict())
+
+    def _read_form(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        return {k: v[-1] for k, v in parse_qs(body).items()}
+
+    def _send(self, status, body=b"", content_type="text/plain; charset=utf-8", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command == "HEAD" or not body:
+            return
+
+        faults = self.state.faults
+        bandwidth = faults.bandwidth if faults.applies_to(urlsplit(self.path).path) else 0
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        # 帯域制限: 1接続あたり bandwidth バイト/秒
+        chunk = max(1024, bandwidth // 20)
+        for offset in range(0, len(body), chunk):
+            piece = body[offset:offset + chunk]
+            self.wfile.write(piece)
+            time.sleep(len(piece) / bandwidth)
+
+    def _send_xml(self, body):
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, headers={"ETag": etag})
+            return
+        self._send(200, body, "application/xml; charset=utf-8", {"ETag": etag})
+
+    def _authorized(self):
+        if self.state.token_valid(self.headers.get("X-Radiko-Authtoken")):
+            return True
+        self._send(403, b"forbidden")
+        return False
+
+    # --- 認証 ---
+
+    def handle_auth1(self):
+        token, offset, length = self.state.issue_token()
+        self._send(200, b"OK", headers={
+            "X-Radiko-AuthToken": token,
+            "X-Radiko-KeyOffset": str(offset),
+            "X-Radiko-KeyLength": str(length),
+        })
+
+    def handle_auth2(self):
+        session = self.query.get("radiko_session")
+        if session and session not in self.state.sessions:
+            self._send(401, b"invalid session")
+            return
+        token = self.headers.get("X-Radiko-AuthToken")
+        if not self.state.activate_token(token, self.headers.get("X-Radiko-PartialKey")):
+            self._send(401, b"invalid partial key")
+            return
+        self._send(200, f"{AREA_ID},TOKYO JAPAN,tokyo Japan\r\n".encode())
+
+    def handle_login(self):
+        form = self._read_form()
+        if self.state.accounts.get(form.get("mail")) != form.get("pass"):
+            self._send(401, json.dumps({"status": "401"}).encode(), "application/json")
+            return
+        session = secrets.token_hex(16)
+        with self.state.lock:
+            self.state.sessions.add(session)
+        self._send(200, json.dumps({"radiko_session": session, "areafree": "1"}).encode(), "application/json")
+
+    def handle_logout(self):
+        form = self._read_form()
+        with self.state.lock:
+            self.state.sessions.discard(form.get("radiko_session"))
+        self._send(200, b"{}", "application/json")
+
+    # --- 局リスト・番組表 ---
+
+    def handle_station_list(self, area):
+        self._send_xml(self.state.station_list_xml())
+
+    def handle_station_guide(self, date, station):
+        if station not in self.state.station_ids:
+            self._send(404, b"unknown station")
+            return
+        self._send_xml(self.state.guide_xml(date, [station]))
+
+    def handle_area_guide(self, date, area):
+        self._send_xml(self.state.guide_xml(date, self.state.station_ids))
+
+    # --- タイムフリーストリーム ---
+
+    def handle_playlist(self):
+        if not self._authorized():
+            return
+        q = self.query
+        try:
+            ft = datetime.strptime(q["ft"], "%Y%m%d%H%M%S")
+            to = datetime.strptime(q["to"], "%Y%m%d%H%M%S")
+        except (KeyError, ValueError):
+            self._send(400, b"bad range")
+            return
+        if to <= ft:
+            self._send(400, b"bad range")
+            return
+        chunklist = f"/v2/api/ts/chunklist.m3u8?station_id={q.get('station_id', '')}&ft={q['ft']}&to={q['to']}"
+        body = "#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-STREAM-INF:BANDWIDTH=52000,CODECS=\"mp4a.40.2\"\n" + chunklist + "\n"
+        self._send(200, body.encode(), "application/vnd.apple.mpegurl")
+
+    def handle_chunklist(self):
+        if not self._authorized():
+            return
+        q = self.query
+        ft = datetime.strptime(q["ft"], "%Y%m%d%H%M%S")
+        to = datetime.strptime(q["to"], "%Y%m%d%H%M%S")
+        count = -(-int((to - ft).total_seconds()) // SEGMENT_SECONDS)
+        lines = [
+            "#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}", "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for index in range(count):
+            lines.append(f"#EXTINF:{SEGMENT_SECONDS}.0,")
+            lines.append(f"/segments/{q.get('station_id', 'X')}/{q['ft']}/{index}.aac")
+        lines.append("#EXT-X-ENDLIST")
+        self._send(200, ("\n".join(lines) + "\n").encode(), "application/vnd.apple.mpegurl")
+
+    def handle_segment(self, station, ft, index):
+        if not self._authorized():
+            return
+        self._send(200, self.state.segment(int(index)), "audio/aac")
+
+    # --- ライブ配信 ---
+
+    def handle_live_playlist(self):
+        if not self._authorized():
+            return
+        chunklist = f"/so/chunklist.m3u8?station_id={self.query.get('station_id', '')}"
+        body = "#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-STREAM-INF:BANDWIDTH=52000,CODECS=\"mp4a.40.2\"\n" + chunklist + "\n"
+        self._send(200, body.encode(), "application/vnd.apple.mpegurl")
+
+    def handle_live_chunklist(self):
+        if not self._authorized():
+            return
+        station_id = self.query.get("station_id", "X")
+        # 放送が終わったセグメントだけを公開する
+        newest = int(time.time() // SEGMENT_SECONDS) - 1
+        first = newest - LIVE_WINDOW_SEGMENTS + 1
+        lines = [
+            "#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}", f"#EXT-X-MEDIA-SEQUENCE:{first}",
+        ]
+        for index in range(first, newest + 1):
+            if self.state.live_program_date_time:
+                start = datetime.fromtimestamp(index * SEGMENT_SECONDS).astimezone()
+                lines.append(f"#EXT-X-PROGRAM-DATE-TIME:{start.isoformat(timespec='milliseconds')}")
+            lines.append(f"#EXTINF:{SEGMENT_SECONDS}.0,")
+            lines.append(f"/live/{station_id}/{index}.aac")
+        self._send(200, ("\n".join(lines) + "\n").encode(), "application/vnd.apple.mpegurl")
+
+    def handle_live_segment(self, station, index):
+        if not self._authorized():
+            return
+        index = int(index)
+        if index >= time.time() // SEGMENT_SECONDS:
+            self._send(404, b"not yet available")
+            return
+        body = id3_tag(index * SEGMENT_SECONDS * 90000) + self.state.segment(index)
+        self._send(200, body, "audio/aac")
+
+    # --- モックの制御 ---
+
+    def handle_faults(self):
+        values = {}
+        for key, value in self.query.items():
+            if key == "path":
+                values[key] = value or None
+            elif key in ("bandwidth", "error_status"):
+                values[key] = int(value)
+            elif key == "retry_after":
+                values[key] = int(value) if value else None
+            else:
+                values[key] = float(value)
+        try:
+            self.state.faults.update(**values)
+        except KeyError as e:
+            self._send(400, f"unknown fault: {e}".encode())
+            return
+        self._send(200, json.dumps(self.state.faults.to_dict()).encode(), "application/json")
+
+    def handle_stats(self):
+        with self.state.lock:
+            body = json.dumps(self.state.counters).encode()
+        self._send(200, body, "application/json")
+
+
+class MockRadikoServer:
+    """モックサーバーをバックグラウンドスレッドで起動する。port=0 なら空いているポートを使う。"""
+    def __init__(self, host="127.0.0.1", port=0, **state_options):
+        self.state = MockRadikoState(**state_options)
+        self.httpd = ThreadingHTTPServer((host, port), MockRadikoHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = self.state
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def faults(self):
+        return self.state.faults
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--stations", type=int, default=20)
+    parser.add_argument("--programs", type=int, default=24, help="1局1日あたりの番組数")
+    parser.add_argument("--bitrate", type=int, default=48000, help="合成AACのビットレート(bps)")
+    parser.add_argument("--latency", type=float, default=0.0, help="応答前の遅延(秒)")
+    parser.add_argument("--bandwidth", type=int, default=0, help="1接続あたりの帯域(バイト/秒, 0=無制限)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="エラー応答を返す確率")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=int, default=None, help="エラー応答に付ける Retry-After(秒)")
+    parser.add_argument("--fault-path", default=None, help="障害を注入するパスの正規表現")
+    args = parser.parse_args()
+
+    server = MockRadikoServer(
+        args.host, args.port, stations=args.stations, programs_per_day=args.programs, bitrate=args.bitrate
+    )
+    server.faults.update(
+        latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate,
+        error_status=args.error_status, retry_after=args.retry_after, path=args.fault_path,
+    )
+    print(f"モックRadikoサーバーを起動しました: RADIKO_BASE_URL={server.base_url}", file=sys.stderr)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,459 @@
+"""
+radiko_rec の asyncio 版クライアント。
+
+認証 (Auth1 → Premium Login → Auth2)、局リスト・番組表、タイムフリーのプレイリストとセグメントを
+aiohttp で取得する。全てのリクエスト（ログアウトを含む）は接続プール付きの1つの ClientSession を
+keep-alive で共有するため、数百件の番組表・プレイリストの取得を1つのイベントループ上で同時に実行できる。
+
+ヘッダの組み立て、応答の解釈、トークン・番組表のキャッシュ、XMLの解析、再試行方針と
+サーキットブレーカーは radiko_rec の同期版クラスと共通。同期版 (RadikoAuth / RadikoMetadata) は
+これまでどおり requests ベースで利用でき、GUIやCLIはそちらを使う。
+
+aiohttp が必要 (pip install aiohttp)。
+
+    async with AsyncRadikoClient() as client:
+        auth = AsyncRadikoAuth(client, print)
+        await auth.async_auth()
+        metadata = AsyncRadikoMetadata(auth, print)
+        await metadata.load_stations()
+        await metadata.get_area_week()
+"""
+import asyncio
+import json
+import time
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp は任意の依存
+    aiohttp = None
+
+from radiko_rec import (
+    AUTH_CACHE_PATH,
+    AUTH_REJECTED_STATUSES,
+    DEFAULT_RETRY_POLICY,
+    GUIDE_CACHE_DIR,
+    HLS_DEFAULT_WORKERS,
+    TIME_FREE_DAYS,
+    URL_AREA_GUIDE,
+    URL_AUTH1,
+    URL_PREMIUM_LOGIN,
+    URL_PREMIUM_LOGOUT,
+    URL_STATION_GUIDE,
+    URL_STATION_LIST,
+    CircuitOpenError,
+    HLSSegmentFetcher,
+    RadikoAuth,
+    RadikoMetadata,
+    StreamDownloader,
+    get_circuit_breaker,
+)
+from datetime import datetime, timedelta
+
+# 接続プール全体・1ホストあたりの同時接続数と、1リクエストのタイムアウト(秒)
+ASYNC_CONNECTION_LIMIT = 100
+ASYNC_CONNECTION_LIMIT_PER_HOST = 32
+ASYNC_REQUEST_TIMEOUT = 10
+# 番組表の一括取得で同時に送るリクエスト数
+ASYNC_GUIDE_CONCURRENCY = 32
+
+
+class AsyncHTTPError(Exception):
+    """HTTPのエラーステータスを受け取ったことを示す例外。"""
+    def __init__(self, status_code, url):
+        super().__init__(f"HTTP {status_code}: {url}")
+        self.status_code = status_code
+        self.url = url
+
+
+class AsyncResponse:
+    """本文を読み終えた応答。同期版と同じ名前 (status_code, headers, content, text) で参照できる。"""
+    __slots__ = ("status_code", "headers", "content", "url")
+
+    def __init__(self, status_code, headers, content, url):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.url = url
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise AsyncHTTPError(self.status_code, self.url)
+
+
+class AsyncRadikoClient:
+    """
+    aiohttp.ClientSession を1つだけ持ち、認証・番組表・プレイリスト・セグメントの全リクエストで共有する。
+    セッションは最初のリクエスト時に、実行中のイベントループ上で作成する。
+    """
+    def __init__(self, log_callback=None, limit=ASYNC_CONNECTION_LIMIT,
+                 limit_per_host=ASYNC_CONNECTION_LIMIT_PER_HOST, timeout=ASYNC_REQUEST_TIMEOUT):
+        if aiohttp is None:
+            raise RuntimeError("radiko_async には aiohttp が必要です (pip install aiohttp)")
+        self.log = log_callback
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def request(self, method, url, endpoint, policy=DEFAULT_RETRY_POLICY, **kwargs):
+        """
+        radiko_rec.request_with_retry の asyncio 版。
+        通信エラーと再試行対象のステータスはバックオフ後に再試行し、最後の応答 (または例外) を返す。
+        待機は asyncio.sleep で行うため、再試行中も他のリクエストは進む。
+        """
+        breaker = get_circuit_breaker(endpoint)
+
+        for attempt in range(policy.max_attempts):
+            last_attempt = attempt + 1 >= policy.max_attempts
+            wait = breaker.wait_time()
+            if wait > 0:
+                if last_attempt or wait > policy.max_delay:
+                    raise CircuitOpenError(f"{endpoint} への接続を一時的に遮断しています (残り {wait:.0f} 秒)")
+                await asyncio.sleep(wait)
+                continue
+
+            retry_after = None
+            try:
+                async with self.session.request(method, url, **kwargs) as res:
+                    response = AsyncResponse(res.status, res.headers, await res.read(), url)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                breaker.record_failure()
+                if last_attempt:
+                    raise
+                reason = str(e) or type(e).__name__
+            else:
+                if response.status_code not in policy.retry_statuses:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                if last_attempt:
+                    return response
+                reason = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+
+            delay = policy.delay(attempt, retry_after)
+            if self.log:
+                self.log(f"{endpoint}: {reason}。{delay:.1f} 秒後に再試行します ({attempt + 1}/{policy.max_attempts - 1})")
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+def _request_errors():
+    """リクエストの失敗として扱う例外 (aiohttp の読み込み後に決まる)。"""
+    return (aiohttp.ClientError, asyncio.TimeoutError, AsyncHTTPError, CircuitOpenError)
+
+
+class AsyncRadikoAuth(RadikoAuth):
+    """
+    RadikoAuth の asyncio 版。トークンの状態・キャッシュ・応答の解釈は RadikoAuth と共通で、
+    ネットワークアクセスを行うメソッドを async_ 付きの名前のコルーチンとして追加する。
+    同期版のメソッド (auth / reauth / ensure_valid / logout) は置き換えないため、RadikoAuth を受け取る
+    同期のコード (StreamDownloader など) にもそのまま渡せる (その場合は requests で通信する)。
+    """
+    def __init__(self, client, log_callback, cache_path=AUTH_CACHE_PATH):
+        super().__init__(log_callback, cache_path)
+        self.client = client
+        self._async_refresh_lock = None
+
+    async def async_auth(self, mail=None, password=None, use_cache=True):
+        self._mail = mail or None
+        self._password = password or None
+
+        if use_cache and self._restore_from_cache():
+            return True
+
+        credentials = await self._async_auth_network(self._mail, self._password)
+        if not credentials:
+            return False
+
+        self._apply_credentials(*credentials)
+        self._store_in_cache()
+        return True
+
+    async def async_reauth(self, stale_token=None):
+        """RadikoAuth.reauth と同じく、同時に呼ばれても再認証は1回だけ行う。"""
+        if self._async_refresh_lock is None:
+            self._async_refresh_lock = asyncio.Lock()
+        async with self._async_refresh_lock:
+            if self.authtoken and self.authtoken != stale_token and self.is_valid():
+                return True
+
+            self.log("認証トークンを更新します...")
+            if self.token_cache:
+                self.token_cache.invalidate(self._cache_account)
+            return await self.async_auth(self._mail, self._password, use_cache=False)
+
+    async def async_ensure_valid(self):
+        if self.is_valid():
+            return True
+        return await self.async_reauth(self.authtoken)
+
+    async def _async_auth_network(self, mail, password):
+        self.log("Radiko認証を開始します...")
+
+        radiko_session = None
+        if mail and password:
+            radiko_session = await self._async_premium_login(mail, password)
+            if not radiko_session:
+                return None
+
+        started = time.perf_counter()
+        try:
+            res1 = await self.client.request("GET", URL_AUTH1, "auth1", headers=self.AUTH1_HEADERS)
+            res1.raise_for_status()
+        except _request_errors() as e:
+            self.log(f"エラー: Auth1リクエストに失敗しました: {e} ")
+            self._observe_auth("auth1", started, False)
+            return None
+
+        auth1 = self._handle_auth1_response(res1.headers)
+        self._observe_auth("auth1", started, bool(auth1))
+        if not auth1:
+            return None
+        authtoken, partial_key = auth1
+
+        auth2_url, auth2_headers = self._build_auth2_request(authtoken, partial_key, radiko_session)
+        started = time.perf_counter()
+        try:
+            res2 = await self.client.request("GET", auth2_url, "auth2", headers=auth2_headers)
+            res2.raise_for_status()
+        except _request_errors() as e:
+            self.log(f"エラー: Auth2リクエストに失敗しました: {e} ")
+            self._observe_auth("auth2", started, False)
+            return None
+
+        area_id = self._handle_auth2_response(res2.text)
+        self._observe_auth("auth2", started, bool(area_id))
+        if not area_id:
+            return None
+        return authtoken, area_id, radiko_session
+
+    async def _async_premium_login(self, mail, password):
+        started = time.perf_counter()
+        radiko_session = None
+        try:
+            res = await self.client.request(
+                "POST", URL_PREMIUM_LOGIN, "login", data={"mail": mail, "pass": password}
+            )
+            res.raise_for_status()
+            # cookie はクライアントのセッションに自動で入っている
+            radiko_session = self._handle_login_response(res.json())
+            return radiko_session
+        except Exception as e:
+            self.log(f"エラー: Premiumログイン中に例外が発生しました: {e} ")
+            return None
+        finally:
+            self._observe_auth("login", started, bool(radiko_session))
+
+    async def async_logout(self):
+        """Premiumセッションを終了する (認証と同じ接続プールを使う)"""
+        if not self.radiko_session:
+            return
+        self.log("Premiumセッションをログアウトします...")
+        try:
+            await self.client.request(
+                "POST", URL_PREMIUM_LOGOUT, "logout", data={"radiko_session": self.radiko_session}
+            )
+        except _request_errors():
+            self.log("警告: ログアウト処理中にエラーが発生しました。")
+        finally:
+            self.radiko_session = None
+            if self.token_cache:
+                self.token_cache.invalidate(self._cache_account)
+
+
+class AsyncRadikoMetadata(RadikoMetadata):
+    """
+    RadikoMetadata の asyncio 版。キャッシュ・索引・XML解析は RadikoMetadata と共通で、
+    番組表の取得だけをコルーチンとして置き換える。一括取得はスレッドを使わず、
+    max_concurrency 件までのリクエストを1つのイベントループ上で同時に実行する。
+    """
+    def __init__(self, auth, log_callback, guide_cache_dir=GUIDE_CACHE_DIR, max_concurrency=ASYNC_GUIDE_CONCURRENCY):
+        super().__init__(auth, log_callback, guide_cache_dir)
+        self.client = auth.client
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+
+    async def load_stations(self, area_id=None):
+        area_id = area_id or self.auth.area_id
+        if not area_id:
+            return False
+        url = URL_STATION_LIST.format(area_id=area_id)
+        content = await self._fetch_guide_xml(url, ("stations", area_id), "")
+        if content is None:
+            return False
+        return self._apply_station_list(content, area_id)
+
+    async def get_area_programs(self, date_str, area_id=None):
+        area_id = area_id or self.auth.area_id
+        if not area_id:
+            self.log("エラー: エリアIDが未確定のため、エリア一括取得を行えません。")
+            return 0
+        url = URL_AREA_GUIDE.format(date=date_str, area_id=area_id)
+        content = await self._fetch_guide_xml(url, ("area", area_id, date_str), date_str)
+        if content is None:
+            return 0
+        return self._index_area_guide(content, date_str, area_id)
+
+    async def get_area_week(self, dates=None, area_id=None):
+        if dates is None:
+            today = datetime.now()
+            dates = [(today - timedelta(days=i)).strftime('%Y%m%d') for i in range(TIME_FREE_DAYS)]
+
+        await asyncio.gather(*(self.get_area_programs(d, area_id) for d in dates))
+        self.log(f"エリア番組表の一括取得完了: {len(dates)} 日分, {len(self.guide_index)} 番組")
+        return self.guide_index
+
+    async def get_programs(self, station_id, date_str):
+        indexed = self._lookup_programs(station_id, date_str)
+        if indexed is not None:
+            return indexed
+
+        url = URL_STATION_GUIDE.format(date=date_str, station_id=station_id)
+        content = await self._fetch_guide_xml(url, (station_id, date_str), date_str)
+        if content is None:
+            return []
+        return self._parse_station_guide(content)
+
+    async def get_programs_many(self, keys):
+        """(局ID, 日付) の組の一覧をまとめて取得し、同じ順序で番組一覧のリストを返す。"""
+        return await asyncio.gather(*(self.get_programs(station_id, date_str) for station_id, date_str in keys))
+
+    async def _fetch_guide_xml(self, url, cache_key, date_str):
+        content, cached, headers = self._guide_cache_lookup(cache_key, date_str)
+        if content is not None:
+            return content
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self.log(f"番組表APIにアクセス: {url}")
+        try:
+            async with self._semaphore:
+                # 同時実行数の上限で待った時間は所要時間に含めない
+                started = time.perf_counter()
+                stale_token = self.auth.authtoken
+                res = await self.client.request("GET", url, "guide", headers=headers)
+                if res.status_code in AUTH_REJECTED_STATUSES and await self.auth.async_reauth(stale_token):
+                    res = await self.client.request("GET", url, "guide", headers=headers)
+
+            if res.status_code == 304 and cached:
+                self._observe_guide_fetch(cache_key, started, "not_modified")
+                return self._guide_not_modified(cache_key, cached)
+            res.raise_for_status()
+        except _request_errors() as e:
+            self.log(f"エラー: 番組表取得に失敗しました: {e}")
+            self._observe_guide_fetch(cache_key, started, "error")
+            return None
+
+        self._observe_guide_fetch(cache_key, started, "ok", len(res.content))
+        return self._guide_fetched(cache_key, res.content, res.headers)
+
+
+class AsyncPlaylistClient:
+    """
+    タイムフリーのプレイリストを asyncio で解決し、セグメントを取得するクラス。
+    プレイリストの解析は HLSSegmentFetcher と共通。
+    """
+    def __init__(self, auth, log_callback, max_concurrency=HLS_DEFAULT_WORKERS):
+        self.auth = auth
+        self.client = auth.client
+        self.log = log_callback
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.bytes_fetched = 0
+        self.segments_fetched = 0
+
+    def playlist_url(self, station_id, start_time_str, end_time_str):
+        return StreamDownloader.build_playlist_url(station_id, start_time_str, end_time_str)
+
+    def _headers(self):
+        headers = {"X-Radiko-Authtoken": self.auth.authtoken}
+        if self.auth.area_id:
+            headers["X-Radiko-AreaId"] = self.auth.area_id
+        return headers
+
+    async def _get(self, url, endpoint):
+        """認証ヘッダ付きでGETする。トークンが拒否された場合は再認証後に1回だけ再試行する。"""
+        stale_token = self.auth.authtoken
+        res = await self.client.request("GET", url, endpoint, headers=self._headers())
+        if res.status_code in AUTH_REJECTED_STATUSES and await self.auth.async_reauth(stale_token):
+            res = await self.client.request("GET", url, endpoint, headers=self._headers())
+        res.raise_for_status()
+        return res
+
+    async def resolve_segments(self, playlist_url, depth=0):
+        """プレイリストを再帰的に辿り、セグメントURLの一覧を返す。"""
+        if depth > HLSSegmentFetcher.MAX_PLAYLIST_DEPTH:
+            raise ValueError("プレイリストの入れ子が深すぎます。")
+
+        text = (await self._get(playlist_url, "playlist")).text
+        if not text.lstrip().startswith("#EXTM3U"):
+            raise ValueError("M3U8形式ではない応答を受信しました。")
+
+        variants, segments = HLSSegmentFetcher.parse_playlist(text, playlist_url)
+        if segments:
+            return segments
+        if variants:
+            return await self.resolve_segments(variants[0], depth + 1)
+        return []
+
+    async def fetch(self, playlist_url, out_file):
+        """
+        全セグメントを最大 max_concurrency 件ずつ同時に取得し、out_file へ順番通りに書き込む。
+        同時に保持するセグメントは max_concurrency の2倍までに制限する。
+        """
+        segments = await self.resolve_segments(playlist_url)
+        if not segments:
+            self.log("エラー: プレイリストにセグメントが含まれていません。")
+            return False
+
+        window = self.max_concurrency * 2
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch_segment(url):
+            async with semaphore:
+                return (await self._get(url, "segment")).content
+
+        pending = {}
+        next_index = 0
+        try:
+            for index in range(len(segments)):
+                while next_index < len(segments) and next_index < index + window:
+                    pending[next_index] = asyncio.ensure_future(fetch_segment(segments[next_index]))
+                    next_index += 1
+                data = await pending.pop(index)
+                out_file.write(data)
+                self.bytes_fetched += len(data)
+                self.segments_fetched += 1
+        except _request_errors() as e:
+            self.log(f"エラー: セグメント取得中に失敗しました: {e}")
+            return False
+        finally:
+            for task in pending.values():
+                task.cancel()
+        return True
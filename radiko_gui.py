@@ -0,0 +1,859 @@
+"""
+radiko_rec の Tkinter GUI。
+GUIを使わないコマンドライン実行では tkinter を読み込まないよう、radiko_rec.py から分離している。
+"""
+import tkinter as tk
+from tkinter import ttk, messagebox, filedialog
+import time
+import threading
+import os
+from datetime import datetime
+from collections import deque
+
+from radiko_rec import (
+    ENGINE_FFMPEG,
+    ENGINE_NATIVE,
+    JOB_CANCELLED,
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_RUNNING,
+    JOB_STATUS_LABELS,
+    LOGIN_CONFIG_PATH,
+    POSTPROCESS_NORMALIZE,
+    POSTPROCESS_OPUS,
+    POSTPROCESS_STAGES,
+    POSTPROCESS_TAG,
+    QUEUE_DEFAULT_PER_STATION,
+    QUEUE_DEFAULT_RETRIES,
+    QUEUE_DEFAULT_WORKERS,
+    SHARD_MAX,
+    DownloadQueue,
+    PostProcessor,
+    ProgramSearchIndex,
+    RadikoAuth,
+    RadikoMetadata,
+    SessionPool,
+    format_duration,
+    load_accounts,
+    load_login_config,
+    open_log_file,
+)
+
+# ログ表示: 画面に残す最大行数、1回の更新で描画する最大行数、更新間隔(ms)
+LOG_VIEW_MAX_LINES = 1000
+LOG_LINES_PER_TICK = 200
+LOG_POLL_MS = 100
+
+# 番組一覧: 表示する行数 (Treeview には常にこの数の行だけを置き、スクロールでは中身を差し替える)
+PROGRAM_TABLE_ROWS = 12
+PROGRAM_TABLE_WHEEL_ROWS = 3
+WEEKDAY_LABELS = "月火水木金土日"
+
+# 後処理の選択肢 (段階, チェックボックスの表示)
+POSTPROCESS_OPTIONS = (
+    (POSTPROCESS_NORMALIZE, "音量正規化"),
+    (POSTPROCESS_TAG, "タグ付け"),
+    (POSTPROCESS_OPUS, "Opus変換"),
+)
+
+
+class ProgramRow:
+    """番組一覧の1行。表示文字列・絞り込み用文字列・並べ替えキーを事前に計算して保持する。"""
+    __slots__ = ("values", "search_text", "sort_keys", "program")
+
+    def __init__(self, values, search_text, sort_keys, program):
+        self.values = values
+        self.search_text = search_text
+        self.sort_keys = sort_keys
+        self.program = program
+
+
+def build_program_rows(programs, station_names):
+    """
+    番組の一覧から ProgramRow のリストを作る。
+    数千件になるエリア1週間分でもメインスレッドを止めないよう、ワーカースレッドで呼び出す。
+    """
+    rows = []
+    for p in programs:
+        start = p.start_time_str
+        end = p.end_time_str
+        station_name = station_names.get(p.station_id, p.station_id or "")
+        weekday = WEEKDAY_LABELS[p.start_time_dt.weekday()]
+        seconds = int(p.duration_seconds)
+        values = (
+            f"{start[4:6]}/{start[6:8]}({weekday})",
+            f"{start[8:10]}:{start[10:12]}-{end[8:10]}:{end[10:12]}",
+            station_name,
+            p.title,
+            f"{seconds // 3600}:{seconds // 60 % 60:02d}",
+        )
+        search_text = f"{p.title} {station_name} {p.station_id} {p.performer}".lower()
+        rows.append(ProgramRow(values, search_text, (start, start[8:], station_name, p.title, seconds), p))
+    return rows
+
+
+class ProgramTable:
+    """
+    仮想化した番組一覧。ttk.Treeview には表示行数分の行だけを置き、
+    スクロール位置に応じて中身を差し替えるため、数千件でも描画・更新のコストが一定になる。
+    列見出しのクリックで並べ替え、filter_var の入力で絞り込む（複数語はAND）。
+    選択状態は行ではなく番組 (ProgramRow) 単位で保持する。
+    on_filtered は絞り込み・並べ替えで表示対象が変わるたびに呼ばれる (件数表示の更新用)。
+    """
+    COLUMNS = (
+        ("date", "日付", 80), ("time", "時刻", 90), ("station", "局", 110), ("title", "番組", 300), ("duration", "長さ", 50),
+    )
+
+    def __init__(self, parent, filter_var, height=PROGRAM_TABLE_ROWS, on_filtered=None):
+        self.height = height
+        self.filter_var = filter_var
+        self.on_filtered = on_filtered
+        self.rows = []
+        # 並べ替え済みの全行と、絞り込み後に表示対象となる行
+        self._sorted = []
+        self._view = []
+        self._filter_text = ""
+        self._offset = 0
+        # スロットのうち先頭から何行を Treeview に表示しているか
+        self._attached = height
+        self._sort_column = 0
+        self._sort_reverse = False
+        self._selected = set()
+
+        self.tree = ttk.Treeview(
+            parent, columns=[c[0] for c in self.COLUMNS], show="headings", height=height, selectmode="extended"
+        )
+        for index, (column, heading, width) in enumerate(self.COLUMNS):
+            self.tree.heading(column, text=heading, command=lambda i=index: self.sort_by(i))
+            self.tree.column(column, width=width, stretch=(column == "title"))
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar = ttk.Scrollbar(parent, command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self._slots = [self.tree.insert("", tk.END, iid=f"slot{i}") for i in range(height)]
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-PROGRAM_TABLE_WHEEL_ROWS))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(PROGRAM_TABLE_WHEEL_ROWS))
+        filter_var.trace_add("write", lambda *args: self.apply_filter())
+        self._render()
+
+    def set_rows(self, rows):
+        """表示する行を差し替える (build_program_rows の結果を渡す)。"""
+        self.rows = rows
+        self._selected = set()
+        self._sort()
+        self.apply_filter(refresh=True)
+
+    def sort_by(self, column_index):
+        if self._sort_column == column_index:
+            self._sort_reverse = not self._sort_reverse
+        else:
+            self._sort_column = column_index
+            self._sort_reverse = False
+        for index, (column, heading, _) in enumerate(self.COLUMNS):
+            mark = (" ▼" if self._sort_reverse else " ▲") if index == column_index else ""
+            self.tree.heading(column, text=heading + mark)
+        self._sort()
+        self.apply_filter(refresh=True)
+
+    def _sort(self):
+        column = self._sort_column
+        self._sorted = sorted(self.rows, key=lambda row: row.sort_keys[column], reverse=self._sort_reverse)
+
+    def apply_filter(self, refresh=False):
+        """
+        絞り込み文字列に一致する行だけを表示対象にする（事前計算した文字列に対する部分一致のみ）。
+        入力中に文字が追加されただけなら、前回の絞り込み結果からさらに絞り込む。
+        """
+        text = self.filter_var.get().lower()
+        if refresh or not self._filter_text or not text.startswith(self._filter_text):
+            view = self._sorted
+        else:
+            view = self._view
+        for term in text.split():
+            view = [row for row in view if term in row.search_text]
+        self._view = view
+        self._filter_text = text
+        self._offset = 0
+        self._render()
+        if self.on_filtered:
+            self.on_filtered()
+
+    def scroll(self, delta):
+        self._offset = max(0, min(self._offset + delta, len(self._view) - self.height))
+        self._render()
+        return "break"
+
+    def _on_mousewheel(self, event):
+        return self.scroll(-PROGRAM_TABLE_WHEEL_ROWS if event.delta > 0 else PROGRAM_TABLE_WHEEL_ROWS)
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self._offset = int(float(value) * len(self._view))
+            self.scroll(0)
+        elif action == "scroll":
+            self.scroll(int(value) * (self.height if unit == "pages" else 1))
+
+    def _render(self):
+        """表示範囲の行だけをスロットに書き込み、選択状態を復元する。"""
+        visible = self._visible_rows()
+        # 表示行数が足りない場合は余ったスロットを外し、増えた場合は戻す
+        for i in range(len(visible), self._attached):
+            self.tree.detach(self._slots[i])
+        for i in range(self._attached, len(visible)):
+            self.tree.move(self._slots[i], "", i)
+        self._attached = len(visible)
+
+        selection = []
+        for iid, row in zip(self._slots, visible):
+            self.tree.item(iid, values=row.values)
+            if row in self._selected:
+                selection.append(iid)
+        self.tree.selection_set(selection)
+
+        total = len(self._view)
+        if total:
+            self.scrollbar.set(self._offset / total, min(1.0, (self._offset + self.height) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _visible_rows(self):
+        return self._view[self._offset:self._offset + self.height]
+
+    def _on_select(self, event=None):
+        selected_iids = set(self.tree.selection())
+        for iid, row in zip(self._slots, self._visible_rows()):
+            if iid in selected_iids:
+                self._selected.add(row)
+            else:
+                self._selected.discard(row)
+
+    def selected_programs(self):
+        """選択中の番組を表示順で返す（スクロールで見えなくなった行も含む）。"""
+        return [row.program for row in self._view if row in self._selected]
+
+    def __len__(self):
+        return len(self._view)
+
+
+class RadikoGUI:
+    def __init__(self, master):
+        self.master = master
+        master.title("Radiko Time-Free 高速ダウンローダー")
+        
+        # ログメッセージをGUIに表示するまで溜めておくリングバッファ
+        # (描画が追いつかない場合は古い行から捨て、メモリ使用量を一定に保つ)
+        self.log_buffer = deque(maxlen=LOG_VIEW_MAX_LINES)
+        self._log_dropped = 0
+        # 複数のワーカースレッドから追加されるため、バッファと省略した行数をまとめて保護する
+        self._log_lock = threading.Lock()
+        # 全てのログはローテーション付きのファイルに残す
+        self.log_file = open_log_file()
+
+        # モデル層の初期化
+        self.auth = RadikoAuth(self.add_log)
+        self.metadata = RadikoMetadata(self.auth, self.add_log)
+        self.search_index = ProgramSearchIndex()
+        self.search_results = []
+        # 後処理はダウンロードとは別のプロセスプールで実行する
+        self.postprocessor = PostProcessor(self.add_log)
+        self.download_queue = DownloadQueue(
+            self.auth, self.add_log, on_update=self._on_job_update, postprocessor=self.postprocessor,
+            on_limit_change=self._on_limit_change,
+        )
+        self.station_vars = {} # ステーションIDと番組情報の保持用
+        self.program_station_id = None
+
+        # ワーカースレッドから通知されたジョブの更新は、まとめて定期的に画面へ反映する
+        self._dirty_jobs = set()
+        self._dirty_lock = threading.Lock()
+
+        # GUIコンポーネントの構築
+        self._create_widgets(master)
+        
+        # ログの定期的な更新を開始
+        self.master.after(LOG_POLL_MS, self._process_log_queue)
+        
+        # アプリケーション終了時にログアウト処理を確実に実行
+        master.protocol("WM_DELETE_WINDOW", self._on_closing)
+
+    def _load_login_from_yaml(self):
+        """
+        プログラムと同じディレクトリにある login.yaml から
+        mail / password を読み込んで入力欄を初期化する。
+        ファイルが無い・読めない場合は何もしない。
+        """
+        mail, password = load_login_config(self.add_log)
+
+        # 読み込めたものだけ反映
+        if mail:
+            self.mail_entry.delete(0, tk.END)
+            self.mail_entry.insert(0, mail)
+        if password:
+            self.pass_entry.delete(0, tk.END)
+            self.pass_entry.insert(0, password)
+
+    def _create_widgets(self, master):
+        # メインフレーム
+        main_frame = ttk.Frame(master, padding="10")
+        main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        
+        # --- 認証セクション ---
+        auth_frame = ttk.LabelFrame(main_frame, text="認証情報 (Premium オプション)", padding="10")
+        auth_frame.grid(row=0, column=0, sticky=(tk.W, tk.E), pady=5)
+        
+        ttk.Label(auth_frame, text="Mail:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
+        self.mail_entry = ttk.Entry(auth_frame, width=30)
+        self.mail_entry.grid(row=0, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+        
+        ttk.Label(auth_frame, text="Password:").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
+        self.pass_entry = ttk.Entry(auth_frame, width=30, show="*")
+        self.pass_entry.grid(row=1, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+        
+        self.auth_button = ttk.Button(auth_frame, text="認証 & 局リスト取得", command=self._start_auth_thread)
+        self.auth_button.grid(row=2, column=0, columnspan=2, pady=10)
+
+        # --- 選択セクション ---
+        select_frame = ttk.LabelFrame(main_frame, text="番組選択", padding="10")
+        select_frame.grid(row=1, column=0, sticky=(tk.W, tk.E), pady=5)
+        
+        # 放送局選択
+        ttk.Label(select_frame, text="放送局:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
+        self.station_var = tk.StringVar(master)
+        self.station_dropdown = ttk.Combobox(select_frame, textvariable=self.station_var, state='disabled')
+        self.station_dropdown.grid(row=0, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+        self.station_dropdown.bind('<<ComboboxSelected>>', self._load_programs)
+
+        # 日付選択 (簡易版として今日の日付)
+        ttk.Label(select_frame, text="日付 (YYYYMMDD):").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
+        self.date_entry = ttk.Entry(select_frame, width=10)
+        self.date_entry.insert(0, datetime.now().strftime('%Y%m%d'))
+        self.date_entry.grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
+        self.date_entry.bind('<Return>', self._load_programs)
+        
+        self.load_button = ttk.Button(select_frame, text="番組表ロード", command=self._load_programs)
+        self.load_button.grid(row=1, column=2, padx=5, pady=5)
+
+        # エリア内全局・タイムフリー期間の番組表を一括取得
+        self.bulk_button = ttk.Button(select_frame, text="エリア1週間分を一括取得", command=self._load_area_week, state='disabled')
+        self.bulk_button.grid(row=1, column=3, padx=5, pady=5)
+
+        # 番組一覧の絞り込み (入力のたびに即時反映)
+        ttk.Label(select_frame, text="絞り込み:").grid(row=2, column=0, padx=5, pady=5, sticky=tk.W)
+        self.filter_var = tk.StringVar()
+        ttk.Entry(select_frame, textvariable=self.filter_var, width=30).grid(
+            row=2, column=1, columnspan=2, padx=5, pady=5, sticky=(tk.W, tk.E)
+        )
+        self.program_count_label = ttk.Label(select_frame, text="")
+        self.program_count_label.grid(row=2, column=3, padx=5, pady=5, sticky=tk.E)
+
+        # 番組一覧 (仮想化したTreeview。列見出しのクリックで並べ替え)
+        list_frame = ttk.Frame(select_frame)
+        list_frame.grid(row=3, column=0, columnspan=4, pady=10, sticky=(tk.W, tk.E))
+        # 件数は絞り込みの後に更新する (変数の trace は登録と逆順に呼ばれるため、別の trace にはしない)
+        self.program_table = ProgramTable(list_frame, self.filter_var, on_filtered=self._update_program_count)
+        
+        # --- 番組検索セクション ---
+        search_frame = ttk.LabelFrame(main_frame, text="番組検索 (全局・タイムフリー期間)", padding="10")
+        search_frame.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=5)
+
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=40)
+        self.search_entry.grid(row=0, column=0, padx=5, pady=5, sticky=(tk.W, tk.E))
+        self.search_entry.bind('<Return>', self._search_programs)
+        ttk.Button(search_frame, text="検索", command=self._search_programs).grid(row=0, column=1, padx=5, pady=5)
+        self.index_button = ttk.Button(search_frame, text="索引更新", command=self._update_search_index, state='disabled')
+        self.index_button.grid(row=0, column=2, padx=5, pady=5)
+
+        result_frame = ttk.Frame(search_frame)
+        result_frame.grid(row=1, column=0, columnspan=3, pady=5, sticky=(tk.W, tk.E))
+        self.search_list = tk.Listbox(result_frame, height=6, width=60, selectmode=tk.EXTENDED)
+        self.search_list.pack(side="left", fill="both", expand=True)
+        search_scrollbar = ttk.Scrollbar(result_frame, command=self.search_list.yview)
+        search_scrollbar.pack(side="right", fill="y")
+        self.search_list.config(yscrollcommand=search_scrollbar.set)
+
+        ttk.Button(
+            search_frame, text="検索結果をキューに追加", command=self._enqueue_search_results
+        ).grid(row=2, column=0, columnspan=3, pady=5, sticky=tk.W)
+
+        # --- ダウンロードセクション ---
+        download_frame = ttk.LabelFrame(main_frame, text="ダウンロード", padding="10")
+        download_frame.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=5)
+        
+        ttk.Label(download_frame, text="保存先:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
+        self.output_path_var = tk.StringVar(value=os.path.join(os.path.expanduser('~'), 'radiko_recordings'))
+        self.output_entry = ttk.Entry(download_frame, textvariable=self.output_path_var, width=40)
+        self.output_entry.grid(row=0, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+        ttk.Button(download_frame, text="参照", command=self._select_output_dir).grid(row=0, column=2, padx=5, pady=5)
+
+        # ダウンロードエンジン選択 (ネイティブ並列取得 or FFmpeg直接読み込み)
+        self.native_engine_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            download_frame,
+            text="ネイティブ並列取得 (FFmpegはM4A化のみ)",
+            variable=self.native_engine_var,
+        ).grid(row=1, column=0, columnspan=2, pady=5, sticky=tk.W)
+
+        # 時間範囲の分割数 (0 の場合は番組の長さから自動決定)
+        shard_frame = ttk.Frame(download_frame)
+        shard_frame.grid(row=1, column=2, pady=5, sticky=tk.E)
+        ttk.Label(shard_frame, text="分割数 (0=自動):").pack(side="left")
+        self.shards_var = tk.IntVar(value=1)
+        ttk.Spinbox(shard_frame, from_=0, to=SHARD_MAX, width=3, textvariable=self.shards_var).pack(side="left")
+
+        # 同時実行数と局ごとの同時実行数
+        limit_frame = ttk.Frame(download_frame)
+        limit_frame.grid(row=2, column=0, columnspan=3, pady=5, sticky=tk.W)
+        ttk.Label(limit_frame, text="同時実行数:").pack(side="left")
+        self.workers_var = tk.IntVar(value=QUEUE_DEFAULT_WORKERS)
+        ttk.Spinbox(
+            limit_frame, from_=1, to=16, width=3, textvariable=self.workers_var, command=self._apply_queue_limits
+        ).pack(side="left", padx=(0, 10))
+        ttk.Label(limit_frame, text="局ごとの上限:").pack(side="left")
+        self.per_station_var = tk.IntVar(value=QUEUE_DEFAULT_PER_STATION)
+        ttk.Spinbox(
+            limit_frame, from_=1, to=8, width=3, textvariable=self.per_station_var, command=self._apply_queue_limits
+        ).pack(side="left", padx=(0, 10))
+        ttk.Label(limit_frame, text="再試行回数:").pack(side="left")
+        self.retries_var = tk.IntVar(value=QUEUE_DEFAULT_RETRIES)
+        ttk.Spinbox(limit_frame, from_=0, to=5, width=3, textvariable=self.retries_var).pack(side="left", padx=(0, 10))
+        self.adaptive_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            limit_frame, text="同時数を自動調整", variable=self.adaptive_var, command=self._toggle_adaptive
+        ).pack(side="left")
+        
+        # ダウンロード完了後の後処理
+        post_frame = ttk.Frame(download_frame)
+        post_frame.grid(row=3, column=0, columnspan=3, pady=5, sticky=tk.W)
+        ttk.Label(post_frame, text="後処理:").pack(side="left")
+        self.postprocess_vars = {}
+        for stage, label in POSTPROCESS_OPTIONS:
+            self.postprocess_vars[stage] = tk.BooleanVar(value=False)
+            ttk.Checkbutton(post_frame, text=label, variable=self.postprocess_vars[stage]).pack(side="left", padx=(0, 10))
+
+        self.download_button = ttk.Button(download_frame, text="選択番組をキューに追加", command=self._enqueue_selected_programs, state='disabled')
+        self.download_button.grid(row=4, column=0, columnspan=2, pady=10, sticky=tk.W)
+
+        # 全体の進捗バー
+        self.progress_var = tk.DoubleVar()
+        self.progress_bar = ttk.Progressbar(download_frame, variable=self.progress_var, maximum=100)
+        self.progress_bar.grid(row=5, column=0, columnspan=3, sticky=(tk.W, tk.E))
+
+        # --- キューセクション ---
+        queue_frame = ttk.LabelFrame(main_frame, text="ダウンロードキュー", padding="10")
+        queue_frame.grid(row=4, column=0, sticky=(tk.W, tk.E), pady=5)
+
+        columns = ("id", "station", "title", "status", "progress", "speed", "eta")
+        self.queue_tree = ttk.Treeview(queue_frame, columns=columns, show="headings", height=6, selectmode="extended")
+        for column, heading, width in (
+            ("id", "#", 40), ("station", "局", 60), ("title", "番組", 260), ("status", "状態", 70), ("progress", "進捗", 60),
+            ("speed", "速度", 60), ("eta", "残り", 70),
+        ):
+            self.queue_tree.heading(column, text=heading)
+            self.queue_tree.column(column, width=width, stretch=(column == "title"))
+        self.queue_tree.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E))
+        queue_scrollbar = ttk.Scrollbar(queue_frame, command=self.queue_tree.yview)
+        queue_scrollbar.grid(row=0, column=2, sticky=(tk.N, tk.S))
+        self.queue_tree.config(yscrollcommand=queue_scrollbar.set)
+
+        self.stop_button = ttk.Button(queue_frame, text="中断", command=self._stop_download)
+        self.stop_button.grid(row=1, column=0, pady=5, sticky=tk.W)
+        self.retry_button = ttk.Button(queue_frame, text="再試行", command=self._retry_download)
+        self.retry_button.grid(row=1, column=1, pady=5, sticky=tk.E)
+        
+        # --- ログセクション ---
+        log_frame = ttk.LabelFrame(main_frame, text="ログ", padding="5")
+        log_frame.grid(row=5, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
+        self.log_text = tk.Text(log_frame, height=8, width=70, state='disabled')
+        self.log_text.pack(fill="both", expand=True)
+        
+        # グリッドの拡張設定
+        main_frame.columnconfigure(0, weight=1)
+        select_frame.columnconfigure(1, weight=1)
+        search_frame.columnconfigure(0, weight=1)
+        download_frame.columnconfigure(1, weight=1)
+        queue_frame.columnconfigure(0, weight=1)
+        log_frame.columnconfigure(0, weight=1)
+        
+        # login.yaml があれば、メール・パスワードを自動入力
+        self._load_login_from_yaml()
+    # --- Controller/Thread管理メソッド ---
+
+    def add_log(self, message):
+        """ログを追加する (任意のスレッドから呼び出し可)。画面への描画は _process_log_queue がまとめて行う。"""
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._log_lock:
+            if len(self.log_buffer) == self.log_buffer.maxlen:
+                self._log_dropped += 1
+            self.log_buffer.append(f"{timestamp} {message}\n")
+        if self.log_file:
+            self.log_file.info(message)
+
+    def _process_log_queue(self):
+        """
+        溜まったログを最大 LOG_LINES_PER_TICK 行ずつ1回の insert で描画し、
+        表示中の行数が LOG_VIEW_MAX_LINES を超えた分は先頭から削除する。
+        """
+        lines = []
+        with self._log_lock:
+            while self.log_buffer and len(lines) < LOG_LINES_PER_TICK:
+                lines.append(self.log_buffer.popleft())
+            dropped = 0
+            if lines:
+                dropped, self._log_dropped = self._log_dropped, 0
+
+        if lines:
+            if dropped:
+                lines.insert(0, f"... {dropped} 行のログを省略しました (全てのログはログファイルに記録されています)\n")
+
+            # 最下部を表示中の場合だけ自動でスクロールする
+            at_bottom = self.log_text.yview()[1] >= 0.999
+            self.log_text.config(state='normal')
+            self.log_text.insert(tk.END, "".join(lines))
+            line_count = int(self.log_text.index('end-1c').split('.')[0])
+            if line_count > LOG_VIEW_MAX_LINES:
+                self.log_text.delete('1.0', f'{line_count - LOG_VIEW_MAX_LINES + 1}.0')
+            self.log_text.config(state='disabled')
+            if at_bottom:
+                self.log_text.see(tk.END)
+
+        self.master.after(LOG_POLL_MS, self._process_log_queue)
+
+    def _start_auth_thread(self):
+        """認証処理をバックグラウンドスレッドで開始する。"""
+        self.auth_button.config(state='disabled')
+        self.add_log("認証スレッドを開始します...")
+        
+        mail = self.mail_entry.get()
+        password = self.pass_entry.get()
+        
+        # 認証処理をメインスレッドをブロックしないようにスレッドで実行
+        thread = threading.Thread(target=self._run_auth, args=(mail, password))
+        thread.start()
+
+    def _run_auth(self, mail, password):
+        """認証処理の実体 (スレッド内実行)"""
+        success = self.auth.auth(mail, password)
+        if success:
+            # エリアの局リストを取得 (失敗時は既定の局リストを使う)
+            self.metadata.load_stations()
+            self._start_session_pool()
+        
+        # メインスレッドに戻ってGUIを更新
+        self.master.after(0, lambda: self._update_gui_after_auth(success))
+
+    def _start_session_pool(self):
+        """
+        login.yaml に複数のアカウント (accounts) があればセッションプールを作り、
+        各アカウントのエリアの局を局リストに加える。以降のダウンロードは局ごとにセッションを使い分ける。
+        (認証スレッド内実行)
+        """
+        if self.download_queue.session_pool or not os.path.exists(LOGIN_CONFIG_PATH):
+            return
+        try:
+            accounts = load_accounts(LOGIN_CONFIG_PATH)
+        except Exception as e:
+            self.add_log(f"警告: アカウント一覧の読み込みに失敗しました: {e}")
+            return
+        if len(accounts) < 2:
+            return
+
+        # 画面で認証したアカウントは self.auth をそのまま使い、二重にログインしない
+        session_pool = SessionPool(accounts, self.add_log, auth=self.auth)
+        if session_pool.start():
+            self.metadata.STATIONS = {**session_pool.stations(), **self.metadata.get_stations()}
+            self.download_queue.session_pool = session_pool
+
+    def _update_gui_after_auth(self, success):
+        """認証結果に基づいてGUIの状態を更新する。"""
+        self.auth_button.config(state='normal')
+        if success:
+            self.add_log("認証完了。局リストを更新します。")
+            stations = self.metadata.get_stations()
+            station_names = list(stations.values())
+            self.station_vars = stations
+            self.postprocessor.station_names = stations
+            
+            self.station_dropdown['values'] = station_names
+            self.station_dropdown.config(state='readonly')
+            self.bulk_button.config(state='normal')
+            self.index_button.config(state='normal')
+            # 検索インデックスを裏で差分更新する
+            self._update_search_index()
+            if station_names:
+                self.station_var.set(station_names[0])
+                self._load_programs()
+        else:
+            messagebox.showerror("認証失敗", "Radiko認証に失敗しました。ログを確認してください。")
+            self.station_dropdown.config(state='disabled')
+            self.download_button.config(state='disabled')
+
+    def _load_programs(self, event=None):
+        """番組表ロードをメインスレッドをブロックしないようにスレッドで実行"""
+        station_name = self.station_var.get()
+        date_str = self.date_entry.get()
+        
+        if not station_name or not date_str or not self.auth.authtoken:
+            return
+
+        self.load_button.config(state='disabled')
+        self.add_log(f"番組表をロード中 ({station_name}, {date_str})...")
+        
+        thread = threading.Thread(target=self._run_load_programs, args=(station_name, date_str))
+        thread.start()
+
+    def _load_area_week(self):
+        """エリア1週間分の番組表一括取得をスレッドで実行"""
+        self.bulk_button.config(state='disabled')
+        self.add_log("エリア内全局の番組表を一括取得しています...")
+        thread = threading.Thread(target=self._run_load_area_week)
+        thread.start()
+
+    def _run_load_area_week(self):
+        """番組表一括取得の実体 (スレッド内実行)"""
+        guide_index = self.metadata.get_area_week()
+
+        # エリア内全局・全日付の番組を一覧に表示する (表示用の行もこのスレッドで作っておく)
+        programs = []
+        for station_id in self.station_vars:
+            for date_str in guide_index.dates(station_id):
+                programs.extend(guide_index.get(station_id, date_str) or [])
+        rows = build_program_rows(programs, self.station_vars)
+
+        def finish():
+            self.bulk_button.config(state='normal')
+            self._update_gui_after_program_load(None, rows)
+        self.master.after(0, finish)
+
+    def _run_load_programs(self, station_name, date_str):
+        """番組表ロードの実体 (スレッド内実行)"""
+        station_id = next((k for k, v in self.station_vars.items() if v == station_name), None)
+        programs = self.metadata.get_programs(station_id, date_str)
+        for program in programs:
+            program.station_id = program.station_id or station_id
+        rows = build_program_rows(programs, self.station_vars)
+
+        # メインスレッドに戻ってGUIを更新
+        self.master.after(0, lambda: self._update_gui_after_program_load(station_id, rows))
+
+    def _update_gui_after_program_load(self, station_id, rows):
+        """番組表ロード結果 (build_program_rows で作成した行) を番組一覧に表示する。"""
+        self.load_button.config(state='normal')
+        self.program_station_id = station_id
+        self.program_table.set_rows(rows)
+
+        if not rows:
+            self.add_log("番組情報がありませんでした。")
+            self.download_button.config(state='disabled')
+            return
+
+        self.add_log(f"{len(rows)} 件の番組をリストに表示しました。")
+        self.download_button.config(state='normal')
+
+    def _update_program_count(self):
+        shown = len(self.program_table)
+        total = len(self.program_table.rows)
+        self.program_count_label.config(text=f"{shown} / {total} 件" if shown != total else f"{total} 件")
+
+    def _select_output_dir(self):
+        """保存先ディレクトリを選択する"""
+        folder_selected = filedialog.askdirectory(initialdir=self.output_path_var.get())
+        if folder_selected:
+            self.output_path_var.set(folder_selected)
+
+    def _enqueue_selected_programs(self):
+        """
+        リストで選択された番組（複数可）をダウンロードキューに追加する。
+        局や日付を切り替えて追加を繰り返すことで、複数局・複数日の番組をまとめて登録できる。
+        """
+        programs = self.program_table.selected_programs()
+        if not programs:
+            messagebox.showerror("エラー", "ダウンロードする番組を選択してください。")
+            return
+
+        for program in programs:
+            program.station_id = program.station_id or self.program_station_id
+        if not all(program.station_id for program in programs):
+            messagebox.showerror("エラー", "放送局IDが見つかりません。")
+            return
+        self._enqueue_programs(programs)
+
+    def _enqueue_search_results(self):
+        """検索結果で選択された番組（複数可）をダウンロードキューに追加する。"""
+        selected_indices = self.search_list.curselection()
+        if not selected_indices:
+            messagebox.showerror("エラー", "ダウンロードする番組を選択してください。")
+            return
+        self._enqueue_programs([self.search_results[i] for i in selected_indices])
+
+    def _enqueue_programs(self, programs):
+        """番組（station_id を持つ Program）をダウンロード設定に従ってキューに追加する。"""
+        output_dir = self.output_path_var.get()
+        engine = ENGINE_NATIVE if self.native_engine_var.get() else ENGINE_FFMPEG
+        try:
+            shards = self.shards_var.get() or None
+            max_retries = self.retries_var.get()
+        except tk.TclError:
+            shards = 1
+            max_retries = QUEUE_DEFAULT_RETRIES
+
+        postprocess = tuple(stage for stage in POSTPROCESS_STAGES if self.postprocess_vars[stage].get())
+
+        self._apply_queue_limits()
+        for program in programs:
+            filename = f"{program.station_id}_{program.start_time_str}_{program.end_time_str}.m4a"
+            output_path = os.path.join(output_dir, filename)
+            self.download_queue.submit(
+                program.station_id, program, output_path, engine=engine, shards=shards, max_retries=max_retries,
+                postprocess=postprocess,
+            )
+
+    def _update_search_index(self):
+        """検索インデックスの差分更新をスレッドで実行"""
+        self.index_button.config(state='disabled')
+        thread = threading.Thread(target=self._run_update_search_index, daemon=True)
+        thread.start()
+
+    def _run_update_search_index(self):
+        """検索インデックス更新の実体 (スレッド内実行)"""
+        try:
+            self.search_index.prune()
+            self.search_index.update_from_metadata(self.metadata)
+        except Exception as e:
+            self.add_log(f"警告: 番組検索インデックスの更新に失敗しました: {e}")
+        self.master.after(0, lambda: self.index_button.config(state='normal'))
+
+    def _search_programs(self, event=None):
+        """検索語で番組検索インデックスを検索し、結果をリストに表示する。"""
+        query = self.search_var.get()
+        start = time.perf_counter()
+        self.search_results = self.search_index.search(query)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        self.search_list.delete(0, tk.END)
+        for p in self.search_results:
+            station_name = self.station_vars.get(p.station_id, p.station_id)
+            self.search_list.insert(
+                tk.END,
+                f"{p.start_time_dt:%m/%d %H:%M}-{p.end_time_dt:%H:%M} [{station_name}] {p.title}",
+            )
+        self.add_log(f"番組検索 '{query}': {len(self.search_results)} 件 ({elapsed_ms:.1f} ms)")
+
+    def _apply_queue_limits(self):
+        """同時実行数の設定をキューに反映する。"""
+        try:
+            self.download_queue.set_limits(self.workers_var.get(), self.per_station_var.get())
+        except tk.TclError:
+            pass
+
+    def _toggle_adaptive(self):
+        """同時実行数の自動調整を切り替える。無効にした場合は画面の設定値に戻す。"""
+        enabled = self.adaptive_var.get()
+        self.download_queue.set_adaptive(enabled)
+        if not enabled:
+            self._apply_queue_limits()
+        elif not self.native_engine_var.get():
+            self.add_log("警告: 自動調整はネイティブ取得でのみ有効です。FFmpegエンジンでは同時実行数は調整されません。")
+
+    def _on_limit_change(self, limit, reason):
+        """自動調整で同時実行数が変わった通知 (ワーカースレッドから呼ばれる)"""
+        self.master.after(0, self.workers_var.set, limit)
+
+    def _on_job_update(self, job):
+        """ジョブ更新の通知 (ワーカースレッドから呼ばれる)"""
+        with self._dirty_lock:
+            schedule = not self._dirty_jobs
+            self._dirty_jobs.add(job.job_id)
+        if schedule:
+            # 進捗通知が集中しても、画面更新は一定間隔にまとめる
+            self.master.after(200, self._refresh_queue_view)
+
+    def _refresh_queue_view(self):
+        """更新されたジョブの行と全体の進捗バーを更新する。"""
+        with self._dirty_lock:
+            job_ids = self._dirty_jobs
+            self._dirty_jobs = set()
+
+        for job_id in sorted(job_ids):
+            job = self.download_queue.jobs[job_id]
+            telemetry = job.telemetry
+            eta = telemetry.eta_seconds if telemetry and job.status == JOB_RUNNING else None
+            values = (
+                job.job_id,
+                job.station_id,
+                job.title,
+                self._job_status_label(job),
+                f"{job.progress:.0f}%",
+                f"{telemetry.speed:.1f}x" if telemetry else "",
+                format_duration(eta) if eta is not None else "",
+            )
+            iid = str(job_id)
+            if self.queue_tree.exists(iid):
+                self.queue_tree.item(iid, values=values)
+            else:
+                self.queue_tree.insert("", tk.END, iid=iid, values=values)
+
+        active = [job for job in self.download_queue.jobs.values() if job.status != JOB_CANCELLED]
+        if active:
+            self.progress_var.set(sum(job.progress for job in active) / len(active))
+
+    @staticmethod
+    def _job_status_label(job):
+        """完了したジョブは後処理の状態も表示する。"""
+        if job.status == JOB_DONE and job.postprocess:
+            result = job.postprocess_result
+            if result is None:
+                return "後処理中"
+            if result["error"]:
+                return "後処理失敗"
+        return JOB_STATUS_LABELS[job.status]
+
+    def _selected_job_ids(self):
+        return [int(iid) for iid in self.queue_tree.selection()]
+
+    def _stop_download(self):
+        """中断ボタンのコマンド。選択が無い場合は全ての未完了ジョブを中断する。"""
+        job_ids = self._selected_job_ids() or list(self.download_queue.jobs)
+        for job_id in job_ids:
+            self.download_queue.cancel(job_id)
+
+    def _retry_download(self):
+        """再試行ボタンのコマンド。選択が無い場合は全ての失敗ジョブを再試行する。"""
+        job_ids = self._selected_job_ids() or [
+            job.job_id for job in self.download_queue.jobs.values() if job.status == JOB_FAILED
+        ]
+        for job_id in job_ids:
+            self.download_queue.retry(job_id)
+
+    def _on_closing(self):
+        """アプリケーション終了時のクリーンアップ処理"""
+        # プレミアムログインしていた場合、ログアウトを試みる
+        self.auth.logout() 
+        if self.download_queue.session_pool:
+            self.download_queue.session_pool.close()
+        # 実行中・待機中のダウンロードがあれば全て停止
+        self.download_queue.shutdown()
+        # 未着手の後処理は取り消す (実行中の変換は完了を待たない)
+        self.postprocessor.shutdown(wait=False, cancel_pending=True)
+        self.search_index.close()
+        self.master.destroy()
+
+
+def run_gui():
+    """GUIを起動し、ウィンドウが閉じられるまでメインループを回す。"""
+    # OSに応じて適切なスケーリングを有効にする
+    try:
+        from ctypes import windll
+        windll.shcore.SetProcessDpiAwareness(1)
+    except:
+        pass # Linux/macOSでは無視
+
+    root = tk.Tk()
+    RadikoGUI(root)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    run_gui()
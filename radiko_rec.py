@@ -1,16 +1,33 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import requests
+import time
+
+# 起動時刻 (CLIで起動から最初の認証リクエストまでの時間を計測する)
+_PROCESS_START = time.perf_counter()
+
 import base64
+import bisect
 import hashlib
-import time
+import json
 import subprocess
+import sys
+import tempfile
 import threading
 import os
-from datetime import datetime, timedelta
-import queue
+import random
+from datetime import datetime, timedelta, timezone
+import io
+import re
+import sqlite3
+import struct
+import weakref
 import xml.etree.ElementTree as ET
-import yaml
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urljoin
+
+# tkinter / requests / yaml は必要になった時点で読み込む。
+# GUIを使わないヘッドレス環境でも動作し、CLIの起動時間を短く保つため。
 
 # --- 設定と定数 ---
 
@@ -19,725 +36,5902 @@ import yaml
 AUTHKEY_VALUE = b"bcd151073c03b352e1ef2fd66c32209da9ca0afa"
 
 # Radiko API エンドポイント
-URL_AUTH1 = "https://radiko.jp/v2/api/auth1"
-URL_AUTH2 = "https://radiko.jp/v2/api/auth2"
-URL_PREMIUM_LOGIN = "https://radiko.jp/v4/api/member/login"
-URL_PREMIUM_LOGOUT = "https://radiko.jp/v4/api/member/logout"
+# 環境変数 RADIKO_BASE_URL で接続先を差し替えられる (benchmarks/mock_radiko.py のモックサーバー等)
+RADIKO_BASE_URL = os.environ.get("RADIKO_BASE_URL", "https://radiko.jp").rstrip("/")
+URL_AUTH1 = f"{RADIKO_BASE_URL}/v2/api/auth1"
+URL_AUTH2 = f"{RADIKO_BASE_URL}/v2/api/auth2"
+URL_PREMIUM_LOGIN = f"{RADIKO_BASE_URL}/v4/api/member/login"
+URL_PREMIUM_LOGOUT = f"{RADIKO_BASE_URL}/v4/api/member/logout"
+URL_TS_PLAYLIST = f"{RADIKO_BASE_URL}/v2/api/ts/playlist.m3u8"
+URL_STATION_LIST = RADIKO_BASE_URL + "/v3/station/list/{area_id}.xml"
+URL_STATION_GUIDE = RADIKO_BASE_URL + "/v3/program/station/date/{date}/{station_id}.xml"
+URL_AREA_GUIDE = RADIKO_BASE_URL + "/v3/program/date/{date}/{area_id}.xml"
+# ライブ配信のプレイリストは別のホストから配信される。RADIKO_BASE_URL を差し替えた場合は同じ接続先を使う
+RADIKO_LIVE_BASE_URL = os.environ.get(
+    "RADIKO_LIVE_BASE_URL",
+    RADIKO_BASE_URL if "RADIKO_BASE_URL" in os.environ else "https://si-f-radiko.smartstream.ne.jp",
+).rstrip("/")
+URL_LIVE_PLAYLIST = f"{RADIKO_LIVE_BASE_URL}/so/playlist.m3u8"
 
-# --- 認証とメタデータ処理クラス ---
+# キャッシュディレクトリ（認証トークン等を保存する）
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'radiko_rec')
+AUTH_CACHE_PATH = os.path.join(CACHE_DIR, 'auth_token.json')
 
-class RadikoAuth:
-    """
-    Radikoの多段階認証とPartialKey生成を管理するクラス。
-    シェルスクリプトのdd/base64/curlロジックをPythonネイティブで再現する 。
-    """
-    def __init__(self, log_callback):
-        self.authtoken = None
-        self.area_id = None
-        self.radiko_session = None
-        self.log = log_callback
-        self.session = requests.Session()
+# 認証トークンの有効期間(秒)と、期限切れ前に再認証を行う余裕(秒)
+AUTH_TOKEN_TTL = 60 * 60
+AUTH_TOKEN_REFRESH_MARGIN = 5 * 60
 
-    def _generate_partial_key(self, keyoffset, keylength):
-        """
-        Auth1で取得したオフセットと長さに基づき、静的キーからPartialKeyを生成する。
-        これはrec_radiko_tsにおけるdd/base64コマンド処理を代替する 。
-        """
-        try:
-            offset = int(keyoffset)
-            length = int(keylength)
-            
-            # Pythonのバイトスライスでddコマンドのロジックを再現
-            partial_key_bytes = AUTHKEY_VALUE[offset : offset + length]
-            
-            # Base64エンコードでbase64コマンドのロジックを再現
-            partial_key = base64.b64encode(partial_key_bytes).decode('utf-8')
-            return partial_key
-        except Exception as e:
-            self.log(f"エラー: PartialKey生成中に失敗しました: {e}")
-            return None
+# 番組表キャッシュ
+GUIDE_CACHE_DIR = os.path.join(CACHE_DIR, 'guide')
+# キャッシュ全体の上限サイズ(バイト)。超えた場合は参照が古いものから削除する
+GUIDE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# 当日以降の番組表を再検証せずに使う期間(秒)
+GUIDE_CACHE_FRESH_SECONDS = 10 * 60
+# Radikoの放送日は翌朝5時に切り替わる（番組表の日付は5:00〜翌4:59を指す）
+RADIKO_DAY_START_HOUR = 5
+# タイムフリーで聴取できる日数と、週単位の一括取得時の同時リクエスト数
+TIME_FREE_DAYS = 7
+GUIDE_BULK_WORKERS = 4
 
-    def auth(self, mail=None, password=None):
-        """
-        Radiko認証フロー（Auth1 -> Premium Login -> Auth2）を実行する。
-        """
-        self.log("Radiko認証を開始します...")
-        
-        # 0. プレミアムログイン (オプション)
-        if mail and password:
-            if not self._premium_login(mail, password):
-                return False
-        
-        # 1. Auth1: AuthToken, KeyOffset, KeyLengthの取得
-    # Auth1
-        auth1_headers = {
-            "User-Agent": "curl/7.52.1",
-            "Accept": "*/*",
-            "X-Radiko-App": "pc_html5",
-            "X-Radiko-App-Version": "0.0.1",
-            "X-Radiko-Device": "pc",
-            "X-Radiko-User": "dummy_user",
-        }
+# 番組検索インデックス (SQLite)
+PROGRAM_INDEX_PATH = os.path.join(CACHE_DIR, 'programs.sqlite3')
+PROGRAM_SEARCH_LIMIT = 200
 
-        try:
-            res1 = self.session.get(URL_AUTH1, headers=auth1_headers, timeout=5)
-            res1.raise_for_status()
-        except requests.RequestException as e:
-            self.log(f"エラー: Auth1リクエストに失敗しました: {e} ")
-            return False
+# ログファイル (上限サイズでローテーションし、指定世代数まで残す)
+LOG_FILE_PATH = os.path.join(CACHE_DIR, 'radiko_rec.log')
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUP_COUNT = 3
 
-        # AuthTokenとKey情報をレスポンスヘッダから抽出 
-        self.authtoken = res1.headers.get("X-Radiko-AuthToken")
-        keyoffset = res1.headers.get("X-Radiko-KeyOffset")
-        keylength = res1.headers.get("X-Radiko-KeyLength")
+# 認証トークンが拒否されたことを示すHTTPステータスと、FFmpegのエラー出力上の表現
+AUTH_REJECTED_STATUSES = (401, 403)
+FFMPEG_AUTH_REJECTED_PATTERN = re.compile(r"Server returned 40[13]")
 
-        if not all([self.authtoken, keyoffset, keylength]):
-            self.log("エラー: Auth1応答ヘッダから必須情報(Token, Offset, Length)が取得できませんでした。")
-            return False
-        
-        self.log("Auth1成功: 認証トークンを取得しました。")
-        
-        # PartialKeyの生成
-        partial_key = self._generate_partial_key(keyoffset, keylength)
-        if not partial_key:
-            return False
+# ダウンロードエンジン
+# "ffmpeg": FFmpegがプレイリストを直接読み込む (従来方式、セグメントは逐次取得)
+# "native": Python側でセグメントを並列取得し、FFmpegは最終的なM4A化 (remux) のみ行う
+ENGINE_FFMPEG = "ffmpeg"
+ENGINE_NATIVE = "native"
 
-        # 2. Auth2: PartialKeyとAuthTokenを送信し、エリアIDを取得
-        auth2_headers = {
-            "User-Agent": "curl/7.52.1",
-            "Accept": "*/*",
-            "X-Radiko-Device": "pc",
-            "X-Radiko-User": "dummy_user",
-            "X-Radiko-App": "pc_html5",
-            "X-Radiko-App-Version": "0.0.1",
-            "X-Radiko-AuthToken": self.authtoken,
-            "X-Radiko-PartialKey": partial_key,
-        }
+# ネイティブ取得時のセグメント同時取得数
+HLS_DEFAULT_WORKERS = 8
 
-        
-        # Premiumセッションがある場合はURLにクエリパラメータを追加 
-        auth2_url = URL_AUTH2
-        if self.radiko_session:
-            auth2_url += f"?radiko_session={self.radiko_session}"
+# 分割ダウンロード: 1分割あたりの目安の長さ(秒)、最大分割数、境界の揃え単位(秒)
+# 境界はRadikoのHLSセグメント長(5秒)の倍数に揃え、区間の継ぎ目で音声が欠けたり重複しないようにする
+SHARD_TARGET_SECONDS = 30 * 60
+SHARD_MAX = 8
+SHARD_ALIGN_SECONDS = 5
 
-        try:
-            res2 = self.session.get(auth2_url, headers=auth2_headers, timeout=5)
-            res2.raise_for_status()
-        except requests.RequestException as e:
-            self.log(f"エラー: Auth2リクエストに失敗しました: {e} ")
-            return False
+# 再開可能なダウンロード: チェックポイントを記録する区間の長さ(秒)と、
+# 完成したファイルの長さと番組の長さ (to - ft) の許容差(秒)
+RESUME_CHUNK_SECONDS = 10 * 60
+DURATION_TOLERANCE_SECONDS = 5
 
-        # エリアIDは応答ボディに含まれる（CSV風テキスト）
-        body = res2.text.strip()
-        # デバッグしたくなったらコメントアウトを外す
-        self.log(f"Auth2レスポンス: {body}")
+# Radikoの時刻 (YYYYMMDDHHMMSS) の時間帯。日本に夏時間は無いため固定のUTC+9とする
+# (zoneinfo はタイムゾーンのデータが無いWindowsでは使えない)
+RADIKO_TIMEZONE = timezone(timedelta(hours=9), "JST")
 
-        # OUT または空文字はエリア判定失敗
-        if not body or body == "OUT":
-            self.log("エラー: Auth2でエリアが判定されませんでした。(レスポンスが空 or OUT)")
-            return False
+# ライブ録音: 開始時刻のこの秒数前から認証の更新とプレイリストの監視を始め、開始時の遅延と取りこぼしを防ぐ
+LIVE_RECORD_PREWARM_SECONDS = 60
+# ライブのプレイリストを確認する間隔(秒)。セグメントの公開時刻の推定精度もこの間隔で決まる
+LIVE_RECORD_POLL_SECONDS = 1.0
+# 新しいセグメントが公開されないまま終了時刻をこの秒数過ぎたら、取得できた分で録音を終える
+LIVE_RECORD_STALL_SECONDS = 30
+# プレイリストに長さが書かれていないセグメントの長さ(秒)
+LIVE_RECORD_SEGMENT_SECONDS = 5
+# 時計のずれの算出に使う、開始時・終了時それぞれの観測数
+LIVE_RECORD_DRIFT_SAMPLES = 10
 
-        # 1行目を取り出してカンマ区切りの先頭要素が area_id
-        first_line = body.splitlines()[0]
-        self.area_id = first_line.split(",")[0].strip()
+# FFmpegの標準エラー出力は末尾のこの行数だけを保持する（長時間のジョブでもメモリを消費しない）
+FFMPEG_STDERR_TAIL_LINES = 200
 
-        if not self.area_id:
-            self.log("エラー: Auth2応答ボディからエリアIDが抽出できませんでした。")
-            return False
+# HTTPリクエストの再試行: 最大試行回数、指数バックオフの初期値と上限(秒)、再試行するステータス
+RETRY_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Retry-After ヘッダで指示された待ち時間の上限(秒)
+RETRY_AFTER_MAX = 120
+# 区間 (チェックポイント単位) の取得の再試行回数と待ち時間
+CHUNK_RETRY_ATTEMPTS = 3
+CHUNK_RETRY_BASE_DELAY = 5
+CHUNK_RETRY_MAX_DELAY = 60
+# サーキットブレーカー: 連続失敗がこの回数に達したエンドポイントへのリクエストを一定時間遮断する
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30
 
-        self.log(f"Auth2成功: エリアID '{self.area_id}' を取得しました。")
-        return True
-            
-    def _premium_login(self, mail, password):
-        """Radiko Premiumログインを実行し、radiko_sessionを取得する """
-        login_data = {"mail": mail, "pass": password}
-        try:
-            res = self.session.post(URL_PREMIUM_LOGIN, data=login_data, timeout=5)
-            res.raise_for_status()
+# --- 再試行とサーキットブレーカー ---
 
-            data = res.json()
-            self.radiko_session = data.get("radiko_session")
-            areafree = data.get("areafree")
+class CircuitOpenError(Exception):
+    """サーキットブレーカーが開いている（エンドポイントへのリクエストを遮断中）ことを示す例外。"""
 
-            if self.radiko_session and areafree == "1":
-                self.log("Premiumログインに成功しました。エリアフリー録音が可能です。")
-                # cookie は self.session.cookies に自動で入っている
-                return True
-            else:
-                self.log("エラー: Premiumログインに失敗しました。認証情報をご確認ください。")
-                return False
-        except Exception as e:
-            self.log(f"エラー: Premiumログイン中に例外が発生しました: {e} ")
-            return False
 
-    def logout(self):
-        """Premiumセッションを終了する """
-        if self.radiko_session:
-            self.log("Premiumセッションをログアウトします...")
-            logout_data = {"radiko_session": self.radiko_session}
-            try:
-                requests.post(URL_PREMIUM_LOGOUT, data=logout_data, timeout=5)
-            except requests.RequestException:
-                # ログアウトの失敗は致命的ではないが記録
-                self.log("警告: ログアウト処理中にエラーが発生しました。")
-            finally:
-                self.radiko_session = None
-        
-import xml.etree.ElementTree as ET
+class RetryPolicy:
+    """
+    指数バックオフ（フルジッタ）による再試行の方針。
+    待ち時間は 0〜min(max_delay, base_delay * 2^attempt) の一様乱数とし、
+    多数のワーカーが同時に失敗しても再試行のタイミングが揃わないようにする。
+    """
+    def __init__(self, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY,
+                 max_delay=RETRY_MAX_DELAY, retry_statuses=RETRY_STATUSES):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = frozenset(retry_statuses)
 
-class RadikoMetadata:
-    def __init__(self, auth, log_callback):
-        self.auth = auth
-        self.log = log_callback
-        self.STATIONS = {
-            "TBS": "TBSラジオ",
-            "QRR": "文化放送",
-            "LFR": "ニッポン放送",
-            "RN1": "ラジオNIKKEI第1",
-            "FMJ": "J-WAVE",
-            # 必要に応じて追加
-        }
+    def delay(self, attempt, retry_after=None):
+        """attempt 回目 (0始まり) の失敗後の待ち時間(秒)。Retry-After があればそれを優先する。"""
+        seconds = self.parse_retry_after(retry_after)
+        if seconds is not None:
+            return min(seconds, RETRY_AFTER_MAX)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
 
-    def get_stations(self):
-        return self.STATIONS
+    @staticmethod
+    def parse_retry_after(value):
+        """Retry-After ヘッダ（秒数またはHTTP日付）を秒数に変換する。解釈できなければ None。"""
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        from email.utils import parsedate_to_datetime
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, when.timestamp() - time.time())
 
-    def get_programs(self, station_id, date_str):
+
+class CircuitBreaker:
+    """
+    エンドポイントごとのサーキットブレーカー。
+    連続失敗が failure_threshold 回に達すると reset_seconds の間リクエストを遮断し (open)、
+    その後は1件だけ試行を通して (half-open)、成功すれば通常状態 (closed) に戻す。
+    多数の並列ワーカーが不調なサーバーへ一斉に再試行し続けるのを防ぐ。
+    """
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return "open"
+            return "half-open"
+
+    def wait_time(self):
         """
-        Radiko公式の番組表APIから、指定局・指定日の番組一覧を取得する。
-        date_str: 'YYYYMMDD'
+        リクエストを送ってよければ 0、遮断中なら再開までの秒数を返す。
+        half-open では最初の呼び出しだけに 0 を返し、試行の結果が出るまで他は待たせる。
         """
-        if station_id not in self.STATIONS:
-            self.log(f"警告: 未知の局IDが指定されました: {station_id}")
-            return []
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self._trial_in_flight:
+                return 1.0
+            self._trial_in_flight = True
+            return 0.0
 
-        url = f"https://radiko.jp/v3/program/station/date/{date_str}/{station_id}.xml"
-        self.log(f"番組表APIにアクセス: {url}")
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
 
-        try:
-            # 認証用セッションがあるならそれを使う（Cookie共有）
-            session = self.auth.session if getattr(self.auth, "session", None) else requests
-            res = session.get(url, timeout=10)
-            res.raise_for_status()
-        except requests.RequestException as e:
-            self.log(f"エラー: 番組表取得に失敗しました: {e}")
-            return []
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
 
-        try:
-            root = ET.fromstring(res.content)
-        except ET.ParseError as e:
-            self.log(f"エラー: 番組表XMLの解析に失敗しました: {e}")
-            return []
 
-        program_data = []
-        # //prog ノードを全部拾う
-        for p in root.findall(".//prog"):
-            ft = p.attrib.get("ft")  # 例: '20240521050000'
-            to = p.attrib.get("to")
-            title = p.findtext("title", default="(タイトル不明)")
+DEFAULT_RETRY_POLICY = RetryPolicy()
+CHUNK_RETRY_POLICY = RetryPolicy(CHUNK_RETRY_ATTEMPTS, CHUNK_RETRY_BASE_DELAY, CHUNK_RETRY_MAX_DELAY)
 
-            if not ft or not to:
-                continue
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
 
-            try:
-                start_dt = datetime.strptime(ft, "%Y%m%d%H%M%S")
-                end_dt   = datetime.strptime(to, "%Y%m%d%H%M%S")
-            except ValueError:
-                continue
 
-            program_data.append(
-                {
-                    "title": title,
-                    "start_time_dt": start_dt,
-                    "end_time_dt": end_dt,
-                    "start_time_str": ft,
-                    "end_time_str": to,
-                }
-            )
+def get_circuit_breaker(endpoint):
+    """エンドポイント名に対応するサーキットブレーカーを返す（プロセス内で共有）。"""
+    with _circuit_breakers_lock:
+        breaker = _circuit_breakers.get(endpoint)
+        if breaker is None:
+            breaker = _circuit_breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
 
-        self.log(f"番組表取得: {len(program_data)} 件")
-        return program_data
 
-class StreamDownloader:
+def request_with_retry(session, method, url, endpoint, log_callback=None, policy=DEFAULT_RETRY_POLICY,
+                       observer=None, **kwargs):
     """
-    FFmpegをsubprocessで実行し、Radikoストリームを高速にM4Aファイルとしてダウンロードするクラス。
+    session.request を再試行方針とエンドポイントごとのサーキットブレーカーのもとで実行する。
+    通信エラーと policy.retry_statuses のステータスはバックオフ後に再試行し、
+    最後の試行の応答（または例外）をそのまま呼び出し元へ返す。
+    認証の拒否 (401/403) などそれ以外の応答は再試行せずに返す。
+    ブレーカーが開いたまま待ち時間が上限を超える場合は CircuitOpenError を送出する。
+    observer を渡すと、試行ごとに observer(応答 (通信エラーの場合は None), 所要秒数) を呼ぶ。
     """
-    def __init__(self, auth, log_callback):
-        self.auth = auth
-        self.log = log_callback
-        self.process = None
+    import requests
+    breaker = get_circuit_breaker(endpoint)
 
-    def _generate_tracking_key(self):
-        """
-        Radiko追跡キー (lsid) のための擬似ランダムMD5ハッシュを生成する。
-        rec_radiko_tsの`/dev/random` + `base64`ロジックをPythonで再現する 。
-        """
-        # 100バイトのランダムデータを生成
-        random_bytes = os.urandom(100)
-        
-        # Base64エンコード
-        encoded_bytes = base64.b64encode(random_bytes)
-        
-        # MD5ハッシュを計算し、32文字の小文字の16進数文字列として返す
-        tracking_key = hashlib.md5(encoded_bytes).hexdigest()
-        return tracking_key
+    for attempt in range(policy.max_attempts):
+        last_attempt = attempt + 1 >= policy.max_attempts
+        wait = breaker.wait_time()
+        if wait > 0:
+            if last_attempt or wait > policy.max_delay:
+                raise CircuitOpenError(f"{endpoint} への接続を一時的に遮断しています (残り {wait:.0f} 秒)")
+            time.sleep(wait)
+            continue
 
-    def download(self, station_id, start_time_str, end_time_str, output_path, progress_callback):
-        """
-        FFmpegプロセスを起動し、ストリームをコピーする。
-        start_time_str, end_time_str は YYYYMMDDHHMMSS 形式 。
-        """
-        if not self.auth.authtoken:
-            self.log("エラー: 認証トークンがありません。ダウンロード前に認証を実行してください。")
-            return False
+        retry_after = None
+        started = time.perf_counter()
+        try:
+            res = session.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            breaker.record_failure()
+            if observer:
+                observer(None, time.perf_counter() - started)
+            if last_attempt:
+                raise
+            reason = str(e)
+        else:
+            if observer:
+                observer(res, time.perf_counter() - started)
+            if res.status_code not in policy.retry_statuses:
+                breaker.record_success()
+                return res
+            breaker.record_failure()
+            if last_attempt:
+                return res
+            reason = f"HTTP {res.status_code}"
+            retry_after = res.headers.get("Retry-After")
 
-        # M3U8ストリームURLの構築 
-        lsid = self._generate_tracking_key()
-        
-        # ts/playlist.m3u8 へのリクエストに必要なパラメータ
-        url_params = {
-            "station_id": station_id,
-            "start_at": start_time_str,
-            "ft": start_time_str,
-            "end_at": end_time_str,
-            "to": end_time_str,
-            "seek": start_time_str,
-            "l": "15", # 固定パラメータ 
-            "lsid": lsid,
-            "type": "c", # 固定パラメータ 
-        }
-        
-        query_string = "&".join(f"{k}={v}" for k, v in url_params.items())
-        m3u8_url = f"https://radiko.jp/v2/api/ts/playlist.m3u8?{query_string}"
-        
-        # FFmpegコマンドの構築
-        # 認証トークンは -headers オプションで渡す 
-        # -acodec copy と -bsf:a aac_adtstoasc は高速化とM4A互換性のために必須 
-        # FFmpeg用ヘッダ（Authtoken + AreaId）
-        header_lines = [
-            f"X-Radiko-Authtoken: {self.auth.authtoken}",
-        ]
-        if self.auth.area_id:
-            header_lines.append(f"X-Radiko-AreaId: {self.auth.area_id}")
-        
-        headers_str = "\r\n".join(header_lines) + "\r\n"
+        delay = policy.delay(attempt, retry_after)
+        if log_callback:
+            log_callback(f"{endpoint}: {reason}。{delay:.1f} 秒後に再試行します ({attempt + 1}/{policy.max_attempts - 1})")
+        time.sleep(delay)
 
-        ffmpeg_command = [
-            "ffmpeg",
-            "-loglevel", "error",
-            "-fflags", "+discardcorrupt",
-            "-headers", headers_str,
-            "-i", m3u8_url,
-            "-acodec", "copy",
-            "-vn",
-            "-bsf:a", "aac_adtstoasc",
-            "-y",
-            output_path,
-        ]
-        
-        self.log(f"FFmpegで録音を開始: {output_path}")
-        
-        try:
-            # subprocess.Popen でプロセスを起動し、非同期で実行する
-            self.process = subprocess.Popen(
-                ffmpeg_command,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.PIPE,  # エラーだけ取りたいならこのままでもOK
-                universal_newlines=True
-            )
-            
-            # ダウンロード進捗の監視を開始
-            self._monitor_progress(start_time_str, end_time_str, progress_callback)
-            
-            # FFmpegプロセスの終了を待つ (タイムアウトなし)
-            stdout, stderr = self.process.communicate() 
-            return_code = self.process.returncode
+# --- 同時実行数の自動調整 ---
 
-            if return_code!= 0:
-                self.log(f"エラー: FFmpegプロセスが非ゼロコード {return_code} で終了しました。")
-                self.log(f"FFmpeg出力:\n{stderr}")
-                return False
-            
-            self.log("録音成功: ファイルがM4A形式で保存されました。")
-            return True
+# 評価の間隔(秒)と、評価に必要な最小の観測数
+ADAPTIVE_WINDOW_SECONDS = 5
+ADAPTIVE_MIN_SAMPLES = 4
+# AIMD: 問題が無ければ1ずつ増やし、スロットリング・エラーでは半分にする
+ADAPTIVE_INCREASE_STEP = 1
+ADAPTIVE_DECREASE_FACTOR = 0.5
+# 同時実行数を減らす条件: エラー率、基準 (過去の最小) に対する遅延の倍率、最良時に対する1件あたりの速度の比
+ADAPTIVE_ERROR_RATE = 0.05
+ADAPTIVE_LATENCY_FACTOR = 2.0
+ADAPTIVE_THROUGHPUT_DROP = 0.6
+# 回線状況の変化に追従するため、基準の遅延・速度を評価のたびに少しずつ緩める
+ADAPTIVE_BASELINE_DECAY = 1.05
+# サーバーが負荷を理由に拒否したことを示すステータス
+ADAPTIVE_THROTTLE_STATUSES = (429, 503)
+ADAPTIVE_HISTORY = 50
+# セグメント取得とダウンロードの同時実行数の範囲
+ADAPTIVE_SEGMENT_MIN = 2
+ADAPTIVE_SEGMENT_MAX = 32
+ADAPTIVE_DOWNLOAD_MAX = 8
 
-        except FileNotFoundError:
-            self.log("エラー: 'ffmpeg' コマンドが見つかりません。FFmpegがインストールされ、PATHが通っていることを確認してください。")
-            return False
-        except Exception as e:
-            self.log(f"エラー: ダウンロード中に予期せぬエラーが発生しました: {e}")
-            return False
 
-    def _monitor_progress(self, start_time_str, end_time_str, progress_callback):
-        """
-        FFmpegの進捗をログパースなしのタイマーで擬似的に監視する。
-        """
-        start_dt = datetime.strptime(start_time_str, '%Y%m%d%H%M%S')
-        end_dt = datetime.strptime(end_time_str, '%Y%m%d%H%M%S')
-        total_duration = (end_dt - start_dt).total_seconds()
-        
-        start_time = time.time()
-        
-        while self.process and self.process.poll() is None:
-            elapsed_time = time.time() - start_time
-            # 経過時間に基づいた擬似的な進捗計算
-            progress_percent = min(100, (elapsed_time / total_duration) * 100)
-            
-            # GUIへ進捗をフィードバック
-            progress_callback(progress_percent)
-            time.sleep(1)
+class AdaptiveConcurrency:
+    """
+    スループット・遅延・エラー/スロットリングの観測から同時実行数 (limit) を AIMD で調整するクラス。
 
-        # 終了時には100%に設定
-        progress_callback(100)
+    ADAPTIVE_WINDOW_SECONDS ごとに観測をまとめて評価する。
+      * 429/503 を受けた・エラー率が高い → limit を ADAPTIVE_DECREASE_FACTOR 倍に減らす
+      * 遅延の中央値が基準の ADAPTIVE_LATENCY_FACTOR 倍を超えた、または1件あたりの速度が
+        最良時の ADAPTIVE_THROUGHPUT_DROP 倍を下回った (帯域の飽和) → 1減らす
+      * 問題が無く、枠を使い切っている → ADAPTIVE_INCREASE_STEP 増やす
+    limit は min_limit〜max_limit の範囲に収め、変更のたびに理由をログと history に残し、
+    on_change(新しいlimit, 理由) を呼ぶ。
 
-    def stop_download(self):
-        """実行中のFFmpegプロセスを安全に停止する"""
-        if self.process and self.process.poll() is None:
-            self.log("ダウンロードを中断しています...")
-            # SIGINT/SIGTERMを送信してプロセスを終了させる
-            self.process.terminate() 
-            try:
-                self.process.wait(timeout=5)
-                self.log("ダウンロードが中断されました。")
-            except subprocess.TimeoutExpired:
-                self.process.kill()
-                self.log("警告: プロセスを強制終了しました。")
+    acquire() / release() (または slot()) で limit を上限とするセマフォとしても使える。
+    同時実行数を別の仕組みで制御する場合は started() / finished() で実行数だけを知らせる。
+    """
+    def __init__(self, name, initial, min_limit, max_limit, log_callback=None, on_change=None,
+                 window_seconds=ADAPTIVE_WINDOW_SECONDS):
+        self.name = name
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.limit = min(max(int(initial), self.min_limit), self.max_limit)
+        self.log = log_callback
+        self.on_change = on_change
+        self.window_seconds = window_seconds
 
+        self.in_flight = 0
+        self.history = deque(maxlen=ADAPTIVE_HISTORY)
+        self._cond = threading.Condition()
+        self._baseline_latency = None
+        self._best_per_slot = 0.0
+        self._reset_window(time.monotonic())
 
-# --- Tkinter GUIとController ---
+    def _reset_window(self, now):
+        self._window_start = now
+        self._last_tick = now
+        self._busy_time = 0.0
+        self._peak = self.in_flight
+        self._samples = 0
+        self._results = 0
+        self._errors = 0
+        self._throttled = 0
+        self._bytes = 0
+        self._latencies = []
 
-class RadikoGUI:
-    def __init__(self, master):
-        self.master = master
-        master.title("Radiko Time-Free 高速ダウンローダー")
-        
-        # ログメッセージをGUIに表示するためのスレッドセーフなキュー
-        self.log_queue = queue.Queue()
+    def _tick(self, now):
+        """実行中の件数の時間積分を進める (平均の同時実行数を求めるため)"""
+        self._busy_time += self.in_flight * (now - self._last_tick)
+        self._last_tick = now
 
-        # モデル層の初期化
-        self.auth = RadikoAuth(self.add_log)
-        self.metadata = RadikoMetadata(self.auth, self.add_log)
-        self.downloader = StreamDownloader(self.auth, self.add_log)
-        self.station_vars = {} # ステーションIDと番組情報の保持用
+    def acquire(self):
+        """実行中の件数が limit 未満になるまで待ってから1件分の枠を確保する。"""
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self._started()
+
+    def release(self):
+        with self._cond:
+            self._finished()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def started(self):
+        with self._cond:
+            self._started()
+
+    def finished(self):
+        with self._cond:
+            self._finished()
+            self._cond.notify_all()
+
+    def _started(self):
+        self._tick(time.monotonic())
+        self.in_flight += 1
+        self._peak = max(self._peak, self.in_flight)
+
+    def _finished(self):
+        self._tick(time.monotonic())
+        self.in_flight -= 1
+
+    def record(self, ok=None, throttled=False, latency=None, nbytes=0):
+        """
+        1件の結果 (リクエストや転送の一部) を記録する。評価の間隔が経過していれば limit を見直す。
+        ok は成否 (None なら成否を伴わない途中経過としてエラー率に数えない)、
+        latency は秒、nbytes は受信したバイト数。
+        """
+        with self._cond:
+            self._samples += 1
+            if ok is not None:
+                self._results += 1
+                self._errors += 0 if ok else 1
+            self._throttled += 1 if throttled else 0
+            self._bytes += nbytes
+            if latency is not None:
+                self._latencies.append(latency)
+
+            now = time.monotonic()
+            change = None
+            if now - self._window_start >= self.window_seconds and self._samples >= ADAPTIVE_MIN_SAMPLES:
+                change = self._evaluate(now)
+
+        if change:
+            old, new, reason = change
+            if self.log:
+                self.log(f"同時実行数の自動調整 [{self.name}]: {old} → {new} ({reason})")
+            if self.on_change:
+                self.on_change(new, reason)
+
+    def _evaluate(self, now):
+        """観測をまとめて評価し、limit を変更した場合は (旧, 新, 理由) を返す (self._cond を保持して呼ぶ)"""
+        self._tick(now)
+        elapsed = now - self._window_start
+        average_in_flight = self._busy_time / elapsed if elapsed > 0 else 0
+        old = self.limit
+        new, reason = old, None
+
+        if self._throttled:
+            new = int(old * ADAPTIVE_DECREASE_FACTOR)
+            reason = f"スロットリング: 429/503 を {self._throttled} 件受信"
+        elif self._errors and self._errors / self._results > ADAPTIVE_ERROR_RATE:
+            new = int(old * ADAPTIVE_DECREASE_FACTOR)
+            reason = f"エラー率 {self._errors / self._results:.0%} ({self._errors}/{self._results} 件)"
+        else:
+            if self._latencies:
+                median = sorted(self._latencies)[len(self._latencies) // 2]
+                baseline = self._baseline_latency
+                if baseline and median > baseline * ADAPTIVE_LATENCY_FACTOR:
+                    new = old - 1
+                    reason = f"遅延の増加: 中央値 {median * 1000:.0f} ms (基準 {baseline * 1000:.0f} ms)"
+                self._baseline_latency = median if baseline is None else min(median, baseline * ADAPTIVE_BASELINE_DECAY)
+
+            if self._bytes and average_in_flight > 0:
+                per_slot = self._bytes / elapsed / average_in_flight
+                best = self._best_per_slot
+                if reason is None and best and per_slot < best * ADAPTIVE_THROUGHPUT_DROP:
+                    new = old - 1
+                    reason = (f"1件あたりの速度の低下: {per_slot / 1024:.0f} KB/s "
+                              f"(最良 {best / 1024:.0f} KB/s)")
+                self._best_per_slot = max(per_slot, best / ADAPTIVE_BASELINE_DECAY)
+
+            if reason is None and self._peak >= old:
+                new = old + ADAPTIVE_INCREASE_STEP
+                reason = "良好: エラー無し、全ての枠を使用中"
+
+        new = min(max(new, self.min_limit), self.max_limit)
+        self._reset_window(now)
+        if new == old:
+            return None
+
+        self.limit = new
+        self.history.append({
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "old": old,
+            "new": new,
+            "reason": reason,
+        })
+        # 増えた枠を待っているスレッドを起こす
+        self._cond.notify_all()
+        return old, new, reason
+
+    def stats(self):
+        with self._cond:
+            return {
+                "name": self.name,
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "min": self.min_limit,
+                "max": self.max_limit,
+                "changes": list(self.history),
+            }
+
+
+# --- メトリクス ---
+# 認証・番組表・ダウンロード・キューの計測値を Prometheus のテキスト形式で公開する。
+# prometheus_client には依存せず、必要な Counter / Gauge / Histogram だけを実装する。
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9468
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# 通信の所要時間(秒)のヒストグラムのバケット
+METRICS_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# ダウンロード1件の所要時間(秒)・大きさ(バイト)・実時間に対する倍速のバケット
+METRICS_DOWNLOAD_SECONDS_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+METRICS_DOWNLOAD_BYTES_BUCKETS = tuple(mb * 1024 * 1024 for mb in (1, 4, 16, 32, 64, 128, 256, 512))
+METRICS_DOWNLOAD_SPEED_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_metric_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    """ラベルの値の組ごとに値を持つ計測値の基底クラス。"""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        pairs = [*zip(self.labelnames, key), *extra]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+    def _samples(self):
+        """(名前の接尾辞, ラベル文字列, 値) を返す。"""
+        with self._lock:
+            items = sorted(self._values.items())
+        return [("", self._labels(key), value) for key, value in items]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(
+            f"{self.name}{suffix}{labels} {_format_metric_value(value)}" for suffix, labels, value in self._samples()
+        )
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """
+    現在値を表す計測値。callback を渡すと、出力のたびに callback() が返す
+    {ラベルの値のタプル: 値} を使う (キューの長さなど、他のオブジェクトが持つ状態を公開するため)。
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def _samples(self):
+        if not self.callback:
+            return super()._samples()
+        return [("", self._labels(key), value) for key, value in sorted(self.callback().items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [バケットごとの件数 (+Inf を含む、累積前), 合計, 件数]
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels):
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return entry[2] if entry else 0
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        samples = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", self._labels(key, [("le", _format_metric_value(bound))]), cumulative))
+            samples.append(("_sum", self._labels(key), total))
+            samples.append(("_count", self._labels(key), count))
+        return samples
+
+
+class MetricsRegistry:
+    """計測値の一覧。render() で全てを Prometheus のテキスト形式にまとめる。"""
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, buckets, labelnames=()):
+        return self._register(Histogram(name, documentation, buckets, labelnames))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "".join(metric.render() + "\n" for metric in self.metrics)
+
+
+METRICS = MetricsRegistry()
+
+METRIC_AUTH_REQUESTS = METRICS.counter(
+    "radiko_auth_requests_total", "認証の各段階 (auth1 / auth2 / login) の結果別の回数", ("step", "result")
+)
+METRIC_AUTH_DURATION = METRICS.histogram(
+    "radiko_auth_duration_seconds", "認証の各段階の所要時間 (再試行を含む)", METRICS_LATENCY_BUCKETS, ("step",)
+)
+METRIC_AUTH_TOKEN_CACHE = METRICS.counter(
+    "radiko_auth_token_cache_total", "認証トークンのディスクキャッシュの参照結果 (hit / miss)", ("result",)
+)
+METRIC_GUIDE_FETCHES = METRICS.counter(
+    "radiko_guide_fetches_total", "番組表・局一覧の取得の結果別の回数 (ok / not_modified / error)", ("kind", "result")
+)
+METRIC_GUIDE_FETCH_DURATION = METRICS.histogram(
+    "radiko_guide_fetch_duration_seconds", "番組表・局一覧の取得の所要時間 (キャッシュから返した場合は含まない)",
+    METRICS_LATENCY_BUCKETS, ("kind",),
+)
+METRIC_GUIDE_CACHE = METRICS.counter(
+    "radiko_guide_cache_total", "番組表キャッシュの参照結果 (hit / revalidated / miss)", ("result",)
+)
+METRIC_DOWNLOADS = METRICS.counter(
+    "radiko_downloads_total", "ダウンロードの結果別の件数 (ok / failed)", ("engine", "result")
+)
+METRIC_DOWNLOADS_IN_PROGRESS = METRICS.gauge("radiko_downloads_in_progress", "実行中のダウンロードの件数")
+METRIC_DOWNLOAD_DURATION = METRICS.histogram(
+    "radiko_download_duration_seconds", "成功したダウンロード1件の所要時間", METRICS_DOWNLOAD_SECONDS_BUCKETS, ("engine",)
+)
+METRIC_DOWNLOAD_BYTES = METRICS.histogram(
+    "radiko_download_bytes", "成功したダウンロード1件のファイルの大きさ", METRICS_DOWNLOAD_BYTES_BUCKETS, ("engine",)
+)
+METRIC_DOWNLOAD_SPEED = METRICS.histogram(
+    "radiko_download_speed_ratio", "成功したダウンロード1件の実時間に対する倍速 (番組の長さ / 所要時間)",
+    METRICS_DOWNLOAD_SPEED_BUCKETS, ("engine",),
+)
+METRIC_FFMPEG_EXITS = METRICS.counter(
+    "radiko_ffmpeg_exits_total", "FFmpegプロセスの終了コード別の回数 (起動できなかった場合は code=\"spawn_error\")",
+    ("code",),
+)
+
+# 計測対象の DownloadQueue (GCされたキューは自動的に外れる)
+_download_queues = weakref.WeakSet()
+_download_queues_lock = threading.Lock()
+
+
+def _queue_gauge(field):
+    """全ての DownloadQueue の worker_stats()[field] の合計を返すゲージの callback を作る。"""
+    def collect():
+        with _download_queues_lock:
+            queues = list(_download_queues)
+        return {(): sum(queue.worker_stats()[field] for queue in queues)}
+    return collect
+
+
+METRICS.gauge("radiko_queue_depth", "キューで実行を待っているジョブの数", callback=_queue_gauge("pending"))
+METRICS.gauge("radiko_queue_active_workers", "ジョブを実行中のワーカーの数", callback=_queue_gauge("running"))
+METRICS.gauge("radiko_queue_max_workers", "キューの同時実行数の上限", callback=_queue_gauge("max_workers"))
+
+
+class MetricsServer:
+    """
+    計測値を Prometheus のテキスト形式で返すローカルHTTPサーバー。GET /metrics に応じる。
+    """
+    def __init__(self, log_callback, host=METRICS_HOST, port=METRICS_PORT, registry=METRICS):
+        self.log = log_callback
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self.httpd = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.httpd.server_address[1] if self.httpd else self.port}/metrics"
+
+    def start(self):
+        """サーバーをバックグラウンドスレッドで起動する (http.server はここで初めて読み込む)"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self.registry
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.log(f"メトリクスを公開しました: {self.url}")
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+
+# --- トレースとプロファイル ---
+# 認証・番組表・ダウンロードの各段階の所要時間を入れ子の区間 (span) として記録し、
+# Chrome / Perfetto のトレース形式 (JSON) で書き出す。既定では無効で、無効の間の span() は
+# 何もしない共有のオブジェクトを返すだけなので、計測を埋め込んだ処理の速度はほぼ変わらない。
+
+# プロファイル結果のログに出す関数の数
+TRACE_PROFILE_TOP = 25
+
+
+class _NullSpan:
+    """トレースが無効のときに span() が返す、何もしない区間。"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    with 文の間を1つの区間として記録する。set() で属性 (局・時間範囲・バイト数など) を追加でき、
+    例外で抜けた場合は属性 error に例外を記録する。
+    """
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.started = None
+        self._profiler = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self._profiler = self.tracer._start_profile(self.name)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ended = time.perf_counter()
+        if self._profiler:
+            self.tracer._stop_profile(self.name, self._profiler)
+        if exc_type:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._add(self.name, self.started, ended, self.attrs)
+        return False
+
+
+class Tracer:
+    """
+    区間を集めてトレースファイルに書き出す。enable() するまでは何も記録しない。
+
+    profile_phases に区間の名前 (例: "guide.parse") を渡すと、その区間を cProfile で計測し、
+    同じ名前の区間の結果を合算する。cProfile は同時に1つしか動かせないため、
+    別の区間を計測中 (入れ子や別スレッド) の区間は計測しない。
+    """
+    def __init__(self):
+        self.enabled = False
+        self.profile_phases = frozenset()
+        self.events = []
+        self.profiles = {}
+        self._thread_names = {}
+        self._lock = threading.Lock()
+        self._profiling = False
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    def enable(self, profile_phases=()):
+        with self._lock:
+            self.events = []
+            self.profiles = {}
+            self._thread_names = {}
+        self.profile_phases = frozenset(profile_phases)
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, **attrs):
+        """区間を記録するコンテキストマネージャを返す (無効のときは何もしない)"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, attrs)
+
+    def add_span(self, name, started, **attrs):
+        """started (time.perf_counter() の値) から現在までを区間として後から記録する。"""
+        if self.enabled:
+            self._add(name, started, time.perf_counter(), attrs)
+
+    def _add(self, name, started, ended, attrs):
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": name.split(".", 1)[0],
+            "ph": "X",
+            "ts": round((started - self._origin) * 1000000, 3),
+            "dur": round((ended - started) * 1000000, 3),
+            "pid": self._pid,
+            "tid": thread.ident,
+            "args": attrs,
+        }
+        with self._lock:
+            self.events.append(event)
+            self._thread_names.setdefault(thread.ident, thread.name)
+
+    def _start_profile(self, name):
+        if name not in self.profile_phases:
+            return None
+        with self._lock:
+            if self._profiling:
+                return None
+            self._profiling = True
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 他のプロファイラ (デバッガなど) が有効
+            with self._lock:
+                self._profiling = False
+            return None
+        return profiler
+
+    def _stop_profile(self, name, profiler):
+        profiler.disable()
+        import pstats
+        with self._lock:
+            self._profiling = False
+            stats = self.profiles.get(name)
+            if stats is None:
+                self.profiles[name] = pstats.Stats(profiler)
+            else:
+                stats.add(profiler)
+
+    def summary(self):
+        """区間の名前ごとの {件数, 合計ミリ秒} を返す。"""
+        with self._lock:
+            events = list(self.events)
+        totals = {}
+        for event in events:
+            total = totals.setdefault(event["name"], {"count": 0, "total_ms": 0.0})
+            total["count"] += 1
+            total["total_ms"] += event["dur"] / 1000
+        return totals
+
+    def profile_report(self, phase, limit=TRACE_PROFILE_TOP):
+        """phase のプロファイル結果 (累積時間の上位 limit 件) を文字列で返す。計測していなければ None。"""
+        with self._lock:
+            stats = self.profiles.get(phase)
+        if stats is None:
+            return None
+        buffer = io.StringIO()
+        stats.stream = buffer
+        stats.sort_stats("cumulative").print_stats(limit)
+        return buffer.getvalue()
+
+    def write(self, path):
+        """
+        トレースを path へ書き出し (chrome://tracing や ui.perfetto.dev で開ける)、
+        プロファイルした区間ごとに <path の拡張子を除いたもの>.<区間名>.prof も書き出す。
+        書き出したファイルの一覧を返す。
+        """
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self._thread_names)
+            profiles = dict(self.profiles)
+
+        metadata = [{"name": "process_name", "ph": "M", "pid": self._pid, "tid": 0, "args": {"name": "radiko_rec"}}]
+        metadata.extend(
+            {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}}
+            for tid, name in thread_names.items()
+        )
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f, ensure_ascii=False, default=str)
+
+        written = [path]
+        base = os.path.splitext(path)[0]
+        for phase, stats in profiles.items():
+            profile_path = f"{base}.{phase}.prof"
+            stats.dump_stats(profile_path)
+            written.append(profile_path)
+        return written
+
+
+TRACER = Tracer()
+
+
+# --- 認証とメタデータ処理クラス ---
+
+_auth_cache_locks = {}
+_auth_cache_locks_lock = threading.Lock()
+
+
+def _auth_cache_lock(path):
+    """キャッシュファイルごとのロックを返す (同じファイルを使う AuthTokenCache の間で共有する)"""
+    key = os.path.abspath(path)
+    with _auth_cache_locks_lock:
+        lock = _auth_cache_locks.get(key)
+        if lock is None:
+            lock = _auth_cache_locks[key] = threading.Lock()
+        return lock
+
+
+class AuthTokenCache:
+    """
+    認証結果（authtoken / area_id / radiko_session）を発行時刻とTTLとともにディスクへ保存し、
+    次回起動時に再利用するためのクラス。エントリはアカウント（メールアドレス）ごとに管理する。
+    セッションプールのように複数の RadikoAuth が同じファイルを並行して更新しても
+    エントリが失われないよう、読み書きはファイルごとのロックで直列化する。
+    """
+    def __init__(self, path=AUTH_CACHE_PATH):
+        self.path = path
+        self._lock = _auth_cache_lock(path)
+
+    @staticmethod
+    def _account_key(mail):
+        # メールアドレスをそのまま保存しないようハッシュ化する (非プレミアムは空文字)
+        return hashlib.sha256((mail or "").encode('utf-8')).hexdigest()[:16]
+
+    def _read_all(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_all(self, entries):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # 一時ファイルは書き込みごとに別名にする (他のプロセスの書き込みと衝突しないように)。
+        # mkstemp のファイルは所有者のみ読み書き可能 (トークンを含むため)
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load(self, mail):
+        """有効期限内のエントリがあれば返す。無ければ None。"""
+        with self._lock:
+            entry = self._read_all().get(self._account_key(mail))
+        if not entry:
+            return None
+        if time.time() >= entry.get("issued_at", 0) + entry.get("ttl", 0) - AUTH_TOKEN_REFRESH_MARGIN:
+            return None
+        return entry
+
+    def save(self, mail, authtoken, area_id, radiko_session, issued_at, ttl):
+        with self._lock:
+            entries = self._read_all()
+            entries[self._account_key(mail)] = {
+                "authtoken": authtoken,
+                "area_id": area_id,
+                "radiko_session": radiko_session,
+                "issued_at": issued_at,
+                "ttl": ttl,
+            }
+            try:
+                self._write_all(entries)
+            except OSError:
+                # キャッシュの保存失敗は致命的ではない
+                pass
+
+    def invalidate(self, mail):
+        with self._lock:
+            entries = self._read_all()
+            if entries.pop(self._account_key(mail), None) is not None:
+                try:
+                    self._write_all(entries)
+                except OSError:
+                    pass
+
+
+class RadikoAuth:
+    """
+    Radikoの多段階認証とPartialKey生成を管理するクラス。
+    シェルスクリプトのdd/base64/curlロジックをPythonネイティブで再現する 。
+    認証結果はディスクにキャッシュし、期限切れや拒否時には自動的に再認証する。
+    proxy を指定すると、認証・番組表・ストリーム取得を全てそのHTTPプロキシ経由で行う
+    (エリアはRadiko側で接続元から判定されるため、別エリアのセッションを作るのに使う)。
+    """
+    def __init__(self, log_callback, cache_path=AUTH_CACHE_PATH, proxy=None):
+        self.authtoken = None
+        self.area_id = None
+        self.radiko_session = None
+        self.issued_at = None
+        self.ttl = AUTH_TOKEN_TTL
+        self.log = log_callback
+        self.proxy = proxy or None
+        self._session = None
+        # cache_path に None を指定するとディスクキャッシュを使わない
+        self.token_cache = AuthTokenCache(cache_path) if cache_path else None
+
+        # 再認証用に保持する認証情報と、再認証を直列化するためのロック
+        self._mail = None
+        self._password = None
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """認証・番組表・ストリーム取得で共有する requests.Session (Cookieとkeep-alive接続を共有する)"""
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+            if self.proxy:
+                self._session.proxies = {"http": self.proxy, "https": self.proxy}
+        return self._session
+
+    @property
+    def _cache_account(self):
+        """トークンキャッシュのキー。プロキシごとにエリアが異なり得るため、プロキシも含める。"""
+        if self.proxy:
+            return f"{self._mail or ''}|{self.proxy}"
+        return self._mail
+
+    def _generate_partial_key(self, keyoffset, keylength):
+        """
+        Auth1で取得したオフセットと長さに基づき、静的キーからPartialKeyを生成する。
+        これはrec_radiko_tsにおけるdd/base64コマンド処理を代替する 。
+        """
+        try:
+            offset = int(keyoffset)
+            length = int(keylength)
+            
+            # Pythonのバイトスライスでddコマンドのロジックを再現
+            partial_key_bytes = AUTHKEY_VALUE[offset : offset + length]
+            
+            # Base64エンコードでbase64コマンドのロジックを再現
+            partial_key = base64.b64encode(partial_key_bytes).decode('utf-8')
+            return partial_key
+        except Exception as e:
+            self.log(f"エラー: PartialKey生成中に失敗しました: {e}")
+            return None
+
+    def auth(self, mail=None, password=None, use_cache=True):
+        """
+        Radiko認証フロー（Auth1 -> Premium Login -> Auth2）を実行する。
+        use_cache が真で、有効期限内のキャッシュがあればネットワークアクセスせずに再利用する。
+        """
+        self._mail = mail or None
+        self._password = password or None
+
+        with TRACER.span("auth", premium=bool(self._mail)) as span:
+            if use_cache and self._restore_from_cache():
+                span.set(cached=True, area=self.area_id)
+                return True
+
+            credentials = self._auth_network(self._mail, self._password)
+            span.set(cached=False, area=credentials[1] if credentials else None, ok=bool(credentials))
+            if not credentials:
+                return False
+
+        self._apply_credentials(*credentials)
+        self._store_in_cache()
+        return True
+
+    def _apply_credentials(self, authtoken, area_id, radiko_session):
+        """
+        認証 (Auth2まで) に成功した結果を反映する。再認証の間も他のスレッドが古いトークンを
+        使い続けられるよう、新しいトークンは全ての段階が成功してからまとめて差し替える
+        (読み手は authtoken を見るため、authtoken を最後に代入する)。
+        """
+        self.area_id = area_id
+        self.radiko_session = radiko_session
+        self.issued_at = time.time()
+        self.ttl = AUTH_TOKEN_TTL
+        self.authtoken = authtoken
+
+    def _store_in_cache(self):
+        """認証に成功した直後に呼び、認証結果をキャッシュへ保存する。"""
+        if self.token_cache:
+            self.token_cache.save(
+                self._cache_account, self.authtoken, self.area_id, self.radiko_session, self.issued_at, self.ttl
+            )
+
+    def _restore_from_cache(self):
+        """キャッシュされた認証結果を復元する。成功すれば True。"""
+        if not self.token_cache:
+            return False
+        entry = self.token_cache.load(self._cache_account)
+        METRIC_AUTH_TOKEN_CACHE.inc(result="hit" if entry else "miss")
+        if not entry:
+            return False
+
+        self.authtoken = entry["authtoken"]
+        self.area_id = entry["area_id"]
+        self.radiko_session = entry.get("radiko_session")
+        self.issued_at = entry["issued_at"]
+        self.ttl = entry["ttl"]
+        remaining = (self.issued_at + self.ttl - time.time()) / 60
+        self.log(f"キャッシュ済みの認証トークンを再利用します (エリアID '{self.area_id}', 残り約 {remaining:.0f} 分)")
+        return True
+
+    def is_valid(self):
+        """トークンが有効期限（余裕を差し引いたもの）内であれば True。"""
+        if not self.authtoken or self.issued_at is None:
+            return False
+        return time.time() < self.issued_at + self.ttl - AUTH_TOKEN_REFRESH_MARGIN
+
+    def reauth(self, stale_token=None):
+        """
+        トークンが拒否された・期限切れの場合に再認証する。
+        複数のワーカーが同時に呼び出しても、ロックで直列化して再認証は1回だけ行う。
+        stale_token には拒否されたトークンを渡す。既に別スレッドが更新済みなら何もしない。
+        """
+        with self._refresh_lock:
+            if self.authtoken and self.authtoken != stale_token and self.is_valid():
+                return True
+
+            self.log("認証トークンを更新します...")
+            if self.token_cache:
+                self.token_cache.invalidate(self._cache_account)
+            # 新しいトークンが揃うまでは古いトークンのまま (auth が成功時にまとめて差し替える)
+            return self.auth(self._mail, self._password, use_cache=False)
+
+    def ensure_valid(self):
+        """有効期限が近いトークンを事前に更新する。長時間のバッチ処理の開始前に呼ぶ。"""
+        if self.is_valid():
+            return True
+        return self.reauth(self.authtoken)
+
+    # Auth1 のリクエストヘッダ
+    AUTH1_HEADERS = {
+        "User-Agent": "curl/7.52.1",
+        "Accept": "*/*",
+        "X-Radiko-App": "pc_html5",
+        "X-Radiko-App-Version": "0.0.1",
+        "X-Radiko-Device": "pc",
+        "X-Radiko-User": "dummy_user",
+    }
+
+    def _auth_network(self, mail, password):
+        """
+        Auth1 / Premium Login / Auth2 をネットワーク越しに実行し、成功すれば
+        (認証トークン, エリアID, radiko_session) を返す。失敗時は None。
+        結果は self に反映しない (反映は _apply_credentials で行う)。
+        """
+        import requests
+        self.log("Radiko認証を開始します...")
+        
+        # 0. プレミアムログイン (オプション)
+        radiko_session = None
+        if mail and password:
+            radiko_session = self._premium_login(mail, password)
+            if not radiko_session:
+                return None
+        
+        # 1. Auth1: AuthToken, KeyOffset, KeyLengthの取得
+        started = time.perf_counter()
+        try:
+            res1 = request_with_retry(self.session, "GET", URL_AUTH1, "auth1", self.log, headers=self.AUTH1_HEADERS, timeout=5)
+            res1.raise_for_status()
+        except (requests.RequestException, CircuitOpenError) as e:
+            self.log(f"エラー: Auth1リクエストに失敗しました: {e} ")
+            self._observe_auth("auth1", started, False)
+            return None
+
+        auth1 = self._handle_auth1_response(res1.headers)
+        self._observe_auth("auth1", started, bool(auth1))
+        if not auth1:
+            return None
+        authtoken, partial_key = auth1
+
+        # 2. Auth2: PartialKeyとAuthTokenを送信し、エリアIDを取得
+        auth2_url, auth2_headers = self._build_auth2_request(authtoken, partial_key, radiko_session)
+        started = time.perf_counter()
+        try:
+            res2 = request_with_retry(self.session, "GET", auth2_url, "auth2", self.log, headers=auth2_headers, timeout=5)
+            res2.raise_for_status()
+        except (requests.RequestException, CircuitOpenError) as e:
+            self.log(f"エラー: Auth2リクエストに失敗しました: {e} ")
+            self._observe_auth("auth2", started, False)
+            return None
+
+        area_id = self._handle_auth2_response(res2.text)
+        self._observe_auth("auth2", started, bool(area_id))
+        if not area_id:
+            return None
+        return authtoken, area_id, radiko_session
+
+    @staticmethod
+    def _observe_auth(step, started, ok):
+        """認証の段階 (auth1 / auth2 / login) の所要時間と成否をメトリクスとトレースに記録する。"""
+        METRIC_AUTH_DURATION.observe(time.perf_counter() - started, step=step)
+        METRIC_AUTH_REQUESTS.inc(step=step, result="ok" if ok else "error")
+        TRACER.add_span(f"auth.{step}", started, ok=ok)
+
+    def _handle_auth1_response(self, headers):
+        """Auth1の応答ヘッダから (認証トークン, PartialKey) を返す。失敗時は None。"""
+        # AuthTokenとKey情報をレスポンスヘッダから抽出 
+        authtoken = headers.get("X-Radiko-AuthToken")
+        keyoffset = headers.get("X-Radiko-KeyOffset")
+        keylength = headers.get("X-Radiko-KeyLength")
+
+        if not all([authtoken, keyoffset, keylength]):
+            self.log("エラー: Auth1応答ヘッダから必須情報(Token, Offset, Length)が取得できませんでした。")
+            return None
+        
+        self.log("Auth1成功: 認証トークンを取得しました。")
+        
+        # PartialKeyの生成
+        partial_key = self._generate_partial_key(keyoffset, keylength)
+        if not partial_key:
+            return None
+        return authtoken, partial_key
+
+    def _build_auth2_request(self, authtoken, partial_key, radiko_session=None):
+        """Auth2 のURLとリクエストヘッダを返す。"""
+        auth2_headers = {
+            "User-Agent": "curl/7.52.1",
+            "Accept": "*/*",
+            "X-Radiko-Device": "pc",
+            "X-Radiko-User": "dummy_user",
+            "X-Radiko-App": "pc_html5",
+            "X-Radiko-App-Version": "0.0.1",
+            "X-Radiko-AuthToken": authtoken,
+            "X-Radiko-PartialKey": partial_key,
+        }
 
-        # GUIコンポーネントの構築
-        self._create_widgets(master)
-        
-        # ログの定期的な更新を開始
-        self.master.after(100, self._process_log_queue)
         
-        # アプリケーション終了時にログアウト処理を確実に実行
-        master.protocol("WM_DELETE_WINDOW", self._on_closing)
+        # Premiumセッションがある場合はURLにクエリパラメータを追加 
+        auth2_url = URL_AUTH2
+        if radiko_session:
+            auth2_url += f"?radiko_session={radiko_session}"
+        return auth2_url, auth2_headers
+
+    def _handle_auth2_response(self, text):
+        """Auth2の応答ボディからエリアIDを取り出して返す。失敗時は None。"""
+        # エリアIDは応答ボディに含まれる（CSV風テキスト）
+        body = text.strip()
+        # デバッグしたくなったらコメントアウトを外す
+        self.log(f"Auth2レスポンス: {body}")
+
+        # OUT または空文字はエリア判定失敗
+        if not body or body == "OUT":
+            self.log("エラー: Auth2でエリアが判定されませんでした。(レスポンスが空 or OUT)")
+            return None
+
+        # 1行目を取り出してカンマ区切りの先頭要素が area_id
+        first_line = body.splitlines()[0]
+        area_id = first_line.split(",")[0].strip()
+
+        if not area_id:
+            self.log("エラー: Auth2応答ボディからエリアIDが抽出できませんでした。")
+            return None
+
+        self.log(f"Auth2成功: エリアID '{area_id}' を取得しました。")
+        return area_id
+            
+    def _premium_login(self, mail, password):
+        """Radiko Premiumログインを実行し、radiko_session を返す。失敗時は None。"""
+        login_data = {"mail": mail, "pass": password}
+        started = time.perf_counter()
+        radiko_session = None
+        try:
+            res = request_with_retry(self.session, "POST", URL_PREMIUM_LOGIN, "login", self.log, data=login_data, timeout=5)
+            res.raise_for_status()
+            # cookie は self.session.cookies に自動で入っている
+            radiko_session = self._handle_login_response(res.json())
+            return radiko_session
+        except Exception as e:
+            self.log(f"エラー: Premiumログイン中に例外が発生しました: {e} ")
+            return None
+        finally:
+            self._observe_auth("login", started, bool(radiko_session))
+
+    def _handle_login_response(self, data):
+        """Premiumログインの応答 (JSON) から radiko_session を取り出して返す。失敗時は None。"""
+        radiko_session = data.get("radiko_session")
+        areafree = data.get("areafree")
+
+        if radiko_session and areafree == "1":
+            self.log("Premiumログインに成功しました。エリアフリー録音が可能です。")
+            return radiko_session
+        self.log("エラー: Premiumログインに失敗しました。認証情報をご確認ください。")
+        return None
+
+    def logout(self):
+        """Premiumセッションを終了する """
+        if self.radiko_session:
+            self.log("Premiumセッションをログアウトします...")
+            logout_data = {"radiko_session": self.radiko_session}
+            import requests
+            try:
+                request_with_retry(self.session, "POST", URL_PREMIUM_LOGOUT, "logout", self.log, data=logout_data, timeout=5)
+            except (requests.RequestException, CircuitOpenError):
+                # ログアウトの失敗は致命的ではないが記録
+                self.log("警告: ログアウト処理中にエラーが発生しました。")
+            finally:
+                self.radiko_session = None
+                # ログアウトしたセッションを含むキャッシュは再利用できない
+                if self.token_cache:
+                    self.token_cache.invalidate(self._cache_account)
+        
+class GuideCache:
+    """
+    番組表XMLを (局ID, 日付) をキーとしてディスクにキャッシュするクラス。
+    放送日の終了後に取得した番組表は不変とみなしてそのまま返し、それ以外 (当日以降、
+    または放送中に取得したまま放送日が終わったもの) は ETag / Last-Modified による
+    条件付きリクエストで再検証する。
+    合計サイズが max_bytes を超えた場合は、最後の参照が古いエントリから削除する。
+    """
+    def __init__(self, cache_dir=GUIDE_CACHE_DIR, max_bytes=GUIDE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._lock = threading.Lock()
+
+    def _paths(self, key):
+        name = "_".join(key)
+        base = os.path.join(self.cache_dir, name)
+        return base + ".xml", base + ".json"
+
+    @staticmethod
+    def is_immutable(date_str, now=None):
+        """放送日（翌朝5時まで）が終了していれば True。"""
+        try:
+            day = datetime.strptime(date_str, '%Y%m%d')
+        except ValueError:
+            return False
+        day_end = day + timedelta(days=1, hours=RADIKO_DAY_START_HOUR)
+        return (now or datetime.now()) >= day_end
+
+    @staticmethod
+    def is_final(date_str, meta):
+        """
+        エントリが放送日の終了後に取得 (または再検証) したものなら True。
+        放送中に取得した番組表は延長・差し替えを含まないため、終了後に1度だけ再検証する。
+        """
+        fetched_at = meta.get("fetched_at")
+        if fetched_at is None:
+            return False
+        return GuideCache.is_immutable(date_str, now=datetime.fromtimestamp(fetched_at))
+
+    def get(self, key):
+        """(XMLバイト列, メタ情報) を返す。無ければ None。参照時刻を更新する。"""
+        xml_path, meta_path = self._paths(key)
+        with self._lock:
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                with open(xml_path, "rb") as f:
+                    content = f.read()
+                # 最終参照時刻を更新 (LRU削除の基準)
+                os.utime(meta_path)
+            except (OSError, ValueError):
+                return None
+        return content, meta
+
+    def put(self, key, content, etag=None, last_modified=None):
+        xml_path, meta_path = self._paths(key)
+        meta = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": time.time(),
+            "size": len(content),
+        }
+        with self._lock:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(xml_path, "wb") as f:
+                    f.write(content)
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+                self._evict()
+            except OSError:
+                # キャッシュの保存失敗は致命的ではない
+                pass
+
+    def mark_fresh(self, key):
+        """再検証の結果、変更が無かったエントリの取得時刻を更新する。"""
+        _, meta_path = self._paths(key)
+        with self._lock:
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                meta["fetched_at"] = time.time()
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+            except (OSError, ValueError):
+                pass
+
+    def _evict(self):
+        """合計サイズが上限を超えていれば、参照が古い順に削除する (self._lock を保持した状態で呼ぶ)"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.cache_dir, name)
+            xml_path = meta_path[:-len(".json")] + ".xml"
+            try:
+                size = os.path.getsize(xml_path)
+                last_used = os.path.getmtime(meta_path)
+            except OSError:
+                continue
+            entries.append((last_used, size, xml_path, meta_path))
+            total += size
+
+        entries.sort()
+        for last_used, size, xml_path, meta_path in entries:
+            if total <= self.max_bytes:
+                break
+            for path in (xml_path, meta_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+    def record(self, hit, revalidated=False):
+        with self._lock:
+            if revalidated:
+                self.revalidations += 1
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+def parse_radiko_time(value):
+    """
+    YYYYMMDDHHMMSS 形式の時刻文字列をdatetimeに変換する。
+    固定長の書式なので、strptime を使わずスライスで直接組み立てる。
+    """
+    return datetime(
+        int(value[0:4]), int(value[4:6]), int(value[6:8]),
+        int(value[8:10]), int(value[10:12]), int(value[12:14]),
+    )
+
+
+class Program:
+    """
+    番組表の1番組を表すレコード。大量の番組を保持するため __slots__ でメモリを抑え、
+    開始・終了時刻のdatetimeは参照されたときに初めて生成する。
+    """
+    __slots__ = (
+        "station_id", "title", "start_time_str", "end_time_str",
+        "performer", "info", "url", "_start_time_dt", "_end_time_dt",
+    )
+
+    def __init__(self, station_id, title, start_time_str, end_time_str, performer="", info="", url=""):
+        self.station_id = station_id
+        self.title = title
+        self.start_time_str = start_time_str
+        self.end_time_str = end_time_str
+        self.performer = performer
+        self.info = info
+        self.url = url
+        self._start_time_dt = None
+        self._end_time_dt = None
+
+    @property
+    def start_time_dt(self):
+        if self._start_time_dt is None:
+            self._start_time_dt = parse_radiko_time(self.start_time_str)
+        return self._start_time_dt
+
+    @property
+    def end_time_dt(self):
+        if self._end_time_dt is None:
+            self._end_time_dt = parse_radiko_time(self.end_time_str)
+        return self._end_time_dt
+
+    @property
+    def duration_seconds(self):
+        return (self.end_time_dt - self.start_time_dt).total_seconds()
+
+    def __repr__(self):
+        return f"Program({self.station_id!r}, {self.title!r}, {self.start_time_str!r}, {self.end_time_str!r})"
+
+
+def _is_radiko_time(value):
+    return value is not None and len(value) == 14 and value.isdigit()
+
+
+def validate_time_range(start_time_str, end_time_str):
+    """開始・終了時刻が YYYYMMDDHHMMSS 形式の実在する時刻で、開始 < 終了 であることを確かめる。不正なら ValueError。"""
+    for value in (start_time_str, end_time_str):
+        if not _is_radiko_time(value):
+            raise ValueError(f"時刻は YYYYMMDDHHMMSS 形式 (14桁) で指定してください: {value!r}")
+    if parse_radiko_time(start_time_str) >= parse_radiko_time(end_time_str):
+        raise ValueError(f"終了時刻が開始時刻より前です: {start_time_str}〜{end_time_str}")
+
+
+def iter_guide_programs(source, station_names=None):
+    """
+    番組表XML（局単位・エリア単位のどちらでも可）を iterparse で逐次解析し、Program を順に返す。
+    処理済みの要素はその場で破棄するため、エリア全体・複数日の番組表でもメモリ使用量が増えない。
+    source はバイト列またはファイルオブジェクト。station_names に辞書を渡すと局名を格納する。
+    解析エラー時は ET.ParseError を送出する。
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    station_id = None
+    depth_in_prog = 0
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == "station":
+                station_id = elem.get("id")
+            elif tag == "prog":
+                depth_in_prog += 1
+            continue
+
+        if tag == "prog":
+            depth_in_prog -= 1
+            ft = elem.get("ft")  # 例: '20240521050000'
+            to = elem.get("to")
+            if _is_radiko_time(ft) and _is_radiko_time(to):
+                yield Program(
+                    station_id,
+                    elem.findtext("title") or "(タイトル不明)",
+                    ft,
+                    to,
+                    elem.findtext("pfm") or "",
+                    elem.findtext("info") or "",
+                    elem.findtext("url") or "",
+                )
+            elem.clear()
+        elif tag == "name" and depth_in_prog == 0:
+            # 局名 (prog 内の name ではないもの)
+            if station_names is not None and station_id and elem.text:
+                station_names[station_id] = elem.text
+        elif tag in ("progs", "station"):
+            elem.clear()
+
+
+class GuideIndex:
+    """
+    取得済みの番組表を (局ID, 日付) で引けるように保持するクラス。
+    エリア一括取得の結果を格納し、以降の「局X・日付Y」の参照をI/Oなしで返す。
+    """
+    def __init__(self):
+        self.station_names = {}
+        self._programs = {}
+        self._lock = threading.Lock()
+
+    def add(self, station_id, date_str, programs, station_name=None):
+        with self._lock:
+            self._programs[(station_id, date_str)] = programs
+            if station_name:
+                self.station_names[station_id] = station_name
+
+    def get(self, station_id, date_str):
+        """該当する番組一覧を返す。未取得なら None。"""
+        with self._lock:
+            return self._programs.get((station_id, date_str))
+
+    def dates(self, station_id=None):
+        with self._lock:
+            return sorted({d for s, d in self._programs if station_id is None or s == station_id})
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(programs) for programs in self._programs.values())
+
+
+class RadikoMetadata:
+    # エリアの局リストが取得できなかった場合の既定の局
+    DEFAULT_STATIONS = {
+        "TBS": "TBSラジオ",
+        "QRR": "文化放送",
+        "LFR": "ニッポン放送",
+        "RN1": "ラジオNIKKEI第1",
+        "FMJ": "J-WAVE",
+    }
+
+    def __init__(self, auth, log_callback, guide_cache_dir=GUIDE_CACHE_DIR):
+        self.auth = auth
+        self.log = log_callback
+        # guide_cache_dir に None を指定すると番組表をキャッシュしない
+        self.guide_cache = GuideCache(guide_cache_dir) if guide_cache_dir else None
+        self.guide_index = GuideIndex()
+        self.STATIONS = dict(self.DEFAULT_STATIONS)
+
+    def get_stations(self):
+        return self.STATIONS
+
+    def load_stations(self, area_id=None):
+        """
+        認証で判定されたエリアの局リストをAPIから取得して STATIONS を更新する。
+        取得に失敗した場合は既存の局リストのまま False を返す。
+        """
+        area_id = area_id or self.auth.area_id
+        if not area_id:
+            return False
+
+        url = URL_STATION_LIST.format(area_id=area_id)
+        content = self._fetch_guide_xml(url, ("stations", area_id), "")
+        if content is None:
+            return False
+        return self._apply_station_list(content, area_id)
+
+    def _apply_station_list(self, content, area_id):
+        """局リストXMLを解析して STATIONS を更新する。"""
+        try:
+            root = ET.fromstring(content)
+        except ET.ParseError as e:
+            self.log(f"エラー: 局リストXMLの解析に失敗しました: {e}")
+            return False
+
+        stations = {}
+        for station in root.iter("station"):
+            station_id = station.findtext("id")
+            if station_id:
+                stations[station_id] = station.findtext("name", default=station_id)
+
+        if not stations:
+            self.log(f"警告: エリア '{area_id}' の局リストが空でした。")
+            return False
+
+        self.STATIONS = stations
+        self.log(f"局リスト取得: エリア '{area_id}' の {len(stations)} 局")
+        return True
+
+    def get_area_programs(self, date_str, area_id=None):
+        """
+        エリア内の全局の番組表を1回のリクエストで取得し、guide_index に格納する。
+        格納した局数を返す。
+        """
+        area_id = area_id or self.auth.area_id
+        if not area_id:
+            self.log("エラー: エリアIDが未確定のため、エリア一括取得を行えません。")
+            return 0
+
+        url = URL_AREA_GUIDE.format(date=date_str, area_id=area_id)
+        with TRACER.span("guide.get_area_programs", area=area_id, date=date_str) as span:
+            content = self._fetch_guide_xml(url, ("area", area_id, date_str), date_str)
+            if content is None:
+                return 0
+            count = self._index_area_guide(content, date_str, area_id)
+            span.set(stations=count)
+            return count
+
+    def _index_area_guide(self, content, date_str, area_id):
+        """エリア番組表XMLを解析して guide_index に格納し、格納した局数を返す。"""
+        station_names = {}
+        by_station = {}
+        with TRACER.span("guide.parse", area=area_id, date=date_str, bytes=len(content)) as span:
+            try:
+                for program in iter_guide_programs(content, station_names):
+                    by_station.setdefault(program.station_id, []).append(program)
+            except ET.ParseError as e:
+                self.log(f"エラー: 番組表XMLの解析に失敗しました: {e}")
+                return 0
+            span.set(programs=sum(len(programs) for programs in by_station.values()))
+
+        for station_id, programs in by_station.items():
+            self.guide_index.add(station_id, date_str, programs, station_names.get(station_id))
+        count = len(by_station)
+
+        self.log(f"エリア番組表取得: {area_id} {date_str} ({count} 局)")
+        return count
+
+    def get_area_week(self, dates=None, area_id=None, max_workers=GUIDE_BULK_WORKERS):
+        """
+        タイムフリー期間（既定は今日を含む過去 TIME_FREE_DAYS 日）のエリア番組表を並行して取得する。
+        取得結果は guide_index に格納され、以降の get_programs はI/Oなしで返る。
+        """
+        if dates is None:
+            today = datetime.now()
+            dates = [(today - timedelta(days=i)).strftime('%Y%m%d') for i in range(TIME_FREE_DAYS)]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(lambda d: self.get_area_programs(d, area_id), dates))
+
+        self.log(f"エリア番組表の一括取得完了: {len(dates)} 日分, {len(self.guide_index)} 番組")
+        return self.guide_index
+
+    def get_programs(self, station_id, date_str):
+        """
+        Radiko公式の番組表APIから、指定局・指定日の番組一覧を取得する。
+        date_str: 'YYYYMMDD'
+        """
+        programs = self.fetch_programs(station_id, date_str)
+        return programs if programs is not None else []
+
+    def fetch_programs(self, station_id, date_str):
+        """get_programs と同じだが、番組表を取得できなかった場合は空リストではなく None を返す。"""
+        with TRACER.span("guide.get_programs", station=station_id, date=date_str) as span:
+            indexed = self._lookup_programs(station_id, date_str)
+            if indexed is not None:
+                span.set(indexed=True, programs=len(indexed))
+                return indexed
+
+            url = URL_STATION_GUIDE.format(date=date_str, station_id=station_id)
+            content = self._fetch_guide_xml(url, (station_id, date_str), date_str)
+            if content is None:
+                return None
+            programs = self._parse_station_guide(content)
+            span.set(indexed=False, programs=len(programs))
+            return programs
+
+    def _lookup_programs(self, station_id, date_str):
+        """通信せずに返せる場合は番組一覧 (未知の局なら空リスト) を、通信が必要なら None を返す。"""
+        if station_id not in self.STATIONS:
+            self.log(f"警告: 未知の局IDが指定されました: {station_id}")
+            return []
+
+        # エリア一括取得済みであればI/Oなしで返す
+        indexed = self.guide_index.get(station_id, date_str)
+        if indexed is not None:
+            self.log(f"番組表取得: {len(indexed)} 件 (一括取得済みの番組表を使用)")
+        return indexed
+
+    def _parse_station_guide(self, content):
+        """局単位の番組表XMLを解析して番組一覧を返す。"""
+        with TRACER.span("guide.parse", bytes=len(content)) as span:
+            try:
+                program_data = list(iter_guide_programs(content))
+            except ET.ParseError as e:
+                self.log(f"エラー: 番組表XMLの解析に失敗しました: {e}")
+                return []
+            span.set(programs=len(program_data))
+
+        stats = self.guide_cache.stats() if self.guide_cache else None
+        if stats:
+            self.log(f"番組表取得: {len(program_data)} 件 (キャッシュ ヒット {stats['hits']} / ミス {stats['misses']})")
+        else:
+            self.log(f"番組表取得: {len(program_data)} 件")
+        return program_data
+
+    def _fetch_guide_xml(self, url, cache_key, date_str):
+        """
+        番組表XMLを取得する。キャッシュがあれば、過去日はそのまま、当日以降は一定期間内なら
+        そのまま、それ以外は条件付きリクエストで再検証して使う。失敗時は None。
+        """
+        content, cached, headers = self._guide_cache_lookup(cache_key, date_str)
+        if content is not None:
+            return content
+
+        self.log(f"番組表APIにアクセス: {url}")
+        import requests
+        started = time.perf_counter()
+        try:
+            # 認証用セッションがあるならそれを使う（Cookie共有）
+            session = self.auth.session if getattr(self.auth, "session", None) else requests
+            stale_token = self.auth.authtoken
+            res = request_with_retry(session, "GET", url, "guide", self.log, headers=headers, timeout=10)
+            if res.status_code in AUTH_REJECTED_STATUSES and self.auth.reauth(stale_token):
+                # 拒否された場合は再認証して1回だけ再試行する
+                res = request_with_retry(session, "GET", url, "guide", self.log, headers=headers, timeout=10)
+
+            if res.status_code == 304 and cached:
+                self._observe_guide_fetch(cache_key, started, "not_modified")
+                return self._guide_not_modified(cache_key, cached)
+
+            res.raise_for_status()
+        except (requests.RequestException, CircuitOpenError) as e:
+            self.log(f"エラー: 番組表取得に失敗しました: {e}")
+            self._observe_guide_fetch(cache_key, started, "error")
+            return None
+
+        self._observe_guide_fetch(cache_key, started, "ok", len(res.content))
+        return self._guide_fetched(cache_key, res.content, res.headers)
+
+    @staticmethod
+    def _observe_guide_fetch(cache_key, started, result, nbytes=0):
+        """
+        番組表の取得の所要時間と結果をメトリクスとトレースに記録する。
+        種別 (kind) はキャッシュのキーから決める (局一覧 stations / エリア一括 area / 局ごと station)。
+        """
+        kind = cache_key[0] if cache_key[0] in ("stations", "area") else "station"
+        METRIC_GUIDE_FETCH_DURATION.observe(time.perf_counter() - started, kind=kind)
+        METRIC_GUIDE_FETCHES.inc(kind=kind, result=result)
+        TRACER.add_span("guide.fetch", started, kind=kind, key="/".join(cache_key), result=result, bytes=nbytes)
+
+    def _guide_cache_lookup(self, cache_key, date_str):
+        """
+        キャッシュを引き、(そのまま使える内容, キャッシュのエントリ, 条件付きリクエスト用ヘッダ) を返す。
+        放送日の終了後に取得したキャッシュ、または放送中の日の一定期間内のキャッシュは再検証せずにそのまま使う。
+        放送中に取得したまま放送日が終わったキャッシュは、条件付きリクエストで1度再検証する。
+        """
+        cached = self.guide_cache.get(cache_key) if self.guide_cache else None
+        headers = {}
+        if cached:
+            content, meta = cached
+            fresh = (not GuideCache.is_immutable(date_str)
+                     and time.time() - meta["fetched_at"] < GUIDE_CACHE_FRESH_SECONDS)
+            if fresh or GuideCache.is_final(date_str, meta):
+                self.guide_cache.record(hit=True)
+                METRIC_GUIDE_CACHE.inc(result="hit")
+                return content, cached, headers
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        return None, cached, headers
+
+    def _guide_not_modified(self, cache_key, cached):
+        """304 (変更なし): キャッシュをそのまま使う"""
+        self.guide_cache.record(hit=True, revalidated=True)
+        METRIC_GUIDE_CACHE.inc(result="revalidated")
+        self.guide_cache.mark_fresh(cache_key)
+        return cached[0]
+
+    def _guide_fetched(self, cache_key, content, headers):
+        """取得した番組表XMLをキャッシュに保存して返す。"""
+        if self.guide_cache:
+            self.guide_cache.record(hit=False)
+            METRIC_GUIDE_CACHE.inc(result="miss")
+            self.guide_cache.put(cache_key, content, headers.get("ETag"), headers.get("Last-Modified"))
+        return content
+
+class ProgramSearchIndex:
+    """
+    番組表をSQLiteに蓄積し、全局・タイムフリー期間を横断してタイトル・出演者・番組詳細を
+    検索するための永続インデックス。FTS5（trigramトークナイザ）が使えればそれを使い、
+    使えない環境や3文字未満の検索語では LIKE による検索にフォールバックする。
+    (局, 日付) 単位で取り込み状況を記録し、未取得・更新が必要な日だけを追加取得する。
+    """
+    def __init__(self, path=PROGRAM_INDEX_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self.fts_enabled = self._create_schema()
+
+    def _create_schema(self):
+        with self._lock, self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS programs (
+                    station_id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    start_time TEXT NOT NULL,
+                    end_time TEXT NOT NULL,
+                    title TEXT,
+                    performer TEXT,
+                    info TEXT,
+                    url TEXT,
+                    UNIQUE (station_id, start_time)
+                );
+                CREATE INDEX IF NOT EXISTS programs_day ON programs (station_id, date);
+                CREATE TABLE IF NOT EXISTS indexed_days (
+                    station_id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    immutable INTEGER NOT NULL,
+                    indexed_at REAL NOT NULL,
+                    PRIMARY KEY (station_id, date)
+                );
+                """
+            )
+            try:
+                # programs を外部コンテンツとする全文検索テーブルと、同期用トリガ
+                self._conn.executescript(
+                    """
+                    CREATE VIRTUAL TABLE IF NOT EXISTS programs_fts USING fts5(
+                        title, performer, info, content='programs', content_rowid='rowid', tokenize='trigram'
+                    );
+                    CREATE TRIGGER IF NOT EXISTS programs_ai AFTER INSERT ON programs BEGIN
+                        INSERT INTO programs_fts (rowid, title, performer, info)
+                        VALUES (new.rowid, new.title, new.performer, new.info);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS programs_ad AFTER DELETE ON programs BEGIN
+                        INSERT INTO programs_fts (programs_fts, rowid, title, performer, info)
+                        VALUES ('delete', old.rowid, old.title, old.performer, old.info);
+                    END;
+                    """
+                )
+                return True
+            except sqlite3.OperationalError:
+                return False
+
+    def needs_update(self, station_id, date_str):
+        """未取り込み、または当日以降で最終取り込みから一定時間経過していれば True。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT immutable, indexed_at FROM indexed_days WHERE station_id = ? AND date = ?",
+                (station_id, date_str),
+            ).fetchone()
+        if row is None:
+            return True
+        immutable, indexed_at = row
+        if immutable:
+            return False
+        return time.time() - indexed_at >= GUIDE_CACHE_FRESH_SECONDS
+
+    def add_programs(self, station_id, date_str, programs):
+        """(局, 日付) の番組を置き換える形で取り込む。"""
+        rows = [
+            (station_id, date_str, p.start_time_str, p.end_time_str, p.title, p.performer, p.info, p.url)
+            for p in programs
+        ]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM programs WHERE station_id = ? AND date = ?", (station_id, date_str))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO programs "
+                "(station_id, date, start_time, end_time, title, performer, info, url) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO indexed_days (station_id, date, immutable, indexed_at) VALUES (?, ?, ?, ?)",
+                (station_id, date_str, int(GuideCache.is_immutable(date_str)), time.time()),
+            )
+
+    def update_from_metadata(self, metadata, dates=None, station_ids=None):
+        """
+        RadikoMetadata から番組表を取得して取り込む。更新が必要な (局, 日付) だけを対象とし、
+        エリアIDが判明していればエリア一括取得で1日1リクエストにまとめる。
+        取り込んだ (局, 日付) の数を返す。
+        """
+        if dates is None:
+            today = datetime.now()
+            dates = [(today - timedelta(days=i)).strftime('%Y%m%d') for i in range(TIME_FREE_DAYS)]
+        station_ids = list(station_ids or metadata.get_stations())
+
+        updated = 0
+        for date_str in dates:
+            stale = [sid for sid in station_ids if self.needs_update(sid, date_str)]
+            if not stale:
+                continue
+
+            if metadata.auth.area_id and len(stale) > 1:
+                metadata.get_area_programs(date_str)
+            for station_id in stale:
+                programs = metadata.guide_index.get(station_id, date_str)
+                if programs is None:
+                    programs = metadata.fetch_programs(station_id, date_str)
+                # 番組の無い日も取り込み済みとして記録し、次回の更新で取得し直さない (取得失敗は除く)
+                if programs is not None:
+                    self.add_programs(station_id, date_str, programs)
+                    updated += 1
+
+        metadata.log(f"番組検索インデックス更新: {updated} 件の局・日付を取り込みました。")
+        return updated
+
+    def search(self, query, limit=PROGRAM_SEARCH_LIMIT, station_id=None):
+        """タイトル・出演者・番組詳細にキーワードを含む番組を新しい順に返す。"""
+        query = query.strip()
+        if not query:
+            return []
+
+        params = []
+        if self.fts_enabled and len(query) >= 3:
+            # 検索語全体を1つのフレーズとして扱う (FTS5の構文として解釈させない)
+            where = "rowid IN (SELECT rowid FROM programs_fts WHERE programs_fts MATCH ?)"
+            params.append('"' + query.replace('"', '""') + '"')
+        else:
+            pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where = "(title LIKE ? ESCAPE '\\' OR performer LIKE ? ESCAPE '\\' OR info LIKE ? ESCAPE '\\')"
+            params.extend([pattern] * 3)
+
+        if station_id:
+            where += " AND station_id = ?"
+            params.append(station_id)
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT station_id, title, start_time, end_time, performer, info, url FROM programs "
+                f"WHERE {where} ORDER BY start_time DESC LIMIT ?",
+                params,
+            ).fetchall()
+        return [Program(*row) for row in rows]
+
+    def prune(self, keep_days=TIME_FREE_DAYS):
+        """タイムフリー期間を過ぎた番組を削除する。"""
+        cutoff = (datetime.now() - timedelta(days=keep_days)).strftime('%Y%m%d')
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM programs WHERE date < ?", (cutoff,))
+            self._conn.execute("DELETE FROM indexed_days WHERE date < ?", (cutoff,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def format_duration(seconds):
+    """秒数を H:MM:SS 形式の文字列にする。"""
+    seconds = int(max(0, seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class DownloadProgress:
+    """
+    1件のダウンロードの進捗。処理済みのメディア時間、書き込んだバイト数、経過時間から
+    実時間に対する取得速度（倍速）と残り時間を算出する。
+    FFmpegの -progress 出力、ネイティブ取得、分割ダウンロードのいずれもこの形で通知する。
+    """
+    __slots__ = ("total_seconds", "media_seconds", "bytes_written", "elapsed", "finished")
+
+    def __init__(self, total_seconds, media_seconds=0.0, bytes_written=0, elapsed=0.0, finished=False):
+        self.total_seconds = total_seconds
+        self.media_seconds = media_seconds
+        self.bytes_written = bytes_written
+        self.elapsed = elapsed
+        self.finished = finished
+
+    @property
+    def percent(self):
+        if self.finished:
+            return 100.0
+        if self.total_seconds <= 0:
+            return 0.0
+        return min(100.0, self.media_seconds / self.total_seconds * 100)
+
+    @property
+    def speed(self):
+        """実時間に対する倍速 (例: 30.0 なら1時間番組を2分で取得)"""
+        return self.media_seconds / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self):
+        """残り時間(秒)。速度が求まらない間は None。"""
+        if self.finished:
+            return 0.0
+        speed = self.speed
+        if speed <= 0:
+            return None
+        return max(0.0, self.total_seconds - self.media_seconds) / speed
+
+    @classmethod
+    def combine(cls, parts, elapsed):
+        """分割ダウンロードの各区間の進捗を1つにまとめる。"""
+        return cls(
+            sum(p.total_seconds for p in parts),
+            sum(p.media_seconds for p in parts),
+            sum(p.bytes_written for p in parts),
+            elapsed,
+            all(p.finished for p in parts),
+        )
+
+    def summary(self):
+        eta = self.eta_seconds
+        return (
+            f"{self.percent:.0f}% {format_duration(self.media_seconds)}/{format_duration(self.total_seconds)} "
+            f"{self.bytes_written / 1024 / 1024:.1f}MB {self.speed:.1f}x "
+            f"残り{format_duration(eta) if eta is not None else '--:--:--'}"
+        )
+
+    def to_dict(self):
+        eta = self.eta_seconds
+        return {
+            "percent": round(self.percent, 1),
+            "media_s": round(self.media_seconds, 1),
+            "total_s": round(self.total_seconds, 1),
+            "bytes": self.bytes_written,
+            "speed": round(self.speed, 2),
+            "eta_s": round(eta, 1) if eta is not None else None,
+        }
+
+
+class HLSSegmentFetcher:
+    """
+    M3U8プレイリスト（入れ子のvariant/chunklistを含む）を解析し、
+    AACセグメントを認証済みセッション上で並列に取得して順番通りに書き出すクラス。
+    FFmpegの逐次的なプレイリスト読み込みを置き換える。
+    """
+    # 入れ子プレイリストを辿る最大の深さ（ループ防止）
+    MAX_PLAYLIST_DEPTH = 5
+
+    def __init__(self, session, headers, log_callback, max_workers=HLS_DEFAULT_WORKERS,
+                 reauth_callback=None, concurrency=None):
+        self.session = session
+        self.headers = headers
+        self.log = log_callback
+        # 認証ヘッダが拒否された際に呼ばれ、新しいヘッダを返すコールバック
+        self.reauth_callback = reauth_callback
+        # AdaptiveConcurrency を渡すと、同時接続数を max_workers ではなくその limit で制限する
+        self.concurrency = concurrency
+        if concurrency:
+            max_workers = concurrency.max_limit
+        self.max_workers = max(1, int(max_workers))
+        self._cancel_event = threading.Event()
+
+        # 取得統計
+        self.bytes_fetched = 0
+        self.segments_fetched = 0
+        self.segments_total = 0
+        self.elapsed = 0.0
+
+    @staticmethod
+    def parse_playlist(text, base_url):
+        """
+        M3U8テキストを解析し、(variantプレイリストURLのリスト, セグメントURLのリスト) を返す。
+        相対URLは base_url を基準に解決する。
+        """
+        variants = []
+        segments = []
+        expect_variant = False
+
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                # 次の行がvariantプレイリストであることを示すタグ
+                if line.startswith("#EXT-X-STREAM-INF"):
+                    expect_variant = True
+                continue
+
+            url = urljoin(base_url, line)
+            if expect_variant or url.split("?", 1)[0].endswith(".m3u8"):
+                variants.append(url)
+            else:
+                segments.append(url)
+            expect_variant = False
+
+        return variants, segments
+
+    def resolve_segments(self, playlist_url, depth=0):
+        """プレイリストを再帰的に辿り、最終的なセグメントURLの一覧を返す。"""
+        if depth > self.MAX_PLAYLIST_DEPTH:
+            raise ValueError("プレイリストの入れ子が深すぎます。")
+
+        text = self.get_playlist(playlist_url)
+        if not text.lstrip().startswith("#EXTM3U"):
+            raise ValueError("M3U8形式ではない応答を受信しました。")
+
+        variants, segments = self.parse_playlist(text, playlist_url)
+        if segments:
+            return segments
+        if variants:
+            # Radikoのタイムフリーは単一のvariantのみを返すため先頭を採用する
+            return self.resolve_segments(variants[0], depth + 1)
+        return []
+
+    def _get(self, url, endpoint="segment"):
+        """
+        認証ヘッダ付きでGETする。一時的なエラーはこのリクエスト単位でバックオフ後に再試行し、
+        トークンが拒否された場合は再認証後に1回だけ再試行する。
+        """
+        headers = self.headers
+        observer = self._observe if self.concurrency and endpoint == "segment" else None
+        res = request_with_retry(self.session, "GET", url, endpoint, self.log, observer=observer,
+                                 headers=headers, timeout=10)
+        if res.status_code in AUTH_REJECTED_STATUSES and self.reauth_callback:
+            new_headers = self.reauth_callback(headers)
+            if new_headers:
+                self.headers = new_headers
+                res = request_with_retry(self.session, "GET", url, endpoint, self.log, observer=observer,
+                                         headers=new_headers, timeout=10)
+        res.raise_for_status()
+        return res
+
+    def _observe(self, res, elapsed):
+        """セグメント取得の試行ごとの結果を同時実行数の自動調整へ渡す"""
+        if res is None:
+            self.concurrency.record(ok=False, latency=elapsed)
+            return
+        status = res.status_code
+        self.concurrency.record(
+            ok=status < 500 and status != 429,
+            throttled=status in ADAPTIVE_THROTTLE_STATUSES,
+            latency=elapsed,
+            nbytes=len(res.content) if status < 400 else 0,
+        )
+
+    def _fetch_segment(self, url):
+        """セグメントを1つ取得してバイト列を返す (ワーカースレッド内実行)"""
+        if self._cancel_event.is_set():
+            return None
+        if self.concurrency:
+            with self.concurrency.slot():
+                if self._cancel_event.is_set():
+                    return None
+                return self.get_segment(url)
+        return self.get_segment(url)
+
+    def get_playlist(self, url):
+        """プレイリストを1回取得してテキストを返す (再試行・再認証は _get と同じ)"""
+        return self._get(url, "playlist").text
+
+    def get_segment(self, url):
+        """セグメントを1つ取得してバイト列を返す (キャンセルや同時実行数の制御はしない)"""
+        with TRACER.span("fetch.segment") as span:
+            data = self._get(url).content
+            span.set(bytes=len(data))
+        return data
+
+    def fetch(self, playlist_url, out_file, progress_callback=None, total_seconds=0):
+        """
+        プレイリスト配下の全セグメントを並列に取得し、out_file へ順番通りに書き込む。
+        同時に保持するセグメント数は max_workers の2倍までに制限する。
+        total_seconds (区間の長さ) を渡すと、取得済みセグメント数からメディア時間を算出して通知する。
+        """
+        self._cancel_event.clear()
+        start_time = time.time()
+
+        try:
+            with TRACER.span("fetch.playlist") as span:
+                segments = self.resolve_segments(playlist_url)
+                span.set(segments=len(segments))
+        except Exception as e:
+            self.log(f"エラー: プレイリストの解析に失敗しました: {e}")
+            return False
+
+        if not segments:
+            self.log("エラー: プレイリストにセグメントが含まれていません。")
+            return False
+
+        self.segments_total = len(segments)
+        if self.concurrency:
+            self.log(f"ネイティブ取得を開始: {self.segments_total} セグメント "
+                     f"(同時接続 {self.concurrency.limit}, 自動調整 {self.concurrency.min_limit}〜{self.concurrency.max_limit})")
+        else:
+            self.log(f"ネイティブ取得を開始: {self.segments_total} セグメント (同時接続 {self.max_workers})")
+
+        window = self.max_workers * 2
+        pending = {}
+        next_index = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            try:
+                for index in range(self.segments_total):
+                    # 先読みウィンドウ分だけ投入しておく
+                    while next_index < self.segments_total and next_index < index + window:
+                        pending[next_index] = pool.submit(self._fetch_segment, segments[next_index])
+                        next_index += 1
+
+                    data = pending.pop(index).result()
+                    if data is None or self._cancel_event.is_set():
+                        self.log("ネイティブ取得が中断されました。")
+                        return False
+
+                    out_file.write(data)
+                    self.bytes_fetched += len(data)
+                    self.segments_fetched += 1
+
+                    if progress_callback:
+                        progress_callback(DownloadProgress(
+                            total_seconds,
+                            total_seconds * self.segments_fetched / self.segments_total,
+                            self.bytes_fetched,
+                            time.time() - start_time,
+                            self.segments_fetched == self.segments_total,
+                        ))
+            except Exception as e:
+                self.log(f"エラー: セグメント取得中に失敗しました: {e}")
+                return False
+            finally:
+                # 未着手のセグメント取得を取り消す
+                for future in pending.values():
+                    future.cancel()
+                self.elapsed = time.time() - start_time
+
+        self.log(
+            f"ネイティブ取得完了: {self.segments_fetched} セグメント, "
+            f"{self.bytes_fetched / 1024 / 1024:.1f} MB, "
+            f"{self.bytes_per_second / 1024 / 1024:.2f} MB/s, "
+            f"{self.segments_per_second:.1f} seg/s"
+        )
+        return True
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes_fetched / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def segments_per_second(self):
+        return self.segments_fetched / self.elapsed if self.elapsed > 0 else 0.0
+
+    def cancel(self):
+        """実行中の並列取得を中断する"""
+        self._cancel_event.set()
+
+class DownloadCheckpoint:
+    """
+    再開可能なダウンロードの進行状況（区間割りと取得済み区間のファイルサイズ）を
+    出力先の隣のJSONファイルに保存するクラス。
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _write(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._state, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # チェックポイントが保存できなくてもダウンロード自体は続行する
+            pass
+
+    def resume(self, station_id, start_time_str, end_time_str, ranges, part_paths):
+        """
+        同じ番組・同じ区間割りのチェックポイントがあれば、一時ファイルが記録どおりのサイズで残っている
+        取得済み区間の番号の集合を返す。無ければチェックポイントを新規に作成して空集合を返す。
+        """
+        key = {
+            "station_id": station_id,
+            "ft": start_time_str,
+            "to": end_time_str,
+            "ranges": [list(r) for r in ranges],
+        }
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+
+        done = {}
+        if state and all(state.get(k) == v for k, v in key.items()):
+            for index, size in state.get("done", {}).items():
+                path = part_paths[int(index)] if int(index) < len(part_paths) else None
+                if path and os.path.exists(path) and os.path.getsize(path) == size:
+                    done[index] = size
+
+        with self._lock:
+            self._state = dict(key, done=done)
+            self._write()
+        return {int(index) for index in done}
+
+    def mark_done(self, index, size):
+        with self._lock:
+            self._state["done"][str(index)] = size
+            self._write()
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class StreamDownloader:
+    """
+    FFmpegをsubprocessで実行し、Radikoストリームを高速にM4Aファイルとしてダウンロードするクラス。
+    """
+    def __init__(self, auth, log_callback, native_workers=HLS_DEFAULT_WORKERS, segment_concurrency=None,
+                 native_mux=True):
+        self.auth = auth
+        self.log = log_callback
+        self.native_workers = native_workers
+        # 取得したADTSのM4A化をFFmpegを起動せずに行う (False なら常にFFmpegでremuxする)
+        self.native_mux = native_mux
+        # AdaptiveConcurrency を渡すと、ネイティブ取得の同時接続数を自動調整する (複数の取得で共有できる)
+        self.segment_concurrency = segment_concurrency
+        # 実行中のFFmpegプロセスとネイティブ取得 (分割ダウンロードでは複数同時に存在する)
+        self.processes = set()
+        self.fetchers = set()
+        self._lock = threading.Lock()
+        # stop_download で立て、未着手の区間の取得を始めないようにする
+        self._stop_event = threading.Event()
+        # 直近の record_live の統計 (LiveStreamRecorder.record の戻り値)
+        self.live_stats = None
+
+    @staticmethod
+    def _generate_tracking_key():
+        """
+        Radiko追跡キー (lsid) のための擬似ランダムMD5ハッシュを生成する。
+        rec_radiko_tsの`/dev/random` + `base64`ロジックをPythonで再現する 。
+        """
+        # 100バイトのランダムデータを生成
+        random_bytes = os.urandom(100)
+        
+        # Base64エンコード
+        encoded_bytes = base64.b64encode(random_bytes)
+        
+        # MD5ハッシュを計算し、32文字の小文字の16進数文字列として返す
+        tracking_key = hashlib.md5(encoded_bytes).hexdigest()
+        return tracking_key
+
+    @classmethod
+    def build_playlist_url(cls, station_id, start_time_str, end_time_str):
+        """タイムフリー用 ts/playlist.m3u8 のURLを構築する。"""
+        lsid = cls._generate_tracking_key()
+        
+        # ts/playlist.m3u8 へのリクエストに必要なパラメータ
+        url_params = {
+            "station_id": station_id,
+            "start_at": start_time_str,
+            "ft": start_time_str,
+            "end_at": end_time_str,
+            "to": end_time_str,
+            "seek": start_time_str,
+            "l": "15", # 固定パラメータ 
+            "lsid": lsid,
+            "type": "c", # 固定パラメータ 
+        }
+        
+        query_string = "&".join(f"{k}={v}" for k, v in url_params.items())
+        return f"{URL_TS_PLAYLIST}?{query_string}"
+
+    def _build_request_headers(self):
+        """ストリーム取得に必要な認証ヘッダ（Authtoken + AreaId）を返す。"""
+        headers = {"X-Radiko-Authtoken": self.auth.authtoken}
+        if self.auth.area_id:
+            headers["X-Radiko-AreaId"] = self.auth.area_id
+        return headers
+
+    @staticmethod
+    def default_shard_count(start_time_str, end_time_str):
+        """番組の長さから既定の分割数を決める（SHARD_TARGET_SECONDSごとに1分割、上限SHARD_MAX）。"""
+        start_dt = datetime.strptime(start_time_str, '%Y%m%d%H%M%S')
+        end_dt = datetime.strptime(end_time_str, '%Y%m%d%H%M%S')
+        total_seconds = (end_dt - start_dt).total_seconds()
+        return max(1, min(SHARD_MAX, int(total_seconds // SHARD_TARGET_SECONDS)))
+
+    @staticmethod
+    def split_time_range(start_time_str, end_time_str, shards):
+        """
+        start_time_str..end_time_str を shards 個の連続した部分区間に分割する。
+        各境界は番組開始からSHARD_ALIGN_SECONDSの倍数に揃え、前の区間の to と
+        次の区間の ft が一致するため、隙間も重複も生じない。
+        """
+        start_dt = datetime.strptime(start_time_str, '%Y%m%d%H%M%S')
+        end_dt = datetime.strptime(end_time_str, '%Y%m%d%H%M%S')
+        total_seconds = int((end_dt - start_dt).total_seconds())
+
+        # 境界を揃えた結果、短すぎる番組では分割数が減ることがある
+        units = total_seconds // SHARD_ALIGN_SECONDS
+        shards = max(1, min(int(shards), units))
+
+        ranges = []
+        prev_str = start_time_str
+        for i in range(1, shards + 1):
+            if i == shards:
+                boundary_str = end_time_str
+            else:
+                offset = (units * i // shards) * SHARD_ALIGN_SECONDS
+                boundary_str = (start_dt + timedelta(seconds=offset)).strftime('%Y%m%d%H%M%S')
+            ranges.append((prev_str, boundary_str))
+            prev_str = boundary_str
+        return ranges
+
+    def download(self, station_id, start_time_str, end_time_str, output_path, progress_callback,
+                 engine=ENGINE_FFMPEG, shards=1, resume=True):
+        """
+        ストリームを取得し、M4Aファイルとして保存する。
+        start_time_str, end_time_str は YYYYMMDDHHMMSS 形式 。
+        engine に ENGINE_NATIVE を指定すると、セグメントを並列取得した上でFFmpegはremuxのみ行う。
+        shards に2以上を指定すると、時間範囲を分割して並列に取得し、ストリームコピーで連結する。
+        None の場合は番組の長さから分割数を自動で決める。
+        resume が True の場合は区間ごとにチェックポイントを記録し、中断後の再実行では未取得の区間だけを取得する。
+        progress_callback には DownloadProgress が渡される。
+        所要時間・ファイルの大きさ・倍速と結果はメトリクスとトレースに記録する。
+        """
+        started = time.perf_counter()
+        with TRACER.span(
+            "download", station=station_id, range=f"{start_time_str}-{end_time_str}", engine=engine, shards=shards
+        ) as span:
+            METRIC_DOWNLOADS_IN_PROGRESS.inc()
+            try:
+                success = self._download(
+                    station_id, start_time_str, end_time_str, output_path, progress_callback, engine, shards, resume
+                )
+            finally:
+                METRIC_DOWNLOADS_IN_PROGRESS.dec()
+            nbytes = self._observe_download(
+                engine, start_time_str, end_time_str, output_path, success, time.perf_counter() - started
+            )
+            span.set(ok=success, bytes=nbytes)
+        return success
+
+    def _download(self, station_id, start_time_str, end_time_str, output_path, progress_callback,
+                  engine, shards, resume):
+        if not self.auth.authtoken:
+            self.log("エラー: 認証トークンがありません。ダウンロード前に認証を実行してください。")
+            return False
+
+        # 長時間のバッチ処理中に期限が近づいたトークンは開始前に更新しておく
+        if not self.auth.ensure_valid():
+            self.log("エラー: 認証トークンの更新に失敗しました。")
+            return False
+
+        if shards is None:
+            shards = self.default_shard_count(start_time_str, end_time_str)
+
+        if self._stopped_before_start():
+            return False
+        if resume:
+            success = self._download_resumable(
+                station_id, start_time_str, end_time_str, output_path, progress_callback, engine, shards
+            )
+        elif shards > 1:
+            success = self._download_sharded(
+                station_id, start_time_str, end_time_str, output_path, progress_callback, engine, shards
+            )
+        elif engine == ENGINE_NATIVE:
+            success = self._download_native(station_id, start_time_str, end_time_str, output_path, progress_callback)
+        else:
+            success = self._download_ffmpeg(station_id, start_time_str, end_time_str, output_path, progress_callback)
+
+        if success:
+            self.log("録音成功: ファイルがM4A形式で保存されました。")
+        return success
+
+    def _observe_download(self, engine, start_time_str, end_time_str, output_path, success, elapsed):
+        """
+        ダウンロード1件の結果をメトリクスに記録し、ファイルの大きさを返す
+        (大きさと倍速は成功した場合のみ記録し、失敗した場合は None を返す)
+        """
+        METRIC_DOWNLOADS.inc(engine=engine, result="ok" if success else "failed")
+        if not success:
+            return None
+        METRIC_DOWNLOAD_DURATION.observe(elapsed, engine=engine)
+        nbytes = os.path.getsize(output_path) if os.path.exists(output_path) else None
+        if nbytes is not None:
+            METRIC_DOWNLOAD_BYTES.observe(nbytes, engine=engine)
+        if elapsed > 0:
+            METRIC_DOWNLOAD_SPEED.observe(self._range_seconds(start_time_str, end_time_str) / elapsed, engine=engine)
+        return nbytes
+
+    def download_adts(self, station_id, start_time_str, end_time_str, output_path, progress_callback,
+                      engine=ENGINE_NATIVE):
+        """
+        ストリームをremuxせず、ADTS (.aac) のまま先頭から順に output_path へ書き出す。
+        書き込みはバッファせずに行うため、取得中のファイルを別のスレッドやプロセスから読んで再生できる。
+        """
+        if not self.auth.authtoken:
+            self.log("エラー: 認証トークンがありません。ダウンロード前に認証を実行してください。")
+            return False
+        if not self.auth.ensure_valid():
+            self.log("エラー: 認証トークンの更新に失敗しました。")
+            return False
+
+        if self._stopped_before_start():
+            return False
+        self.log(f"ADTSで逐次取得を開始: {output_path}")
+        success = self._fetch_range_adts(
+            station_id, start_time_str, end_time_str, output_path, engine, progress_callback, progressive=True
+        )
+        if success:
+            self.log("録音成功: ファイルがADTS形式で保存されました。")
+        return success
+
+    def record_live(self, station_id, start_time_str, end_time_str, output_path, progress_callback,
+                    prewarm=LIVE_RECORD_PREWARM_SECONDS):
+        """
+        ライブ配信を start_time_str から end_time_str まで録音し、M4Aファイルとして保存する。
+        開始前に呼ぶと開始の prewarm 秒前まで待ち、認証とプレイリストの準備を済ませてから開始時刻を待つ。
+        終了はメディア時間 (取得した音声の長さ) で判定する。録音の統計は self.live_stats に残す。
+        """
+        self.live_stats = None
+        try:
+            validate_time_range(start_time_str, end_time_str)
+        except ValueError as e:
+            self.log(f"エラー: {e}")
+            return False
+        # 放送時刻 (EXT-X-PROGRAM-DATE-TIME) や time.time() と比べるため、実行環境の時間帯によらず日本時間として解釈する
+        start_ts = parse_radiko_time(start_time_str).replace(tzinfo=RADIKO_TIMEZONE).timestamp()
+        end_ts = parse_radiko_time(end_time_str).replace(tzinfo=RADIKO_TIMEZONE).timestamp()
+        if end_ts <= time.time():
+            self.log("エラー: 終了時刻を過ぎているためライブ録音できません。タイムフリーで録音してください。")
+            return False
+        if not self.auth.authtoken:
+            self.log("エラー: 認証トークンがありません。ダウンロード前に認証を実行してください。")
+            return False
+
+        if self._stopped_before_start():
+            return False
+        self.log(f"ライブ録音を予約: {station_id} {start_time_str}〜{end_time_str} → {output_path}")
+        tmp_path = output_path + ".aac.part"
+        recorder = LiveStreamRecorder(self, station_id, start_ts, end_ts, prewarm)
+        try:
+            with open(tmp_path, "wb") as f:
+                stats = recorder.record(f, progress_callback)
+            if not stats:
+                return False
+            self.live_stats = stats
+            if not self._remux_to_m4a([tmp_path], output_path):
+                return False
+            if not self._verify_duration(output_path, stats["media_s"]):
+                return False
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.log("録音成功: ファイルがM4A形式で保存されました。")
+        return True
+
+    def _download_ffmpeg(self, station_id, start_time_str, end_time_str, output_path, progress_callback):
+        """FFmpegにプレイリストを直接読み込ませ、M4Aとして保存する（従来方式）。"""
+        # M3U8ストリームURLの構築 
+        m3u8_url = self.build_playlist_url(station_id, start_time_str, end_time_str)
+
+        # FFmpegコマンドの構築 (再認証時に認証ヘッダを差し替えられるよう関数にしておく)
+        # 認証トークンは -headers オプションで渡す 
+        # -acodec copy と -bsf:a aac_adtstoasc は高速化とM4A互換性のために必須 
+        def build_command():
+            return [
+                "ffmpeg",
+                "-loglevel", "error",
+                "-nostats",
+                "-progress", "pipe:1",
+                "-fflags", "+discardcorrupt",
+                "-headers", self._build_ffmpeg_headers(),
+                *self._ffmpeg_proxy_args(),
+                "-i", m3u8_url,
+                "-acodec", "copy",
+                "-vn",
+                "-bsf:a", "aac_adtstoasc",
+                "-y",
+                output_path,
+            ]
+        
+        self.log(f"FFmpegで録音を開始: {output_path}")
+        
+        return self._run_stream_ffmpeg(
+            build_command,
+            lambda process: self._monitor_progress(process, start_time_str, end_time_str, progress_callback),
+        )
+
+    def _refresh_request_headers(self, stale_headers):
+        """拒否された認証ヘッダを受け取り、再認証後の新しいヘッダを返す。失敗時は None。"""
+        if self.auth.reauth(stale_headers.get("X-Radiko-Authtoken")):
+            return self._build_request_headers()
+        return None
+
+    def _build_ffmpeg_headers(self):
+        """FFmpegの -headers オプションに渡す形式で認証ヘッダを返す。"""
+        return "".join(f"{k}: {v}\r\n" for k, v in self._build_request_headers().items())
+
+    def _ffmpeg_proxy_args(self):
+        """認証がプロキシ経由の場合、FFmpegのストリーム取得も同じプロキシを通す。"""
+        return ["-http_proxy", self.auth.proxy] if self.auth.proxy else []
+
+    def _fetch_range_adts(self, station_id, start_time_str, end_time_str, part_path, engine, progress_callback,
+                          progressive=False):
+        """
+        指定区間のAACストリームをADTS形式のまま part_path に保存する。
+        ADTSはフレーム単位で独立しているため、複数の区間を無劣化で連結できる。
+        progressive の場合は受信したデータを即座にファイルへ書き出す (取得中の配信用)。
+        """
+        with TRACER.span("fetch", station=station_id, range=f"{start_time_str}-{end_time_str}", engine=engine) as span:
+            ok = self._fetch_range_adts_to(
+                station_id, start_time_str, end_time_str, part_path, engine, progress_callback, progressive
+            )
+            span.set(ok=ok, bytes=os.path.getsize(part_path) if os.path.exists(part_path) else 0)
+        return ok
+
+    def _fetch_range_adts_to(self, station_id, start_time_str, end_time_str, part_path, engine, progress_callback,
+                             progressive):
+        m3u8_url = self.build_playlist_url(station_id, start_time_str, end_time_str)
+
+        if engine == ENGINE_NATIVE:
+            fetcher = HLSSegmentFetcher(
+                self.auth.session, self._build_request_headers(), self.log, self.native_workers,
+                reauth_callback=self._refresh_request_headers, concurrency=self.segment_concurrency,
+            )
+            with self._lock:
+                self.fetchers.add(fetcher)
+            try:
+                with open(part_path, "wb", buffering=0 if progressive else -1) as f:
+                    return fetcher.fetch(
+                        m3u8_url, f, progress_callback, self._range_seconds(start_time_str, end_time_str)
+                    )
+            finally:
+                with self._lock:
+                    self.fetchers.discard(fetcher)
+
+        def build_command():
+            return [
+                "ffmpeg",
+                "-loglevel", "error",
+                "-nostats",
+                "-progress", "pipe:1",
+                "-fflags", "+discardcorrupt",
+                "-headers", self._build_ffmpeg_headers(),
+                *self._ffmpeg_proxy_args(),
+                "-i", m3u8_url,
+                "-acodec", "copy",
+                "-vn",
+                "-f", "adts",
+                *(["-flush_packets", "1"] if progressive else []),
+                "-y",
+                part_path,
+            ]
+        return self._run_stream_ffmpeg(
+            build_command,
+            lambda process: self._monitor_progress(process, start_time_str, end_time_str, progress_callback),
+        )
+
+    def _remux_to_m4a(self, input_paths, output_path):
+        """
+        ADTSファイル群を連結してM4Aとして保存する。FFmpegを起動せずにプロセス内で書き出し、
+        想定外の入力だった場合は FFmpeg (_remux_to_m4a_ffmpeg) に切り替える。
+        """
+        if self.native_mux:
+            start = time.perf_counter()
+            try:
+                with TRACER.span("mux", inputs=len(input_paths)) as span:
+                    duration = mux_adts_to_m4a(input_paths, output_path)
+                    span.set(media_seconds=duration, bytes=os.path.getsize(output_path))
+            except (OSError, ValueError) as e:
+                self.log(f"警告: M4Aへの書き出しに失敗したため、FFmpegでremuxします: {e}")
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+            else:
+                self.log(
+                    f"取得したAACをM4Aへ書き出しました ({format_duration(duration)}, "
+                    f"{(time.perf_counter() - start) * 1000:.0f} ms)"
+                )
+                return True
+        return self._remux_to_m4a_ffmpeg(input_paths, output_path)
+
+    def _remux_to_m4a_ffmpeg(self, input_paths, output_path):
+        """
+        ADTSファイル群をFFmpegのストリームコピーで連結し、aac_adtstoasc を適用したM4Aとして保存する。
+        """
+        if len(input_paths) == 1:
+            input_args = ["-i", input_paths[0]]
+            list_path = None
+        else:
+            # concat demuxer用のリストファイルを作成
+            list_path = output_path + ".concat.txt"
+            with open(list_path, "w", encoding="utf-8") as f:
+                for path in input_paths:
+                    escaped = os.path.abspath(path).replace("'", "'\\''")
+                    f.write(f"file '{escaped}'\n")
+            input_args = ["-f", "concat", "-safe", "0", "-i", list_path]
+
+        ffmpeg_command = [
+            "ffmpeg",
+            "-loglevel", "error",
+            *input_args,
+            "-acodec", "copy",
+            "-vn",
+            "-bsf:a", "aac_adtstoasc",
+            "-y",
+            output_path,
+        ]
+        self.log("取得したAACをM4Aへremuxしています...")
+        try:
+            return self._run_ffmpeg(ffmpeg_command)
+        finally:
+            if list_path and os.path.exists(list_path):
+                os.remove(list_path)
+
+    def _download_native(self, station_id, start_time_str, end_time_str, output_path, progress_callback):
+        """
+        HLSSegmentFetcherでAACセグメントを並列取得して一時ファイルへ連結し、
+        FFmpegで aac_adtstoasc を適用したM4Aへremuxする。
+        """
+        self.log(f"ネイティブエンジンで録音を開始: {output_path}")
+        tmp_path = output_path + ".aac.part"
+
+        try:
+            if not self._fetch_range_adts(
+                station_id, start_time_str, end_time_str, tmp_path, ENGINE_NATIVE, progress_callback
+            ):
+                return False
+            return self._remux_to_m4a([tmp_path], output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _download_sharded(self, station_id, start_time_str, end_time_str, output_path,
+                          progress_callback, engine, shards):
+        """
+        時間範囲を分割し、各区間を並列ワーカーで取得した後、ストリームコピーで1つのM4Aに連結する。
+        """
+        ranges = self.split_time_range(start_time_str, end_time_str, shards)
+        self.log(f"分割ダウンロードを開始: {len(ranges)} 分割 (エンジン: {engine})")
+
+        # 各区間の最新の進捗を合算して全体の進捗とする
+        shard_progress = [DownloadProgress(self._range_seconds(ft, to)) for ft, to in ranges]
+        progress_lock = threading.Lock()
+        start_time = time.time()
+
+        def make_progress(index):
+            def update(progress):
+                with progress_lock:
+                    shard_progress[index] = progress
+                    overall = DownloadProgress.combine(shard_progress, time.time() - start_time)
+                progress_callback(overall)
+            return update
+
+        part_paths = [f"{output_path}.part{i:02d}.aac" for i in range(len(ranges))]
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+                futures = [
+                    pool.submit(
+                        self._fetch_range_adts, station_id, ft, to, part_path, engine, make_progress(i)
+                    )
+                    for i, ((ft, to), part_path) in enumerate(zip(ranges, part_paths))
+                ]
+                results = [future.result() for future in futures]
+
+            if not all(results):
+                failed = [i for i, ok in enumerate(results) if not ok]
+                self.log(f"エラー: 分割 {failed} の取得に失敗しました。")
+                return False
+
+            return self._remux_to_m4a(part_paths, output_path)
+        finally:
+            for part_path in part_paths:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+    def _download_resumable(self, station_id, start_time_str, end_time_str, output_path,
+                            progress_callback, engine, shards):
+        """
+        時間範囲を RESUME_CHUNK_SECONDS ごとの区間に分け、区間単位でチェックポイントを記録しながら
+        ADTS形式の一時ファイルへ取得する (同時に取得する区間数は shards)。
+        前回中断したダウンロードの一時ファイルとチェックポイントが残っていれば、未取得の区間だけを取得する。
+        全区間が揃ったらストリームコピーで連結し、長さを検証してから一時ファイルを削除する。
+        """
+        total_seconds = self._range_seconds(start_time_str, end_time_str)
+        chunk_count = max(shards, -(-int(total_seconds) // RESUME_CHUNK_SECONDS))
+        ranges = self.split_time_range(start_time_str, end_time_str, chunk_count)
+        part_paths = [f"{output_path}.part{i:02d}.aac" for i in range(len(ranges))]
+
+        checkpoint = DownloadCheckpoint(output_path + ".resume.json")
+        done = checkpoint.resume(station_id, start_time_str, end_time_str, ranges, part_paths)
+        missing = [i for i in range(len(ranges)) if i not in done]
+        if done:
+            self.log(f"前回の続きから再開します: {len(done)}/{len(ranges)} 区間は取得済み")
+        self.log(f"録音を開始: {output_path} ({len(missing)} 区間, 同時 {shards}, エンジン: {engine})")
+
+        # 取得済みの区間は完了扱いにして全体の進捗を算出する
+        chunk_progress = []
+        for i, (ft, to) in enumerate(ranges):
+            seconds = self._range_seconds(ft, to)
+            if i in done:
+                chunk_progress.append(DownloadProgress(seconds, seconds, os.path.getsize(part_paths[i]), finished=True))
+            else:
+                chunk_progress.append(DownloadProgress(seconds))
+        progress_lock = threading.Lock()
+        start_time = time.time()
+
+        def fetch_chunk(index):
+            if self._stop_event.is_set():
+                return False
+
+            def update(progress):
+                with progress_lock:
+                    chunk_progress[index] = progress
+                    overall = DownloadProgress.combine(chunk_progress, time.time() - start_time)
+                progress_callback(overall)
+
+            ft, to = ranges[index]
+            # 一時的な失敗はこの区間だけを取り直す (録音全体はやり直さない)
+            for attempt in range(CHUNK_RETRY_POLICY.max_attempts):
+                if attempt:
+                    delay = CHUNK_RETRY_POLICY.delay(attempt - 1)
+                    self.log(f"区間 {index} ({ft}-{to}) を {delay:.0f} 秒後に再取得します ({attempt}/{CHUNK_RETRY_POLICY.max_attempts - 1})")
+                    if self._stop_event.wait(delay):
+                        return False
+                if self._fetch_range_adts(station_id, ft, to, part_paths[index], engine, update):
+                    size = os.path.getsize(part_paths[index]) if os.path.exists(part_paths[index]) else 0
+                    if size > 0:
+                        checkpoint.mark_done(index, size)
+                        return True
+                    self.log(f"エラー: 区間 {index} ({ft}-{to}) のデータが空です。")
+                if self._stop_event.is_set():
+                    return False
+            return False
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, min(shards, len(missing)))) as pool:
+                results = list(pool.map(fetch_chunk, missing))
+            if not all(results):
+                remaining = [i for i, ok in zip(missing, results) if not ok]
+                self.log(
+                    f"エラー: {len(remaining)} 区間の取得に失敗しました。"
+                    f"取得済みの {len(ranges) - len(remaining)} 区間は保存されており、再実行すると続きから取得します。"
+                )
+                return False
+
+        if not self._remux_to_m4a(part_paths, output_path):
+            return False
+
+        if not self._verify_duration(output_path, total_seconds):
+            # 一時ファイルのどこかが壊れているため、次回は最初から取得し直す
+            os.remove(output_path)
+            checkpoint.discard()
+            for part_path in part_paths:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+            return False
+
+        checkpoint.discard()
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        return True
+
+    def _probe_duration(self, path):
+        """ファイルの長さ(秒)を調べる。MP4として読めない場合はffprobeを使い、調べられない場合は None。"""
+        duration = read_m4a_duration(path)
+        if duration is not None:
+            return duration
+        try:
+            result = subprocess.run(
+                [
+                    "ffprobe", "-v", "error",
+                    "-show_entries", "format=duration",
+                    "-of", "default=noprint_wrappers=1:nokey=1",
+                    path,
+                ],
+                capture_output=True, text=True, timeout=60,
+            )
+            return float(result.stdout.strip())
+        except (OSError, subprocess.TimeoutExpired, ValueError):
+            return None
+
+    def _verify_duration(self, path, expected_seconds):
+        """完成したファイルの長さが番組の長さ (to - ft) と一致するか検証する。"""
+        actual = self._probe_duration(path)
+        if actual is None:
+            self.log("警告: 録音ファイルの長さを取得できなかったため、整合性の検証を省略しました。")
+            return True
+        if abs(actual - expected_seconds) > DURATION_TOLERANCE_SECONDS:
+            self.log(
+                f"エラー: 録音ファイルの長さ ({format_duration(actual)}) が番組の長さ "
+                f"({format_duration(expected_seconds)}) と一致しません。"
+            )
+            return False
+        return True
+
+    def _execute_ffmpeg(self, ffmpeg_command, monitor=None):
+        """
+        FFmpegプロセスを起動し、終了まで待機して (終了コード, 標準エラー出力の末尾) を返す。
+        monitor があれば実行中にプロセスを渡して呼び出す（-progress pipe:1 の出力は標準出力から読む）。
+        起動自体に失敗した場合は None。
+        分割ダウンロードでは複数のプロセスが同時に走るため、起動中のプロセスは全て記録しておく。
+        """
+        with TRACER.span("ffmpeg", input=self._ffmpeg_input_name(ffmpeg_command)) as span:
+            result = self._execute_ffmpeg_process(ffmpeg_command, monitor)
+            span.set(exit_code=result[0] if result else None)
+        return result
+
+    @staticmethod
+    def _ffmpeg_input_name(ffmpeg_command):
+        """トレースの属性用に、FFmpegの入力 (-i の引数) をクエリ文字列を除いて返す。"""
+        if "-i" not in ffmpeg_command:
+            return None
+        return ffmpeg_command[ffmpeg_command.index("-i") + 1].split("?", 1)[0]
+
+    def _execute_ffmpeg_process(self, ffmpeg_command, monitor):
+        try:
+            # subprocess.Popen でプロセスを起動し、非同期で実行する
+            started = time.perf_counter()
+            process = subprocess.Popen(
+                ffmpeg_command,
+                stdout=subprocess.PIPE if monitor else subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                universal_newlines=True
+            )
+            TRACER.add_span("ffmpeg.spawn", started)
+            # 最初の進捗報告までを起動時間として記録するため、起動時刻を残しておく
+            process.started_at = started
+            with self._lock:
+                self.processes.add(process)
+
+            # 標準エラー出力は別スレッドで読み捨て、末尾だけを保持する
+            # (パイプが詰まってFFmpegが停止するのを防ぎつつ、出力全体をメモリに溜めない)
+            stderr_tail = deque(maxlen=FFMPEG_STDERR_TAIL_LINES)
+            stderr_thread = threading.Thread(
+                target=lambda: stderr_tail.extend(process.stderr), daemon=True
+            )
+            stderr_thread.start()
+
+            try:
+                # ダウンロード進捗の監視を開始
+                if monitor:
+                    monitor(process)
+                    # 監視が途中で終わっても標準出力のパイプは空にしておく
+                    for _ in process.stdout:
+                        pass
+
+                # FFmpegプロセスの終了を待つ (タイムアウトなし)
+                process.wait()
+                stderr_thread.join()
+                METRIC_FFMPEG_EXITS.inc(code=process.returncode)
+            finally:
+                with self._lock:
+                    self.processes.discard(process)
+                for stream in (process.stdout, process.stderr):
+                    if stream:
+                        stream.close()
+            return process.returncode, "".join(stderr_tail)
+
+        except FileNotFoundError:
+            METRIC_FFMPEG_EXITS.inc(code="spawn_error")
+            self.log("エラー: 'ffmpeg' コマンドが見つかりません。FFmpegがインストールされ、PATHが通っていることを確認してください。")
+            return None
+        except Exception as e:
+            self.log(f"エラー: ダウンロード中に予期せぬエラーが発生しました: {e}")
+            return None
+
+    def _log_ffmpeg_failure(self, return_code, stderr):
+        self.log(f"エラー: FFmpegプロセスが非ゼロコード {return_code} で終了しました。")
+        self.log(f"FFmpeg出力:\n{stderr}")
+
+    def _run_ffmpeg(self, ffmpeg_command, monitor=None):
+        """FFmpegを実行し、成功すれば True を返す。"""
+        result = self._execute_ffmpeg(ffmpeg_command, monitor)
+        if result is None:
+            return False
+        return_code, stderr = result
+        if return_code != 0:
+            self._log_ffmpeg_failure(return_code, stderr)
+            return False
+        return True
+
+    def _run_stream_ffmpeg(self, build_command, monitor=None):
+        """
+        Radikoのストリームを読み込むFFmpegを実行する。
+        トークンが拒否された（HTTP 401/403）場合は再認証し、認証ヘッダを組み直して1回だけ再実行する。
+        """
+        for attempt in range(2):
+            stale_token = self.auth.authtoken
+            result = self._execute_ffmpeg(build_command(), monitor)
+            if result is None:
+                return False
+            return_code, stderr = result
+            if return_code == 0:
+                return True
+            if attempt == 0 and FFMPEG_AUTH_REJECTED_PATTERN.search(stderr or ""):
+                self.log("認証トークンが拒否されました。再認証して再試行します。")
+                if self.auth.reauth(stale_token):
+                    continue
+            self._log_ffmpeg_failure(return_code, stderr)
+            return False
+        return False
+
+    @staticmethod
+    def _range_seconds(start_time_str, end_time_str):
+        return (parse_radiko_time(end_time_str) - parse_radiko_time(start_time_str)).total_seconds()
+
+    def _monitor_progress(self, process, start_time_str, end_time_str, progress_callback):
+        """
+        FFmpegの -progress pipe:1 の出力 (key=value の行が progress=continue/end で区切られたブロック) を
+        逐次解析し、ブロックごとに DownloadProgress を通知する。
+        """
+        progress = DownloadProgress(self._range_seconds(start_time_str, end_time_str))
+        start_time = time.time()
+        first_report = True
+
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            if key in ("out_time_us", "out_time_ms"):
+                # out_time_ms も実際にはマイクロ秒単位
+                if value.isdigit():
+                    progress.media_seconds = int(value) / 1000000
+            elif key == "total_size":
+                if value.isdigit():
+                    progress.bytes_written = int(value)
+            elif key == "progress":
+                if first_report and hasattr(process, "started_at"):
+                    # 起動から入力を開いて最初の出力を書くまで (-progress の報告間隔の粒度)
+                    TRACER.add_span("ffmpeg.startup", process.started_at)
+                first_report = False
+                progress.elapsed = time.time() - start_time
+                progress.finished = value == "end"
+                progress_callback(progress)
+
+    def _stopped_before_start(self):
+        """開始前に stop_download が呼ばれていれば記録して True を返す (最初の区間の取得を始めない)"""
+        if not self._stop_event.is_set():
+            return False
+        self.log("ダウンロードは開始前に中断されました。")
+        return True
+
+    def reset_stop(self):
+        """stop_download で中断したダウンローダーを再び使えるようにする。"""
+        self._stop_event.clear()
+
+    def stop_download(self):
+        """実行中の全FFmpegプロセス（およびネイティブ取得）を安全に停止する"""
+        self._stop_event.set()
+        with self._lock:
+            fetchers = list(self.fetchers)
+            processes = [p for p in self.processes if p.poll() is None]
+
+        for fetcher in fetchers:
+            fetcher.cancel()
+
+        if processes:
+            self.log("ダウンロードを中断しています...")
+        for process in processes:
+            # SIGINT/SIGTERMを送信してプロセスを終了させる
+            process.terminate() 
+        for process in processes:
+            try:
+                process.wait(timeout=5)
+                self.log("ダウンロードが中断されました。")
+            except subprocess.TimeoutExpired:
+                process.kill()
+                self.log("警告: プロセスを強制終了しました。")
+
+
+# --- ADTSの解析とM4Aへの書き出し ---
+
+ADTS_SAMPLE_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350)
+# ADTSのチャンネル構成 (1〜7) ごとのチャンネル数
+ADTS_CHANNEL_COUNTS = (0, 1, 2, 3, 4, 5, 6, 8)
+AAC_SAMPLES_PER_BLOCK = 1024
+# ADTSフレームの最大長 (13ビット)
+ADTS_MAX_FRAME_LENGTH = 8191
+# M4Aへの書き出しで入力を読み込む単位と、1チャンクにまとめるフレーム数
+MUX_READ_SIZE = 1024 * 1024
+MUX_SAMPLES_PER_CHUNK = 64
+# mvhd / tkhd の時間単位
+MUX_MOVIE_TIMESCALE = 1000
+_MP4_MATRIX = struct.pack(">9I", 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+
+
+def _id3_length(view, offset=0):
+    """HLSのパックドオーディオのセグメント先頭に付くID3タグの長さ(バイト)を返す。無ければ0。"""
+    length = 0
+    while len(view) - offset - length >= 10 and view[offset + length:offset + length + 3] == b"ID3":
+        header = view[offset + length:offset + length + 10]
+        size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        length += 10 + size + (10 if header[5] & 0x10 else 0)
+    return length
+
+
+def _parse_adts_header(view, offset):
+    """
+    offset から始まるADTSヘッダを解析し、
+    (ヘッダ長, フレーム長, プロファイル, サンプリング周波数の番号, チャンネル構成, ブロック数) を返す。
+    同期が取れない場合は ValueError を送出する (7バイト以上あることは呼び出し元で確認する)。
+    """
+    if view[offset] != 0xFF or (view[offset + 1] & 0xF6) != 0xF0:
+        raise ValueError("ADTSの同期ワードが見つかりません")
+    b2 = view[offset + 2]
+    b3 = view[offset + 3]
+    sf_index = (b2 >> 2) & 0x0F
+    if sf_index >= len(ADTS_SAMPLE_RATES):
+        raise ValueError("ADTSのサンプリング周波数が不正です")
+    length = ((b3 & 0x03) << 11) | (view[offset + 4] << 3) | (view[offset + 5] >> 5)
+    # protection_absent が0ならCRCの2バイトが続く
+    header_length = 7 if view[offset + 1] & 0x01 else 9
+    if length <= header_length:
+        raise ValueError("ADTSフレームの長さが不正です")
+    return header_length, length, b2 >> 6, sf_index, ((b2 & 0x01) << 2) | (b3 >> 6), (view[offset + 6] & 0x03) + 1
+
+
+def iter_adts_frames(data):
+    """
+    ADTSのバイト列を先頭から解析し、フレームごとに (開始位置, 長さ, サンプリング周波数, サンプル数) を返す。
+    ID3タグは読み飛ばす。データはコピーせず memoryview 上で読む。
+    同期が取れない・途中で切れたデータでは ValueError を送出する。
+    """
+    view = memoryview(data)
+    end = len(view)
+    offset = 0
+    while True:
+        offset += _id3_length(view, offset)
+        if offset >= end:
+            return
+        if end - offset < 7:
+            raise ValueError(f"ADTSフレームが途中で切れています (位置 {offset})")
+        _, length, _, sf_index, _, blocks = _parse_adts_header(view, offset)
+        if offset + length > end:
+            raise ValueError(f"ADTSフレームが途中で切れています (位置 {offset})")
+        yield offset, length, ADTS_SAMPLE_RATES[sf_index], blocks * AAC_SAMPLES_PER_BLOCK
+        offset += length
+
+
+def _mp4_box(kind, *payloads):
+    data = b"".join(payloads)
+    return struct.pack(">I4s", 8 + len(data), kind) + data
+
+
+def _mp4_full_box(kind, version, flags, *payloads):
+    return _mp4_box(kind, struct.pack(">I", (version << 24) | flags), *payloads)
+
+
+def _mp4_container(kind, *children):
+    """
+    子のボックス (bytes または _mp4_container の戻り値) を持つボックスを、連結せずに部品のリストで返す。
+    サンプルテーブルのような大きなデータを入れ子の階層ごとにコピーしないようにする。
+    """
+    parts = []
+    for child in children:
+        if isinstance(child, list):
+            parts.extend(child)
+        else:
+            parts.append(child)
+    return [struct.pack(">I4s", 8 + sum(len(part) for part in parts), kind)] + parts
+
+
+def _mp4_descriptor(tag, *payloads):
+    """MPEG-4のディスクリプタ (esds内)。長さは4バイトの可変長表現で書く。"""
+    data = b"".join(payloads)
+    size = len(data)
+    return bytes([tag, 0x80 | (size >> 21) & 0x7F, 0x80 | (size >> 14) & 0x7F, 0x80 | (size >> 7) & 0x7F, size & 0x7F]) + data
+
+
+def _big_endian_array(values):
+    """array の内容をビッグエンディアンのバイト列で返す"""
+    if sys.byteorder == "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class ADTSToM4AMuxer:
+    """
+    ADTSファイル群をFFmpegを使わずにM4A (MP4) へ書き出すクラス。
+    `-acodec copy -bsf:a aac_adtstoasc` と同じく、ADTSヘッダを外した生のAACフレームを mdat に並べ、
+    AudioSpecificConfig と サンプルテーブルを持つ moov を最後に書く。
+
+    入力は MUX_READ_SIZE ずつ読み、フレームは memoryview の切り出しのままコピーせずに書き込む。
+    メモリに保持するのはフレームごとのサイズとチャンクの位置だけ (1時間あたり約0.7MB)。
+    途中で形式が変わる・1フレームに複数のブロックを持つなど、想定外の入力では ValueError を送出する
+    (呼び出し元でFFmpegにフォールバックする)。
+    """
+    def __init__(self):
+        self.config = None
+        self.sample_sizes = array("I")
+        self.chunk_offsets = array("Q")
+        self.mdat_bytes = 0
+        self._max_second_bytes = 0
+        self._second_bytes = 0
+        self._second_frames = 0
+
+    @property
+    def sample_rate(self):
+        return ADTS_SAMPLE_RATES[self.config[1]]
+
+    @property
+    def duration(self):
+        """書き込んだ音声の長さ(秒)"""
+        if not self.config:
+            return 0.0
+        return len(self.sample_sizes) * AAC_SAMPLES_PER_BLOCK / self.sample_rate
+
+    def mux(self, input_paths, output_path):
+        """input_paths を順に連結して output_path へ書き出し、音声の長さ(秒)を返す。"""
+        with open(output_path, "wb") as out:
+            out.write(_mp4_box(b"ftyp", b"M4A ", struct.pack(">I", 0x200), b"M4A ", b"mp42", b"isom"))
+            # mdat の大きさは書き終えるまで分からないため、64ビットの長さ欄を用意しておき最後に書き戻す
+            mdat_start = out.tell()
+            out.write(struct.pack(">I4sQ", 1, b"mdat", 0))
+            for path in input_paths:
+                with open(path, "rb") as f:
+                    self._copy_frames(f, out)
+            if not self.sample_sizes:
+                raise ValueError("AACフレームがありません")
+
+            moov_start = out.tell()
+            out.seek(mdat_start + 8)
+            out.write(struct.pack(">Q", moov_start - mdat_start))
+            out.seek(moov_start)
+            out.writelines(self._moov())
+        return self.duration
+
+    def _copy_frames(self, f, out):
+        """ファイルからADTSフレームを読み、ヘッダを除いたAACフレームを out へ書き込む。"""
+        buffer = bytearray(MUX_READ_SIZE + ADTS_MAX_FRAME_LENGTH)
+        view = memoryview(buffer)
+        filled = 0
+        # 読み込み単位をまたぐID3タグの、まだ読み飛ばしていないバイト数
+        skip = 0
+        eof = False
+
+        while True:
+            if not eof:
+                count = f.readinto(view[filled:filled + MUX_READ_SIZE])
+                eof = not count
+                filled += count or 0
+            if not filled:
+                return
+
+            offset = min(skip, filled)
+            skip -= offset
+            while not skip and offset < filled:
+                if view[offset:offset + 3] == b"ID3":
+                    if filled - offset < 10 and not eof:
+                        break
+                    length = _id3_length(view[:filled], offset)
+                    if not length:
+                        raise ValueError("ID3タグが途中で切れています")
+                    consumed = min(length, filled - offset)
+                    offset += consumed
+                    skip = length - consumed
+                    continue
+                if filled - offset < 7:
+                    break
+                header_length, length, profile, sf_index, channels, blocks = _parse_adts_header(view, offset)
+                if offset + length > filled:
+                    break
+                self._add_frame(out, view[offset + header_length:offset + length], (profile, sf_index, channels, blocks))
+                offset += length
+
+            # 1フレームに満たない端数は先頭へ移し、続きを読み足してから処理する
+            remaining = filled - offset
+            if eof:
+                if remaining or skip:
+                    raise ValueError("ADTSフレームが途中で切れています")
+                return
+            buffer[:remaining] = view[offset:filled]
+            filled = remaining
+
+    def _add_frame(self, out, payload, config):
+        if self.config is None:
+            profile, sf_index, channels, blocks = config
+            if blocks != 1:
+                raise ValueError("1フレームに複数のブロックを持つADTSには対応していません")
+            if not channels:
+                raise ValueError("チャンネル構成がPCEで指定されたADTSには対応していません")
+            self.config = config
+        elif config != self.config:
+            raise ValueError("途中でAACの形式が変わっています")
+
+        index = len(self.sample_sizes)
+        if index % MUX_SAMPLES_PER_CHUNK == 0:
+            self.chunk_offsets.append(out.tell())
+        out.write(payload)
+        size = len(payload)
+        self.sample_sizes.append(size)
+        self.mdat_bytes += size
+
+        # 最大ビットレート (1秒あたりのバイト数の最大) を esds に書くために数えておく
+        self._second_bytes += size
+        self._second_frames += 1
+        if self._second_frames * AAC_SAMPLES_PER_BLOCK >= self.sample_rate:
+            self._max_second_bytes = max(self._max_second_bytes, self._second_bytes)
+            self._second_bytes = self._second_frames = 0
+
+    def _esds(self):
+        profile, sf_index, channels, _ = self.config
+        # AudioSpecificConfig: オブジェクトタイプ(5) + サンプリング周波数の番号(4) + チャンネル構成(4) + 0(3)
+        audio_specific_config = struct.pack(">H", ((profile + 1) << 11) | (sf_index << 7) | (channels << 3))
+        avg_bitrate = int(self.mdat_bytes * 8 / self.duration) if self.duration else 0
+        max_bitrate = max(self._max_second_bytes, self._second_bytes) * 8 or avg_bitrate
+        decoder_config = _mp4_descriptor(
+            0x04,
+            # objectTypeIndication 0x40 (MPEG-4 Audio), streamType 5 (音声)
+            struct.pack(">BB", 0x40, (0x05 << 2) | 1),
+            (max(self.sample_sizes)).to_bytes(3, "big"),
+            struct.pack(">II", max_bitrate, avg_bitrate),
+            _mp4_descriptor(0x05, audio_specific_config),
+        )
+        es_descriptor = _mp4_descriptor(0x03, struct.pack(">HB", 1, 0), decoder_config, _mp4_descriptor(0x06, b"\x02"))
+        return _mp4_full_box(b"esds", 0, 0, es_descriptor)
+
+    def _moov(self):
+        rate = self.sample_rate
+        channels = self.config[2]
+        sample_count = len(self.sample_sizes)
+        media_duration = sample_count * AAC_SAMPLES_PER_BLOCK
+        movie_duration = round(media_duration * MUX_MOVIE_TIMESCALE / rate)
+        now = int(time.time()) + 2082844800  # 1904-01-01 起点
+
+        long_time = max(media_duration, movie_duration, now) >= 1 << 32
+        version = 1 if long_time else 0
+        time_format = ">QQ" if long_time else ">II"
+        duration_format = ">Q" if long_time else ">I"
+
+        mvhd = _mp4_full_box(
+            b"mvhd", version, 0,
+            struct.pack(time_format, now, now), struct.pack(">I", MUX_MOVIE_TIMESCALE),
+            struct.pack(duration_format, movie_duration),
+            struct.pack(">IH10x", 0x00010000, 0x0100), _MP4_MATRIX, bytes(24), struct.pack(">I", 2),
+        )
+        tkhd = _mp4_full_box(
+            b"tkhd", version, 0x000003,
+            struct.pack(time_format, now, now), struct.pack(">II", 1, 0),
+            struct.pack(duration_format, movie_duration),
+            struct.pack(">8xhhH2x", 0, 1, 0x0100), _MP4_MATRIX, struct.pack(">II", 0, 0),
+        )
+        mdhd = _mp4_full_box(
+            b"mdhd", version, 0,
+            struct.pack(time_format, now, now), struct.pack(">I", rate), struct.pack(duration_format, media_duration),
+            struct.pack(">HH", 0x55C4, 0),  # 言語 "und"
+        )
+        hdlr = _mp4_full_box(b"hdlr", 0, 0, struct.pack(">I4s12x", 0, b"soun"), b"SoundHandler\x00")
+
+        mp4a = _mp4_box(
+            b"mp4a",
+            struct.pack(">6xH8xHHHHI", 1, ADTS_CHANNEL_COUNTS[channels], 16, 0, 0, rate << 16 if rate < 65536 else 0),
+            self._esds(),
+        )
+        stsd = _mp4_full_box(b"stsd", 0, 0, struct.pack(">I", 1), mp4a)
+        stts = _mp4_full_box(b"stts", 0, 0, struct.pack(">III", 1, sample_count, AAC_SAMPLES_PER_BLOCK))
+
+        chunk_count = len(self.chunk_offsets)
+        last_chunk_samples = sample_count - (chunk_count - 1) * MUX_SAMPLES_PER_CHUNK
+        stsc_entries = [(1, min(sample_count, MUX_SAMPLES_PER_CHUNK), 1)]
+        if chunk_count > 1 and last_chunk_samples != MUX_SAMPLES_PER_CHUNK:
+            stsc_entries.append((chunk_count, last_chunk_samples, 1))
+        stsc = _mp4_full_box(
+            b"stsc", 0, 0, struct.pack(">I", len(stsc_entries)), *(struct.pack(">III", *e) for e in stsc_entries)
+        )
+        stsz = _mp4_container(
+            b"stsz", struct.pack(">III", 0, 0, sample_count), _big_endian_array(self.sample_sizes)
+        )
+        if self.chunk_offsets[-1] < 1 << 32:
+            stco = _mp4_container(
+                b"stco", struct.pack(">II", 0, chunk_count), _big_endian_array(array("I", self.chunk_offsets))
+            )
+        else:
+            stco = _mp4_container(b"co64", struct.pack(">II", 0, chunk_count), _big_endian_array(self.chunk_offsets))
+
+        stbl = _mp4_container(b"stbl", stsd, stts, stsc, stsz, stco)
+        dinf = _mp4_box(b"dinf", _mp4_full_box(b"dref", 0, 0, struct.pack(">I", 1), _mp4_full_box(b"url ", 0, 1)))
+        minf = _mp4_container(b"minf", _mp4_full_box(b"smhd", 0, 0, struct.pack(">hH", 0, 0)), dinf, stbl)
+        mdia = _mp4_container(b"mdia", mdhd, hdlr, minf)
+        return _mp4_container(b"moov", mvhd, _mp4_container(b"trak", tkhd, mdia))
+
+
+def mux_adts_to_m4a(input_paths, output_path):
+    """ADTSファイル群をFFmpegを使わずに1つのM4Aへ書き出し、音声の長さ(秒)を返す。"""
+    return ADTSToM4AMuxer().mux(input_paths, output_path)
+
+
+def read_m4a_duration(path):
+    """MP4/M4A の moov/mvhd から長さ(秒)を読む。MP4として読めない場合は None。"""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                size, kind = struct.unpack(">I4s", header)
+                header_size = 8
+                if size == 1:
+                    size = struct.unpack(">Q", f.read(8))[0]
+                    header_size = 16
+                elif size == 0:
+                    return None
+                if kind != b"moov":
+                    f.seek(size - header_size, os.SEEK_CUR)
+                    continue
+                moov = f.read(size - header_size)
+                offset = 0
+                while offset + 8 <= len(moov):
+                    child_size, child_kind = struct.unpack_from(">I4s", moov, offset)
+                    if child_kind == b"mvhd":
+                        if moov[offset + 8] == 1:
+                            timescale, duration = struct.unpack_from(">IQ", moov, offset + 28)
+                        else:
+                            timescale, duration = struct.unpack_from(">II", moov, offset + 20)
+                        return duration / timescale if timescale else None
+                    if child_size < 8:
+                        return None
+                    offset += child_size
+                return None
+    except (OSError, struct.error):
+        return None
+
+
+# --- ライブ録音 ---
+
+class LiveStreamRecorder:
+    """
+    ライブ配信のHLSプレイリスト (スライディングウィンドウ) を追いかけ、指定した時間帯を録音するクラス。
+
+    開始の prewarm 秒前から認証の更新・variantの解決・プレイリストの監視を始め、各セグメントの
+    放送時刻を求めておく (EXT-X-PROGRAM-DATE-TIME があればその値、無ければ公開を検知した時刻と
+    セグメントの長さの累積から推定する)。開始時刻を含むセグメントからフレーム単位で切り出して書き込み、
+    メディア時間 (書き込んだサンプル数と欠落したセグメントの長さ) が録音の長さに達した時点で終える。
+    録音ごとに先頭の欠落・開始時刻から最初の書き込みまでの遅延・配信側の時計とのずれを記録する。
+    """
+    MAX_PLAYLIST_DEPTH = 5
+
+    def __init__(self, downloader, station_id, start_ts, end_ts, prewarm=LIVE_RECORD_PREWARM_SECONDS):
+        self.downloader = downloader
+        self.log = downloader.log
+        self.station_id = station_id
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.prewarm = prewarm
+
+        self.fetcher = None
+        self.chunklist_url = None
+        # セグメント番号 -> {"url", "duration", "pdt", "offset"}。offset は最初に見えたセグメントからの累積秒
+        self.segments = {}
+        self._last_seq = None
+        # 最後に確認したプレイリストに含まれていたセグメント番号
+        self._window = set()
+        # 公開を検知した時刻から推定した「最初に見えたセグメントの開始時刻」の観測値
+        self._base_estimates = []
+
+    @staticmethod
+    def build_playlist_url(station_id):
+        """ライブ配信用 playlist.m3u8 のURLを構築する。"""
+        params = {
+            "station_id": station_id,
+            "l": "15",
+            "lsid": StreamDownloader._generate_tracking_key(),
+            "type": "b",
+        }
+        return f"{URL_LIVE_PLAYLIST}?" + "&".join(f"{k}={v}" for k, v in params.items())
+
+    @staticmethod
+    def parse_playlist(text, base_url):
+        """
+        ライブのM3U8テキストを解析し、(variantのURLのリスト, [(番号, URL, 長さ, 放送時刻)], 終了済みか) を返す。
+        放送時刻は EXT-X-PROGRAM-DATE-TIME のUNIX時刻で、無ければ None。
+        """
+        variants = []
+        segments = []
+        sequence = 0
+        duration = None
+        pdt = None
+        ended = False
+        expect_variant = False
+
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                tag, _, value = line.partition(":")
+                if tag == "#EXT-X-STREAM-INF":
+                    expect_variant = True
+                elif tag == "#EXT-X-MEDIA-SEQUENCE":
+                    sequence = int(value)
+                elif tag == "#EXTINF":
+                    duration = float(value.split(",", 1)[0])
+                elif tag == "#EXT-X-PROGRAM-DATE-TIME":
+                    pdt = datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+                elif tag == "#EXT-X-ENDLIST":
+                    ended = True
+                continue
+
+            url = urljoin(base_url, line)
+            if expect_variant or url.split("?", 1)[0].endswith(".m3u8"):
+                variants.append(url)
+            else:
+                segments.append((sequence, url, duration, pdt))
+                sequence += 1
+                # PROGRAM-DATE-TIME は次のセグメントには引き継がず、長さから算出する
+                pdt = pdt + duration if pdt is not None and duration else None
+            duration = None
+            expect_variant = False
+
+        return variants, segments, ended
+
+    def _poll(self):
+        """チャンクリストを取得して新しいセグメントを登録し、(新しいセグメント数, 終了済みか) を返す。"""
+        text = self.fetcher.get_playlist(self.chunklist_url)
+        observed_at = time.time()
+        _, segments, ended = self.parse_playlist(text, self.chunklist_url)
+
+        added = 0
+        for seq, url, duration, pdt in segments:
+            if seq in self.segments or (self._last_seq is not None and seq < self._last_seq):
+                continue
+            duration = duration or LIVE_RECORD_SEGMENT_SECONDS
+            if self._last_seq is None:
+                offset = 0.0
+            else:
+                previous = self.segments[self._last_seq]
+                # 取りこぼした番号があれば、標準のセグメント長で埋めて累積を保つ
+                offset = previous["offset"] + previous["duration"] + (seq - self._last_seq - 1) * LIVE_RECORD_SEGMENT_SECONDS
+            self.segments[seq] = {"url": url, "duration": duration, "pdt": pdt, "offset": offset}
+            self._last_seq = seq
+            added += 1
+
+        self._window = {seq for seq, _, _, _ in segments}
+        if segments:
+            # 最新のセグメントは観測時刻までに公開されていたので、その終わりは observed_at 以前
+            newest = self.segments[self._last_seq]
+            self._base_estimates.append(observed_at - newest["offset"] - newest["duration"])
+        return added, ended
+
+    def _resolve(self):
+        """variantプレイリストを辿ってチャンクリストのURLを求める。"""
+        url = self.build_playlist_url(self.station_id)
+        for _ in range(self.MAX_PLAYLIST_DEPTH):
+            text = self.fetcher.get_playlist(url)
+            if not text.lstrip().startswith("#EXTM3U"):
+                raise ValueError("M3U8形式ではない応答を受信しました。")
+            variants, segments, _ = self.parse_playlist(text, url)
+            if segments or not variants:
+                return url
+            url = variants[0]
+        raise ValueError("プレイリストの入れ子が深すぎます。")
+
+    @property
+    def _base(self):
+        """最初に見えたセグメントの開始時刻の推定値 (観測値の最小が公開時刻に最も近い)"""
+        return min(self._base_estimates) if self._base_estimates else None
+
+    def segment_start(self, seq):
+        """セグメントの放送開始時刻 (UNIX時刻)"""
+        segment = self.segments[seq]
+        if segment["pdt"] is not None:
+            return segment["pdt"]
+        return self._base + segment["offset"]
+
+    def clock_drift(self):
+        """
+        録音の開始付近と終了付近での公開時刻の推定値の差(秒)。正ならメディア時間が実時間より遅れている
+        (または配信の遅延が増えた)。観測が足りない場合は None。
+        """
+        estimates = self._base_estimates
+        if len(estimates) < LIVE_RECORD_DRIFT_SAMPLES * 2:
+            return None
+        return min(estimates[-LIVE_RECORD_DRIFT_SAMPLES:]) - min(estimates[:LIVE_RECORD_DRIFT_SAMPLES])
+
+    def _wait(self, seconds):
+        """stop_download で中断された場合は True"""
+        return self.downloader._stop_event.wait(max(0.0, seconds))
+
+    def _first_segment(self):
+        """開始時刻を含む (無ければ開始時刻より後の最初の) セグメントの番号。まだ公開されていなければ None。"""
+        for seq in sorted(self.segments):
+            if self.segment_start(seq) + self.segments[seq]["duration"] > self.start_ts:
+                return seq
+        return None
+
+    def _write_frames(self, out_file, data, skip_seconds, remaining_seconds):
+        """
+        セグメントのうち、先頭 skip_seconds 秒より後かつ remaining_seconds 秒に収まるフレームだけを書き込み、
+        (書き込んだ秒数, バイト数, 終了時刻に達したか) を返す。フレーム境界は開始・終了時刻に近い方へ丸める。
+        ADTSとして解析できないセグメントはそのまま書き込み、秒数は None を返す。
+        """
+        first = last = None
+        position = 0.0
+        written = 0.0
+        reached_end = False
+        try:
+            for offset, length, rate, samples in iter_adts_frames(data):
+                frame_seconds = samples / rate
+                if position + frame_seconds / 2 <= skip_seconds:
+                    position += frame_seconds
+                    continue
+                if written + frame_seconds / 2 > remaining_seconds:
+                    reached_end = True
+                    break
+                if first is None:
+                    first = offset
+                last = offset + length
+                position += frame_seconds
+                written += frame_seconds
+        except ValueError as e:
+            self.log(f"警告: セグメントをADTSとして解析できないため、そのまま書き込みます: {e}")
+            out_file.write(data)
+            return None, len(data), False
+
+        if first is None:
+            return 0.0, 0, reached_end
+        # フレームは連続しているので、範囲全体を1回で書き込む
+        out_file.write(memoryview(data)[first:last])
+        return written, last - first, reached_end
+
+    def record(self, out_file, progress_callback=None):
+        """
+        録音を行い、統計の辞書を返す。中断・失敗した場合は None。
+        out_file へはADTSフレームを書き込む。
+        """
+        downloader = self.downloader
+        total_seconds = self.end_ts - self.start_ts
+
+        # 事前準備の開始時刻まで待つ
+        if self._wait(self.start_ts - self.prewarm - time.time()):
+            return None
+
+        # 認証を更新し、プレイリストを解決して監視を始める (keep-alive接続もここで確立される)
+        prewarm_started = time.time()
+        if not downloader.auth.ensure_valid():
+            self.log("エラー: 認証トークンの更新に失敗しました。")
+            return None
+        self.fetcher = HLSSegmentFetcher(
+            downloader.auth.session, downloader._build_request_headers(), self.log, 1,
+            reauth_callback=downloader._refresh_request_headers,
+        )
+        try:
+            self.chunklist_url = self._resolve()
+            self._poll()
+        except Exception as e:
+            self.log(f"エラー: ライブのプレイリストを取得できませんでした: {e}")
+            return None
+        prewarm_ready = time.time()
+        self.log(
+            f"ライブ録音の準備完了: {self.station_id} (準備 {(prewarm_ready - prewarm_started) * 1000:.0f} ms, "
+            f"開始まで {self.start_ts - prewarm_ready:.1f} 秒)"
+        )
+
+        next_seq = None
+        # 開始時刻からのメディア時間(秒)。書き込んだサンプル数と欠落したセグメントの長さで進める
+        position = None
+        written_seconds = 0.0
+        lost_seconds = 0.0
+        head_lost = 0.0
+        first_write_at = None
+        bytes_written = 0
+        stalled = False
+        finished = False
+
+        while True:
+            if next_seq is None:
+                next_seq = self._first_segment()
+
+            while next_seq is not None and next_seq in self.segments and not finished:
+                segment = self.segments[next_seq]
+                try:
+                    data = self.fetcher.get_segment(segment["url"])
+                except Exception as e:
+                    if next_seq in self._window:
+                        # まだウィンドウ内にあるので次の確認で再試行する
+                        self.log(f"警告: セグメント {next_seq} の取得に失敗しました。再試行します: {e}")
+                        break
+                    self.log(f"警告: セグメント {next_seq} を取得できませんでした ({segment['duration']:.1f} 秒の欠落): {e}")
+                    data = None
+
+                skip_seconds = 0.0
+                if position is None:
+                    relative_start = self.segment_start(next_seq) - self.start_ts
+                    skip_seconds = max(0.0, -relative_start)
+                    position = head_lost = max(0.0, relative_start)
+                    if head_lost:
+                        self.log(f"警告: 開始時刻の {head_lost:.1f} 秒後からの録音になります。")
+
+                if data is None:
+                    lost_seconds += segment["duration"] - skip_seconds
+                    position += segment["duration"] - skip_seconds
+                    finished = position >= total_seconds
+                else:
+                    written, nbytes, finished = self._write_frames(
+                        out_file, data, skip_seconds, total_seconds - position
+                    )
+                    if written is None:
+                        written = segment["duration"] - skip_seconds
+                    if first_write_at is None and nbytes:
+                        first_write_at = time.time()
+                        # 最初のセグメントの公開 (推定) から書き込みまでの遅れ
+                        publish_latency = first_write_at - (self._base + segment["offset"] + segment["duration"])
+                        self.log(
+                            f"ライブ録音の書き込みを開始: 開始時刻から {first_write_at - self.start_ts:.2f} 秒後, "
+                            f"セグメントの公開から {publish_latency:.2f} 秒後 (先頭の欠落 {head_lost:.2f} 秒)"
+                        )
+                    position += written
+                    written_seconds += written
+                    bytes_written += nbytes
+                    finished = finished or position >= total_seconds
+
+                next_seq += 1
+                if progress_callback:
+                    progress_callback(DownloadProgress(
+                        total_seconds, min(position, total_seconds), bytes_written,
+                        max(0.0, time.time() - self.start_ts), finished,
+                    ))
+
+            if finished:
+                break
+            if time.time() > self.end_ts + LIVE_RECORD_STALL_SECONDS:
+                stalled = True
+                self.log("警告: 新しいセグメントが公開されないため、取得できた分で録音を終えます。")
+                break
+            if self._wait(LIVE_RECORD_POLL_SECONDS):
+                self.log("ライブ録音が中断されました。")
+                return None
+            try:
+                _, ended = self._poll()
+            except Exception as e:
+                self.log(f"警告: ライブのプレイリストの確認に失敗しました: {e}")
+                continue
+            if ended and next_seq is not None and next_seq > self._last_seq:
+                self.log("配信が終了しました。")
+                break
+
+        if first_write_at is None:
+            self.log("エラー: ライブ配信から音声を取得できませんでした。")
+            return None
+
+        drift = self.clock_drift()
+        stats = {
+            "station_id": self.station_id,
+            "prewarm_ms": round((prewarm_ready - prewarm_started) * 1000, 1),
+            "ready_before_start_s": round(self.start_ts - prewarm_ready, 2),
+            "start_latency_s": round(first_write_at - self.start_ts, 2),
+            "publish_latency_s": round(publish_latency, 2),
+            "head_lost_s": round(head_lost, 2),
+            "lost_s": round(lost_seconds + head_lost + max(0.0, total_seconds - position), 2),
+            "media_s": round(written_seconds, 3),
+            "drift_s": round(drift, 3) if drift is not None else None,
+            "bytes": bytes_written,
+            "program_date_time": any(s["pdt"] is not None for s in self.segments.values()),
+            "stalled": stalled,
+        }
+        self.log(
+            f"ライブ録音完了: {format_duration(written_seconds)} "
+            f"(開始遅延 {stats['start_latency_s']} 秒, 先頭の欠落 {stats['head_lost_s']} 秒, "
+            f"欠落の合計 {stats['lost_s']} 秒, 時計のずれ {stats['drift_s'] if drift is not None else '-'} 秒)"
+        )
+        return stats
+
+
+# --- 後処理パイプライン ---
+
+# 後処理の段階 (この順で実行する)
+# "normalize": EBU R128 (loudnorm) で音量を揃え、AACで再エンコードする
+# "tag": 番組表の情報 (番組名・出演者・局・放送日・番組詳細) をM4Aに書き込む
+# "opus": モバイル向けの低ビットレートOpus (.opus) を出力ファイルの隣に作成する
+POSTPROCESS_NORMALIZE = "normalize"
+POSTPROCESS_TAG = "tag"
+POSTPROCESS_OPUS = "opus"
+POSTPROCESS_STAGES = (POSTPROCESS_NORMALIZE, POSTPROCESS_TAG, POSTPROCESS_OPUS)
+
+LOUDNORM_FILTER = "loudnorm=I=-16:TP=-1.5:LRA=11"
+NORMALIZE_AAC_BITRATE = "96k"
+OPUS_BITRATE = "32k"
+# 番組詳細はHTMLを含み長いため、タグに書き込む長さを制限する
+TAG_COMMENT_MAX_CHARS = 1000
+
+
+def parse_postprocess_stages(value):
+    """カンマ区切りの段階名を POSTPROCESS_STAGES の実行順に並べたタプルにする。"""
+    names = {name.strip() for name in (value or "").split(",") if name.strip()}
+    unknown = names - set(POSTPROCESS_STAGES)
+    if unknown:
+        raise ValueError(f"不明な後処理: {', '.join(sorted(unknown))} (指定できるのは {', '.join(POSTPROCESS_STAGES)})")
+    return tuple(stage for stage in POSTPROCESS_STAGES if stage in names)
+
+
+def program_tags(program, station_name=None):
+    """番組表の情報からM4A/Opusに書き込むタグを作る。"""
+    if program is None:
+        return {}
+    tags = {
+        "title": program.title,
+        "artist": program.performer,
+        "album": station_name or program.station_id,
+        "comment": re.sub(r"<[^>]+>", "", program.info or "")[:TAG_COMMENT_MAX_CHARS],
+    }
+    if _is_radiko_time(program.start_time_str):
+        tags["date"] = program.start_time_dt.strftime("%Y-%m-%d %H:%M")
+    return {key: value for key, value in tags.items() if value}
+
+
+def _run_postprocess_ffmpeg(args):
+    """後処理用にFFmpegを実行する。失敗時はエラー出力の末尾を含む RuntimeError。"""
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "1", *args],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors="replace",
+    )
+    if result.returncode != 0:
+        tail = result.stderr.strip().splitlines()[-5:]
+        raise RuntimeError(f"FFmpegが失敗しました (終了コード {result.returncode}): {' / '.join(tail)}")
+
+
+def run_postprocess(input_path, stages, tags=None):
+    """
+    1ファイルの後処理を実行する (ProcessPoolExecutor の子プロセス内で実行)。
+    M4Aを置き換える段階は一時ファイルへ書き出してから差し替えるため、失敗しても元のファイルは残る。
+    FFmpegは1スレッドで実行し、プールの大きさ (=CPU数) で全体のCPU使用量を決める。
+    戻り値は段階ごとの所要時間(秒)・作成したファイル・エラーを持つ辞書。
+    """
+    tags = tags or {}
+    metadata_args = [arg for key, value in tags.items() for arg in ("-metadata", f"{key}={value}")]
+    result = {"input": input_path, "outputs": {}, "timings": {}, "error": None, "failed_stage": None}
+
+    for stage in stages:
+        start = time.perf_counter()
+        tmp_path = input_path + ".post.m4a"
+        try:
+            if stage == POSTPROCESS_NORMALIZE:
+                _run_postprocess_ffmpeg([
+                    "-i", input_path, "-vn",
+                    "-af", LOUDNORM_FILTER,
+                    "-c:a", "aac", "-b:a", NORMALIZE_AAC_BITRATE,
+                    "-map_metadata", "0",
+                    "-y", tmp_path,
+                ])
+                os.replace(tmp_path, input_path)
+                output = input_path
+            elif stage == POSTPROCESS_TAG:
+                _run_postprocess_ffmpeg([
+                    "-i", input_path, "-map", "0", "-c", "copy",
+                    *metadata_args,
+                    "-y", tmp_path,
+                ])
+                os.replace(tmp_path, input_path)
+                output = input_path
+            elif stage == POSTPROCESS_OPUS:
+                output = os.path.splitext(input_path)[0] + ".opus"
+                _run_postprocess_ffmpeg([
+                    "-i", input_path, "-vn",
+                    "-c:a", "libopus", "-b:a", OPUS_BITRATE,
+                    "-map_metadata", "0", *metadata_args,
+                    "-y", output,
+                ])
+            else:
+                raise ValueError(f"不明な後処理: {stage}")
+        except Exception as e:
+            result["error"] = str(e)
+            result["failed_stage"] = stage
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            break
+        finally:
+            result["timings"][stage] = round(time.perf_counter() - start, 3)
+        result["outputs"][stage] = output
+
+    return result
+
+
+class PostProcessor:
+    """
+    ダウンロード済みのファイルの後処理 (音量正規化・Opus変換・タグ付け) を
+    CPU数のワーカープロセスで並列に実行するクラス。
+    ネットワーク待ちのダウンロードワーカーとは別のプールで動くため、変換がダウンロードを妨げない。
+    submit() はすぐに戻り、完了時に段階ごとの所要時間をログに出す。
+    """
+    def __init__(self, log_callback, max_workers=None, station_names=None):
+        self.log = log_callback
+        self.max_workers = max(1, int(max_workers or os.cpu_count() or 1))
+        # 局ID → 局名 (タグの album に使う)
+        self.station_names = station_names or {}
+
+        self._executor = None
+        self._pending = set()
+        self._cond = threading.Condition()
+        # 段階ごとの [処理件数, 合計秒数]
+        self._stage_totals = {stage: [0, 0.0] for stage in POSTPROCESS_STAGES}
+        self.completed = 0
+        self.failed = 0
+
+    def _get_executor(self):
+        """プロセスプールを初回の投入時に作成する (multiprocessing の読み込みもここで行う)"""
+        if self._executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # GUIやダウンロードのスレッドが動いている状態で fork しないよう spawn で起動する
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def submit(self, input_path, stages, program=None, on_done=None):
+        """
+        input_path の後処理をプールに投入し、Future を返す。
+        on_done は結果の辞書を引数に、プールの結果受け取りスレッドから呼ばれる。
+        """
+        station_name = self.station_names.get(program.station_id) if program else None
+        tags = program_tags(program, station_name) if POSTPROCESS_TAG in stages or POSTPROCESS_OPUS in stages else {}
+
+        with self._cond:
+            future = self._get_executor().submit(run_postprocess, input_path, tuple(stages), tags)
+            self._pending.add(future)
+        self.log(f"後処理を開始: {os.path.basename(input_path)} ({', '.join(stages)})")
+
+        def done(future):
+            try:
+                if future.cancelled():
+                    return
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # ワーカープロセスの異常終了など
+                    result = {"input": input_path, "outputs": {}, "timings": {}, "error": str(e), "failed_stage": None}
+                self._record(result)
+                if on_done:
+                    on_done(result)
+            finally:
+                # wait() は結果の通知が終わってから戻る
+                with self._cond:
+                    self._pending.discard(future)
+                    self._cond.notify_all()
+
+        future.add_done_callback(done)
+        return future
+
+    def _record(self, result):
+        with self._cond:
+            for stage, seconds in result["timings"].items():
+                totals = self._stage_totals[stage]
+                totals[0] += 1
+                totals[1] += seconds
+            if result["error"]:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+        timings = ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in result["timings"].items())
+        name = os.path.basename(result["input"])
+        if result["error"]:
+            stage = f" ({result['failed_stage']})" if result["failed_stage"] else ""
+            self.log(f"エラー: 後処理{stage}に失敗しました: {name}: {result['error']} [{timings}]")
+        else:
+            self.log(f"後処理完了: {name} [{timings}]")
+
+    def stats(self):
+        """段階ごとの処理件数・合計/平均所要時間を返す。"""
+        with self._cond:
+            return {
+                stage: {
+                    "count": count,
+                    "total_s": round(total, 3),
+                    "mean_s": round(total / count, 3) if count else None,
+                }
+                for stage, (count, total) in self._stage_totals.items()
+                if count
+            }
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending)
+
+    def wait(self):
+        """投入済みの後処理が全て終わり、結果が通知されるまで待つ。"""
+        with self._cond:
+            while self._pending:
+                self._cond.wait()
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        """プロセスプールを終了する。cancel_pending の場合は未着手の後処理を取り消す。"""
+        with self._cond:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait, cancel_futures=cancel_pending)
+
+
+# --- 取得中の録音の配信 ---
+
+LIVE_SERVER_HOST = "127.0.0.1"
+LIVE_SERVER_PORT = 8765
+# 読み手が新しいデータを待つ間隔(秒)と、1回に送る最大バイト数
+LIVE_POLL_SECONDS = 0.5
+LIVE_READ_SIZE = 64 * 1024
+LIVE_PATH_PATTERN = re.compile(r"^/recordings/([A-Za-z0-9_-]+)/(\d{14})/(\d{14})\.aac$")
+
+LIVE_FETCHING = "fetching"
+LIVE_FINISHED = "finished"
+LIVE_FAILED = "failed"
+
+
+class LiveRecording:
+    """
+    取得中 (または取得済み) の1番組のADTSファイル。
+    取得スレッドがファイルの末尾へ書き足し、複数の読み手は書き込み済みの範囲だけを読む。
+    """
+    def __init__(self, station_id, start_time_str, end_time_str, path):
+        self.station_id = station_id
+        self.start_time_str = start_time_str
+        self.end_time_str = end_time_str
+        self.path = path
+        self.state = LIVE_FETCHING
+        self.telemetry = None
+        self.readers = 0
+        self._cond = threading.Condition()
+
+    @property
+    def key(self):
+        return (self.station_id, self.start_time_str, self.end_time_str)
+
+    @property
+    def done(self):
+        return self.state != LIVE_FETCHING
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def notify(self, progress=None):
+        """取得スレッドから呼ばれ、新しいデータを待っている読み手を起こす。"""
+        with self._cond:
+            if progress is not None:
+                self.telemetry = progress
+            self._cond.notify_all()
+
+    def finish(self, success):
+        with self._cond:
+            self.state = LIVE_FINISHED if success else LIVE_FAILED
+            self._cond.notify_all()
+
+    def wait_for(self, size):
+        """
+        ファイルが size バイト以上になるか、取得が終わるまで待ち、その時点の大きさを返す。
+        進捗の通知が無くても LIVE_POLL_SECONDS ごとにファイルの大きさを確認する。
+        """
+        with self._cond:
+            while True:
+                current = self.size()
+                if current >= size or self.done:
+                    return self.size()
+                self._cond.wait(LIVE_POLL_SECONDS)
+
+    def to_dict(self):
+        return {
+            "station_id": self.station_id,
+            "ft": self.start_time_str,
+            "to": self.end_time_str,
+            "state": self.state,
+            "bytes": self.size(),
+            "readers": self.readers,
+            "progress": self.telemetry.to_dict() if self.telemetry else None,
+        }
+
+
+def parse_byte_range(header):
+    """
+    Range ヘッダ (単一範囲のみ) を (先頭, 末尾 or None, 末尾からのバイト数 or None) にする。
+    解釈できない・複数範囲の場合は None (Range を無視して全体を返す)。
+    """
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", (header or "").strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    first, last = match.groups()
+    if not first:
+        return None, None, int(last)
+    return int(first), int(last) if last else None, None
+
+
+class LiveRecordingServer:
+    """
+    取得中の録音をHTTPで配信するローカルサーバー。
+
+    GET /recordings/<局ID>/<開始>/<終了>.aac で番組のADTSストリームを返す。
+    その番組をまだ取得していなければ StreamDownloader.download_adts で取得を始め、
+    同じ番組を要求した全ての読み手が1つの取得を共有する。取得済みの範囲は Range 要求にも応じ、
+    Range の無い要求には取得の完了までファイルの末尾を追いかけて送り続けるため、
+    数秒で再生を始められる。GET /recordings は録音の一覧をJSONで返す。
+    """
+    def __init__(self, auth, log_callback, output_dir=".", host=LIVE_SERVER_HOST, port=LIVE_SERVER_PORT,
+                 engine=ENGINE_NATIVE):
+        self.auth = auth
+        self.log = log_callback
+        self.output_dir = output_dir
+        self.host = host
+        self.port = port
+        self.engine = engine
+
+        self.recordings = {}
+        self._downloaders = {}
+        self._lock = threading.Lock()
+        self.httpd = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.httpd.server_address[1] if self.httpd else self.port}"
+
+    def recording_url(self, station_id, start_time_str, end_time_str):
+        return f"{self.base_url}/recordings/{station_id}/{start_time_str}/{end_time_str}.aac"
+
+    def get_recording(self, station_id, start_time_str, end_time_str):
+        """
+        番組の LiveRecording を返す。取得中・取得済みのものがあればそれを共有し、
+        無ければ (または前回の取得が失敗していれば) 取得を開始する。
+        """
+        key = (station_id, start_time_str, end_time_str)
+        with self._lock:
+            recording = self.recordings.get(key)
+            if recording and recording.state != LIVE_FAILED:
+                return recording
+
+            path = os.path.join(self.output_dir, f"{station_id}_{start_time_str}_{end_time_str}.aac")
+            # 失敗した前回の取得の途中までのファイルが残っていれば、読み手に渡る前に空にする
+            # (前回の読み手が開いたままでも消せるよう、削除ではなく切り詰める)
+            if os.path.exists(path):
+                open(path, "wb").close()
+            recording = LiveRecording(station_id, start_time_str, end_time_str, path)
+            self.recordings[key] = recording
+            downloader = StreamDownloader(self.auth, self.log)
+            self._downloaders[key] = downloader
+
+        thread = threading.Thread(target=self._fetch, args=(recording, downloader), daemon=True)
+        thread.start()
+        return recording
+
+    def _fetch(self, recording, downloader):
+        """番組を取得する (取得スレッド内実行)"""
+        success = False
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            success = downloader.download_adts(
+                recording.station_id, recording.start_time_str, recording.end_time_str, recording.path,
+                recording.notify, engine=self.engine,
+            )
+        finally:
+            recording.finish(success)
+            with self._lock:
+                self._downloaders.pop(recording.key, None)
+
+    def start(self):
+        """サーバーをバックグラウンドスレッドで起動する (http.server はここで初めて読み込む)"""
+        from http.server import ThreadingHTTPServer
+        self.httpd = ThreadingHTTPServer((self.host, self.port), _make_live_handler(self))
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.log(f"配信サーバーを起動しました: {self.base_url}/recordings/<局ID>/<開始>/<終了>.aac")
+        return self
+
+    def stop(self):
+        """サーバーを停止し、実行中の取得を中断する。"""
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        with self._lock:
+            downloaders = list(self._downloaders.values())
+        for downloader in downloaders:
+            downloader.stop_download()
+
+
+def _make_live_handler(server):
+    """LiveRecordingServer 用のリクエストハンドラのクラスを作る。"""
+    from http.server import BaseHTTPRequestHandler
+
+    class LiveRecordingHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_HEAD(self):
+            self._dispatch(send_body=False)
+
+        def do_GET(self):
+            self._dispatch(send_body=True)
+
+        def _dispatch(self, send_body):
+            path = self.path.split("?", 1)[0]
+            if path in ("/recordings", "/recordings/"):
+                with server._lock:
+                    recordings = [recording.to_dict() for recording in server.recordings.values()]
+                body = json.dumps(recordings, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+                return
+
+            match = LIVE_PATH_PATTERN.match(path)
+            if not match:
+                self.send_error(404)
+                return
+
+            recording = server.get_recording(*match.groups())
+            with recording._cond:
+                recording.readers += 1
+            try:
+                self._send_recording(recording, send_body)
+            except (BrokenPipeError, ConnectionResetError):
+                # 再生側が接続を閉じた (シーク・停止など)
+                pass
+            finally:
+                with recording._cond:
+                    recording.readers -= 1
+
+        def _send_recording(self, recording, send_body):
+            byte_range = parse_byte_range(self.headers.get("Range"))
+            # 最初のデータが届くまで (または取得が失敗するまで) 待つ
+            available = recording.wait_for(1)
+            if recording.state == LIVE_FAILED and available == 0:
+                self.send_error(502, "番組の取得に失敗しました")
+                return
+
+            if byte_range is None or (byte_range[0] == 0 and byte_range[1] is None and not recording.done):
+                # Range 無し (または取得中の bytes=0-): 取得の完了まで末尾を追いかけて送る
+                self._send_headers(200, recording)
+                if send_body:
+                    self._copy(recording, 0, None)
+                return
+
+            first, last, suffix = byte_range
+            if suffix is not None:
+                # 末尾からの範囲は全体の大きさが確定してから応じる
+                available = recording.wait_for(float("inf"))
+                first, last = max(0, available - suffix), available - 1
+            elif last is not None:
+                available = recording.wait_for(last + 1)
+            else:
+                available = recording.wait_for(first + 1)
+
+            total = str(available) if recording.done else "*"
+            if first >= available:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{total}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            # 取得中は書き込み済みの範囲だけを返す (全体の大きさは "*")
+            last = available - 1 if last is None else min(last, available - 1)
+            self._send_headers(206, recording, last - first + 1, {"Content-Range": f"bytes {first}-{last}/{total}"})
+            if send_body:
+                self._copy(recording, first, last)
+
+        def _send_headers(self, status, recording, length=None, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", "audio/aac")
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Cache-Control", "no-cache")
+            if length is None and recording.done:
+                length = recording.size()
+            if length is not None:
+                self.send_header("Content-Length", str(length))
+            else:
+                # 大きさが未確定のまま送り続けるため、終端は接続の切断で示す
+                self.send_header("Connection", "close")
+                self.close_connection = True
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+
+        def _copy(self, recording, first, last):
+            """first から last (None の場合は取得の完了まで) のバイトを送る。"""
+            position = first
+            with open(recording.path, "rb") as f:
+                f.seek(first)
+                while last is None or position <= last:
+                    available = recording.wait_for(position + 1)
+                    if available <= position:
+                        return
+                    end = available if last is None else min(available, last + 1)
+                    data = f.read(min(end - position, LIVE_READ_SIZE))
+                    if not data:
+                        return
+                    self.wfile.write(data)
+                    position += len(data)
+
+    return LiveRecordingHandler
+
+
+# --- セッションプール ---
+
+# 1セッション (アカウント) あたりの同時ダウンロード数の既定値
+POOL_DEFAULT_MAX_LEASES = 2
+# 有効期限のこの秒数前になったセッションをバックグラウンドで更新する
+# (ダウンロード開始時の更新 AUTH_TOKEN_REFRESH_MARGIN より早く更新し、ダウンロードを待たせない)
+POOL_REFRESH_MARGIN = 15 * 60
+POOL_REFRESH_INTERVAL = 60
+# ログインに失敗したセッションを再試行する間隔の上限(秒) (失敗のたびに倍にする)
+POOL_RELOGIN_MAX_DELAY = 60 * 60
+
+
+class SessionLeaseError(Exception):
+    """対象の局を受信できるセッションが無い、または貸し出しを待ちきれなかったことを示す例外。"""
+    pass
+
+
+def load_accounts(path):
+    """
+    アカウント一覧 (YAML または JSON) を読み込む。login.yaml と同じ形式のファイルに accounts を加えたもの:
+
+        accounts:
+          - mail: foo@sample.com      # Premium会員 (エリアフリー)
+            password: passme
+            max_leases: 2             # このアカウントの同時ダウンロード数
+          - proxy: http://osaka.example:3128   # 非会員。エリアはプロキシの接続元で決まる
+
+    accounts が無ければ、トップレベルの mail / password (無ければ非会員) の1アカウントとして扱う。
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        import yaml
+        cfg = yaml.safe_load(text) or {}
+    else:
+        cfg = json.loads(text)
+
+    if isinstance(cfg, list):
+        return cfg
+    accounts = cfg.get("accounts")
+    if accounts:
+        return accounts
+    return [{"mail": cfg.get("mail"), "password": cfg.get("password")}]
+
+
+class PooledSession:
+    """SessionPool が管理する1アカウント分の認証済みセッションと、その受信可能な局。"""
+    def __init__(self, account, log_callback, cache_path=AUTH_CACHE_PATH, auth=None):
+        self.mail = account.get("mail") or None
+        self.password = account.get("password") or None
+        self.proxy = account.get("proxy") or None
+        self.max_leases = max(1, int(account.get("max_leases") or POOL_DEFAULT_MAX_LEASES))
+        # auth を渡された場合は呼び出し元のログイン済みセッションを使い回す (ログアウトも呼び出し元が行う)
+        self.shared = auth is not None
+        self.auth = auth or RadikoAuth(log_callback, cache_path, proxy=self.proxy)
+        self.log = log_callback
+
+        self.ready = False
+        self.login_failures = 0
+        self.next_login_at = 0.0
+        # 局ID → 局名 (認証で判定されたエリアの局)
+        self.stations = {}
+        self.active = 0
+        self.leases = 0
+
+    @property
+    def name(self):
+        name = self.mail or "非会員"
+        return f"{name} via {self.proxy}" if self.proxy else name
+
+    @property
+    def area_free(self):
+        """Premium会員のセッションはエリア外の局も受信できる。"""
+        return bool(self.auth.radiko_session)
+
+    def login(self):
+        """認証し、エリアの局リストを取得する。成功すれば True。"""
+        if not (self.shared and self.auth.is_valid()) and not self.auth.auth(self.mail, self.password):
+            self._login_failed()
+            return False
+        metadata = RadikoMetadata(self.auth, self.log)
+        metadata.load_stations()
+        self.stations = dict(metadata.get_stations())
+        self.login_failures = 0
+        self.ready = True
+        return True
+
+    def refresh(self):
+        """
+        期限が近いトークンを更新する。更新中も貸し出し中のジョブは古いトークンを使い続けられる。
+        失敗した場合は貸し出しを止め、再ログインを予約して False を返す。
+        """
+        if not self.auth.reauth(self.auth.authtoken):
+            self._login_failed()
+            return False
+        self.login_failures = 0
+        return True
+
+    def _login_failed(self):
+        self.ready = False
+        # 認証情報の誤りでアカウントがロックされないよう、再試行の間隔を広げていく
+        self.login_failures += 1
+        delay = min(POOL_REFRESH_INTERVAL * 2 ** (self.login_failures - 1), POOL_RELOGIN_MAX_DELAY)
+        self.next_login_at = time.time() + delay
+
+    def covers(self, station_id):
+        return self.ready and (station_id in self.stations or self.area_free)
+
+    def expires_in(self):
+        if self.auth.issued_at is None:
+            return 0
+        return self.auth.issued_at + self.auth.ttl - time.time()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "area_id": self.auth.area_id,
+            "premium": self.area_free,
+            "ready": self.ready,
+            "stations": len(self.stations),
+            "active": self.active,
+            "max_leases": self.max_leases,
+            "leases": self.leases,
+            "expires_in_s": round(self.expires_in()),
+        }
+
+
+class SessionPool:
+    """
+    複数のエリア・アカウントの認証済みセッション (RadikoAuth) を保持し、ダウンロードに貸し出すクラス。
+
+    lease(局ID) は、その局のエリアを受信できるセッションのうち空きのあるものを貸し出す
+    (エリア内のセッションを優先し、Premiumのエリアフリーは他に無い場合に使う)。
+    各セッションは同時に max_leases 件まで貸し出され、空きが無ければ返却を待つ。
+    ログインは全セッション並列に行い、期限が近いセッションはバックグラウンドで更新するため、
+    ワーカーが1つのログインの完了を待って直列化されることは無い。
+    """
+    def __init__(self, accounts, log_callback, cache_path=AUTH_CACHE_PATH,
+                 refresh_margin=POOL_REFRESH_MARGIN, refresh_interval=POOL_REFRESH_INTERVAL, auth=None):
+        self.log = log_callback
+        # auth (ログイン済みの RadikoAuth) は、同じアカウント (メールアドレスが同じでプロキシ無し) に使い回す
+        self.sessions = []
+        for account in accounts:
+            shared = None
+            if (auth and auth.authtoken and not account.get("proxy")
+                    and (account.get("mail") or None) == auth._mail):
+                shared, auth = auth, None
+            self.sessions.append(PooledSession(account, log_callback, cache_path, auth=shared))
+        self.refresh_margin = refresh_margin
+        self.refresh_interval = refresh_interval
+
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._refresh_thread = None
+
+        # 貸し出しの待ち時間の統計
+        self.lease_count = 0
+        self.waited_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def start(self):
+        """全セッションに並列でログインし、更新スレッドを起動する。ログインできたセッション数を返す。"""
+        with ThreadPoolExecutor(max_workers=max(1, len(self.sessions))) as executor:
+            results = list(executor.map(lambda session: session.login(), self.sessions))
+
+        for session, ok in zip(self.sessions, results):
+            if ok:
+                coverage = "全エリア" if session.area_free else f"{len(session.stations)} 局"
+                self.log(f"セッション準備完了: {session.name} (エリア {session.auth.area_id}, {coverage})")
+            else:
+                self.log(f"警告: セッションのログインに失敗しました: {session.name}")
+
+        self._refresh_thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._refresh_thread.start()
+        return sum(results)
+
+    @property
+    def primary(self):
+        """番組表の取得などに使う、最初のログイン済みセッションの RadikoAuth。"""
+        for session in self.sessions:
+            if session.ready:
+                return session.auth
+        return None
+
+    def stations(self):
+        """いずれかのセッションのエリアに含まれる局 (局ID → 局名)。"""
+        stations = {}
+        for session in self.sessions:
+            stations.update(session.stations)
+        return stations
+
+    def _pick(self, station_id):
+        """
+        貸し出すセッションを選ぶ (self._cond を保持した状態で呼ぶ)。
+        受信できるセッションが無ければ SessionLeaseError、全て貸し出し中なら None。
+        """
+        candidates = [session for session in self.sessions if session.covers(station_id)]
+        if not candidates:
+            raise SessionLeaseError(f"局 {station_id} を受信できるセッションがありません")
+        free = [session for session in candidates if session.active < session.max_leases]
+        if not free:
+            return None
+        # エリア内のセッションを優先し、その中で空きの割合が大きいものを選ぶ
+        return min(free, key=lambda s: (station_id not in s.stations, s.active / s.max_leases))
+
+    @contextmanager
+    def lease(self, station_id, timeout=None):
+        """
+        局を受信できるセッションを貸し出し、その RadikoAuth を返すコンテキストマネージャ。
+        timeout 秒以内に空きが出なければ SessionLeaseError。
+        """
+        start = time.perf_counter()
+        with self._cond:
+            while True:
+                session = self._pick(station_id)
+                if session:
+                    break
+                remaining = None if timeout is None else timeout - (time.perf_counter() - start)
+                if remaining is not None and remaining <= 0:
+                    raise SessionLeaseError(f"局 {station_id} のセッションの空きを待ちきれませんでした")
+                self._cond.wait(remaining)
+
+            waited = time.perf_counter() - start
+            session.active += 1
+            session.leases += 1
+            self.lease_count += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if waited > 0.001:
+                self.waited_count += 1
+
+        if waited > 1:
+            self.log(f"セッション {session.name} を {waited:.1f} 秒待って確保しました ({station_id})")
+        try:
+            yield session.auth
+        finally:
+            with self._cond:
+                session.active -= 1
+                self._cond.notify_all()
+
+    def _refresh_loop(self):
+        """期限が近いセッションを更新し、ログインに失敗したセッションを再試行する (更新スレッド内実行)"""
+        while not self._stop_event.wait(self.refresh_interval):
+            for session in self.sessions:
+                if self._stop_event.is_set():
+                    return
+                if not session.ready:
+                    if time.time() < session.next_login_at:
+                        continue
+                    if session.login():
+                        self.log(f"セッションを再ログインしました: {session.name}")
+                        with self._cond:
+                            self._cond.notify_all()
+                elif session.expires_in() < self.refresh_margin:
+                    self.log(f"セッションを事前に更新します: {session.name}")
+                    if not session.refresh():
+                        self.log(f"警告: セッションの更新に失敗したため、再ログインまで使用を止めます: {session.name}")
+
+    def stats(self):
+        """セッションごとの状態と、貸し出しの待ち時間の統計を返す。"""
+        with self._cond:
+            return {
+                "sessions": [session.to_dict() for session in self.sessions],
+                "leases": self.lease_count,
+                "waited": self.waited_count,
+                "wait_total_s": round(self.wait_total, 3),
+                "wait_mean_s": round(self.wait_total / self.lease_count, 3) if self.lease_count else None,
+                "wait_max_s": round(self.wait_max, 3),
+            }
+
+    def close(self):
+        """更新スレッドを止め、Premiumセッションをログアウトする (使い回したセッションは呼び出し元に任せる)。"""
+        self._stop_event.set()
+        for session in self.sessions:
+            if session.ready and not session.shared:
+                session.auth.logout()
+
+
+# --- ダウンロードキュー ---
+
+# ジョブの状態
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+JOB_STATUS_LABELS = {
+    JOB_PENDING: "待機中",
+    JOB_RUNNING: "実行中",
+    JOB_DONE: "完了",
+    JOB_FAILED: "失敗",
+    JOB_CANCELLED: "中断",
+}
+
+# キューの既定値
+QUEUE_DEFAULT_WORKERS = 2
+QUEUE_DEFAULT_PER_STATION = 1
+QUEUE_DEFAULT_RETRIES = 1
+
+
+class DownloadJob:
+    """
+    ダウンロードキュー内の1件の録音ジョブ。
+    ジョブごとに専用のStreamDownloader（=専用のFFmpegプロセス）と進捗・中断・再試行の状態を持つ。
+    """
+    def __init__(self, job_id, station_id, program, output_path,
+                 engine=ENGINE_FFMPEG, shards=1, max_retries=QUEUE_DEFAULT_RETRIES, postprocess=()):
+        self.job_id = job_id
+        self.station_id = station_id
+        self.program = program
+        self.output_path = output_path
+        self.engine = engine
+        self.shards = shards
+        self.max_retries = max_retries
+        # ダウンロード完了後に実行する後処理の段階
+        self.postprocess = tuple(postprocess or ())
+        # 後処理の結果 (run_postprocess の戻り値)。未実行・実行中は None
+        self.postprocess_result = None
+
+        self.status = JOB_PENDING
+        self.progress = 0.0
+        # 最新の DownloadProgress (処理済みメディア時間・速度・残り時間)
+        self.telemetry = None
+        self.attempts = 0
+        self.downloader = None
+        self.cancel_requested = False
+
+    @property
+    def title(self):
+        return self.program.title
+
+
+class DownloadQueue:
+    """
+    録音ジョブのキューと、上限付きのワーカースレッド群を管理するクラス。
+    同時実行数（max_workers）に加え、同一放送局の同時実行数（per_station_limit）を制限する。
+    on_update はジョブの状態や進捗が変化するたびにワーカースレッドから呼ばれる。
+    postprocessor (PostProcessor) を渡すと、完了したジョブの後処理をそのプールへ投入する。
+    ダウンロードワーカーは後処理の完了を待たずに次のジョブへ進む。
+    session_pool (SessionPool) を渡すと、ジョブごとに局を受信できるセッションを借りてダウンロードする
+    (渡さない場合は全ジョブが auth を共有する)。
+    adaptive を有効にすると、同時実行数 (max_workers) と全ジョブ合計のセグメント同時取得数を
+    AdaptiveConcurrency で自動調整する。同時実行数が変わるたびに on_limit_change(新しい値, 理由) を呼ぶ。
+    """
+    def __init__(self, auth, log_callback, max_workers=QUEUE_DEFAULT_WORKERS,
+                 per_station_limit=QUEUE_DEFAULT_PER_STATION, on_update=None, postprocessor=None,
+                 session_pool=None, adaptive=False, on_limit_change=None):
+        self.auth = auth
+        self.session_pool = session_pool
+        self.log = log_callback
+        self.max_workers = max(1, int(max_workers))
+        self.per_station_limit = max(1, int(per_station_limit))
+        self.on_update = on_update
+        self.postprocessor = postprocessor
+        self.on_limit_change = on_limit_change
+        self.download_concurrency = None
+        self.segment_concurrency = None
+        if adaptive:
+            self.set_adaptive(True)
 
-    def _load_login_from_yaml(self):
+        self.jobs = {}
+        self._pending = []
+        self._station_active = {}
+        self._worker_count = 0
+        self._next_id = 1
+        self._shutdown = False
+        self._cond = threading.Condition()
+        with _download_queues_lock:
+            _download_queues.add(self)
+
+    def submit(self, station_id, program, output_path, engine=ENGINE_FFMPEG, shards=1,
+               max_retries=QUEUE_DEFAULT_RETRIES, postprocess=()):
         """
-        プログラムと同じディレクトリにある login.yaml から
-        mail / password を読み込んで入力欄を初期化する。
-        ファイルが無い・読めない場合は何もしない。
+        ジョブをキューに追加し、必要に応じてワーカーを起動する。
+        番組の開始・終了時刻が YYYYMMDDHHMMSS 形式でない、または終了が開始より前の場合は ValueError。
         """
-        try:
-            # このファイルと同じディレクトリにある login.yaml を探す
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            yaml_path = os.path.join(base_dir, "login.yaml")
+        validate_time_range(program.start_time_str, program.end_time_str)
+        with self._cond:
+            job = DownloadJob(
+                self._next_id, station_id, program, output_path, engine, shards, max_retries, postprocess
+            )
+            self._next_id += 1
+            self.jobs[job.job_id] = job
+            self._pending.append(job)
+            self._ensure_workers()
+            self._cond.notify_all()
 
-            if not os.path.exists(yaml_path):
-                # 無ければ何もしない
-                self.add_log("login.yaml が見つからないため、認証情報の自動設定は行いません。")
-                return
+        self.log(f"[#{job.job_id}] キューに追加: {station_id} {job.title}")
+        self._notify(job)
+        return job
 
-            mail = None
-            password = None
+    def set_limits(self, max_workers=None, per_station_limit=None):
+        """同時実行数と局ごとの同時実行数を実行中に変更する。"""
+        with self._cond:
+            if max_workers is not None:
+                self.max_workers = max(1, int(max_workers))
+            if per_station_limit is not None:
+                self.per_station_limit = max(1, int(per_station_limit))
+            self._ensure_workers()
+            # 余剰ワーカーの終了・局の上限緩和を待っているワーカーを起こす
+            self._cond.notify_all()
 
-            with open(yaml_path, encoding="utf-8") as f:
-                cfg = yaml.safe_load(f)
-            mail = cfg.get("mail")
-            password = cfg.get("password")
+    def set_adaptive(self, enabled):
+        """
+        同時実行数の自動調整を切り替える。有効にした時点の max_workers から調整を始め、
+        無効にすると最後に調整された値のまま固定する。
+        """
+        if not enabled:
+            self.download_concurrency = None
+            self.segment_concurrency = None
+            return
+        if self.download_concurrency:
+            return
+        self.segment_concurrency = AdaptiveConcurrency(
+            "セグメント", HLS_DEFAULT_WORKERS, ADAPTIVE_SEGMENT_MIN, ADAPTIVE_SEGMENT_MAX, self.log
+        )
+        self.download_concurrency = AdaptiveConcurrency(
+            "ダウンロード", self.max_workers, 1, max(ADAPTIVE_DOWNLOAD_MAX, self.max_workers), self.log,
+            on_change=self._on_adaptive_change,
+        )
 
-            # 読み込めたものだけ反映
-            if mail:
-                self.mail_entry.delete(0, tk.END)
-                self.mail_entry.insert(0, mail)
-            if password:
-                self.pass_entry.delete(0, tk.END)
-                self.pass_entry.insert(0, password)
+    def _on_adaptive_change(self, limit, reason):
+        self.set_limits(max_workers=limit)
+        if self.on_limit_change:
+            self.on_limit_change(limit, reason)
 
-            self.add_log("login.yaml から認証情報を初期化しました。")
+    def adaptive_stats(self):
+        """自動調整の現在の上限と変更履歴を返す。無効の場合は None。"""
+        download_concurrency, segment_concurrency = self.download_concurrency, self.segment_concurrency
+        if not download_concurrency:
+            return None
+        return {"downloads": download_concurrency.stats(), "segments": segment_concurrency.stats()}
 
-        except Exception as e:
-            # 読み取り失敗しても致命的ではないのでログだけ残す
-            self.add_log(f"警告: login.yaml 読み込み中にエラーが発生しました: {e}")
+    def cancel(self, job_id):
+        """待機中のジョブは取り消し、実行中のジョブはFFmpegを停止する。"""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if not job or job.status not in (JOB_PENDING, JOB_RUNNING):
+                return False
+            job.cancel_requested = True
+            if job.status == JOB_PENDING:
+                self._pending.remove(job)
+                job.status = JOB_CANCELLED
+            downloader = job.downloader
 
-    def _create_widgets(self, master):
-        # メインフレーム
-        main_frame = ttk.Frame(master, padding="10")
-        main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        
-        # --- 認証セクション ---
-        auth_frame = ttk.LabelFrame(main_frame, text="認証情報 (Premium オプション)", padding="10")
-        auth_frame.grid(row=0, column=0, sticky=(tk.W, tk.E), pady=5)
-        
-        ttk.Label(auth_frame, text="Mail:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
-        self.mail_entry = ttk.Entry(auth_frame, width=30)
-        self.mail_entry.grid(row=0, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
-        
-        ttk.Label(auth_frame, text="Password:").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
-        self.pass_entry = ttk.Entry(auth_frame, width=30, show="*")
-        self.pass_entry.grid(row=1, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
-        
-        self.auth_button = ttk.Button(auth_frame, text="認証 & 局リスト取得", command=self._start_auth_thread)
-        self.auth_button.grid(row=2, column=0, columnspan=2, pady=10)
+        if downloader:
+            downloader.stop_download()
+        self.log(f"[#{job.job_id}] 中断を要求しました。")
+        self._notify(job)
+        return True
 
-        # --- 選択セクション ---
-        select_frame = ttk.LabelFrame(main_frame, text="番組選択", padding="10")
-        select_frame.grid(row=1, column=0, sticky=(tk.W, tk.E), pady=5)
-        
-        # 放送局選択
-        ttk.Label(select_frame, text="放送局:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
-        self.station_var = tk.StringVar(master)
-        self.station_dropdown = ttk.Combobox(select_frame, textvariable=self.station_var, state='disabled')
-        self.station_dropdown.grid(row=0, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
-        self.station_dropdown.bind('<<ComboboxSelected>>', self._load_programs)
-
-        # 日付選択 (簡易版として今日の日付)
-        ttk.Label(select_frame, text="日付 (YYYYMMDD):").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
-        self.date_entry = ttk.Entry(select_frame, width=10)
-        self.date_entry.insert(0, datetime.now().strftime('%Y%m%d'))
-        self.date_entry.grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
-        self.date_entry.bind('<Return>', self._load_programs)
-        
-        self.load_button = ttk.Button(select_frame, text="番組表ロード", command=self._load_programs)
-        self.load_button.grid(row=1, column=2, padx=5, pady=5)
-
-        # 番組リストボックス
-        list_frame = ttk.Frame(select_frame)
-        list_frame.grid(row=2, column=0, columnspan=3, pady=10, sticky=(tk.W, tk.E))
-        self.program_list = tk.Listbox(list_frame, height=8, width=60)
-        self.program_list.pack(side="left", fill="both", expand=True)
-        scrollbar = ttk.Scrollbar(list_frame, command=self.program_list.yview)
-        scrollbar.pack(side="right", fill="y")
-        self.program_list.config(yscrollcommand=scrollbar.set)
-        
-        # --- ダウンロードセクション ---
-        download_frame = ttk.LabelFrame(main_frame, text="ダウンロード", padding="10")
-        download_frame.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=5)
-        
-        ttk.Label(download_frame, text="保存先:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
-        self.output_path_var = tk.StringVar(value=os.path.join(os.path.expanduser('~'), 'radiko_recordings'))
-        self.output_entry = ttk.Entry(download_frame, textvariable=self.output_path_var, width=40)
-        self.output_entry.grid(row=0, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
-        ttk.Button(download_frame, text="参照", command=self._select_output_dir).grid(row=0, column=2, padx=5, pady=5)
-        
-        self.download_button = ttk.Button(download_frame, text="ダウンロード開始", command=self._start_download_thread, state='disabled')
-        self.download_button.grid(row=1, column=0, columnspan=2, pady=10, sticky=tk.W)
-        
-        self.stop_button = ttk.Button(download_frame, text="中断", command=self._stop_download, state='disabled')
-        self.stop_button.grid(row=1, column=2, pady=10, sticky=tk.E)
+    def retry(self, job_id):
+        """失敗または中断したジョブを再度キューに入れる。"""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if not job or job.status not in (JOB_FAILED, JOB_CANCELLED):
+                return False
+            job.status = JOB_PENDING
+            job.progress = 0.0
+            job.telemetry = None
+            job.postprocess_result = None
+            job.attempts = 0
+            job.cancel_requested = False
+            self._pending.append(job)
+            self._ensure_workers()
+            self._cond.notify_all()
 
-        # 進捗バー
-        self.progress_var = tk.DoubleVar()
-        self.progress_bar = ttk.Progressbar(download_frame, variable=self.progress_var, maximum=100)
-        self.progress_bar.grid(row=2, column=0, columnspan=3, sticky=(tk.W, tk.E))
-        
-        # --- ログセクション ---
-        log_frame = ttk.LabelFrame(main_frame, text="ログ", padding="5")
-        log_frame.grid(row=3, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
-        self.log_text = tk.Text(log_frame, height=8, width=70, state='disabled')
-        self.log_text.pack(fill="both", expand=True)
-        
-        # グリッドの拡張設定
-        main_frame.columnconfigure(0, weight=1)
-        select_frame.columnconfigure(1, weight=1)
-        download_frame.columnconfigure(1, weight=1)
-        log_frame.columnconfigure(0, weight=1)
-        
-        # login.yaml があれば、メール・パスワードを自動入力
-        self._load_login_from_yaml()
-    # --- Controller/Thread管理メソッド ---
-
-    def add_log(self, message):
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        self.log_queue.put(f"{timestamp} {message}\n")
-
-    def _process_log_queue(self):
-        self.log_text.config(state='normal')
-        while not self.log_queue.empty():
-            log_entry = self.log_queue.get()
-            self.log_text.insert(tk.END, log_entry)
-        self.log_text.see(tk.END)
-        self.log_text.config(state='disabled')
-        self.master.after(100, self._process_log_queue)
-
-    def _start_auth_thread(self):
-        """認証処理をバックグラウンドスレッドで開始する。"""
-        self.auth_button.config(state='disabled')
-        self.add_log("認証スレッドを開始します...")
-        
-        mail = self.mail_entry.get()
-        password = self.pass_entry.get()
-        
-        # 認証処理をメインスレッドをブロックしないようにスレッドで実行
-        thread = threading.Thread(target=self._run_auth, args=(mail, password))
-        thread.start()
+        self.log(f"[#{job.job_id}] 再試行のためキューに戻しました。")
+        self._notify(job)
+        return True
 
-    def _run_auth(self, mail, password):
-        """認証処理の実体 (スレッド内実行)"""
-        success = self.auth.auth(mail, password)
-        
-        # メインスレッドに戻ってGUIを更新
-        self.master.after(0, lambda: self._update_gui_after_auth(success))
+    def shutdown(self):
+        """全ジョブを中断し、ワーカーを終了させる。"""
+        with self._cond:
+            self._shutdown = True
+            job_ids = [job.job_id for job in self.jobs.values() if job.status in (JOB_PENDING, JOB_RUNNING)]
+            self._cond.notify_all()
+        for job_id in job_ids:
+            self.cancel(job_id)
 
-    def _update_gui_after_auth(self, success):
-        """認証結果に基づいてGUIの状態を更新する。"""
-        self.auth_button.config(state='normal')
-        if success:
-            self.add_log("認証完了。局リストを取得・更新します。")
-            stations = self.metadata.get_stations()
-            station_names = list(stations.values())
-            self.station_vars = stations
-            
-            self.station_dropdown['values'] = station_names
-            self.station_dropdown.config(state='readonly')
-            if station_names:
-                self.station_var.set(station_names[0])
-                self._load_programs()
-        else:
-            messagebox.showerror("認証失敗", "Radiko認証に失敗しました。ログを確認してください。")
-            self.station_dropdown.config(state='disabled')
-            self.download_button.config(state='disabled')
-
-    def _load_programs(self, event=None):
-        """番組表ロードをメインスレッドをブロックしないようにスレッドで実行"""
-        station_name = self.station_var.get()
-        date_str = self.date_entry.get()
-        
-        if not station_name or not date_str or not self.auth.authtoken:
-            return
+    def counts(self):
+        """状態ごとのジョブ数を返す。"""
+        with self._cond:
+            result = {status: 0 for status in JOB_STATUS_LABELS}
+            for job in self.jobs.values():
+                result[job.status] += 1
+            return result
 
-        self.load_button.config(state='disabled')
-        self.add_log(f"番組表をロード中 ({station_name}, {date_str})...")
-        
-        thread = threading.Thread(target=self._run_load_programs, args=(station_name, date_str))
-        thread.start()
+    def worker_stats(self):
+        """待機中のジョブ数・実行中のジョブ数・ワーカー数・同時実行数の上限を返す。"""
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "running": self._running_count(),
+                "workers": self._worker_count,
+                "max_workers": self.max_workers,
+            }
 
-    def _run_load_programs(self, station_name, date_str):
-        """番組表ロードの実体 (スレッド内実行)"""
-        station_id = next((k for k, v in self.station_vars.items() if v == station_name), None)
-        programs = self.metadata.get_programs(station_id, date_str)
-        
-        # メインスレッドに戻ってGUIを更新
-        self.master.after(0, lambda: self._update_gui_after_program_load(programs))
-
-    def _update_gui_after_program_load(self, programs):
-        """番組表ロード結果に基づいてGUIを更新する。"""
-        self.load_button.config(state='normal')
-        self.program_list.delete(0, tk.END)
-        self.program_data = programs # 全ての番組情報を保持
-        
-        if not programs:
-            self.add_log("番組情報がありませんでした。")
-            self.download_button.config(state='disabled')
+    def _notify(self, job):
+        if self.on_update:
+            self.on_update(job)
+
+    def _ensure_workers(self):
+        """必要な数だけワーカースレッドを起動する (self._cond を保持した状態で呼ぶ)"""
+        while self._worker_count < min(self.max_workers, len(self._pending) + self._running_count()):
+            self._worker_count += 1
+            thread = threading.Thread(target=self._worker_loop, daemon=True)
+            thread.start()
+
+    def _running_count(self):
+        return sum(self._station_active.values())
+
+    def _next_job(self):
+        """局ごとの上限内で実行可能な次のジョブを取り出す。ワーカーを終了すべき場合は None。"""
+        with self._cond:
+            while True:
+                if self._shutdown or self._worker_count > self.max_workers or not self._pending:
+                    self._worker_count -= 1
+                    return None
+                for job in self._pending:
+                    if self._station_active.get(job.station_id, 0) < self.per_station_limit:
+                        self._pending.remove(job)
+                        self._station_active[job.station_id] = self._station_active.get(job.station_id, 0) + 1
+                        job.status = JOB_RUNNING
+                        return job
+                # 全ての待機ジョブが局の上限に達している
+                self._cond.wait()
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._notify(job)
+            try:
+                self._run_job(job)
+            except Exception as e:
+                # 想定外の例外でもワーカーは止めず、ジョブを失敗として次へ進む
+                job.status = JOB_FAILED
+                self.log(f"[#{job.job_id}] エラー: ジョブの実行中に予期せぬエラーが発生しました: {e!r}")
+            finally:
+                with self._cond:
+                    self._station_active[job.station_id] -= 1
+                    job.downloader = None
+                    self._cond.notify_all()
+                self._notify(job)
+
+    def _run_job(self, job):
+        """セッションを決めてジョブを実行する (ワーカースレッド内実行)"""
+        session_pool = self.session_pool
+        if not session_pool:
+            self._download_job(job, self.auth)
             return
 
-        for i, p in enumerate(programs):
-            start = p['start_time_dt'].strftime('%H:%M')
-            end = p['end_time_dt'].strftime('%H:%M')
-            display_text = f"{start} - {end}: {p['title']}"
-            self.program_list.insert(tk.END, display_text)
-            
-        self.add_log(f"{len(programs)} 件の番組をリストに表示しました。")
-        self.download_button.config(state='normal')
-
-    def _select_output_dir(self):
-        """保存先ディレクトリを選択する"""
-        folder_selected = filedialog.askdirectory(initialdir=self.output_path_var.get())
-        if folder_selected:
-            self.output_path_var.set(folder_selected)
-
-    def _start_download_thread(self):
-        """ダウンロード処理をバックグラウンドスレッドで開始する。"""
-        selected_index = self.program_list.curselection()
-        if not selected_index:
-            messagebox.showerror("エラー", "ダウンロードする番組を選択してください。")
+        try:
+            with session_pool.lease(job.station_id) as auth:
+                self._download_job(job, auth)
+        except SessionLeaseError as e:
+            job.status = JOB_FAILED
+            self.log(f"[#{job.job_id}] エラー: {e}")
+
+    def _download_job(self, job, auth):
+        """ジョブを実行し、失敗時は max_retries 回まで再試行する。"""
+        def job_log(message):
+            self.log(f"[#{job.job_id}] {message}")
+
+        concurrency = self.download_concurrency
+        last_bytes = [0]
+
+        def update_progress(progress):
+            job.progress = progress.percent
+            job.telemetry = progress
+            if concurrency:
+                # 試行し直すと bytes_written は0から数え直される
+                concurrency.record(nbytes=max(0, progress.bytes_written - last_bytes[0]))
+                last_bytes[0] = progress.bytes_written
+            self._notify(job)
+
+        output_dir = os.path.dirname(job.output_path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+
+        job.downloader = StreamDownloader(auth, job_log, segment_concurrency=self.segment_concurrency)
+        if concurrency:
+            concurrency.started()
+        try:
+            self._download_attempts(job, job_log, update_progress)
+        finally:
+            if concurrency:
+                concurrency.finished()
+                if job.status in (JOB_DONE, JOB_FAILED):
+                    concurrency.record(ok=job.status == JOB_DONE)
+
+    def _download_attempts(self, job, job_log, update_progress):
+        """max_retries 回まで再試行しながらダウンロードし、job.status を更新する。"""
+        while job.attempts <= job.max_retries:
+            if job.cancel_requested:
+                job.status = JOB_CANCELLED
+                return
+            job.attempts += 1
+            if job.attempts > 1:
+                job_log(f"再試行します ({job.attempts - 1}/{job.max_retries})")
+
+            success = job.downloader.download(
+                job.station_id,
+                job.program.start_time_str,
+                job.program.end_time_str,
+                job.output_path,
+                update_progress,
+                engine=job.engine,
+                shards=job.shards,
+            )
+            if job.cancel_requested:
+                job.status = JOB_CANCELLED
+                return
+            if success:
+                job.status = JOB_DONE
+                job.progress = 100.0
+                self._start_postprocess(job)
+                return
+
+        job.status = JOB_FAILED
+        job_log("ダウンロードに失敗しました。")
+
+    def _start_postprocess(self, job):
+        """完了したジョブの後処理をプロセスプールへ投入する (完了は待たない)"""
+        if not job.postprocess or not self.postprocessor:
             return
-        
-        # 選択された番組データを取得
-        program_index = selected_index[0]
-        program = self.program_data[program_index]
-        station_name = self.station_var.get()
-        station_id = next((k for k, v in self.station_vars.items() if v == station_name), None)
-        
-        if not station_id:
-            messagebox.showerror("エラー", "放送局IDが見つかりません。")
+
+        def on_done(result):
+            job.postprocess_result = result
+            self._notify(job)
+
+        self.postprocessor.submit(job.output_path, job.postprocess, job.program, on_done)
+
+
+# --- 自動録音スケジューラ ---
+
+SCHEDULER_STATE_PATH = os.path.join(CACHE_DIR, 'scheduler_state.json')
+SCHEDULER_POLL_SECONDS = 15 * 60
+# 放送終了からタイムフリーで聴取可能になるまでの待ち時間(秒)
+TIME_FREE_AVAILABLE_DELAY = 10 * 60
+
+WEEKDAY_NAMES = {
+    "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6,
+    "月": 0, "火": 1, "水": 2, "木": 3, "金": 4, "土": 5, "日": 6,
+}
+
+
+def _parse_clock(value):
+    """'HH:MM' を0時からの分に変換する。Radiko式の '25:00' なども受け付ける。"""
+    hours, minutes = str(value).split(":")
+    return (int(hours) * 60 + int(minutes)) % (24 * 60)
+
+
+class RecordingRule:
+    """
+    自動録音ルール。局、タイトルの正規表現、曜日、開始時刻の時間帯で番組を絞り込む。
+    指定しなかった条件は全てに一致する。時間帯は番組の開始時刻に対して判定し、
+    start > end の場合は日付をまたぐ時間帯 (例: 23:00〜03:00) として扱う。
+    曜日は番組表と同じく放送日 (翌朝5時までを前日とする) で判定する。
+    """
+    def __init__(self, name, station_id=None, title_pattern=None, weekdays=None, start=None, end=None):
+        self.name = name
+        self.station_id = station_id or None
+        self.title_re = re.compile(title_pattern) if title_pattern else None
+        self.weekdays = frozenset(weekdays) if weekdays else None
+        self.start_minute = _parse_clock(start) if start is not None else None
+        self.end_minute = _parse_clock(end) if end is not None else None
+
+    @classmethod
+    def from_dict(cls, data, index=0):
+        weekdays = data.get("weekdays")
+        if weekdays is not None:
+            weekdays = [WEEKDAY_NAMES[str(w).lower()] if str(w).lower() in WEEKDAY_NAMES else int(w) for w in weekdays]
+        return cls(
+            data.get("name") or f"rule{index + 1}",
+            station_id=data.get("station"),
+            title_pattern=data.get("title"),
+            weekdays=weekdays,
+            start=data.get("start"),
+            end=data.get("end"),
+        )
+
+    def hour_buckets(self):
+        """このルールが対象とし得る開始時刻の「時」の集合を返す。"""
+        if self.start_minute is None and self.end_minute is None:
+            return range(24)
+        start = self.start_minute or 0
+        end = self.end_minute if self.end_minute is not None else 24 * 60
+        if end <= start:
+            end += 24 * 60
+        return {(minute // 60) % 24 for minute in range(start, end, 60)} | {((end - 1) // 60) % 24}
+
+    def matches(self, program):
+        if self.station_id and program.station_id != self.station_id:
+            return False
+        start_dt = program.start_time_dt
+        if self.weekdays is not None:
+            # 火曜 25:00 (水曜 01:00) の番組は火曜の番組として扱う
+            broadcast_day = start_dt - timedelta(hours=RADIKO_DAY_START_HOUR)
+            if broadcast_day.weekday() not in self.weekdays:
+                return False
+        if self.start_minute is not None or self.end_minute is not None:
+            minute = start_dt.hour * 60 + start_dt.minute
+            start = self.start_minute or 0
+            end = self.end_minute if self.end_minute is not None else 24 * 60
+            if start < end:
+                if not start <= minute < end:
+                    return False
+            elif not (minute >= start or minute < end):
+                return False
+        if self.title_re and not self.title_re.search(program.title):
+            return False
+        return True
+
+
+class RuleIndex:
+    """
+    ルールを (局ID, 開始時刻の「時」) で索引化し、番組ごとに候補となるルールだけを評価する。
+    局を指定しないルールはワイルドカードとして全局の候補に含める。
+    """
+    WILDCARD = "*"
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._buckets = {}
+        for rule in self.rules:
+            station = rule.station_id or self.WILDCARD
+            for hour in rule.hour_buckets():
+                self._buckets.setdefault((station, hour), []).append(rule)
+
+    def stations(self):
+        """ルールで指定された局の集合。ワイルドカードがあれば None (全局)。"""
+        stations = {rule.station_id for rule in self.rules}
+        return None if None in stations else stations
+
+    def match(self, program):
+        hour = program.start_time_dt.hour
+        candidates = self._buckets.get((program.station_id, hour), []) + self._buckets.get((self.WILDCARD, hour), [])
+        return [rule for rule in candidates if rule.matches(program)]
+
+
+def load_rules(path):
+    """ルールファイル (YAML または JSON) を読み込む。{'rules': [...]} またはリスト形式。"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        import yaml
+        data = yaml.safe_load(text) or []
+    else:
+        data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("rules", [])
+    return [RecordingRule.from_dict(entry, i) for i, entry in enumerate(data)]
+
+
+class AutoRecordScheduler:
+    """
+    番組表を定期的に取得し、ルールに一致した番組をタイムフリーで聴取可能になった時点で
+    ダウンロードキューへ投入するスケジューラ。
+    前回取得した番組表との差分（新規・変更された番組）だけをルール評価の対象とし、
+    投入済みの番組は状態ファイルに記録して二重に録音しない。
+    """
+    def __init__(self, metadata, download_queue, rules, output_dir, log_callback,
+                 state_path=SCHEDULER_STATE_PATH, engine=ENGINE_FFMPEG, shards=1, max_retries=QUEUE_DEFAULT_RETRIES,
+                 postprocess=()):
+        self.metadata = metadata
+        self.download_queue = download_queue
+        self.rule_index = RuleIndex(rules)
+        self.output_dir = output_dir
+        self.log = log_callback
+        self.state_path = state_path
+        self.engine = engine
+        self.shards = shards
+        self.max_retries = max_retries
+        self.postprocess = postprocess
+
+        # (局, 日付) ごとに前回見た番組のキー集合
+        self._seen = {}
+        # 一致したがまだ聴取可能になっていない番組 (キー -> Program)
+        self.pending = {}
+        self.submitted = self._load_state()
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def program_key(program):
+        return f"{program.station_id}_{program.start_time_str}_{program.end_time_str}"
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return set(json.load(f).get("submitted", []))
+        except (OSError, ValueError):
+            return set()
+
+    def _save_state(self):
+        # タイムフリー期間を過ぎた記録は不要なので捨てる
+        cutoff = (datetime.now() - timedelta(days=TIME_FREE_DAYS + 1)).strftime('%Y%m%d')
+        self.submitted = {key for key in self.submitted if key.split("_")[1][:8] >= cutoff}
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            with open(self.state_path, "w", encoding="utf-8") as f:
+                json.dump({"submitted": sorted(self.submitted)}, f)
+        except OSError as e:
+            self.log(f"警告: スケジューラの状態を保存できませんでした: {e}")
+
+    def _poll_dates(self):
+        """タイムフリー期間と翌日分（予約のため）の日付。"""
+        today = datetime.now()
+        return [(today + timedelta(days=i)).strftime('%Y%m%d') for i in range(1, -TIME_FREE_DAYS, -1)]
+
+    def _fetch_day(self, date_str, stations):
+        """指定日の番組表を {局ID: [Program]} で返す。"""
+        if self.metadata.auth.area_id and (stations is None or len(stations) > 1):
+            # エリア一括取得 (キャッシュにより変化が無ければ通信はほぼ発生しない)
+            self.metadata.get_area_programs(date_str)
+            targets = stations or list(self.metadata.get_stations())
+            result = {}
+            for sid in targets:
+                programs = self.metadata.guide_index.get(sid, date_str)
+                # エリア外の局 (別エリアのセッションで録音する局) は局単位で取得する
+                result[sid] = programs if programs is not None else self.metadata.get_programs(sid, date_str)
+            return result
+        return {sid: self.metadata.get_programs(sid, date_str) for sid in (stations or self.metadata.get_stations())}
+
+    def poll(self):
+        """番組表を取得して差分をルール評価し、聴取可能になった番組をキューへ投入する。投入数を返す。"""
+        stations = self.rule_index.stations()
+        new_programs = 0
+        for date_str in self._poll_dates():
+            for station_id, programs in self._fetch_day(date_str, stations).items():
+                seen = self._seen.get((station_id, date_str), set())
+                current = set()
+                for program in programs:
+                    program.station_id = program.station_id or station_id
+                    key = (program.start_time_str, program.end_time_str, program.title)
+                    current.add(key)
+                    if key in seen:
+                        continue
+                    new_programs += 1
+                    self._consider(program)
+                self._seen[(station_id, date_str)] = current
+
+        self.log(f"自動録音: 新規・変更 {new_programs} 番組を評価, 待機中 {len(self.pending)} 件")
+        return self.submit_ready()
+
+    def _consider(self, program):
+        key = self.program_key(program)
+        if key in self.submitted or key in self.pending:
             return
-        
-        # 出力パスを決定
-        output_dir = self.output_path_var.get()
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            
-        filename = f"{station_id}_{program['start_time_str']}_{program['end_time_str']}.m4a"
-        output_path = os.path.join(output_dir, filename)
+        rules = self.rule_index.match(program)
+        if rules:
+            self.pending[key] = program
+            self.log(f"自動録音: ルール '{rules[0].name}' に一致: {program.station_id} {program.start_time_str} {program.title}")
 
-        self.download_button.config(state='disabled')
-        self.stop_button.config(state='normal')
-        self.progress_var.set(0)
-        
-        self.add_log(f"ダウンロード準備中: {program['title']}")
-        
-        # ダウンロード処理をメインスレッドをブロックしないようにスレッドで実行
-        thread = threading.Thread(target=self._run_download, args=(station_id, program, output_path))
-        thread.start()
+    def submit_ready(self, now=None):
+        """放送が終了しタイムフリーで聴取可能になった番組をキューへ投入する。"""
+        now = now or datetime.now()
+        oldest = now - timedelta(days=TIME_FREE_DAYS)
+        submitted = 0
+        for key, program in list(self.pending.items()):
+            if program.end_time_dt + timedelta(seconds=TIME_FREE_AVAILABLE_DELAY) > now:
+                continue
+            del self.pending[key]
+            if program.start_time_dt < oldest:
+                # 既にタイムフリー期間を過ぎている
+                continue
+            output_path = os.path.join(self.output_dir, f"{key}.m4a")
+            if not os.path.exists(output_path):
+                self.download_queue.submit(
+                    program.station_id, program, output_path, engine=self.engine, shards=self.shards,
+                    max_retries=self.max_retries, postprocess=self.postprocess,
+                )
+                submitted += 1
+            self.submitted.add(key)
 
-    def _run_download(self, station_id, program, output_path):
-        """ダウンロード処理の実体 (スレッド内実行)"""
-        
-        def update_progress(percent):
-            """進捗をメインスレッドに安全にフィードバックするコールバック"""
-            self.master.after(0, lambda: self.progress_var.set(percent))
-
-        success = self.downloader.download(
-            station_id, 
-            program['start_time_str'], 
-            program['end_time_str'], 
-            output_path, 
-            update_progress
+        if submitted:
+            self._save_state()
+        return submitted
+
+    def run_forever(self, interval=SCHEDULER_POLL_SECONDS):
+        """stop() が呼ばれるまで interval 秒ごとに poll する。"""
+        self._stop_event.clear()
+        while not self._stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                self.log(f"エラー: 自動録音のポーリング中に失敗しました: {e}")
+            self._stop_event.wait(interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+# --- ログファイル ---
+
+def open_log_file(path=LOG_FILE_PATH, max_bytes=LOG_FILE_MAX_BYTES, backup_count=LOG_FILE_BACKUP_COUNT):
+    """
+    ログを書き出すローテーション付きのロガーを返す。ファイルを開けない場合は None。
+    ロガーはスレッドセーフなので、ワーカースレッドのログコールバックから直接呼んでよい。
+    """
+    import logging
+    from logging.handlers import RotatingFileHandler
+
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    except OSError:
+        return None
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s", "%Y-%m-%d %H:%M:%S"))
+
+    logger = logging.getLogger(f"radiko_rec.file.{os.path.abspath(path)}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    for old_handler in list(logger.handlers):
+        logger.removeHandler(old_handler)
+        old_handler.close()
+    logger.addHandler(handler)
+    return logger
+
+
+# --- 設定ファイル ---
+
+# 認証情報 (と複数アカウントの一覧) を置くファイル
+LOGIN_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "login.yaml")
+
+def load_login_config(log_callback, path=None):
+    """
+    login.yaml から (mail, password) を読み込む。ファイルが無い・読めない場合は (None, None)。
+    path を省略した場合はこのファイルと同じディレクトリの login.yaml を使う。
+    """
+    if path is None:
+        path = LOGIN_CONFIG_PATH
+
+    if not os.path.exists(path):
+        # 無ければ何もしない
+        log_callback("login.yaml が見つからないため、認証情報の自動設定は行いません。")
+        return None, None
+
+    try:
+        import yaml
+        with open(path, encoding="utf-8") as f:
+            cfg = yaml.safe_load(f) or {}
+        log_callback("login.yaml から認証情報を初期化しました。")
+        return cfg.get("mail"), cfg.get("password")
+    except Exception as e:
+        # 読み取り失敗しても致命的ではないのでログだけ残す
+        log_callback(f"警告: login.yaml 読み込み中にエラーが発生しました: {e}")
+        return None, None
+
+
+# --- コマンドラインインターフェース ---
+
+# 録音中の進捗をログに出す間隔(秒)
+CLI_PROGRESS_INTERVAL = 5
+
+def _cli_log(quiet):
+    """ログを標準エラー出力へ書き出すコールバックを返す (標準出力はJSON専用)。"""
+    def log(message):
+        if not quiet:
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            print(f"{timestamp} {message}", file=sys.stderr, flush=True)
+    return log
+
+
+def _cli_output(data):
+    json.dump(data, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+
+
+def _program_to_dict(program):
+    return {
+        "station_id": program.station_id,
+        "title": program.title,
+        "ft": program.start_time_str,
+        "to": program.end_time_str,
+        "performer": program.performer,
+        "info": program.info,
+        "url": program.url,
+    }
+
+
+def _cli_auth(args, log):
+    """認証を行い、RadikoAuthと (起動から最初の認証要求までの時間, 認証所要時間) を返す。"""
+    mail, password = args.mail, args.password
+    if not mail and not args.no_login_file:
+        mail, password = load_login_config(log)
+
+    auth = RadikoAuth(log)
+    startup_ms = (time.perf_counter() - _PROCESS_START) * 1000
+    start = time.perf_counter()
+    ok = auth.auth(mail, password, use_cache=not args.no_cache)
+    auth_ms = (time.perf_counter() - start) * 1000
+    return auth if ok else None, startup_ms, auth_ms
+
+
+def _cmd_auth(args, log):
+    auth, startup_ms, auth_ms = _cli_auth(args, log)
+    _cli_output({
+        "ok": auth is not None,
+        "area_id": auth.area_id if auth else None,
+        "premium": bool(auth and auth.radiko_session),
+        "startup_ms": round(startup_ms, 1),
+        "auth_ms": round(auth_ms, 1),
+    })
+    return 0 if auth else 1
+
+
+def _cmd_guide(args, log):
+    auth, _, _ = _cli_auth(args, log)
+    if not auth:
+        _cli_output({"ok": False, "error": "auth failed"})
+        return 1
+
+    metadata = RadikoMetadata(auth, log)
+    metadata.load_stations()
+    date_str = args.date or datetime.now().strftime('%Y%m%d')
+
+    if args.station:
+        programs = metadata.get_programs(args.station, date_str)
+    else:
+        # 局の指定が無ければエリア全局を一括取得する
+        metadata.get_area_programs(date_str)
+        programs = [
+            p for station_id in metadata.get_stations()
+            for p in (metadata.guide_index.get(station_id, date_str) or [])
+        ]
+
+    _cli_output({
+        "ok": True,
+        "date": date_str,
+        "stations": metadata.get_stations(),
+        "programs": [_program_to_dict(p) for p in programs],
+    })
+    return 0
+
+
+def _cli_download_auth(args, log):
+    """
+    --accounts があればセッションプールを、無ければ単一の認証を用意し、(RadikoAuth, SessionPool) を返す。
+    プールを使う場合の RadikoAuth は番組表の取得用 (最初のセッション)。
+    """
+    if not args.accounts:
+        auth, _, _ = _cli_auth(args, log)
+        return auth, None
+
+    session_pool = SessionPool(
+        load_accounts(args.accounts), log, cache_path=None if args.no_cache else AUTH_CACHE_PATH
+    )
+    if not session_pool.start():
+        session_pool.close()
+        return None, None
+    return session_pool.primary, session_pool
+
+
+def _cli_postprocessor(args, log):
+    """--post が指定されていれば PostProcessor を作る。"""
+    if not args.post:
+        return None
+    return PostProcessor(log, max_workers=args.post_workers or None)
+
+
+def _cli_warn_adaptive(args, log):
+    """--adaptive はネイティブ取得のセグメント取得だけを観測するため、FFmpegエンジンでは警告する。"""
+    if args.adaptive and args.engine != ENGINE_NATIVE:
+        log("警告: --adaptive はネイティブ取得 (--engine native) でのみ有効です。"
+            "FFmpegエンジンでは同時実行数は調整されません。")
+
+
+def _cli_check_time_range(args, log):
+    """--ft / --to を検証し、不正ならエラーを結果のJSONとして出力して False を返す。"""
+    try:
+        validate_time_range(args.ft, args.to)
+    except ValueError as e:
+        log(f"エラー: {e}")
+        _cli_output({"ok": False, "station_id": args.station, "ft": args.ft, "to": args.to, "error": str(e)})
+        return False
+    return True
+
+
+def _cli_find_program(auth, log, station_id, ft, to):
+    """タグ付け用に、番組表から ft/to に一致する番組を探す。見つからなければ時刻だけの Program。"""
+    try:
+        # 放送日は翌朝5時までを前日として扱う
+        date_str = (parse_radiko_time(ft) - timedelta(hours=RADIKO_DAY_START_HOUR)).strftime('%Y%m%d')
+        metadata = RadikoMetadata(auth, log)
+        metadata.load_stations()
+        for program in metadata.get_programs(station_id, date_str):
+            if program.start_time_str == ft and program.end_time_str == to:
+                program.station_id = station_id
+                return program
+    except ValueError:
+        pass
+    return Program(station_id, "", ft, to)
+
+
+def _cmd_record(args, log):
+    if not _cli_check_time_range(args, log):
+        return 1
+    _cli_warn_adaptive(args, log)
+    auth, session_pool = _cli_download_auth(args, log)
+    if not auth:
+        _cli_output({"ok": False, "error": "auth failed"})
+        return 1
+
+    output_path = args.output or f"{args.station}_{args.ft}_{args.to}.m4a"
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    last = {"progress": None, "logged_at": 0.0}
+
+    def on_progress(progress):
+        last["progress"] = progress
+        now = time.perf_counter()
+        if now - last["logged_at"] >= CLI_PROGRESS_INTERVAL:
+            last["logged_at"] = now
+            log(f"進捗: {progress.summary()}")
+
+    segment_concurrency = None
+    if args.adaptive:
+        segment_concurrency = AdaptiveConcurrency(
+            "セグメント", HLS_DEFAULT_WORKERS, ADAPTIVE_SEGMENT_MIN, ADAPTIVE_SEGMENT_MAX, log
         )
-        
-        # 終了時にGUIの状態を更新
-        self.master.after(0, lambda: self._update_gui_after_download(success))
-
-    def _update_gui_after_download(self, success):
-        """ダウンロード完了またはエラー時にGUIの状態を更新する。"""
-        self.download_button.config(state='normal')
-        self.stop_button.config(state='disabled')
-        self.progress_var.set(100 if success else 0)
-        
-        if success:
-            messagebox.showinfo("完了", "ダウンロードが正常に完了しました！")
+
+    try:
+        with session_pool.lease(args.station) if session_pool else nullcontext(auth) as download_auth:
+            ok = StreamDownloader(download_auth, log, segment_concurrency=segment_concurrency).download(
+                args.station, args.ft, args.to, output_path, on_progress,
+                engine=args.engine, shards=args.shards or None, resume=not args.no_resume,
+            )
+    except SessionLeaseError as e:
+        log(f"エラー: {e}")
+        ok = False
+    finally:
+        if session_pool:
+            session_pool.close()
+    download_s = time.perf_counter() - start
+
+    postprocess_result = None
+    postprocessor = _cli_postprocessor(args, log)
+    if ok and postprocessor:
+        program = _cli_find_program(auth, log, args.station, args.ft, args.to)
+        results = []
+        try:
+            postprocessor.submit(output_path, args.post, program, results.append)
+            postprocessor.wait()
+        finally:
+            postprocessor.shutdown()
+        postprocess_result = results[0] if results else None
+        ok = bool(postprocess_result) and not postprocess_result["error"]
+
+    _cli_output({
+        "ok": ok,
+        "output": output_path,
+        "elapsed_s": round(time.perf_counter() - start, 1),
+        "download_s": round(download_s, 1),
+        "progress": last["progress"].to_dict() if last["progress"] else None,
+        "postprocess": postprocess_result,
+        "sessions": session_pool.stats() if session_pool else None,
+        "adaptive": segment_concurrency.stats() if segment_concurrency else None,
+    })
+    return 0 if ok else 1
+
+
+def _load_batch_file(path):
+    """
+    バッチファイル (JSON または YAML) を読み込む。形式は以下の要素を持つリスト:
+    {"station": "TBS", "ft": "YYYYMMDDHHMMSS", "to": "YYYYMMDDHHMMSS", "output": "任意", "title": "任意"}
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        import yaml
+        return yaml.safe_load(text) or []
+    return json.loads(text)
+
+
+def _cmd_batch(args, log):
+    _cli_warn_adaptive(args, log)
+    entries = _load_batch_file(args.file)
+    auth, session_pool = _cli_download_auth(args, log)
+    if not auth:
+        _cli_output({"ok": False, "error": "auth failed"})
+        return 1
+
+    postprocessor = _cli_postprocessor(args, log)
+    download_queue = DownloadQueue(
+        auth, log, max_workers=args.workers, per_station_limit=args.per_station, postprocessor=postprocessor,
+        session_pool=session_pool, adaptive=args.adaptive,
+    )
+    rejected = []
+    for entry in entries:
+        station_id = entry["station"]
+        program = Program(station_id, entry.get("title", ""), str(entry["ft"]), str(entry["to"]))
+        output_path = entry.get("output") or os.path.join(
+            args.output_dir, f"{station_id}_{program.start_time_str}_{program.end_time_str}.m4a"
+        )
+        try:
+            download_queue.submit(
+                station_id, program, output_path,
+                engine=args.engine, shards=args.shards or None, max_retries=args.retries, postprocess=args.post,
+            )
+        except ValueError as e:
+            log(f"エラー: {station_id} の番組を投入できません: {e}")
+            rejected.append({"station_id": station_id, "ft": program.start_time_str, "to": program.end_time_str,
+                             "error": str(e)})
+
+    # 全ジョブ (と後処理) の終了を待つ
+    try:
+        while True:
+            counts = download_queue.counts()
+            if counts[JOB_PENDING] == 0 and counts[JOB_RUNNING] == 0:
+                break
+            time.sleep(1)
+        if postprocessor:
+            postprocessor.wait()
+    except KeyboardInterrupt:
+        download_queue.shutdown()
+    finally:
+        if postprocessor:
+            postprocessor.shutdown(cancel_pending=True)
+        if session_pool:
+            session_pool.close()
+
+    jobs = [
+        {
+            "id": job.job_id,
+            "station_id": job.station_id,
+            "ft": job.program.start_time_str,
+            "to": job.program.end_time_str,
+            "output": job.output_path,
+            "status": job.status,
+            "attempts": job.attempts,
+            "progress": job.telemetry.to_dict() if job.telemetry else None,
+            "postprocess": job.postprocess_result,
+        }
+        for job in download_queue.jobs.values()
+    ]
+    ok = not rejected and all(
+        job["status"] == JOB_DONE and not (job["postprocess"] or {}).get("error")
+        for job in jobs
+    )
+    _cli_output({
+        "ok": ok,
+        "counts": download_queue.counts(),
+        "jobs": jobs,
+        "rejected": rejected,
+        "postprocess_stats": postprocessor.stats() if postprocessor else None,
+        "sessions": session_pool.stats() if session_pool else None,
+        "adaptive": download_queue.adaptive_stats(),
+    })
+    return 0 if ok else 1
+
+
+def _cmd_schedule(args, log):
+    rules = load_rules(args.rules)
+    if not rules:
+        _cli_output({"ok": False, "error": "no rules"})
+        return 1
+    _cli_warn_adaptive(args, log)
+    auth, session_pool = _cli_download_auth(args, log)
+    if not auth:
+        _cli_output({"ok": False, "error": "auth failed"})
+        return 1
+
+    metadata = RadikoMetadata(auth, log)
+    metadata.load_stations()
+    if session_pool:
+        # 全セッションのエリアの局を対象にする
+        metadata.STATIONS = session_pool.stations()
+    postprocessor = _cli_postprocessor(args, log)
+    if postprocessor:
+        postprocessor.station_names = metadata.get_stations()
+    download_queue = DownloadQueue(
+        auth, log, max_workers=args.workers, per_station_limit=args.per_station, postprocessor=postprocessor,
+        session_pool=session_pool, adaptive=args.adaptive,
+    )
+    scheduler = AutoRecordScheduler(
+        metadata, download_queue, rules, args.output_dir, log,
+        engine=args.engine, shards=args.shards or None, max_retries=args.retries, postprocess=args.post,
+    )
+    log(f"自動録音を開始します: {len(rules)} ルール")
+
+    try:
+        if args.once:
+            scheduler.poll()
+            while True:
+                counts = download_queue.counts()
+                if counts[JOB_PENDING] == 0 and counts[JOB_RUNNING] == 0:
+                    break
+                time.sleep(1)
+            if postprocessor:
+                postprocessor.wait()
         else:
-            messagebox.showerror("失敗", "ダウンロードに失敗しました。ログを確認してください。")
-
-    def _stop_download(self):
-        """中断ボタンのコマンド"""
-        self.downloader.stop_download()
-        self.download_button.config(state='normal')
-        self.stop_button.config(state='disabled')
-
-    def _on_closing(self):
-        """アプリケーション終了時のクリーンアップ処理"""
-        # プレミアムログインしていた場合、ログアウトを試みる
-        self.auth.logout() 
-        # 実行中のダウンロードがあれば停止
-        self.downloader.stop_download()
-        self.master.destroy()
+            scheduler.run_forever(args.interval)
+    except KeyboardInterrupt:
+        scheduler.stop()
+        download_queue.shutdown()
+    finally:
+        if postprocessor:
+            postprocessor.shutdown(cancel_pending=True)
+        if session_pool:
+            session_pool.close()
 
-if __name__ == "__main__":
-    # OSに応じて適切なスケーリングを有効にする
+    _cli_output({
+        "ok": True,
+        "pending": sorted(scheduler.pending),
+        "counts": download_queue.counts(),
+        "postprocess_stats": postprocessor.stats() if postprocessor else None,
+        "sessions": session_pool.stats() if session_pool else None,
+        "adaptive": download_queue.adaptive_stats(),
+    })
+    return 0
+
+
+def _cmd_live(args, log):
+    if not _cli_check_time_range(args, log):
+        return 1
+    auth, _, _ = _cli_auth(args, log)
+    if not auth:
+        _cli_output({"ok": False, "error": "auth failed"})
+        return 1
+
+    output_path = args.output or f"{args.station}_{args.ft}_{args.to}_live.m4a"
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    last = {"logged_at": 0.0}
+
+    def on_progress(progress):
+        now = time.perf_counter()
+        if now - last["logged_at"] >= CLI_PROGRESS_INTERVAL:
+            last["logged_at"] = now
+            log(f"進捗: {progress.summary()}")
+
+    downloader = StreamDownloader(auth, log)
+    try:
+        ok = downloader.record_live(args.station, args.ft, args.to, output_path, on_progress, prewarm=args.prewarm)
+    except KeyboardInterrupt:
+        downloader.stop_download()
+        ok = False
+
+    _cli_output({"ok": ok, "output": output_path, "live": downloader.live_stats})
+    return 0 if ok else 1
+
+
+def _cmd_serve(args, log):
+    auth, _, _ = _cli_auth(args, log)
+    if not auth:
+        _cli_output({"ok": False, "error": "auth failed"})
+        return 1
+
+    server = LiveRecordingServer(
+        auth, log, output_dir=args.output_dir, host=args.host, port=args.port, engine=args.engine
+    ).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+    _cli_output({"ok": True, "recordings": [recording.to_dict() for recording in server.recordings.values()]})
+    return 0
+
+
+def _postprocess_arg(value):
+    import argparse
+    try:
+        return parse_postprocess_stages(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_arg_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="radiko_rec",
+        description="Radiko タイムフリー録音ツール。サブコマンドを省略するとGUIを起動する。",
+    )
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--mail", help="Premium会員のメールアドレス (省略時は login.yaml)")
+    common.add_argument("--password", help="Premium会員のパスワード")
+    common.add_argument("--no-login-file", action="store_true", help="login.yaml を読み込まない")
+    common.add_argument("--no-cache", action="store_true", help="キャッシュ済みの認証トークンを使わない")
+    common.add_argument("-q", "--quiet", action="store_true", help="ログを出力しない")
+    common.add_argument(
+        "--metrics-port", type=int, default=0,
+        help=f"計測値を Prometheus 形式で http://<host>:<port>/metrics に公開する (0=公開しない, 例: {METRICS_PORT})",
+    )
+    common.add_argument("--metrics-host", default=METRICS_HOST, help="計測値を公開するアドレス")
+    common.add_argument(
+        "--trace", metavar="PATH", help="各段階の所要時間を Chrome / Perfetto 形式のトレース (JSON) として書き出す"
+    )
+    common.add_argument(
+        "--profile", metavar="SPANS", type=lambda value: [name for name in value.split(",") if name], default=[],
+        help="cProfileで計測する区間 (カンマ区切り: auth, guide.parse, download, fetch, mux など。--trace が必要)",
+    )
+
+    download_opts = argparse.ArgumentParser(add_help=False)
+    download_opts.add_argument("--engine", choices=[ENGINE_FFMPEG, ENGINE_NATIVE], default=ENGINE_FFMPEG)
+    download_opts.add_argument("--shards", type=int, default=1, help="時間範囲の分割数 (0=自動)")
+    download_opts.add_argument(
+        "--post", type=_postprocess_arg, default=(),
+        help=f"ダウンロード後の後処理 (カンマ区切り: {','.join(POSTPROCESS_STAGES)})",
+    )
+    download_opts.add_argument("--post-workers", type=int, default=0, help="後処理の並列数 (0=CPU数)")
+    download_opts.add_argument(
+        "--accounts", help="複数のアカウント・エリアのセッションを使い分けるアカウント一覧 (YAML または JSON)"
+    )
+    download_opts.add_argument(
+        "--adaptive", action="store_true",
+        help="スループット・遅延・エラーを見て同時実行数とセグメントの同時取得数を自動調整する"
+             " (--engine native のみ。FFmpegエンジンでは調整されない)",
+    )
+
+    sub = parser.add_subparsers(dest="command")
+
+    sub.add_parser("auth", parents=[common], help="認証してエリアIDを表示する")
+
+    p = sub.add_parser("guide", parents=[common], help="番組表をJSONで出力する")
+    p.add_argument("--station", help="局ID (省略時はエリア全局)")
+    p.add_argument("--date", help="日付 YYYYMMDD (省略時は今日)")
+
+    p = sub.add_parser("record", parents=[common, download_opts], help="タイムフリー番組を録音する")
+    p.add_argument("--station", required=True, help="局ID")
+    p.add_argument("--ft", required=True, help="開始時刻 YYYYMMDDHHMMSS")
+    p.add_argument("--to", required=True, help="終了時刻 YYYYMMDDHHMMSS")
+    p.add_argument("-o", "--output", help="出力ファイル (.m4a)")
+    p.add_argument("--no-resume", action="store_true", help="チェックポイントを使わず最初から取得する")
+
+    p = sub.add_parser("batch", parents=[common, download_opts], help="バッチファイルの番組をまとめて録音する")
+    p.add_argument("file", help="番組一覧 (JSON または YAML)")
+    p.add_argument("--output-dir", default=".", help="出力先ディレクトリ")
+    p.add_argument("--workers", type=int, default=QUEUE_DEFAULT_WORKERS, help="同時実行数")
+    p.add_argument("--per-station", type=int, default=QUEUE_DEFAULT_PER_STATION, help="局ごとの同時実行数")
+    p.add_argument("--retries", type=int, default=QUEUE_DEFAULT_RETRIES, help="失敗時の再試行回数")
+
+    p = sub.add_parser("schedule", parents=[common, download_opts], help="ルールに一致する番組を自動録音する")
+    p.add_argument("rules", help="ルールファイル (YAML または JSON)")
+    p.add_argument("--output-dir", default=".", help="出力先ディレクトリ")
+    p.add_argument("--interval", type=int, default=SCHEDULER_POLL_SECONDS, help="番組表の確認間隔(秒)")
+    p.add_argument("--once", action="store_true", help="1回だけ確認し、投入した録音の完了を待って終了する")
+    p.add_argument("--workers", type=int, default=QUEUE_DEFAULT_WORKERS, help="同時実行数")
+    p.add_argument("--per-station", type=int, default=QUEUE_DEFAULT_PER_STATION, help="局ごとの同時実行数")
+    p.add_argument("--retries", type=int, default=QUEUE_DEFAULT_RETRIES, help="失敗時の再試行回数")
+
+    p = sub.add_parser("live", parents=[common], help="ライブ配信を指定した時間帯だけ録音する")
+    p.add_argument("--station", required=True, help="局ID")
+    p.add_argument("--ft", required=True, help="開始時刻 YYYYMMDDHHMMSS")
+    p.add_argument("--to", required=True, help="終了時刻 YYYYMMDDHHMMSS")
+    p.add_argument("-o", "--output", help="出力ファイル (.m4a)")
+    p.add_argument(
+        "--prewarm", type=int, default=LIVE_RECORD_PREWARM_SECONDS, help="認証とプレイリストの準備を始める開始前の秒数"
+    )
+
+    p = sub.add_parser("serve", parents=[common], help="取得中の録音をHTTPで配信する")
+    p.add_argument("--host", default=LIVE_SERVER_HOST, help="待ち受けるアドレス")
+    p.add_argument("--port", type=int, default=LIVE_SERVER_PORT, help="待ち受けるポート")
+    p.add_argument("--output-dir", default=".", help="取得したADTS (.aac) の保存先")
+    p.add_argument("--engine", choices=[ENGINE_FFMPEG, ENGINE_NATIVE], default=ENGINE_NATIVE)
+
+    return parser
+
+
+CLI_COMMANDS = {
+    "auth": _cmd_auth,
+    "guide": _cmd_guide,
+    "record": _cmd_record,
+    "batch": _cmd_batch,
+    "schedule": _cmd_schedule,
+    "live": _cmd_live,
+    "serve": _cmd_serve,
+}
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if not args.command:
+        # サブコマンドが無ければGUIを起動する (tkinter はここで初めて読み込む)
+        from radiko_gui import run_gui
+        run_gui()
+        return 0
+
+    if args.profile and not args.trace:
+        build_arg_parser().error("--profile には --trace が必要です")
+
+    log = _cli_log(args.quiet)
+    metrics_server = MetricsServer(log, args.metrics_host, args.metrics_port).start() if args.metrics_port else None
+    if args.trace:
+        TRACER.enable(args.profile)
     try:
-        from ctypes import windll
-        windll.shcore.SetProcessDpiAwareness(1)
-    except:
-        pass # Linux/macOSでは無視
-
-    root = tk.Tk()
-    app = RadikoGUI(root)
-    root.mainloop()
\ No newline at end of file
+        return CLI_COMMANDS[args.command](args, log)
+    finally:
+        if metrics_server:
+            metrics_server.stop()
+        if args.trace:
+            _write_trace(args.trace, args.profile, log)
+
+
+def _write_trace(path, profile_phases, log):
+    """トレース (とプロファイル) を書き出し、区間ごとの合計時間とプロファイルの上位をログに出す。"""
+    TRACER.disable()
+    written = TRACER.write(path)
+    for name, total in sorted(TRACER.summary().items(), key=lambda item: -item[1]["total_ms"]):
+        log(f"トレース: {name} {total['count']} 回, 合計 {total['total_ms']:.1f} ms")
+    for phase in profile_phases:
+        report = TRACER.profile_report(phase)
+        if report is None:
+            log(f"警告: 区間 '{phase}' はプロファイルされませんでした (実行されなかったか、別の区間を計測中でした)")
+        else:
+            log(f"プロファイル ({phase}):\n{report.rstrip()}")
+    log(f"トレースを書き出しました: {', '.join(written)}")
+
+
+def __getattr__(name):
+    # 後方互換: radiko_rec.RadikoGUI を参照したときだけGUIモジュールを読み込む
+    if name == "RadikoGUI":
+        from radiko_gui import RadikoGUI
+        return RadikoGUI
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
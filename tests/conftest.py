@@ -0,0 +1,57 @@
+"""
+テスト共通の設定。
+radiko_rec は読み込み時に接続先 (RADIKO_BASE_URL) を決めるため、先にモックRadikoサーバー
+(benchmarks/mock_radiko.py) を起動してから読み込ませる。radiko.jp には一切アクセスしない。
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from mock_radiko import MockRadikoServer  # noqa: E402
+
+MOCK_SERVER = MockRadikoServer(stations=3, programs_per_day=4).start()
+os.environ["RADIKO_BASE_URL"] = MOCK_SERVER.base_url
+
+import radiko_rec  # noqa: E402
+
+# 障害注入のテストで待たされないよう、再試行の待ち時間を短くした方針
+FAST_RETRY_POLICY = radiko_rec.RetryPolicy(max_attempts=2, base_delay=0.01, max_delay=0.05)
+
+
+def quiet(message):
+    pass
+
+
+@pytest.fixture
+def mock_server():
+    """モックサーバー。テストごとに注入した障害とサーキットブレーカーの状態を元に戻す。"""
+    yield MOCK_SERVER
+    MOCK_SERVER.faults.update(latency=0.0, bandwidth=0, error_rate=0.0, error_status=503, retry_after=None, path=None)
+    with radiko_rec._circuit_breakers_lock:
+        radiko_rec._circuit_breakers.clear()
+
+
+@pytest.fixture
+def auth(mock_server):
+    """モックサーバーで認証済みの RadikoAuth (トークンはキャッシュしない)。"""
+    auth = radiko_rec.RadikoAuth(quiet, cache_path=None)
+    assert auth.auth(use_cache=False)
+    return auth
+
+
+@pytest.fixture
+def tk_root():
+    """Tk のルートウィンドウ。ディスプレイが無い環境ではテストをスキップする。"""
+    tk = pytest.importorskip("tkinter")
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        pytest.skip(f"Tk を初期化できません: {e}")
+    root.withdraw()
+    yield root
+    root.destroy()
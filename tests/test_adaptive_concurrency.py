@@ -0,0 +1,131 @@
+"""AdaptiveConcurrency (同時実行数の自動調整) のテスト。"""
+import io
+import threading
+import time
+
+from conftest import quiet
+import radiko_rec
+
+
+def make(initial=8, min_limit=1, max_limit=16, **kwargs):
+    # 評価の間隔を0にし、ADAPTIVE_MIN_SAMPLES 件の記録ごとに評価させる
+    return radiko_rec.AdaptiveConcurrency("test", initial, min_limit, max_limit, window_seconds=0, **kwargs)
+
+
+def record_window(concurrency, **kwargs):
+    for _ in range(radiko_rec.ADAPTIVE_MIN_SAMPLES):
+        concurrency.record(**kwargs)
+
+
+def fill(concurrency, count):
+    for _ in range(count):
+        concurrency.started()
+
+
+def test_initial_limit_is_clamped():
+    assert radiko_rec.AdaptiveConcurrency("t", 100, 2, 4).limit == 4
+    assert radiko_rec.AdaptiveConcurrency("t", 0, 2, 4).limit == 2
+
+
+def test_throttling_halves_limit():
+    changes = []
+    concurrency = make(on_change=lambda limit, reason: changes.append((limit, reason)))
+    record_window(concurrency, ok=False, throttled=True)
+    assert concurrency.limit == 4
+    assert changes == [(4, "スロットリング: 429/503 を 4 件受信")]
+    record_window(concurrency, ok=False, throttled=True)
+    record_window(concurrency, ok=False, throttled=True)
+    record_window(concurrency, ok=False, throttled=True)
+    # min_limit より下げない
+    assert concurrency.limit == 1
+    assert [change["new"] for change in concurrency.stats()["changes"]] == [4, 2, 1]
+
+
+def test_error_rate_halves_limit():
+    concurrency = make()
+    concurrency.record(ok=False)
+    for _ in range(3):
+        concurrency.record(ok=True)
+    assert concurrency.limit == 4
+    assert concurrency.history[-1]["reason"].startswith("エラー率 25%")
+
+
+def test_increases_only_when_all_slots_are_used():
+    concurrency = make(initial=2, max_limit=3)
+    fill(concurrency, 1)
+    record_window(concurrency, ok=True)
+    assert concurrency.limit == 2
+
+    fill(concurrency, 1)
+    record_window(concurrency, ok=True)
+    assert concurrency.limit == 3
+    fill(concurrency, 1)
+    record_window(concurrency, ok=True)
+    # max_limit より上げない
+    assert concurrency.limit == 3
+
+
+def test_latency_growth_decreases_limit():
+    concurrency = make()
+    record_window(concurrency, ok=True, latency=0.01)
+    assert concurrency.limit == 8
+    record_window(concurrency, ok=True, latency=0.1)
+    assert concurrency.limit == 7
+    assert concurrency.history[-1]["reason"].startswith("遅延の増加")
+
+
+def test_acquire_waits_for_release_and_limit_increase():
+    concurrency = make(initial=1, max_limit=2)
+    concurrency.acquire()
+    acquired = threading.Event()
+
+    def waiter():
+        with concurrency.slot():
+            acquired.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.05)
+    assert not acquired.is_set()
+    # 枠を使い切った状態で問題が無ければ limit が増え、待っているスレッドが動き出す
+    record_window(concurrency, ok=True)
+    thread.join(5)
+    assert acquired.is_set()
+    assert concurrency.limit == 2
+    concurrency.release()
+    assert concurrency.in_flight == 0
+
+
+def test_fetcher_backs_off_when_server_throttles(auth, mock_server):
+    downloader = radiko_rec.StreamDownloader(auth, quiet)
+    url = downloader.build_playlist_url("ST000", "20240101050000", "20240101051000")
+    concurrency = make(initial=8, min_limit=2)
+    fetcher = radiko_rec.HLSSegmentFetcher(
+        auth.session, downloader._build_request_headers(), quiet, max_workers=8, concurrency=concurrency
+    )
+    # Retry-After: 0 で再試行を待たせずに 429 を返させる
+    mock_server.faults.update(error_status=429, error_rate=0.3, retry_after=0, path="/segments/")
+    # 再試行を使い切って失敗するセグメントもあるため、取得の成否は問わない
+    fetcher.fetch(url, io.BytesIO())
+
+    assert concurrency.limit < 8
+    assert concurrency.in_flight == 0
+    assert any(change["reason"].startswith("スロットリング") for change in concurrency.history)
+
+
+def test_queue_follows_download_limit_changes():
+    changes = []
+    queue = radiko_rec.DownloadQueue(None, quiet, max_workers=4, adaptive=True,
+                                     on_limit_change=lambda limit, reason: changes.append(limit))
+    try:
+        assert queue.adaptive_stats()["downloads"]["limit"] == 4
+        queue.download_concurrency.window_seconds = 0
+        record_window(queue.download_concurrency, ok=False, throttled=True)
+        assert queue.max_workers == 2
+        assert changes == [2]
+
+        queue.set_adaptive(False)
+        assert queue.adaptive_stats() is None
+        assert queue.max_workers == 2
+    finally:
+        queue.shutdown()
@@ -0,0 +1,50 @@
+"""エリアの局リストとエリア一括番組表 (RadikoMetadata / GuideIndex) のテスト。"""
+from conftest import quiet
+import radiko_rec
+
+
+def request_count(mock_server, name):
+    with mock_server.state.lock:
+        return mock_server.state.counters.get(name, 0)
+
+
+def test_load_stations_replaces_default_list(auth):
+    metadata = radiko_rec.RadikoMetadata(auth, quiet, guide_cache_dir=None)
+    assert metadata.load_stations()
+    assert metadata.get_stations() == {f"ST{i:03d}": f"テスト局ST{i:03d}" for i in range(3)}
+
+
+def test_load_stations_keeps_defaults_without_area(mock_server):
+    unauthenticated = radiko_rec.RadikoAuth(quiet, cache_path=None)
+    metadata = radiko_rec.RadikoMetadata(unauthenticated, quiet, guide_cache_dir=None)
+    assert not metadata.load_stations()
+    assert metadata.get_stations() == radiko_rec.RadikoMetadata.DEFAULT_STATIONS
+
+
+def test_area_guide_serves_station_lookups_without_io(auth, mock_server):
+    metadata = radiko_rec.RadikoMetadata(auth, quiet, guide_cache_dir=None)
+    metadata.load_stations()
+    assert metadata.get_area_programs("20240101") == 3
+
+    before = request_count(mock_server, "station_guide")
+    for station_id in metadata.get_stations():
+        programs = metadata.get_programs(station_id, "20240101")
+        assert len(programs) == 4
+        assert {p.station_id for p in programs} == {station_id}
+    assert request_count(mock_server, "station_guide") == before
+    assert metadata.guide_index.station_names["ST001"] == "テスト局ST001"
+
+
+def test_area_week_fetches_every_day(auth):
+    metadata = radiko_rec.RadikoMetadata(auth, quiet, guide_cache_dir=None)
+    dates = ["20240101", "20240102", "20240103"]
+    index = metadata.get_area_week(dates)
+    assert index.dates() == dates
+    assert len(index) == 3 * 3 * 4
+
+
+def test_unknown_station_returns_no_programs(auth):
+    metadata = radiko_rec.RadikoMetadata(auth, quiet, guide_cache_dir=None)
+    metadata.load_stations()
+    assert metadata.get_programs("NOPE", "20240101") == []
+
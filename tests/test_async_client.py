@@ -0,0 +1,113 @@
+"""asyncio 版クライアント (radiko_async) のテスト。aiohttp が無い環境ではスキップする。"""
+import asyncio
+import io
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from conftest import FAST_RETRY_POLICY, quiet  # noqa: E402
+import radiko_async  # noqa: E402
+import radiko_rec  # noqa: E402
+
+
+def run(coroutine_function):
+    """クライアントを作って coroutine_function(client) を実行し、最後にセッションを閉じる。"""
+    async def main():
+        async with radiko_async.AsyncRadikoClient(quiet) as client:
+            return await coroutine_function(client)
+    return asyncio.run(main())
+
+
+def test_auth_and_reauth(mock_server):
+    async def scenario(client):
+        auth = radiko_async.AsyncRadikoAuth(client, quiet, cache_path=None)
+        assert await auth.async_auth(use_cache=False)
+        token = auth.authtoken
+        # 同時に呼ばれても再認証は1回だけ
+        results = await asyncio.gather(*(auth.async_reauth(token) for _ in range(5)))
+        return auth, token, results
+
+    auth, token, results = run(scenario)
+    assert results == [True] * 5
+    assert auth.authtoken != token
+    assert auth.area_id == "JP13"
+
+
+def test_premium_login_and_logout(mock_server):
+    async def scenario(client):
+        auth = radiko_async.AsyncRadikoAuth(client, quiet, cache_path=None)
+        assert await auth.async_auth("user@example.com", "password", use_cache=False)
+        assert auth.radiko_session
+        await auth.async_logout()
+        assert auth.radiko_session is None
+        return await radiko_async.AsyncRadikoAuth(client, quiet, cache_path=None).async_auth(
+            "user@example.com", "wrong", use_cache=False
+        )
+
+    assert run(scenario) is False
+
+
+def test_guide_matches_sync_client(auth, mock_server):
+    sync_metadata = radiko_rec.RadikoMetadata(auth, quiet, guide_cache_dir=None)
+    sync_metadata.load_stations()
+    expected = [(p.station_id, p.title, p.start_time_str) for p in sync_metadata.get_programs("ST001", "20240101")]
+
+    async def scenario(client):
+        async_auth = radiko_async.AsyncRadikoAuth(client, quiet, cache_path=None)
+        await async_auth.async_auth(use_cache=False)
+        metadata = radiko_async.AsyncRadikoMetadata(async_auth, quiet, guide_cache_dir=None)
+        await metadata.load_stations()
+        many = await metadata.get_programs_many([("ST001", "20240101"), ("ST002", "20240102")])
+        week = await metadata.get_area_week(["20240101", "20240102"])
+        return many, week
+
+    many, week = run(scenario)
+    assert [(p.station_id, p.title, p.start_time_str) for p in many[0]] == expected
+    assert len(many[1]) == 4
+    assert len(week) == 2 * 3 * 4
+
+
+def test_playlist_fetch(mock_server):
+    async def scenario(client):
+        auth = radiko_async.AsyncRadikoAuth(client, quiet, cache_path=None)
+        await auth.async_auth(use_cache=False)
+        playlist = radiko_async.AsyncPlaylistClient(auth, quiet, max_concurrency=4)
+        out = io.BytesIO()
+        ok = await playlist.fetch(playlist.playlist_url("ST000", "20240101050000", "20240101051000"), out)
+        return ok, playlist.segments_fetched, out.getvalue()
+
+    ok, count, data = run(scenario)
+    assert ok
+    assert count == 120
+    assert data == b"".join(mock_server.state.segment(i) for i in range(120))
+
+
+def test_request_retries_and_returns_last_response(mock_server):
+    mock_server.faults.update(error_status=503, error_rate=1.0, path="/v2/api/auth1")
+
+    async def scenario(client):
+        return await client.request("GET", radiko_rec.URL_AUTH1, "async-retry", policy=FAST_RETRY_POLICY)
+
+    res = run(scenario)
+    assert res.status_code == 503
+    with pytest.raises(radiko_async.AsyncHTTPError):
+        res.raise_for_status()
+
+
+def test_async_auth_still_works_as_sync_auth(mock_server, tmp_path):
+    # 同期のコードは RadikoAuth のメソッドを呼ぶため、コルーチンではなく結果が返る
+    async def scenario(client):
+        auth = radiko_async.AsyncRadikoAuth(client, quiet, cache_path=None)
+        await auth.async_auth(use_cache=False)
+        return auth
+
+    auth = run(scenario)
+    token = auth.authtoken
+    assert auth.ensure_valid() is True
+    assert auth.reauth(token) is True
+    assert auth.authtoken != token
+    assert radiko_rec.StreamDownloader(auth, quiet).download(
+        "ST000", "20240101050000", "20240101050100", str(tmp_path / "a.m4a"), quiet,
+        engine=radiko_rec.ENGINE_NATIVE, resume=False,
+    )
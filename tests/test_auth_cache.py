@@ -0,0 +1,104 @@
+"""認証トークンのキャッシュ (AuthTokenCache) と、期限切れ・拒否時の再認証のテスト。"""
+import threading
+import time
+
+from conftest import quiet
+import radiko_rec
+
+
+def auth1_count(mock_server):
+    with mock_server.state.lock:
+        return mock_server.state.counters.get("auth1", 0)
+
+
+def test_cache_roundtrip_and_expiry(tmp_path):
+    cache = radiko_rec.AuthTokenCache(str(tmp_path / "auth.json"))
+    now = time.time()
+    cache.save(None, "token", "JP13", None, now, radiko_rec.AUTH_TOKEN_TTL)
+    assert cache.load(None)["authtoken"] == "token"
+    # アカウントごとに別のエントリ
+    assert cache.load("user@example.com") is None
+
+    # 期限 (から余裕を引いた時刻) を過ぎたエントリは使わない
+    cache.save(None, "old", "JP13", None, now - radiko_rec.AUTH_TOKEN_TTL, radiko_rec.AUTH_TOKEN_TTL)
+    assert cache.load(None) is None
+
+    cache.save(None, "token", "JP13", None, now, radiko_rec.AUTH_TOKEN_TTL)
+    cache.invalidate(None)
+    assert cache.load(None) is None
+
+
+def test_cache_does_not_store_mail_address(tmp_path):
+    path = tmp_path / "auth.json"
+    radiko_rec.AuthTokenCache(str(path)).save("user@example.com", "t", "JP13", "s", time.time(), 3600)
+    assert "user@example.com" not in path.read_text()
+
+
+def test_concurrent_saves_keep_every_account(tmp_path):
+    path = str(tmp_path / "auth.json")
+
+    def save(i):
+        cache = radiko_rec.AuthTokenCache(path)
+        for _ in range(20):
+            cache.save(f"user{i}@example.com", f"token{i}", "JP13", None, time.time(), 3600)
+
+    threads = [threading.Thread(target=save, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    cache = radiko_rec.AuthTokenCache(path)
+    assert [cache.load(f"user{i}@example.com")["authtoken"] for i in range(8)] == [f"token{i}" for i in range(8)]
+    assert not [name for name in tmp_path.iterdir() if name.suffix == ".tmp"]
+
+
+def test_auth_reuses_cached_token(mock_server, tmp_path):
+    path = str(tmp_path / "auth.json")
+    first = radiko_rec.RadikoAuth(quiet, cache_path=path)
+    assert first.auth()
+
+    before = auth1_count(mock_server)
+    second = radiko_rec.RadikoAuth(quiet, cache_path=path)
+    assert second.auth()
+    assert second.authtoken == first.authtoken
+    assert second.area_id == first.area_id
+    assert auth1_count(mock_server) == before
+
+
+def test_reauth_replaces_stale_token_once(auth, mock_server):
+    stale = auth.authtoken
+    assert auth.reauth(stale)
+    assert auth.authtoken != stale
+    assert auth.is_valid()
+
+    # 既に別のスレッドが更新済みのトークンを渡した場合は何もしない
+    before = auth1_count(mock_server)
+    assert auth.reauth(stale)
+    assert auth1_count(mock_server) == before
+
+
+def test_failed_reauth_keeps_current_token(auth, mock_server):
+    token = auth.authtoken
+    mock_server.faults.update(error_status=500, error_rate=1.0, path="auth1")
+    assert not auth.reauth(token)
+    assert auth.authtoken == token
+
+
+def test_ensure_valid_refreshes_expiring_token(auth):
+    token = auth.authtoken
+    auth.issued_at = time.time() - auth.ttl
+    assert not auth.is_valid()
+    assert auth.ensure_valid()
+    assert auth.authtoken != token
+    assert auth.is_valid()
+
+
+def test_premium_login_and_logout(mock_server):
+    auth = radiko_rec.RadikoAuth(quiet, cache_path=None)
+    assert auth.auth("user@example.com", "password", use_cache=False)
+    assert auth.radiko_session
+    auth.logout()
+    assert auth.radiko_session is None
+
+    assert not radiko_rec.RadikoAuth(quiet, cache_path=None).auth("user@example.com", "wrong", use_cache=False)
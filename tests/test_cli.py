@@ -0,0 +1,79 @@
+"""ヘッドレスのコマンドライン実行 (main / build_arg_parser) のテスト。"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import radiko_rec
+from conftest import MOCK_SERVER, ROOT
+
+
+def run_cli(home, *args):
+    # キャッシュ (~/.cache/radiko_rec) や login.yaml を実際のホームディレクトリに作らない
+    env = dict(os.environ, RADIKO_BASE_URL=MOCK_SERVER.base_url, HOME=str(home))
+    return subprocess.run(
+        [sys.executable, os.path.join(ROOT, "radiko_rec.py"), *args],
+        capture_output=True, text=True, env=env, cwd=str(home), timeout=60,
+    )
+
+
+def test_import_does_not_load_tkinter_or_requests():
+    code = "import sys, radiko_rec; print(sorted(m for m in ('tkinter', 'requests') if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT, timeout=60)
+    assert result.stdout.strip() == "[]"
+
+
+def test_auth_command_prints_json(tmp_path):
+    result = run_cli(tmp_path, "auth", "--quiet", "--no-cache", "--no-login-file")
+    assert result.returncode == 0, result.stderr
+    output = json.loads(result.stdout)
+    assert output["ok"]
+    assert output["area_id"] == "JP13"
+
+
+def test_guide_command_lists_programs(tmp_path):
+    result = run_cli(tmp_path, "guide", "--quiet", "--no-cache", "--no-login-file",
+                     "--station", "ST000", "--date", "20240101")
+    assert result.returncode == 0, result.stderr
+    output = json.loads(result.stdout)
+    assert len(output["programs"]) == 4
+
+
+def test_arg_parser_rejects_unknown_engine():
+    with pytest.raises(SystemExit):
+        radiko_rec.build_arg_parser().parse_args(["record", "--station", "TBS", "--ft", "1", "--to", "2",
+                                                   "--engine", "vlc"])
+
+
+def test_profile_requires_trace(tmp_path):
+    result = run_cli(tmp_path, "auth", "--profile", "auth", "--no-login-file")
+    assert result.returncode == 2
+    assert "--trace" in result.stderr
+
+
+@pytest.mark.parametrize("ft, to", [
+    ("2024010105", "20240101060000"),
+    ("20240101060000", "20240101050000"),
+])
+def test_record_rejects_invalid_time_range_before_auth(tmp_path, ft, to):
+    with MOCK_SERVER.state.lock:
+        before = MOCK_SERVER.state.counters.get("auth1", 0)
+    result = run_cli(tmp_path, "record", "--quiet", "--no-cache", "--no-login-file",
+                     "--station", "ST000", "--ft", ft, "--to", to)
+    assert result.returncode == 1, result.stderr
+    output = json.loads(result.stdout)
+    assert not output["ok"]
+    assert output["error"]
+    with MOCK_SERVER.state.lock:
+        assert MOCK_SERVER.state.counters.get("auth1", 0) == before
+
+
+def test_live_rejects_invalid_time_range(tmp_path):
+    result = run_cli(tmp_path, "live", "--quiet", "--no-cache", "--no-login-file",
+                     "--station", "ST000", "--ft", "bad", "--to", "20240101060000")
+    assert result.returncode == 1, result.stderr
+    output = json.loads(result.stdout)
+    assert not output["ok"]
+    assert "YYYYMMDDHHMMSS" in output["error"]
@@ -0,0 +1,119 @@
+"""DownloadQueue (ワーカープールによるバッチダウンロード) のテスト。"""
+import threading
+import time
+
+import pytest
+
+from conftest import quiet
+import radiko_rec
+
+
+def wait_idle(queue, timeout=30):
+    """待機中・実行中のジョブが無くなり、ワーカーが全て終了するまで待つ。"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        counts = queue.counts()
+        if not counts[radiko_rec.JOB_PENDING] and not counts[radiko_rec.JOB_RUNNING] \
+                and not queue.worker_stats()["workers"]:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"キューが終了しませんでした: {queue.counts()}")
+
+
+def program(station_id, ft="20240101050000", to="20240101051000"):
+    return radiko_rec.Program(station_id, f"{station_id} {ft}", ft, to)
+
+
+def test_validate_time_range():
+    radiko_rec.validate_time_range("20240101050000", "20240101060000")
+    with pytest.raises(ValueError):
+        radiko_rec.validate_time_range("2024010105000", "20240101060000")
+    with pytest.raises(ValueError):
+        radiko_rec.validate_time_range("20240101060000", "20240101060000")
+    with pytest.raises(ValueError):
+        radiko_rec.validate_time_range("20240101070000", "20240101060000")
+
+
+def test_submit_rejects_invalid_time_range(auth, tmp_path):
+    queue = radiko_rec.DownloadQueue(auth, quiet)
+    with pytest.raises(ValueError):
+        queue.submit("ST000", program("ST000", "20240101060000", "20240101050000"), str(tmp_path / "x.m4a"))
+    assert not queue.jobs
+
+
+def test_jobs_download_through_workers(auth, tmp_path):
+    queue = radiko_rec.DownloadQueue(auth, quiet, max_workers=2)
+    jobs = [
+        queue.submit(station_id, program(station_id), str(tmp_path / f"{station_id}.m4a"),
+                     engine=radiko_rec.ENGINE_NATIVE)
+        for station_id in ("ST000", "ST001", "ST002")
+    ]
+    wait_idle(queue)
+    assert [job.status for job in jobs] == [radiko_rec.JOB_DONE] * 3
+    for job in jobs:
+        assert abs(radiko_rec.read_m4a_duration(job.output_path) - 600) < 1
+
+
+def test_worker_survives_unexpected_exception(auth, tmp_path):
+    queue = radiko_rec.DownloadQueue(auth, quiet, max_workers=1)
+    run_job = queue._run_job
+
+    def flaky_run_job(job):
+        if job.station_id == "ST000":
+            raise OSError("disk full")
+        run_job(job)
+
+    queue._run_job = flaky_run_job
+    failed = queue.submit("ST000", program("ST000"), str(tmp_path / "a.m4a"), engine=radiko_rec.ENGINE_NATIVE)
+    done = queue.submit("ST001", program("ST001"), str(tmp_path / "b.m4a"), engine=radiko_rec.ENGINE_NATIVE)
+    wait_idle(queue)
+
+    assert failed.status == radiko_rec.JOB_FAILED
+    assert done.status == radiko_rec.JOB_DONE
+    assert queue.worker_stats()["workers"] == 0
+
+
+def test_per_station_limit(auth, tmp_path):
+    queue = radiko_rec.DownloadQueue(auth, quiet, max_workers=4, per_station_limit=1)
+    lock = threading.Lock()
+    active = {}
+    peak = {}
+
+    def fake_run_job(job):
+        with lock:
+            active[job.station_id] = active.get(job.station_id, 0) + 1
+            peak[job.station_id] = max(peak.get(job.station_id, 0), active[job.station_id])
+        time.sleep(0.05)
+        with lock:
+            active[job.station_id] -= 1
+        job.status = radiko_rec.JOB_DONE
+
+    queue._run_job = fake_run_job
+    for i in range(3):
+        queue.submit("ST000", program("ST000"), str(tmp_path / f"a{i}.m4a"))
+        queue.submit("ST001", program("ST001"), str(tmp_path / f"b{i}.m4a"))
+    wait_idle(queue)
+
+    assert peak == {"ST000": 1, "ST001": 1}
+    assert queue.counts()[radiko_rec.JOB_DONE] == 6
+
+
+def test_cancel_pending_job_and_retry(auth, tmp_path):
+    queue = radiko_rec.DownloadQueue(auth, quiet, max_workers=1)
+    release = threading.Event()
+
+    def blocking_run_job(job):
+        release.wait(5)
+        job.status = radiko_rec.JOB_DONE
+
+    queue._run_job = blocking_run_job
+    first = queue.submit("ST000", program("ST000"), str(tmp_path / "a.m4a"))
+    second = queue.submit("ST001", program("ST001"), str(tmp_path / "b.m4a"))
+
+    assert queue.cancel(second.job_id)
+    assert second.status == radiko_rec.JOB_CANCELLED
+    assert queue.retry(second.job_id)
+    assert second.status == radiko_rec.JOB_PENDING
+    release.set()
+    wait_idle(queue)
+    assert first.status == second.status == radiko_rec.JOB_DONE
@@ -0,0 +1,66 @@
+"""GUIのログ表示 (上限付きのバッファとまとめ描画) のテスト。"""
+import threading
+from collections import deque
+
+import pytest
+
+radiko_gui = pytest.importorskip("radiko_gui")
+
+
+def bare_gui():
+    """ウィンドウを作らずにログ関連の属性だけを持つ RadikoGUI。"""
+    gui = radiko_gui.RadikoGUI.__new__(radiko_gui.RadikoGUI)
+    gui.log_buffer = deque(maxlen=radiko_gui.LOG_VIEW_MAX_LINES)
+    gui._log_dropped = 0
+    gui._log_lock = threading.Lock()
+    gui.log_file = None
+    return gui
+
+
+def test_log_buffer_is_bounded_and_counts_dropped_lines():
+    gui = bare_gui()
+    total = radiko_gui.LOG_VIEW_MAX_LINES + 25
+    for i in range(total):
+        gui.add_log(f"line {i}")
+
+    assert len(gui.log_buffer) == radiko_gui.LOG_VIEW_MAX_LINES
+    assert gui._log_dropped == 25
+    assert gui.log_buffer[0].endswith(" line 25\n")
+    assert gui.log_buffer[-1].endswith(f" line {total - 1}\n")
+
+
+def test_dropped_lines_are_counted_across_threads():
+    gui = bare_gui()
+    threads = [
+        threading.Thread(target=lambda: [gui.add_log("x") for _ in range(radiko_gui.LOG_VIEW_MAX_LINES)])
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 追加した行は、バッファに残っているか省略した行数に数えられている
+    assert len(gui.log_buffer) + gui._log_dropped == 8 * radiko_gui.LOG_VIEW_MAX_LINES
+
+
+def test_log_view_keeps_last_lines(tk_root):
+    import tkinter as tk
+
+    gui = bare_gui()
+    gui.master = tk_root
+    gui.log_text = tk.Text(tk_root, state='disabled')
+    for i in range(radiko_gui.LOG_VIEW_MAX_LINES + 10):
+        gui.add_log(f"line {i}")
+
+    # 1回の描画は LOG_LINES_PER_TICK 行まで
+    gui._process_log_queue()
+    rendered = gui.log_text.get("1.0", "end-1c").splitlines()
+    assert rendered[0].startswith("... 10 行のログを省略しました")
+    assert len(rendered) == radiko_gui.LOG_LINES_PER_TICK + 1
+
+    while gui.log_buffer:
+        gui._process_log_queue()
+    rendered = gui.log_text.get("1.0", "end-1c").splitlines()
+    assert len(rendered) <= radiko_gui.LOG_VIEW_MAX_LINES
+    assert rendered[-1].endswith(f" line {radiko_gui.LOG_VIEW_MAX_LINES + 9}")
@@ -0,0 +1,112 @@
+"""番組表のディスクキャッシュ (GuideCache) と条件付きリクエストのテスト。"""
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from conftest import quiet
+import radiko_rec
+
+GuideCache = radiko_rec.GuideCache
+
+
+def request_count(mock_server, name):
+    with mock_server.state.lock:
+        return mock_server.state.counters.get(name, 0)
+
+
+def test_is_immutable_uses_broadcast_day():
+    # 2024/01/01 の放送日は 01/02 の 5:00 に終わる
+    assert not GuideCache.is_immutable("20240101", now=datetime(2024, 1, 2, 4, 59))
+    assert GuideCache.is_immutable("20240101", now=datetime(2024, 1, 2, 5, 0))
+    assert not GuideCache.is_immutable("not-a-date")
+
+
+def test_put_and_get(tmp_path):
+    cache = GuideCache(str(tmp_path))
+    cache.put(("TBS", "20240101"), b"<xml/>", etag='"abc"')
+    content, meta = cache.get(("TBS", "20240101"))
+    assert content == b"<xml/>"
+    assert meta["etag"] == '"abc"'
+    assert cache.get(("TBS", "20240102")) is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = GuideCache(str(tmp_path), max_bytes=250)
+    for i, day in enumerate(("20240101", "20240102")):
+        cache.put(("TBS", day), b"x" * 100)
+        meta_path = cache._paths(("TBS", day))[1]
+        os.utime(meta_path, (1000 + i, 1000 + i))
+    cache.put(("TBS", "20240103"), b"x" * 100)
+
+    assert cache.get(("TBS", "20240101")) is None
+    assert cache.get(("TBS", "20240102")) is not None
+    assert cache.get(("TBS", "20240103")) is not None
+
+
+def test_past_day_is_served_from_cache(auth, mock_server, tmp_path):
+    metadata = radiko_rec.RadikoMetadata(auth, quiet, guide_cache_dir=str(tmp_path))
+    metadata.load_stations()
+    first = metadata.get_programs("ST000", "20240101")
+    before = request_count(mock_server, "station_guide")
+
+    again = radiko_rec.RadikoMetadata(auth, quiet, guide_cache_dir=str(tmp_path))
+    again.load_stations()
+    assert [p.title for p in again.get_programs("ST000", "20240101")] == [p.title for p in first]
+    assert request_count(mock_server, "station_guide") == before
+    assert again.guide_cache.stats()["hits"] >= 1
+
+
+def test_stale_current_day_is_revalidated(auth, mock_server, tmp_path):
+    today = (datetime.now() - timedelta(hours=radiko_rec.RADIKO_DAY_START_HOUR)).strftime('%Y%m%d')
+    metadata = radiko_rec.RadikoMetadata(auth, quiet, guide_cache_dir=str(tmp_path))
+    metadata.load_stations()
+    assert metadata.get_programs("ST000", today)
+
+    # 取得から一定時間が経った扱いにする
+    meta_path = metadata.guide_cache._paths(("ST000", today))[1]
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["fetched_at"] = time.time() - radiko_rec.GUIDE_CACHE_FRESH_SECONDS - 1
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    fresh = radiko_rec.RadikoMetadata(auth, quiet, guide_cache_dir=str(tmp_path))
+    fresh.load_stations()
+    before = request_count(mock_server, "station_guide")
+    assert fresh.get_programs("ST000", today)
+    # 条件付きリクエストを1回送り、304 でキャッシュを使った
+    assert request_count(mock_server, "station_guide") == before + 1
+    assert fresh.guide_cache.stats()["revalidations"] == 1
+
+
+def test_is_final_uses_fetch_time():
+    day_end = datetime(2024, 1, 2, 5, 0)
+    assert not GuideCache.is_final("20240101", {"fetched_at": (day_end - timedelta(hours=3)).timestamp()})
+    assert GuideCache.is_final("20240101", {"fetched_at": day_end.timestamp()})
+    assert not GuideCache.is_final("20240101", {})
+
+
+def test_entry_fetched_mid_day_is_revalidated_once_after_day_end(auth, mock_server, tmp_path):
+    metadata = radiko_rec.RadikoMetadata(auth, quiet, guide_cache_dir=str(tmp_path))
+    metadata.load_stations()
+    assert metadata.get_programs("ST000", "20240101")
+
+    # 放送中 (2024/01/01 の昼) に取得したエントリとする
+    meta_path = metadata.guide_cache._paths(("ST000", "20240101"))[1]
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["fetched_at"] = datetime(2024, 1, 1, 12, 0).timestamp()
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    later = radiko_rec.RadikoMetadata(auth, quiet, guide_cache_dir=str(tmp_path))
+    later.load_stations()
+    before = request_count(mock_server, "station_guide")
+    assert later.get_programs("ST000", "20240101")
+    # 放送日の終了後に条件付きリクエストで1度だけ確認し、以後は再検証しない
+    assert request_count(mock_server, "station_guide") == before + 1
+    assert later.guide_cache.stats()["revalidations"] == 1
+    assert later.get_programs("ST000", "20240101")
+    assert request_count(mock_server, "station_guide") == before + 1
+    assert GuideCache.is_final("20240101", later.guide_cache.get(("ST000", "20240101"))[1])
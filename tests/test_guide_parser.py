@@ -0,0 +1,70 @@
+"""番組表XMLの逐次解析 (iter_guide_programs) と Program レコードのテスト。"""
+import io
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+import pytest
+
+import radiko_rec
+
+AREA_GUIDE = """<?xml version="1.0" encoding="UTF-8"?>
+<radiko>
+  <stations>
+    <station id="TBS">
+      <name>TBSラジオ</name>
+      <progs>
+        <date>20240101</date>
+        <prog ft="20240101050000" to="20240101060000">
+          <title>朝の番組</title>
+          <pfm>出演者A</pfm>
+          <info>&lt;p&gt;詳細&lt;/p&gt;</info>
+          <url>https://example.com/a</url>
+        </prog>
+        <prog ft="2024010106" to="20240101070000"><title>時刻が不正</title></prog>
+        <prog ft="20240101060000" to="20240101070000"></prog>
+      </progs>
+    </station>
+    <station id="QRR">
+      <name>文化放送</name>
+      <progs>
+        <prog ft="20240102010000" to="20240102020000"><title>深夜</title></prog>
+      </progs>
+    </station>
+  </stations>
+</radiko>
+""".encode("utf-8")
+
+
+def test_parses_programs_of_every_station():
+    station_names = {}
+    programs = list(radiko_rec.iter_guide_programs(AREA_GUIDE, station_names))
+
+    assert [(p.station_id, p.title) for p in programs] == [
+        ("TBS", "朝の番組"), ("TBS", "(タイトル不明)"), ("QRR", "深夜"),
+    ]
+    first = programs[0]
+    assert (first.performer, first.info, first.url) == ("出演者A", "<p>詳細</p>", "https://example.com/a")
+    # prog 内の要素ではなく局の name だけを局名とする
+    assert station_names == {"TBS": "TBSラジオ", "QRR": "文化放送"}
+
+
+def test_accepts_file_objects():
+    programs = list(radiko_rec.iter_guide_programs(io.BytesIO(AREA_GUIDE)))
+    assert len(programs) == 3
+
+
+def test_raises_on_broken_xml():
+    with pytest.raises(ET.ParseError):
+        list(radiko_rec.iter_guide_programs(b"<radiko><stations>"))
+
+
+def test_program_times_are_parsed_lazily():
+    program = radiko_rec.Program("TBS", "t", "20240101233000", "20240102003000")
+    assert program._start_time_dt is None
+    assert program.start_time_dt == datetime(2024, 1, 1, 23, 30)
+    assert program.duration_seconds == 3600
+    assert not hasattr(program, "__dict__")
+
+
+def test_parse_radiko_time():
+    assert radiko_rec.parse_radiko_time("20240102013005") == datetime(2024, 1, 2, 1, 30, 5)
@@ -0,0 +1,61 @@
+"""HLSSegmentFetcher (ネイティブ並列取得) のテスト。"""
+import io
+
+from conftest import quiet
+import radiko_rec
+
+
+def test_parse_playlist_separates_variants_and_segments():
+    text = (
+        "#EXTM3U\n"
+        "#EXT-X-STREAM-INF:BANDWIDTH=52000\n"
+        "chunklist.m3u8?id=1\n"
+        "#EXTINF:5.0,\n"
+        "seg/0.aac\n"
+        "\n"
+        "#EXTINF:5.0,\n"
+        "https://cdn.example.com/seg/1.aac\n"
+    )
+    variants, segments = radiko_rec.HLSSegmentFetcher.parse_playlist(text, "https://example.com/a/playlist.m3u8")
+    assert variants == ["https://example.com/a/chunklist.m3u8?id=1"]
+    assert segments == ["https://example.com/a/seg/0.aac", "https://cdn.example.com/seg/1.aac"]
+
+
+def test_parse_playlist_treats_m3u8_urls_as_variants():
+    variants, segments = radiko_rec.HLSSegmentFetcher.parse_playlist("#EXTM3U\nnext.m3u8\n", "https://example.com/")
+    assert variants == ["https://example.com/next.m3u8"]
+    assert segments == []
+
+
+def test_fetch_writes_segments_in_order(auth, mock_server):
+    downloader = radiko_rec.StreamDownloader(auth, quiet)
+    url = downloader.build_playlist_url("ST000", "20240101050000", "20240101051000")
+    fetcher = radiko_rec.HLSSegmentFetcher(auth.session, downloader._build_request_headers(), quiet, max_workers=4)
+    out = io.BytesIO()
+    reports = []
+
+    assert fetcher.fetch(url, out, reports.append, total_seconds=600)
+
+    # 10分 / 5秒 = 120セグメントが、番号順に連結されている
+    assert fetcher.segments_fetched == fetcher.segments_total == 120
+    expected = b"".join(mock_server.state.segment(i) for i in range(120))
+    assert out.getvalue() == expected
+    assert reports[-1].finished
+    assert reports[-1].media_seconds == 600
+
+
+def test_fetch_fails_when_playlist_is_rejected(mock_server):
+    auth = radiko_rec.RadikoAuth(quiet, cache_path=None)
+    downloader = radiko_rec.StreamDownloader(auth, quiet)
+    url = downloader.build_playlist_url("ST000", "20240101050000", "20240101051000")
+    # 認証していないトークンはモックサーバーに拒否される
+    fetcher = radiko_rec.HLSSegmentFetcher(auth.session, {"X-Radiko-AuthToken": "invalid"}, quiet)
+    assert not fetcher.fetch(url, io.BytesIO())
+    assert fetcher.segments_fetched == 0
+
+
+def test_cancelled_fetcher_does_not_fetch_segments(auth):
+    downloader = radiko_rec.StreamDownloader(auth, quiet)
+    fetcher = radiko_rec.HLSSegmentFetcher(auth.session, downloader._build_request_headers(), quiet)
+    fetcher.cancel()
+    assert fetcher._fetch_segment("http://127.0.0.1:1/never.aac") is None
@@ -0,0 +1,98 @@
+"""ライブ録音 (LiveStreamRecorder) のテスト。"""
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from conftest import quiet
+import radiko_rec
+
+
+def test_parse_playlist_numbers_segments_and_program_date_time():
+    text = (
+        "#EXTM3U\n"
+        "#EXT-X-MEDIA-SEQUENCE:100\n"
+        "#EXT-X-PROGRAM-DATE-TIME:2024-01-01T00:00:00Z\n"
+        "#EXTINF:5.0,\n"
+        "/live/TBS/100.aac\n"
+        "#EXTINF:4.5,\n"
+        "seg/101.aac\n"
+        "#EXT-X-ENDLIST\n"
+    )
+    variants, segments, ended = radiko_rec.LiveStreamRecorder.parse_playlist(text, "https://example.com/so/chunklist.m3u8")
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+    assert variants == []
+    # PROGRAM-DATE-TIME は後続のセグメントには長さを足して引き継ぐ
+    assert segments == [
+        (100, "https://example.com/live/TBS/100.aac", 5.0, start),
+        (101, "https://example.com/so/seg/101.aac", 4.5, start + 5.0),
+    ]
+    assert ended
+
+
+def test_parse_playlist_variants_without_program_date_time():
+    text = '#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=52000,CODECS="mp4a.40.2"\n/so/chunklist.m3u8?station_id=TBS\n#EXTINF:5.0,\na.aac\n'
+    variants, segments, ended = radiko_rec.LiveStreamRecorder.parse_playlist(text, "https://example.com/so/playlist.m3u8")
+    assert variants == ["https://example.com/so/chunklist.m3u8?station_id=TBS"]
+    assert segments == [(0, "https://example.com/so/a.aac", 5.0, None)]
+    assert not ended
+
+
+@pytest.mark.parametrize("ft, to", [
+    ("20240101050000", "20240101051000"),
+    ("bad", "20240101051000"),
+])
+def test_record_live_rejects_past_or_invalid_range(auth, ft, to):
+    downloader = radiko_rec.StreamDownloader(auth, quiet)
+    assert not downloader.record_live("ST000", ft, to, "unused.m4a", None)
+
+
+def clock(ts):
+    """UNIX時刻をRadikoの時刻 (日本時間) にする。"""
+    return datetime.fromtimestamp(ts, radiko_rec.RADIKO_TIMEZONE).strftime("%Y%m%d%H%M%S")
+
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    """実行環境の時間帯を一時的に変える (time.tzset が無い環境ではスキップする)。"""
+    if not hasattr(time, "tzset"):
+        pytest.skip("time.tzset がありません")
+
+    def set_timezone(name):
+        monkeypatch.setenv("TZ", name)
+        time.tzset()
+
+    yield set_timezone
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.parametrize("program_date_time", [False, True])
+def test_record_live_cuts_requested_range(auth, mock_server, tmp_path, monkeypatch, program_date_time):
+    monkeypatch.setattr(mock_server.state, "live_program_date_time", program_date_time)
+    # 配信中のウィンドウに含まれる直前の10秒から、2秒後までを録音する
+    now = int(time.time())
+    output = str(tmp_path / "live.m4a")
+    downloader = radiko_rec.StreamDownloader(auth, quiet)
+
+    assert downloader.record_live("ST000", clock(now - 10), clock(now + 2), output, None)
+
+    stats = downloader.live_stats
+    assert stats["program_date_time"] is program_date_time
+    assert stats["head_lost_s"] == 0
+    assert not stats["stalled"]
+    assert radiko_rec.read_m4a_duration(output) == pytest.approx(12, abs=0.1)
+
+
+def test_record_live_interprets_times_as_japan_time(auth, mock_server, tmp_path, local_timezone):
+    # 日本時間ではない環境 (UTC-5) でも、指定した時刻 (日本時間) の範囲を録音する
+    local_timezone("EST+5")
+    now = int(time.time())
+    output = str(tmp_path / "live.m4a")
+    downloader = radiko_rec.StreamDownloader(auth, quiet)
+
+    assert downloader.record_live("ST000", clock(now - 10), clock(now + 2), output, None)
+
+    assert downloader.live_stats["head_lost_s"] == 0
+    assert downloader.live_stats["start_latency_s"] < 20
+    assert radiko_rec.read_m4a_duration(output) == pytest.approx(12, abs=0.1)
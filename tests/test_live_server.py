@@ -0,0 +1,131 @@
+"""取得中の録音の配信 (LiveRecording / LiveRecordingServer) のテスト。"""
+import threading
+import time
+
+import pytest
+import requests
+
+from conftest import quiet
+import radiko_rec
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-", (0, None, None)),
+    ("bytes=100-199", (100, 199, None)),
+    (" bytes=5-5 ", (5, 5, None)),
+    ("bytes=-500", (None, None, 500)),
+    ("bytes=-", None),
+    ("bytes=0-1,5-9", None),
+    ("items=0-1", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_byte_range(header, expected):
+    assert radiko_rec.parse_byte_range(header) == expected
+
+
+def test_wait_for_returns_when_data_arrives_or_fetch_ends(tmp_path):
+    path = tmp_path / "a.aac"
+    recording = radiko_rec.LiveRecording("ST000", "20240101050000", "20240101051000", str(path))
+    path.write_bytes(b"x" * 10)
+    assert recording.wait_for(5) == 10
+
+    def writer():
+        with open(path, "ab") as f:
+            f.write(b"y" * 10)
+        recording.notify()
+        recording.finish(True)
+
+    timer = threading.Timer(0.05, writer)
+    timer.start()
+    # 取得が終われば要求した大きさに届かなくても戻る
+    assert recording.wait_for(1000) == 20
+    timer.join()
+    assert recording.done and recording.state == radiko_rec.LIVE_FINISHED
+    assert recording.to_dict()["bytes"] == 20
+
+
+@pytest.fixture
+def live_server(auth, tmp_path):
+    server = radiko_rec.LiveRecordingServer(auth, quiet, output_dir=str(tmp_path), port=0).start()
+    yield server
+    server.stop()
+
+
+def expected_adts(mock_server, count):
+    return b"".join(mock_server.state.segment(i) for i in range(count))
+
+
+def test_server_streams_and_shares_one_fetch(live_server, mock_server):
+    url = live_server.recording_url("ST000", "20240101050000", "20240101050100")
+    with mock_server.state.lock:
+        before = mock_server.state.counters.get("segment", 0)
+
+    results = [None, None]
+
+    def get(i):
+        results[i] = requests.get(url, timeout=30).content
+
+    threads = [threading.Thread(target=get, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 1分 / 5秒 = 12セグメントを1回だけ取得し、2つの読み手が同じ内容を受け取る
+    assert results[0] == results[1] == expected_adts(mock_server, 12)
+    with mock_server.state.lock:
+        assert mock_server.state.counters.get("segment", 0) - before == 12
+
+    listing = requests.get(live_server.base_url + "/recordings", timeout=10).json()
+    assert listing[0]["state"] == radiko_rec.LIVE_FINISHED
+    assert listing[0]["bytes"] == len(results[0])
+
+
+def test_server_answers_range_requests(live_server, mock_server):
+    url = live_server.recording_url("ST001", "20240101050000", "20240101050100")
+    data = expected_adts(mock_server, 12)
+
+    res = requests.get(url, headers={"Range": "bytes=10-19"}, timeout=30)
+    assert res.status_code == 206
+    assert res.content == data[10:20]
+
+    recording = live_server.get_recording("ST001", "20240101050000", "20240101050100")
+    recording.wait_for(float("inf"))
+    res = requests.get(url, headers={"Range": "bytes=-16"}, timeout=30)
+    assert res.status_code == 206
+    assert res.headers["Content-Range"] == f"bytes {len(data) - 16}-{len(data) - 1}/{len(data)}"
+    assert res.content == data[-16:]
+
+    res = requests.get(url, headers={"Range": f"bytes={len(data)}-"}, timeout=30)
+    assert res.status_code == 416
+    assert res.headers["Content-Range"] == f"bytes */{len(data)}"
+
+
+def test_server_rejects_unknown_paths(live_server):
+    assert requests.get(live_server.base_url + "/recordings/ST000/x.aac", timeout=10).status_code == 404
+
+
+def test_retry_after_failed_fetch_does_not_serve_stale_bytes(live_server, mock_server, monkeypatch):
+    key = ("ST002", "20240101050000", "20240101050100")
+    # 前回の取得が途中で失敗し、壊れた内容が残っている状態
+    mock_server.faults.update(error_status=404, error_rate=1.0, path="/segments/")
+    failed = live_server.get_recording(*key)
+    failed.wait_for(float("inf"))
+    assert failed.state == radiko_rec.LIVE_FAILED
+    with open(failed.path, "wb") as f:
+        f.write(b"stale partial data")
+
+    mock_server.faults.update(error_rate=0.0, path=None)
+    # FFmpegエンジンのように、再取得が出力ファイルを開くまでに時間がかかる場合
+    download_adts = radiko_rec.StreamDownloader.download_adts
+
+    def slow_download_adts(self, *args, **kwargs):
+        time.sleep(0.5)
+        return download_adts(self, *args, **kwargs)
+
+    monkeypatch.setattr(radiko_rec.StreamDownloader, "download_adts", slow_download_adts)
+    retry = live_server.get_recording(*key)
+    assert retry is not failed
+    res = requests.get(live_server.recording_url(*key), timeout=30)
+    assert res.content == expected_adts(mock_server, 12)
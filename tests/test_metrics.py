@@ -0,0 +1,90 @@
+"""メトリクス (Counter / Gauge / Histogram / MetricsServer) のテスト。"""
+import pytest
+import requests
+
+from conftest import quiet
+import radiko_rec
+
+
+def test_counter_renders_labels_in_order():
+    registry = radiko_rec.MetricsRegistry()
+    counter = registry.counter("requests_total", "リクエスト数", ("step", "result"))
+    counter.inc(step="auth2", result="ok")
+    counter.inc(2, step="auth1", result="ok")
+    counter.inc(step="auth1", result='bad "quote"\n')
+
+    assert counter.value(step="auth1", result="ok") == 2
+    assert counter.value(step="login", result="ok") == 0
+    assert registry.render() == (
+        "# HELP requests_total リクエスト数\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{step="auth1",result="bad \\"quote\\"\\n"} 1\n'
+        'requests_total{step="auth1",result="ok"} 2\n'
+        'requests_total{step="auth2",result="ok"} 1\n'
+    )
+
+
+def test_counter_requires_every_label():
+    counter = radiko_rec.Counter("c", "doc", ("step",))
+    with pytest.raises(KeyError):
+        counter.inc()
+
+
+def test_gauge_set_inc_dec_and_callback():
+    registry = radiko_rec.MetricsRegistry()
+    gauge = registry.gauge("in_progress", "実行中")
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    gauge.set(0.5)
+    registry.gauge("depth", "深さ", ("queue",), callback=lambda: {("b",): 2, ("a",): 1})
+
+    lines = registry.render().splitlines()
+    assert "in_progress 0.5" in lines
+    assert lines[-2:] == ['depth{queue="a"} 1', 'depth{queue="b"} 2']
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = radiko_rec.Histogram("latency_seconds", "遅延", (1, 0.1), ("kind",))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, kind="guide")
+
+    assert histogram.count(kind="guide") == 4
+    assert histogram.count(kind="auth") == 0
+    assert histogram.render().splitlines()[2:] == [
+        'latency_seconds_bucket{kind="guide",le="0.1"} 2',
+        'latency_seconds_bucket{kind="guide",le="1"} 3',
+        'latency_seconds_bucket{kind="guide",le="+Inf"} 4',
+        'latency_seconds_sum{kind="guide"} 3.65',
+        'latency_seconds_count{kind="guide"} 4',
+    ]
+
+
+def test_metrics_server_serves_registry():
+    registry = radiko_rec.MetricsRegistry()
+    registry.counter("hits_total", "ヒット数").inc(3)
+    server = radiko_rec.MetricsServer(quiet, port=0, registry=registry).start()
+    try:
+        res = requests.get(server.url, timeout=10)
+        assert res.status_code == 200
+        assert res.headers["Content-Type"] == radiko_rec.METRICS_CONTENT_TYPE
+        assert res.text == registry.render()
+        assert requests.get(server.url.replace("/metrics", "/other"), timeout=10).status_code == 404
+    finally:
+        server.stop()
+
+
+def test_auth_and_download_are_counted(mock_server, tmp_path):
+    auth_ok = radiko_rec.METRIC_AUTH_REQUESTS.value(step="auth1", result="ok")
+    downloads_ok = radiko_rec.METRIC_DOWNLOADS.value(engine=radiko_rec.ENGINE_NATIVE, result="ok")
+
+    auth = radiko_rec.RadikoAuth(quiet, cache_path=None)
+    assert auth.auth(use_cache=False)
+    assert radiko_rec.StreamDownloader(auth, quiet).download(
+        "ST000", "20240101050000", "20240101050100", str(tmp_path / "a.m4a"), quiet,
+        engine=radiko_rec.ENGINE_NATIVE, resume=False,
+    )
+
+    assert radiko_rec.METRIC_AUTH_REQUESTS.value(step="auth1", result="ok") == auth_ok + 1
+    assert radiko_rec.METRIC_DOWNLOADS.value(engine=radiko_rec.ENGINE_NATIVE, result="ok") == downloads_ok + 1
+    assert "radiko_queue_depth " in radiko_rec.METRICS.render()
@@ -0,0 +1,43 @@
+"""ベンチマーク・テスト用のモックRadikoサーバー (benchmarks/mock_radiko.py) のテスト。"""
+import requests
+
+import mock_radiko
+import radiko_rec
+
+
+def test_auth2_rejects_wrong_partial_key(mock_server):
+    session = requests.Session()
+    res = session.get(radiko_rec.URL_AUTH1)
+    token = res.headers["X-Radiko-AuthToken"]
+    res = session.get(radiko_rec.URL_AUTH2, headers={"X-Radiko-AuthToken": token, "X-Radiko-PartialKey": "AAAA"})
+    assert res.status_code == 401
+    assert not mock_server.state.token_valid(token)
+
+
+def test_media_requires_activated_token(mock_server):
+    res = requests.get(mock_server.base_url + "/segments/ST000/20240101050000/0.aac")
+    assert res.status_code == 403
+
+
+def test_guide_supports_etag(mock_server):
+    url = radiko_rec.URL_STATION_GUIDE.format(date="20240101", station_id="ST000")
+    first = requests.get(url)
+    assert first.status_code == 200
+    again = requests.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def test_fault_injection_is_limited_to_path(mock_server):
+    res = requests.get(mock_server.base_url + "/_mock/faults", params={"error_rate": "1", "path": "/v3/program/"})
+    assert res.json()["error_rate"] == 1.0
+    assert requests.get(radiko_rec.URL_AREA_GUIDE.format(date="20240101", area_id="JP13")).status_code == 503
+    assert requests.get(radiko_rec.URL_STATION_LIST.format(area_id="JP13")).status_code == 200
+    assert requests.get(mock_server.base_url + "/_mock/faults", params={"bogus": "1"}).status_code == 400
+
+
+def test_segments_are_adts_frames_of_constant_length(mock_server):
+    state = mock_server.state
+    frames = [list(radiko_rec.iter_adts_frames(state.segment(i))) for i in range(4)]
+    # 1セグメント5秒: 累積フレーム数で端数を揃えるため、4セグメントの合計は20秒分
+    total = sum(len(f) for f in frames)
+    assert total == int(4 * mock_radiko.SEGMENT_SECONDS * state.frames_per_second)
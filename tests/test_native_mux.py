@@ -0,0 +1,114 @@
+"""ADTSの解析とFFmpegを使わないM4Aへの書き出し (ADTSToM4AMuxer) のテスト。"""
+import struct
+
+import pytest
+
+from conftest import quiet
+from mock_radiko import adts_frame, id3_tag
+import radiko_rec
+
+
+def frame(index, payload_size=20, sample_rate=48000, channels=2):
+    """内容で順序を確かめられるよう、番号を埋めたペイロードを持つADTSフレーム。"""
+    header = adts_frame(payload_size, sample_rate, channels)[:7]
+    return header + bytes([index % 256]) * payload_size
+
+
+def boxes(data, offset=0, end=None):
+    """MP4のボックスを (種類, 中身の開始位置, 終了位置) で列挙する。"""
+    end = len(data) if end is None else end
+    while offset < end:
+        size, kind = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header = 16
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def find_box(data, *path):
+    start, end = 0, len(data)
+    for kind in path:
+        start, end = next((s, e) for k, s, e in boxes(data, start, end) if k == kind)
+    return data[start:end]
+
+
+def test_iter_adts_frames_skips_id3_tags():
+    data = id3_tag(0) + frame(0) + frame(1, 30) + id3_tag(90000) + frame(2)
+    frames = list(radiko_rec.iter_adts_frames(data))
+    assert [length for _, length, _, _ in frames] == [27, 37, 27]
+    assert all(rate == 48000 and samples == 1024 for _, _, rate, samples in frames)
+    first_offset = len(id3_tag(0))
+    assert frames[0][0] == first_offset
+    assert frames[2][0] == first_offset + 27 + 37 + len(id3_tag(90000))
+    assert list(radiko_rec.iter_adts_frames(b"")) == []
+
+
+@pytest.mark.parametrize("data", [
+    frame(0)[:-1],
+    frame(0) + frame(1)[:5],
+    b"\x00" * 10,
+])
+def test_iter_adts_frames_rejects_broken_data(data):
+    with pytest.raises(ValueError):
+        list(radiko_rec.iter_adts_frames(data))
+
+
+def test_mux_writes_raw_frames_and_sample_table(tmp_path, monkeypatch):
+    # 読み込み単位を小さくし、フレームやID3タグが読み込み単位をまたぐ場合も通す
+    monkeypatch.setattr(radiko_rec, "MUX_READ_SIZE", 50)
+    first, second = tmp_path / "a.aac", tmp_path / "b.aac"
+    first.write_bytes(id3_tag(0) + b"".join(frame(i) for i in range(100)))
+    second.write_bytes(id3_tag(0) + b"".join(frame(i, 25) for i in range(100, 150)))
+    output = tmp_path / "out.m4a"
+
+    duration = radiko_rec.mux_adts_to_m4a([str(first), str(second)], str(output))
+
+    assert duration == pytest.approx(150 * 1024 / 48000)
+    assert radiko_rec.read_m4a_duration(str(output)) == pytest.approx(duration, abs=0.001)
+    data = output.read_bytes()
+    assert [kind for kind, _, _ in boxes(data)] == [b"ftyp", b"mdat", b"moov"]
+    expected = b"".join(bytes([i]) * 20 for i in range(100)) + b"".join(bytes([i]) * 25 for i in range(100, 150))
+    assert find_box(data, b"mdat") == expected
+
+    stbl = (b"moov", b"trak", b"mdia", b"minf", b"stbl")
+    stsz = find_box(data, *stbl, b"stsz")
+    assert struct.unpack_from(">III", stsz) == (0, 0, 150)
+    assert list(struct.unpack_from(">150I", stsz, 12)) == [20] * 100 + [25] * 50
+    # 64サンプルずつのチャンクで、最初のチャンクは mdat の先頭を指す
+    stco = find_box(data, *stbl, b"stco")
+    count, = struct.unpack_from(">I", stco, 4)
+    assert count == 3
+    mdat_start = next(start for kind, start, _ in boxes(data) if kind == b"mdat")
+    assert struct.unpack_from(">I", stco, 8)[0] == mdat_start
+
+
+def test_mux_rejects_format_change(tmp_path):
+    path = tmp_path / "a.aac"
+    path.write_bytes(frame(0) + frame(1, sample_rate=44100))
+    with pytest.raises(ValueError):
+        radiko_rec.ADTSToM4AMuxer().mux([str(path)], str(tmp_path / "out.m4a"))
+
+
+def test_mux_rejects_truncated_input(tmp_path):
+    path = tmp_path / "a.aac"
+    path.write_bytes(frame(0) + frame(1)[:10])
+    with pytest.raises(ValueError):
+        radiko_rec.mux_adts_to_m4a([str(path)], str(tmp_path / "out.m4a"))
+
+
+def test_read_m4a_duration_of_non_mp4(tmp_path):
+    path = tmp_path / "a.aac"
+    path.write_bytes(frame(0))
+    assert radiko_rec.read_m4a_duration(str(path)) is None
+    assert radiko_rec.read_m4a_duration(str(tmp_path / "missing.m4a")) is None
+
+
+def test_native_download_of_mock_stream(auth, tmp_path):
+    output = str(tmp_path / "a.m4a")
+    downloader = radiko_rec.StreamDownloader(auth, quiet)
+    assert downloader.download(
+        "ST000", "20240101050000", "20240101051000", output, quiet, engine=radiko_rec.ENGINE_NATIVE, resume=False
+    )
+    assert radiko_rec.read_m4a_duration(output) == pytest.approx(600, abs=0.1)
@@ -0,0 +1,116 @@
+"""後処理パイプライン (段階の指定・タグ・PostProcessor) のテスト。"""
+import os
+import shutil
+
+import pytest
+
+from conftest import quiet
+import radiko_rec
+
+
+def test_parse_postprocess_stages_orders_and_validates():
+    assert radiko_rec.parse_postprocess_stages("opus, normalize,tag,opus") == ("normalize", "tag", "opus")
+    assert radiko_rec.parse_postprocess_stages("") == ()
+    assert radiko_rec.parse_postprocess_stages(None) == ()
+    with pytest.raises(ValueError):
+        radiko_rec.parse_postprocess_stages("tag,mp3")
+
+
+def test_program_tags():
+    program = radiko_rec.Program(
+        "TBS", "番組", "20240102053000", "20240102070000", performer="出演者", info="<p>番組<b>詳細</b></p>"
+    )
+    assert radiko_rec.program_tags(program, "TBSラジオ") == {
+        "title": "番組",
+        "artist": "出演者",
+        "album": "TBSラジオ",
+        "comment": "番組詳細",
+        "date": "2024-01-02 05:30",
+    }
+    # 局名が無ければ局ID、空の値は書き込まない
+    assert radiko_rec.program_tags(radiko_rec.Program("TBS", "番組", "", "")) == {"title": "番組", "album": "TBS"}
+    assert radiko_rec.program_tags(None) == {}
+
+
+def test_run_postprocess_replaces_file_and_records_outputs(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_ffmpeg(args):
+        # 出力先 (最後の引数) に入力ファイルの内容と段階の印を書く
+        calls.append(args)
+        source = args[args.index("-i") + 1]
+        with open(source, "rb") as f:
+            data = f.read()
+        with open(args[-1], "wb") as f:
+            f.write(data + b"+")
+
+    monkeypatch.setattr(radiko_rec, "_run_postprocess_ffmpeg", fake_ffmpeg)
+    path = tmp_path / "a.m4a"
+    path.write_bytes(b"m4a")
+
+    result = radiko_rec.run_postprocess(str(path), ("normalize", "tag", "opus"), {"title": "番組"})
+
+    assert result["error"] is None
+    assert result["outputs"] == {"normalize": str(path), "tag": str(path), "opus": str(tmp_path / "a.opus")}
+    assert set(result["timings"]) == {"normalize", "tag", "opus"}
+    assert path.read_bytes() == b"m4a++"
+    assert (tmp_path / "a.opus").read_bytes() == b"m4a+++"
+    assert "title=番組" in calls[1]
+    assert not os.path.exists(str(path) + ".post.m4a")
+
+
+def test_run_postprocess_keeps_original_on_failure(tmp_path, monkeypatch):
+    def failing_ffmpeg(args):
+        with open(args[-1], "wb") as f:
+            f.write(b"partial")
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(radiko_rec, "_run_postprocess_ffmpeg", failing_ffmpeg)
+    path = tmp_path / "a.m4a"
+    path.write_bytes(b"m4a")
+
+    result = radiko_rec.run_postprocess(str(path), ("normalize", "opus"), {})
+
+    assert result["failed_stage"] == "normalize"
+    assert result["error"] == "boom"
+    assert result["outputs"] == {}
+    assert "opus" not in result["timings"]
+    assert path.read_bytes() == b"m4a"
+    assert not os.path.exists(str(path) + ".post.m4a")
+
+
+def test_postprocessor_reports_failure_from_worker_process(tmp_path):
+    logs = []
+    results = []
+    processor = radiko_rec.PostProcessor(logs.append, max_workers=1)
+    try:
+        # 存在しない入力はFFmpegの有無にかかわらず失敗する
+        processor.submit(str(tmp_path / "missing.m4a"), ("normalize",), on_done=results.append)
+        processor.wait()
+    finally:
+        processor.shutdown()
+
+    assert processor.pending_count() == 0
+    assert (processor.completed, processor.failed) == (0, 1)
+    assert results[0]["failed_stage"] == "normalize"
+    assert processor.stats()["normalize"]["count"] == 1
+    assert any(message.startswith("エラー: 後処理 (normalize)") for message in logs)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="FFmpeg がありません")
+def test_postprocessor_tags_native_recording(auth, mock_server, tmp_path):
+    output = str(tmp_path / "a.m4a")
+    downloader = radiko_rec.StreamDownloader(auth, quiet)
+    assert downloader.download("ST000", "20240101050000", "20240101050100", output, quiet, engine="native")
+
+    processor = radiko_rec.PostProcessor(quiet, max_workers=1, station_names={"ST000": "局0"})
+    results = []
+    try:
+        program = radiko_rec.Program("ST000", "番組", "20240101050000", "20240101050100")
+        processor.submit(output, ("tag",), program, results.append)
+        processor.wait()
+    finally:
+        processor.shutdown()
+
+    assert results[0]["error"] is None
+    assert processor.completed == 1
@@ -0,0 +1,85 @@
+"""番組一覧の行 (build_program_rows) と仮想化した番組一覧 (ProgramTable) のテスト。"""
+import pytest
+
+import radiko_rec
+
+radiko_gui = pytest.importorskip("radiko_gui")
+
+STATIONS = {"TBS": "TBSラジオ", "QRR": "文化放送"}
+
+
+def programs(count=50):
+    result = []
+    for i in range(count):
+        station_id = "TBS" if i % 2 else "QRR"
+        ft = f"202401{1 + i // 24:02d}{i % 24:02d}0000"
+        to = f"202401{1 + i // 24:02d}{i % 24:02d}3000"
+        result.append(radiko_rec.Program(station_id, f"番組{i}", ft, to, performer=f"出演者{i % 5}"))
+    return result
+
+
+def test_build_program_rows_precomputes_display_and_search_text():
+    program = radiko_rec.Program("TBS", "Morning Show", "20240102053000", "20240102070000", performer="DJ")
+    row, = radiko_gui.build_program_rows([program], STATIONS)
+    assert row.values == ("01/02(火)", "05:30-07:00", "TBSラジオ", "Morning Show", "1:30")
+    assert row.search_text == "morning show tbsラジオ tbs dj"
+    assert row.program is program
+
+
+def test_rows_for_unknown_station_use_station_id():
+    row, = radiko_gui.build_program_rows([radiko_rec.Program("XYZ", "t", "20240101050000", "20240101060000")], {})
+    assert row.values[2] == "XYZ"
+
+
+@pytest.fixture
+def table(tk_root):
+    import tkinter as tk
+
+    filter_var = tk.StringVar(tk_root)
+    counts = []
+    table = radiko_gui.ProgramTable(tk_root, filter_var, height=10, on_filtered=lambda: counts.append(len(table)))
+    table.set_rows(radiko_gui.build_program_rows(programs(), STATIONS))
+    return table, filter_var, counts
+
+
+def test_filter_count_is_current_after_each_keystroke(table):
+    table, filter_var, counts = table
+    assert counts[-1] == 50
+    filter_var.set("出演者1")
+    # 件数の通知は絞り込みの後に呼ばれる (1打鍵遅れない)
+    assert counts[-1] == len(table) == 10
+    filter_var.set("出演者1 tbs")
+    assert counts[-1] == len(table) == 5
+    filter_var.set("出演者1 tbs 該当なし")
+    assert counts[-1] == 0
+
+
+def test_only_visible_rows_are_in_the_tree(table):
+    table, _, _ = table
+    assert len(table.tree.get_children()) == 10
+    table.scroll(45)
+    # 末尾までしかスクロールしない
+    assert table._offset == 40
+    titles = [table.tree.item(iid, "values")[3] for iid in table.tree.get_children()]
+    assert titles == [row.program.title for row in table._view[40:]]
+
+
+def test_selection_is_kept_per_program_across_scrolling(table):
+    table, _, _ = table
+    first_slot = table.tree.get_children()[0]
+    table.tree.selection_set([first_slot])
+    table._on_select()
+    selected = table.selected_programs()
+    table.scroll(20)
+    table.scroll(-20)
+    assert table.selected_programs() == selected
+    assert len(selected) == 1
+
+
+def test_sort_by_column_toggles_direction(table):
+    table, _, _ = table
+    table.sort_by(3)
+    titles = [row.program.title for row in table._view]
+    assert titles == sorted(titles)
+    table.sort_by(3)
+    assert [row.program.title for row in table._view] == sorted(titles, reverse=True)
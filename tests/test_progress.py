@@ -0,0 +1,77 @@
+"""ダウンロードの進捗 (DownloadProgress) と FFmpeg の -progress 出力の解析のテスト。"""
+from conftest import quiet
+import radiko_rec
+
+DownloadProgress = radiko_rec.DownloadProgress
+
+
+def test_speed_percent_and_eta():
+    progress = DownloadProgress(3600, media_seconds=900, bytes_written=1024 * 1024, elapsed=30)
+    assert progress.percent == 25.0
+    assert progress.speed == 30.0
+    assert progress.eta_seconds == 90.0
+    assert progress.to_dict() == {
+        "percent": 25.0, "media_s": 900.0, "total_s": 3600.0, "bytes": 1048576, "speed": 30.0, "eta_s": 90.0,
+    }
+    assert progress.summary() == "25% 0:15:00/1:00:00 1.0MB 30.0x 残り0:01:30"
+
+
+def test_unknown_speed_and_finished():
+    assert DownloadProgress(3600).eta_seconds is None
+    assert DownloadProgress(3600).summary().endswith("残り--:--:--")
+    finished = DownloadProgress(3600, media_seconds=3599.9, elapsed=10, finished=True)
+    assert finished.percent == 100.0
+    assert finished.eta_seconds == 0.0
+    assert DownloadProgress(0).percent == 0.0
+
+
+def test_combine_shards():
+    parts = [
+        DownloadProgress(600, 600, 100, 5, True),
+        DownloadProgress(600, 300, 50, 5, False),
+    ]
+    combined = DownloadProgress.combine(parts, elapsed=10)
+    assert (combined.total_seconds, combined.media_seconds, combined.bytes_written) == (1200, 900, 150)
+    assert not combined.finished
+    assert combined.speed == 90.0
+
+
+def test_format_duration():
+    assert radiko_rec.format_duration(0) == "0:00:00"
+    assert radiko_rec.format_duration(3725.9) == "1:02:05"
+    assert radiko_rec.format_duration(-5) == "0:00:00"
+
+
+class FFmpegOutput:
+    """-progress pipe:1 の出力を stdout として持つ、終了済みのプロセスに見立てたオブジェクト。"""
+    def __init__(self, lines):
+        self.stdout = iter(line + "\n" for line in lines)
+
+
+def test_monitor_progress_parses_ffmpeg_blocks():
+    downloader = radiko_rec.StreamDownloader(radiko_rec.RadikoAuth(quiet, cache_path=None), quiet)
+    process = FFmpegOutput([
+        "total_size=1000", "out_time_us=60000000", "speed=N/A", "progress=continue",
+        "total_size=N/A", "out_time_ms=120000000", "progress=continue",
+        "total_size=3000", "out_time_us=600000000", "progress=end",
+    ])
+    reports = []
+    downloader._monitor_progress(
+        process, "20240101050000", "20240101051000",
+        lambda p: reports.append((p.media_seconds, p.bytes_written, p.finished)),
+    )
+    # 数値でない値は無視して直前の値を保つ
+    assert reports == [(60.0, 1000, False), (120.0, 1000, False), (600.0, 3000, True)]
+
+
+def test_native_download_reports_progress(auth, tmp_path):
+    downloader = radiko_rec.StreamDownloader(auth, quiet)
+    reports = []
+    assert downloader.download(
+        "ST000", "20240101050000", "20240101051000", str(tmp_path / "a.m4a"), reports.append,
+        engine=radiko_rec.ENGINE_NATIVE, shards=1, resume=False,
+    )
+    media = [p.media_seconds for p in reports]
+    assert media == sorted(media)
+    assert reports[-1].finished
+    assert reports[-1].bytes_written > 0
@@ -0,0 +1,104 @@
+"""再試行 (RetryPolicy / request_with_retry) とサーキットブレーカーのテスト。"""
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from conftest import FAST_RETRY_POLICY, MOCK_SERVER
+import radiko_rec
+
+RetryPolicy = radiko_rec.RetryPolicy
+CircuitBreaker = radiko_rec.CircuitBreaker
+
+
+def test_delay_is_bounded_full_jitter():
+    policy = RetryPolicy(max_attempts=5, base_delay=1, max_delay=4)
+    for attempt in range(6):
+        for _ in range(50):
+            assert 0 <= policy.delay(attempt) <= min(4, 2 ** attempt)
+
+
+def test_retry_after_takes_precedence():
+    policy = RetryPolicy(base_delay=100, max_delay=100)
+    assert policy.delay(0, "3") == 3.0
+    assert policy.delay(0, str(10 ** 6)) == radiko_rec.RETRY_AFTER_MAX
+
+
+def test_parse_retry_after():
+    assert RetryPolicy.parse_retry_after(None) is None
+    assert RetryPolicy.parse_retry_after(" 7 ") == 7.0
+    assert RetryPolicy.parse_retry_after("soon") is None
+    seconds = RetryPolicy.parse_retry_after(formatdate(time.time() + 60, usegmt=True))
+    assert 55 <= seconds <= 61
+    assert RetryPolicy.parse_retry_after(formatdate(time.time() - 60, usegmt=True)) == 0.0
+
+
+def test_breaker_opens_after_threshold_and_half_opens(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=10)
+
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.wait_time() == 10
+
+    now[0] += 10
+    assert breaker.state == "half-open"
+    # half-open では1件だけ試行を通す
+    assert breaker.wait_time() == 0
+    assert breaker.wait_time() > 0
+
+    # 試行が失敗すると再び開く
+    breaker.record_failure()
+    assert breaker.state == "open"
+    now[0] += 10
+    assert breaker.wait_time() == 0
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_request_retries_transient_errors(mock_server):
+    mock_server.faults.update(error_status=503, error_rate=1.0, path="/v2/api/auth1")
+    session = requests.Session()
+    attempts = []
+    policy = RetryPolicy(max_attempts=3, base_delay=0.01, max_delay=0.01)
+    res = radiko_rec.request_with_retry(
+        session, "GET", radiko_rec.URL_AUTH1, "test-retry", policy=policy,
+        observer=lambda res, elapsed: attempts.append(res.status_code),
+    )
+    # 最後の試行の応答をそのまま返す
+    assert res.status_code == 503
+    assert attempts == [503, 503, 503]
+
+
+def test_request_does_not_retry_other_statuses(mock_server):
+    attempts = []
+    res = radiko_rec.request_with_retry(
+        requests.Session(), "GET", MOCK_SERVER.base_url + "/no-such-path", "test-404", policy=FAST_RETRY_POLICY,
+        observer=lambda res, elapsed: attempts.append(res.status_code),
+    )
+    assert res.status_code == 404
+    assert attempts == [404]
+
+
+def test_open_breaker_rejects_requests(mock_server):
+    breaker = radiko_rec.get_circuit_breaker("test-open")
+    assert radiko_rec.get_circuit_breaker("test-open") is breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    with pytest.raises(radiko_rec.CircuitOpenError):
+        radiko_rec.request_with_retry(
+            requests.Session(), "GET", radiko_rec.URL_AUTH1, "test-open", policy=FAST_RETRY_POLICY,
+        )
+
+
+def test_connection_errors_are_raised_after_retries():
+    with pytest.raises(requests.ConnectionError):
+        radiko_rec.request_with_retry(
+            requests.Session(), "GET", "http://127.0.0.1:9/", "test-connect", policy=FAST_RETRY_POLICY, timeout=1,
+        )
@@ -0,0 +1,141 @@
+"""自動録音のルール (RecordingRule / RuleIndex) とスケジューラのテスト。"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import quiet
+import radiko_rec
+
+RecordingRule = radiko_rec.RecordingRule
+
+
+def program(station_id, title, ft, minutes=60):
+    start = radiko_rec.parse_radiko_time(ft)
+    return radiko_rec.Program(station_id, title, ft, (start + timedelta(minutes=minutes)).strftime('%Y%m%d%H%M%S'))
+
+
+def test_rule_without_conditions_matches_everything():
+    assert RecordingRule("all").matches(program("TBS", "何でも", "20240101050000"))
+
+
+def test_rule_matches_station_and_title():
+    rule = RecordingRule("r", station_id="TBS", title_pattern="^爆笑")
+    assert rule.matches(program("TBS", "爆笑問題カーボーイ", "20240102010000"))
+    assert not rule.matches(program("QRR", "爆笑問題カーボーイ", "20240102010000"))
+    assert not rule.matches(program("TBS", "深夜の爆笑", "20240102010000"))
+
+
+def test_time_window_across_midnight():
+    rule = RecordingRule("r", start="23:00", end="03:00")
+    assert rule.matches(program("TBS", "t", "20240101230000"))
+    assert rule.matches(program("TBS", "t", "20240102025900"))
+    assert not rule.matches(program("TBS", "t", "20240102030000"))
+    assert not rule.matches(program("TBS", "t", "20240101220000"))
+
+
+def test_radiko_style_clock():
+    # '25:00' は 1:00
+    rule = RecordingRule("r", start="25:00", end="27:00")
+    assert rule.matches(program("TBS", "t", "20240102013000"))
+
+
+def test_weekday_uses_broadcast_day():
+    # 2024/01/02 は火曜。火曜 25:30 (= 水曜 1:30) の番組は火曜の番組
+    rule = RecordingRule.from_dict({"weekdays": ["火"]})
+    assert rule.matches(program("TBS", "t", "20240103013000"))
+    assert rule.matches(program("TBS", "t", "20240102050000"))
+    # 火曜 1:30 は月曜の放送日
+    assert not rule.matches(program("TBS", "t", "20240102013000"))
+
+
+def test_from_dict_parses_weekday_names():
+    rule = RecordingRule.from_dict({"weekdays": ["mon", "日", 2]}, index=4)
+    assert rule.name == "rule5"
+    assert rule.weekdays == {0, 6, 2}
+
+
+def test_rule_index_returns_same_matches_as_linear_scan():
+    rules = [
+        RecordingRule("tbs-night", station_id="TBS", start="23:00", end="03:00"),
+        RecordingRule("news", title_pattern="ニュース"),
+        RecordingRule("tue", weekdays=[1], start="01:00", end="03:00"),
+        RecordingRule("morning", station_id="QRR", start="05:00", end="09:00"),
+    ]
+    index = radiko_rec.RuleIndex(rules)
+    start = datetime(2024, 1, 1, 0, 0)
+    for hour in range(0, 24 * 7, 1):
+        ft = (start + timedelta(hours=hour, minutes=30)).strftime('%Y%m%d%H%M%S')
+        for station_id in ("TBS", "QRR", "LFR"):
+            for title in ("ニュース", "音楽"):
+                p = program(station_id, title, ft)
+                expected = [rule for rule in rules if rule.matches(p)]
+                assert sorted(r.name for r in index.match(p)) == sorted(r.name for r in expected)
+
+
+def test_rule_index_stations():
+    assert radiko_rec.RuleIndex([RecordingRule("a", station_id="TBS")]).stations() == {"TBS"}
+    assert radiko_rec.RuleIndex([RecordingRule("a", station_id="TBS"), RecordingRule("b")]).stations() is None
+
+
+def test_load_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"rules": [{"name": "n", "station": "TBS", "title": "x"}]}), encoding="utf-8")
+    rules = radiko_rec.load_rules(str(path))
+    assert [(r.name, r.station_id) for r in rules] == [("n", "TBS")]
+
+
+class FakeQueue:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, station_id, program, output_path, **options):
+        self.submitted.append((station_id, program.start_time_str, output_path))
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    metadata = radiko_rec.RadikoMetadata(radiko_rec.RadikoAuth(quiet, cache_path=None), quiet, guide_cache_dir=None)
+    rules = [RecordingRule("news", title_pattern="ニュース")]
+    return radiko_rec.AutoRecordScheduler(
+        metadata, FakeQueue(), rules, str(tmp_path / "out"), quiet, state_path=str(tmp_path / "state.json"),
+    )
+
+
+def test_scheduler_submits_only_finished_programs_once(scheduler, tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    finished = program("TBS", "朝のニュース", (now - timedelta(hours=2)).strftime('%Y%m%d%H%M%S'))
+    upcoming = program("TBS", "夜のニュース", (now + timedelta(hours=2)).strftime('%Y%m%d%H%M%S'))
+    other = program("TBS", "音楽", (now - timedelta(hours=2)).strftime('%Y%m%d%H%M%S'))
+    for p in (finished, upcoming, other):
+        scheduler._consider(p)
+
+    assert scheduler.submit_ready(now) == 1
+    assert [s[1] for s in scheduler.download_queue.submitted] == [finished.start_time_str]
+    assert list(scheduler.pending) == [scheduler.program_key(upcoming)]
+
+    # 投入済みの番組は再び評価しても投入しない (状態ファイルから復元した場合も)
+    scheduler._consider(finished)
+    assert scheduler.submit_ready(now) == 0
+    state = json.loads((tmp_path / "state.json").read_text())
+    assert state["submitted"] == [scheduler.program_key(finished)]
+
+
+def test_poll_evaluates_only_new_programs(auth, tmp_path):
+    metadata = radiko_rec.RadikoMetadata(auth, quiet, guide_cache_dir=None)
+    metadata.load_stations()
+    queue = FakeQueue()
+    logs = []
+    scheduler = radiko_rec.AutoRecordScheduler(
+        metadata, queue, [RecordingRule("first", station_id="ST000", title_pattern=r"^番組0 ")],
+        str(tmp_path / "out"), logs.append, state_path=str(tmp_path / "state.json"),
+    )
+
+    submitted = scheduler.poll()
+    # タイムフリー期間の過去の日の番組0 (5:00〜11:00) は全て放送済み
+    assert submitted >= radiko_rec.TIME_FREE_DAYS - 2
+    assert len(queue.submitted) == submitted
+    assert {s[0] for s in queue.submitted} == {"ST000"}
+
+    assert scheduler.poll() == 0
+    assert "新規・変更 0 番組" in logs[-1]
@@ -0,0 +1,108 @@
+"""番組検索インデックス (ProgramSearchIndex) のテスト。"""
+import time
+from datetime import datetime
+
+import pytest
+
+from conftest import quiet
+import radiko_rec
+
+
+def program(station_id, title, ft, performer="", info=""):
+    to = ft[:8] + f"{int(ft[8:10]) + 1:02d}" + ft[10:]
+    return radiko_rec.Program(station_id, title, ft, to, performer, info)
+
+
+@pytest.fixture
+def index():
+    index = radiko_rec.ProgramSearchIndex(":memory:")
+    yield index
+    index.close()
+
+
+def test_search_title_performer_and_info(index):
+    index.add_programs("TBS", "20240101", [
+        program("TBS", "爆笑問題カーボーイ", "20240101010000", performer="爆笑問題"),
+        program("TBS", "ニュース", "20240101050000", info="今日の天気"),
+    ])
+    index.add_programs("QRR", "20240101", [program("QRR", "深夜のニュース", "20240101020000")])
+
+    assert [p.title for p in index.search("ニュース")] == ["ニュース", "深夜のニュース"]
+    assert [p.title for p in index.search("爆笑問題")] == ["爆笑問題カーボーイ"]
+    # 3文字未満は LIKE で検索する
+    assert [p.title for p in index.search("天気")] == ["ニュース"]
+    assert [p.station_id for p in index.search("ニュース", station_id="QRR")] == ["QRR"]
+    assert index.search("   ") == []
+
+
+def test_search_escapes_query_syntax(index):
+    index.add_programs("TBS", "20240101", [program("TBS", '100% "OK" 番組', "20240101010000")])
+    assert len(index.search('100% "OK"')) == 1
+    assert index.search("%") and not index.search("_")
+
+
+def test_add_programs_replaces_the_day(index):
+    index.add_programs("TBS", "20240101", [program("TBS", "古い番組", "20240101010000")])
+    index.add_programs("TBS", "20240101", [program("TBS", "新しい番組", "20240101010000")])
+    assert index.search("古い番組") == []
+    assert len(index.search("新しい番組")) == 1
+
+
+def test_needs_update(index, monkeypatch):
+    assert index.needs_update("TBS", "20240101")
+    index.add_programs("TBS", "20240101", [])
+    # 過去日は一度取り込めば再取得しない
+    assert not index.needs_update("TBS", "20240101")
+
+    today = datetime.now().strftime('%Y%m%d')
+    index.add_programs("TBS", today, [])
+    assert not index.needs_update("TBS", today)
+    monkeypatch.setattr(time, "time", lambda: datetime.now().timestamp() + radiko_rec.GUIDE_CACHE_FRESH_SECONDS + 1)
+    assert index.needs_update("TBS", today)
+
+
+def test_update_from_metadata_skips_indexed_days(auth, mock_server, index):
+    metadata = radiko_rec.RadikoMetadata(auth, quiet, guide_cache_dir=None)
+    metadata.load_stations()
+    dates = ["20240101", "20240102"]
+
+    assert index.update_from_metadata(metadata, dates=dates) == 6
+    # 2日 × 4番組
+    assert len(index.search("(ST001)")) == 8
+    assert index.update_from_metadata(metadata, dates=dates) == 0
+
+
+class EmptyDayMetadata:
+    """ST000 は番組の無い日、ST001 は取得に失敗する日を返す番組表。"""
+    class auth:
+        area_id = None
+
+    guide_index = radiko_rec.GuideIndex()
+    log = staticmethod(quiet)
+
+    def get_stations(self):
+        return {"ST000": "", "ST001": ""}
+
+    def fetch_programs(self, station_id, date_str):
+        return [] if station_id == "ST000" else None
+
+
+def test_empty_days_are_recorded_but_failures_are_retried(index):
+    assert index.update_from_metadata(EmptyDayMetadata(), dates=["20240101"]) == 1
+    assert not index.needs_update("ST000", "20240101")
+    assert index.needs_update("ST001", "20240101")
+
+
+def test_fetch_programs_returns_none_on_failure(auth, mock_server):
+    metadata = radiko_rec.RadikoMetadata(auth, quiet, guide_cache_dir=None)
+    metadata.load_stations()
+    mock_server.faults.update(error_status=404, error_rate=1.0, path="/program/")
+    assert metadata.fetch_programs("ST000", "20240101") is None
+    assert metadata.get_programs("ST000", "20240101") == []
+
+
+def test_prune_removes_days_outside_time_free(index):
+    index.add_programs("TBS", "20000101", [program("TBS", "大昔の番組", "20000101010000")])
+    index.prune()
+    assert index.search("大昔の番組") == []
+    assert index.needs_update("TBS", "20000101")
@@ -0,0 +1,137 @@
+"""SessionPool (複数アカウントのセッションの貸し出し) のテスト。"""
+import json
+import threading
+import time
+
+import pytest
+
+from conftest import quiet
+import radiko_rec
+
+ANONYMOUS = {"mail": None, "max_leases": 1}
+PREMIUM = {"mail": "user@example.com", "password": "password", "max_leases": 1}
+
+
+@pytest.fixture
+def make_pool(mock_server):
+    pools = []
+
+    def make(accounts, **kwargs):
+        # 更新スレッドがテスト中に動かないよう、更新間隔を長くする
+        pool = radiko_rec.SessionPool(accounts, quiet, cache_path=None, refresh_interval=3600, **kwargs)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def test_load_accounts(tmp_path):
+    path = tmp_path / "accounts.json"
+    path.write_text(json.dumps({"accounts": [PREMIUM, {"proxy": "http://proxy:3128"}]}), encoding="utf-8")
+    assert radiko_rec.load_accounts(str(path)) == [PREMIUM, {"proxy": "http://proxy:3128"}]
+
+    path.write_text(json.dumps([ANONYMOUS]), encoding="utf-8")
+    assert radiko_rec.load_accounts(str(path)) == [ANONYMOUS]
+
+    # accounts が無い login.yaml は1アカウントとして扱う
+    pytest.importorskip("yaml")
+    path = tmp_path / "login.yaml"
+    path.write_text("mail: foo@sample.com\npassword: passme\n", encoding="utf-8")
+    assert radiko_rec.load_accounts(str(path)) == [{"mail": "foo@sample.com", "password": "passme"}]
+
+
+def test_lease_prefers_in_area_session_then_area_free(make_pool):
+    pool = make_pool([PREMIUM, ANONYMOUS])
+    assert pool.start() == 2
+    premium, anonymous = pool.sessions
+    assert premium.area_free and not anonymous.area_free
+    assert set(pool.stations()) == {"ST000", "ST001", "ST002"}
+
+    # Premium会員のセッションが別のエリアにあるものとする
+    premium.stations = {}
+    with pool.lease("ST000") as first:
+        with pool.lease("ST001") as second:
+            assert first is anonymous.auth
+            # エリア内のセッションが全て貸し出し中なら、エリアフリーのセッションを使う
+            assert second is premium.auth
+    with pool.lease("OTHER") as auth:
+        assert auth is premium.auth
+    assert pool.stats()["leases"] == 3
+
+
+def test_lease_rejects_uncovered_station(make_pool):
+    pool = make_pool([ANONYMOUS])
+    pool.start()
+    with pytest.raises(radiko_rec.SessionLeaseError):
+        with pool.lease("OTHER"):
+            pass
+
+
+def test_lease_waits_for_release_and_times_out(make_pool):
+    pool = make_pool([ANONYMOUS])
+    pool.start()
+
+    with pool.lease("ST000"):
+        with pytest.raises(radiko_rec.SessionLeaseError):
+            with pool.lease("ST000", timeout=0.05):
+                pass
+
+    acquired = threading.Event()
+    with pool.lease("ST000"):
+        def waiter():
+            with pool.lease("ST000", timeout=5):
+                acquired.set()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.1)
+        assert not acquired.is_set()
+    thread.join(5)
+    assert acquired.is_set()
+    stats = pool.stats()
+    assert stats["waited"] == 1
+    assert stats["sessions"][0]["active"] == 0
+
+
+def test_failed_refresh_stops_lending_until_relogin(make_pool, monkeypatch):
+    pool = make_pool([ANONYMOUS])
+    pool.start()
+    session = pool.sessions[0]
+    monkeypatch.setattr(session.auth, "reauth", lambda token: False)
+
+    assert not session.refresh()
+    assert not session.ready
+    assert session.next_login_at > time.time()
+    with pytest.raises(radiko_rec.SessionLeaseError):
+        with pool.lease("ST000"):
+            pass
+
+    monkeypatch.undo()
+    assert session.login()
+    with pool.lease("ST000") as auth:
+        assert auth is session.auth
+
+
+def test_failed_login_backs_off(make_pool):
+    pool = make_pool([{"mail": "user@example.com", "password": "wrong"}])
+    assert pool.start() == 0
+    session = pool.sessions[0]
+    first_delay = session.next_login_at - time.time()
+    assert not session.login()
+    assert session.login_failures == 2
+    assert session.next_login_at - time.time() > first_delay
+
+
+def test_pool_reuses_callers_logged_in_auth(auth, make_pool, mock_server):
+    with mock_server.state.lock:
+        before = mock_server.state.counters.get("auth1", 0)
+    pool = make_pool([ANONYMOUS, {"mail": None, "proxy": "http://127.0.0.1:9"}], auth=auth)
+
+    assert pool.sessions[0].auth is auth and pool.sessions[0].shared
+    # プロキシ経由のアカウントには使い回さない
+    assert pool.sessions[1].auth is not auth and not pool.sessions[1].shared
+    assert pool.sessions[0].login()
+    with mock_server.state.lock:
+        assert mock_server.state.counters.get("auth1", 0) == before
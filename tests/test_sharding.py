@@ -0,0 +1,53 @@
+"""時間区間の分割 (split_time_range) と、分割ダウンロードの結合のテスト。"""
+from conftest import quiet
+import radiko_rec
+
+split_time_range = radiko_rec.StreamDownloader.split_time_range
+
+
+def test_split_time_range_is_contiguous_and_aligned():
+    ranges = split_time_range("20240101050000", "20240101060000", 4)
+    assert ranges == [
+        ("20240101050000", "20240101051500"),
+        ("20240101051500", "20240101053000"),
+        ("20240101053000", "20240101054500"),
+        ("20240101054500", "20240101060000"),
+    ]
+
+
+def test_split_time_range_keeps_odd_end_in_last_range():
+    ranges = split_time_range("20240101050000", "20240101050103", 3)
+    assert ranges[0][0] == "20240101050000"
+    assert ranges[-1][1] == "20240101050103"
+    for (_, to), (ft, _) in zip(ranges, ranges[1:]):
+        assert to == ft
+        # 内側の境界は SHARD_ALIGN_SECONDS の倍数に揃う
+        assert int(ft[-2:]) % radiko_rec.SHARD_ALIGN_SECONDS == 0
+
+
+def test_split_time_range_reduces_shards_for_short_ranges():
+    # 10秒の番組は5秒単位で2つまでしか分割できない
+    assert len(split_time_range("20240101050000", "20240101050010", 8)) == 2
+    assert split_time_range("20240101050000", "20240101050003", 4) == [("20240101050000", "20240101050003")]
+
+
+def test_split_time_range_crosses_midnight():
+    ranges = split_time_range("20240101233000", "20240102003000", 2)
+    assert ranges == [("20240101233000", "20240102000000"), ("20240102000000", "20240102003000")]
+
+
+def test_default_shard_count():
+    assert radiko_rec.StreamDownloader.default_shard_count("20240101050000", "20240101051000") == 1
+    assert radiko_rec.StreamDownloader.default_shard_count("20240101050000", "20240101070000") == 4
+    assert radiko_rec.StreamDownloader.default_shard_count("20240101000000", "20240102000000") == radiko_rec.SHARD_MAX
+
+
+def test_sharded_download_matches_program_length(auth, tmp_path):
+    output_path = str(tmp_path / "sharded.m4a")
+    downloader = radiko_rec.StreamDownloader(auth, quiet)
+    assert downloader.download(
+        "ST000", "20240101050000", "20240101052000", output_path, lambda progress: None,
+        engine=radiko_rec.ENGINE_NATIVE, shards=4, resume=False,
+    )
+    duration = radiko_rec.read_m4a_duration(output_path)
+    assert abs(duration - 20 * 60) < 1
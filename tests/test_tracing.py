@@ -0,0 +1,100 @@
+"""トレース (Tracer / Span) とプロファイルのテスト。"""
+import json
+import threading
+
+import pytest
+
+from conftest import quiet
+import radiko_rec
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = radiko_rec.Tracer()
+    with tracer.span("auth", premium=False) as span:
+        span.set(area="JP13")
+    tracer.add_span("auth.auth1", 0.0)
+    assert span is radiko_rec._NULL_SPAN
+    assert tracer.events == []
+
+
+def test_spans_record_attributes_and_errors():
+    tracer = radiko_rec.Tracer()
+    tracer.enable()
+    with tracer.span("fetch", station="TBS") as outer:
+        with tracer.span("fetch.segment") as inner:
+            inner.set(bytes=10)
+        outer.set(segments=1)
+    with pytest.raises(ValueError):
+        with tracer.span("mux"):
+            raise ValueError("broken")
+
+    segment, fetch, mux = tracer.events
+    assert (segment["name"], segment["cat"], segment["args"]) == ("fetch.segment", "fetch", {"bytes": 10})
+    assert fetch["args"] == {"station": "TBS", "segments": 1}
+    # 内側の区間は外側の区間に含まれる
+    assert fetch["ts"] <= segment["ts"]
+    assert segment["ts"] + segment["dur"] <= fetch["ts"] + fetch["dur"]
+    assert mux["args"]["error"] == "ValueError: broken"
+
+    summary = tracer.summary()
+    assert summary["fetch"]["count"] == summary["fetch.segment"]["count"] == 1
+    assert summary["fetch"]["total_ms"] >= summary["fetch.segment"]["total_ms"]
+
+    # 再度 enable() すると記録をやり直す
+    tracer.enable()
+    assert tracer.events == []
+
+
+def test_write_includes_thread_names(tmp_path):
+    tracer = radiko_rec.Tracer()
+    tracer.enable()
+
+    def work():
+        with tracer.span("guide.parse"):
+            pass
+
+    thread = threading.Thread(target=work, name="guide-worker")
+    thread.start()
+    thread.join()
+    path = str(tmp_path / "trace.json")
+    assert tracer.write(path) == [path]
+
+    with open(path, encoding="utf-8") as f:
+        trace = json.load(f)
+    names = {event["args"]["name"] for event in trace["traceEvents"] if event["ph"] == "M"}
+    assert names == {"radiko_rec", "guide-worker"}
+    span, = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert span["name"] == "guide.parse"
+
+
+def test_profiled_phase_writes_stats(tmp_path):
+    tracer = radiko_rec.Tracer()
+    tracer.enable(profile_phases=["guide.parse"])
+    for _ in range(2):
+        with tracer.span("guide.parse"):
+            sorted(range(1000), key=lambda value: -value)
+    with tracer.span("fetch"):
+        pass
+
+    assert tracer.profile_report("fetch") is None
+    assert "function calls" in tracer.profile_report("guide.parse")
+    written = tracer.write(str(tmp_path / "trace.json"))
+    assert written == [str(tmp_path / "trace.json"), str(tmp_path / "trace.guide.parse.prof")]
+
+
+def test_auth_and_download_are_traced(mock_server, tmp_path):
+    radiko_rec.TRACER.enable()
+    try:
+        auth = radiko_rec.RadikoAuth(quiet, cache_path=None)
+        assert auth.auth(use_cache=False)
+        assert radiko_rec.StreamDownloader(auth, quiet).download(
+            "ST000", "20240101050000", "20240101050100", str(tmp_path / "a.m4a"), quiet,
+            engine=radiko_rec.ENGINE_NATIVE, resume=False,
+        )
+        summary = radiko_rec.TRACER.summary()
+    finally:
+        radiko_rec.TRACER.disable()
+
+    for name in ("auth", "auth.auth1", "auth.auth2", "fetch", "fetch.playlist", "mux"):
+        assert name in summary
+    assert summary["fetch.segment"]["count"] == 12